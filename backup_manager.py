@@ -9,11 +9,26 @@ import sys
 import sqlite3
 import shutil
 import gzip
+import bz2
+import lzma
 import json
+import zlib
+import time
+import io
+import hashlib
+import tempfile
 import argparse
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import logging
 import subprocess
+from partitions import list_archives
+
+try:
+    import fcntl
+except ImportError:  # no store lock on Windows; the chunk grace period still applies
+    fcntl = None
 
 # Configure logging
 logging.basicConfig(
@@ -26,11 +41,57 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Incremental backups split the snapshot into fixed-size chunks aligned to
+# SQLite pages, so an unchanged page range maps to an already-stored chunk
+CHUNK_SIZE = 64 * 1024
+MANIFEST_SUFFIX = '.manifest'
+MANIFEST_FORMAT = 'chunked-v1'
+
+# Full backups are compressed as independent blocks in parallel; every codec
+# below decompresses a concatenation of such blocks as a single stream
+COMPRESS_BLOCK_SIZE = 1024 * 1024
+CODECS = {
+    'gzip': {'extension': '.gz', 'open': gzip.open,
+             'compress': lambda data, level: gzip.compress(data, compresslevel=level, mtime=0)},
+    'bz2': {'extension': '.bz2', 'open': bz2.open,
+            'compress': lambda data, level: bz2.compress(data, compresslevel=max(1, level))},
+    'xz': {'extension': '.xz', 'open': lzma.open,
+           'compress': lambda data, level: lzma.compress(data, preset=level)},
+}
+BACKUP_EXTENSIONS = ('.db',) + tuple('.db' + codec['extension'] for codec in CODECS.values())
+
+def open_backup_file(path):
+    """Open a full backup for reading, decompressing by file extension"""
+    for codec in CODECS.values():
+        if path.endswith(codec['extension']):
+            return codec['open'](path, 'rb')
+    return open(path, 'rb')
+
+# Verification results are cached here, keyed by each backup's size and mtime
+VERIFY_CACHE_FILE = 'verify_cache.json'
+
+# Chunks younger than this are never garbage collected, so a backup that is
+# still writing its manifest cannot lose chunks to a concurrent cleanup.
+# Reused chunks have their mtime refreshed for the same reason
+CHUNK_GC_GRACE_SECONDS = 3600
+
+# Held shared while a backup stores chunks and writes its manifest, and
+# exclusively while unreferenced chunks are collected
+STORE_LOCK_FILE = '.lock'
+
+# Archived years (partitions.py) live in their own files, which never change
+# once written. Backups store them as chunk lists: in the manifest of a
+# chunked backup, and in this sidecar file next to a full one
+ARCHIVES_SUFFIX = '.archives'
+
 class BackupManager:
-    def __init__(self, db_path='data_usage.db', backup_dir='backups'):
+    def __init__(self, db_path='data_usage.db', backup_dir='backups', progress=None):
         self.db_path = os.path.abspath(db_path)
+        # Optional progress(stage, done, total) callback, e.g. for API jobs
+        self.progress = progress
         self.backup_dir = os.path.abspath(backup_dir)
         self.config_file = os.path.join(self.backup_dir, 'backup_config.json')
+        self.chunk_dir = os.path.join(self.backup_dir, 'store', 'chunks')
         
         # Create backup directory if it doesn't exist
         os.makedirs(self.backup_dir, exist_ok=True)
@@ -40,6 +101,15 @@ class BackupManager:
             'retention_days': 30,
             'max_backups': 50,
             'compress_backups': True,
+            'backup_format': 'full',  # 'full' or 'chunked' (deduplicating incremental)
+            'compression_codec': 'gzip',  # gzip, bz2 or xz
+            'compression_level': 6,
+            'compression_workers': 0,  # 0 = one per CPU core
+            'verify_workers': 0,  # 0 = one per CPU core
+            'verify_memory_limit_mb': 512,  # larger images are checked from a spill file
+            'snapshot_memory_limit_mb': 128,  # larger databases are snapshotted to a temp file
+            'backup_step_pages': 256,  # pages copied per online backup step
+            'backup_step_sleep': 0.005,  # seconds between steps so writers get the lock
             'backup_schedule': 'daily',
             'notification_email': None
         }
@@ -68,45 +138,67 @@ class BackupManager:
         except Exception as e:
             logger.error(f"Failed to save configuration: {e}")
     
-    def create_backup(self, backup_name=None):
-        """Create a database backup"""
+    def create_backup(self, backup_name=None, incremental=None):
+        """Create a database backup
+        
+        ``incremental`` selects the deduplicating chunk store; by default the
+        ``backup_format`` setting decides.
+        """
         if not os.path.exists(self.db_path):
             logger.error(f"Database file not found: {self.db_path}")
             return False
         
+        if incremental is None:
+            incremental = self.config['backup_format'] == 'chunked'
+        
         try:
             # Generate backup filename
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            if backup_name:
-                filename = f"{backup_name}_{timestamp}.db"
-            else:
-                filename = f"data_usage_backup_{timestamp}.db"
+            prefix = backup_name or 'data_usage_backup'
             
-            backup_path = os.path.join(self.backup_dir, filename)
+            if incremental:
+                return self._create_chunked_backup(f"{prefix}_{timestamp}{MANIFEST_SUFFIX}", timestamp)
             
-            # Create backup using SQLite backup API for consistency
-            self._create_sqlite_backup(backup_path)
+            filename = f"{prefix}_{timestamp}.db"
+            started = time.perf_counter()
             
-            # Compress if enabled
             if self.config['compress_backups']:
-                compressed_path = backup_path + '.gz'
-                with open(backup_path, 'rb') as f_in:
-                    with gzip.open(compressed_path, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                
-                # Remove uncompressed file
-                os.remove(backup_path)
-                backup_path = compressed_path
-                filename = filename + '.gz'
+                # Compress a snapshot block by block straight into the backup file
+                codec_name = self.config['compression_codec']
+                if codec_name not in CODECS:
+                    raise ValueError(f"Unknown compression codec: {codec_name}")
+                filename += CODECS[codec_name]['extension']
+                backup_path = os.path.join(self.backup_dir, filename)
+                db_size = self._write_compressed_snapshot(backup_path, codec_name)
+            else:
+                # Create backup using SQLite backup API for consistency
+                codec_name = None
+                backup_path = os.path.join(self.backup_dir, filename)
+                self._create_sqlite_backup(backup_path)
+                try:
+                    self._write_archives_sidecar(backup_path, self._snapshot_archives(backup_path))
+                except BaseException:
+                    os.remove(backup_path)
+                    raise
+                db_size = os.path.getsize(backup_path)
+            
+            elapsed = time.perf_counter() - started
             
             # Get backup size
             backup_size = os.path.getsize(backup_path)
             backup_size_mb = round(backup_size / (1024 * 1024), 2)
+            stats = {
+                'codec': codec_name or 'none',
+                'ratio': round(db_size / backup_size, 2) if backup_size else None,
+                'throughput_mb_s': round(db_size / (1024 * 1024) / elapsed, 2) if elapsed > 0 else None,
+                'seconds': round(elapsed, 3)
+            }
             
             # Update database with backup info
-            self._update_backup_info(filename, backup_size_mb)
+            self._update_backup_info(filename, backup_size_mb, stats)
             
-            logger.info(f"Backup created successfully: {filename} ({backup_size_mb} MB)")
+            logger.info(f"Backup created successfully: {filename} ({backup_size_mb} MB, "
+                        f"ratio {stats['ratio']}, {stats['throughput_mb_s']} MB/s)")
             
             # Clean up old backups
             self.cleanup_old_backups()
@@ -115,26 +207,426 @@ class BackupManager:
                 'filename': filename,
                 'path': backup_path,
                 'size_mb': backup_size_mb,
-                'timestamp': timestamp
+                'timestamp': timestamp,
+                **stats
             }
             
         except Exception as e:
             logger.error(f"Failed to create backup: {e}")
             return False
     
+    def _write_compressed_snapshot(self, backup_path, codec_name):
+        """Compress a database snapshot in parallel blocks into backup_path
+        
+        The snapshot is read in fixed-size blocks that are compressed
+        concurrently (zlib, bz2 and lzma release the GIL) and written in
+        order as they complete, with at most two blocks per worker in flight.
+        The archives the snapshot registers go to the chunk store first.
+        Returns the uncompressed size.
+        """
+        compress = CODECS[codec_name]['compress']
+        level = self.config['compression_level']
+        workers = self.config['compression_workers'] or os.cpu_count() or 1
+        
+        temp_path = f"{backup_path}.{os.getpid()}.tmp"
+        try:
+            with self._snapshot() as (f_in, db_size, archives):
+                self._write_archives_sidecar(backup_path, archives)
+                total_blocks = -(-db_size // COMPRESS_BLOCK_SIZE)
+                with ThreadPoolExecutor(max_workers=workers) as executor, open(temp_path, 'wb') as f_out:
+                    pending = []
+                    written = 0
+                    for block in iter(lambda: f_in.read(COMPRESS_BLOCK_SIZE), b''):
+                        pending.append(executor.submit(compress, block, level))
+                        if len(pending) >= workers * 2:
+                            f_out.write(pending.pop(0).result())
+                            written += 1
+                            self._report('compress', written, total_blocks)
+                    for future in pending:
+                        f_out.write(future.result())
+                        written += 1
+                        self._report('compress', written, total_blocks)
+            os.replace(temp_path, backup_path)
+        except BaseException:
+            for path in (temp_path, backup_path + ARCHIVES_SUFFIX):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        
+        return db_size
+    
+    def _create_chunked_backup(self, filename, timestamp):
+        """Write only the chunks not already in the store, plus a manifest"""
+        chunks = []
+        new_chunks = 0
+        stored_bytes = 0
+        hasher = hashlib.sha256()
+        backup_path = os.path.join(self.backup_dir, filename)
+        with self._store_lock(), self._snapshot() as (f, db_size, archives):
+            total_chunks = -(-db_size // CHUNK_SIZE)
+            for data in iter(lambda: f.read(CHUNK_SIZE), b''):
+                hasher.update(data)
+                digest, written = self._store_chunk(data)
+                chunks.append(digest)
+                if written:
+                    new_chunks += 1
+                    stored_bytes += written
+                self._report('store', len(chunks), total_chunks)
+            archives = self._store_archives(archives)
+            
+            manifest = {
+                'format': MANIFEST_FORMAT,
+                'created': datetime.now().isoformat(),
+                'db_size': db_size,
+                'chunk_size': CHUNK_SIZE,
+                'sha256': hasher.hexdigest(),
+                'new_chunks': new_chunks,
+                'stored_bytes': stored_bytes,
+                'chunks': chunks,
+                'archives': archives
+            }
+            self._write_atomic(backup_path, json.dumps(manifest).encode('utf-8'))
+        
+        stored_mb = round(stored_bytes / (1024 * 1024), 2)
+        self._update_backup_info(filename, stored_mb)
+        
+        logger.info(f"Incremental backup created: {filename} "
+                    f"({new_chunks}/{len(chunks)} chunks new, {stored_mb} MB written)")
+        
+        self.cleanup_old_backups()
+        
+        return {
+            'filename': filename,
+            'path': backup_path,
+            'size_mb': stored_mb,
+            'db_size_mb': round(db_size / (1024 * 1024), 2),
+            'new_chunks': new_chunks,
+            'total_chunks': len(chunks),
+            'timestamp': timestamp
+        }
+    
+    def _report(self, stage, done=0, total=0):
+        if self.progress is not None:
+            self.progress(stage, done, total)
+    
+    def _online_backup(self, source_conn, dest_conn, stage):
+        """Run the SQLite backup API in page steps, reporting progress
+        
+        The source is only read-locked while a step runs, so writers can get
+        in between steps instead of waiting for the whole copy.
+        """
+        def on_step(status, remaining, total):
+            self._report(stage, total - remaining, total)
+        
+        source_conn.backup(
+            dest_conn,
+            pages=self.config['backup_step_pages'],
+            progress=on_step,
+            sleep=self.config['backup_step_sleep']
+        )
+    
+    def _database_size(self):
+        """Size of the live database, including a WAL not yet checkpointed"""
+        wal_path = self.db_path + '-wal'
+        return os.path.getsize(self.db_path) + (os.path.getsize(wal_path) if os.path.exists(wal_path) else 0)
+    
+    @contextmanager
+    def _snapshot(self):
+        """Take a consistent snapshot of the live database
+        
+        Yields (file, size, archives): a binary file over the snapshot, its
+        size and the archives it registers. Databases up to
+        ``snapshot_memory_limit_mb`` are copied into memory and serialized,
+        so a backup reads the database once and writes only its output.
+        Larger ones are copied to a temporary file next to the backups,
+        which is removed afterwards.
+        """
+        limit = self.config['snapshot_memory_limit_mb'] * 1024 * 1024
+        if hasattr(sqlite3.Connection, 'serialize') and self._database_size() <= limit:
+            source_conn = sqlite3.connect(self.db_path)
+            try:
+                memory_conn = sqlite3.connect(':memory:')
+                try:
+                    self._online_backup(source_conn, memory_conn, 'snapshot')
+                    archives = list_archives(memory_conn)
+                    image = memory_conn.serialize()
+                finally:
+                    memory_conn.close()
+            finally:
+                source_conn.close()
+            yield io.BytesIO(image), len(image), archives
+            return
+        
+        with tempfile.TemporaryDirectory(dir=self.backup_dir) as temp_dir:
+            temp_path = os.path.join(temp_dir, 'snapshot.db')
+            source_conn = sqlite3.connect(self.db_path)
+            try:
+                temp_conn = sqlite3.connect(temp_path)
+                try:
+                    self._online_backup(source_conn, temp_conn, 'snapshot')
+                finally:
+                    temp_conn.close()
+            finally:
+                source_conn.close()
+            with open(temp_path, 'rb') as f:
+                yield f, os.path.getsize(temp_path), self._snapshot_archives(temp_path)
+    
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunk_dir, digest[:2], digest)
+    
+    @contextmanager
+    def _store_lock(self, exclusive=False):
+        """Lock the chunk store against concurrent garbage collection
+        
+        Backups take it shared, so several can store chunks at once;
+        collect_chunk_garbage takes it exclusively. Not reentrant.
+        """
+        if fcntl is None:
+            yield
+            return
+        
+        store_dir = os.path.dirname(self.chunk_dir)
+        os.makedirs(store_dir, exist_ok=True)
+        with open(os.path.join(store_dir, STORE_LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _store_chunk(self, data):
+        """Store a chunk by content hash; returns (digest, bytes written)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            try:
+                # Restart the grace period, as for a newly written chunk
+                os.utime(path)
+                return digest, 0
+            except FileNotFoundError:
+                pass  # collected in the meantime, so write it again
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(data, 6)
+        self._write_atomic(path, compressed)
+        return digest, len(compressed)
+    
+    def _write_atomic(self, path, data):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    
+    def _read_chunks(self, digests):
+        """Yield stored chunks in order, checking every chunk hash"""
+        for digest in digests:
+            with open(self._chunk_path(digest), 'rb') as f:
+                data = zlib.decompress(f.read())
+            if hashlib.sha256(data).hexdigest() != digest:
+                raise ValueError(f"Chunk {digest} is corrupt")
+            yield data
+    
+    def _archive_file(self, archive):
+        """Absolute path of a registered archive; relative ones are beside the database"""
+        return os.path.join(os.path.dirname(self.db_path), archive['path'])
+    
+    def _snapshot_archives(self, snapshot_path):
+        """Archives registered in a snapshot or backup database file"""
+        conn = sqlite3.connect(f"file:{snapshot_path}?mode=ro&immutable=1", uri=True)
+        try:
+            return list_archives(conn)
+        finally:
+            conn.close()
+    
+    def _store_archives(self, archives):
+        """Store registered archive files as chunks; returns their entries
+        
+        The caller holds the store lock. Archives never change, so after the
+        first backup their chunks are all reused and nothing new is written.
+        """
+        entries = []
+        for archive in archives:
+            path = self._archive_file(archive)
+            if not os.path.exists(path):
+                raise ValueError(f"Archive for {archive['year']} is missing: {path}")
+            hasher = hashlib.sha256()
+            chunks = []
+            size = 0
+            with open(path, 'rb') as f:
+                for data in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    hasher.update(data)
+                    chunks.append(self._store_chunk(data)[0])
+                    size += len(data)
+            entries.append({'id': archive['id'], 'year': archive['year'], 'path': archive['path'],
+                            'size': size, 'sha256': hasher.hexdigest(), 'chunks': chunks})
+        return entries
+    
+    def _write_archives_sidecar(self, backup_path, archives):
+        """Store a full backup's archives and list them beside it"""
+        if not archives:
+            return
+        with self._store_lock():
+            entries = self._store_archives(archives)
+            self._write_atomic(backup_path + ARCHIVES_SUFFIX, json.dumps(entries).encode('utf-8'))
+    
+    def _backup_archives(self, backup_filename):
+        """Archive entries stored with a backup; empty for backups without any"""
+        backup_path = os.path.join(self.backup_dir, backup_filename)
+        if backup_filename.endswith(MANIFEST_SUFFIX):
+            return self._load_manifest(backup_path).get('archives', [])
+        if os.path.exists(backup_path + ARCHIVES_SUFFIX):
+            with open(backup_path + ARCHIVES_SUFFIX, 'r') as f:
+                return json.load(f)
+        return []
+    
+    def _check_archive_chunks(self, entries):
+        """Raise ValueError unless every stored archive reassembles intact"""
+        for entry in entries:
+            hasher = hashlib.sha256()
+            for data in self._read_chunks(entry['chunks']):
+                hasher.update(data)
+            if hasher.hexdigest() != entry['sha256']:
+                raise ValueError(f"Archive for {entry['year']} does not match its checksum")
+    
+    def _restore_archives(self, archives, entries):
+        """Put back the archive files a backup's registry refers to
+        
+        Files already matching the backup are left alone. Fails before
+        writing anything if an archive is neither on disk nor in the backup.
+        Returns the number of files written.
+        """
+        stored = {entry['id']: entry for entry in entries}
+        missing = []
+        pending = []
+        for archive in archives:
+            path = self._archive_file(archive)
+            entry = stored.get(archive['id'])
+            if entry is None:
+                # Backups from before archives were stored only have the registry
+                if not os.path.exists(path):
+                    missing.append(archive['year'])
+            elif not os.path.exists(path) or self._file_sha256(path) != entry['sha256']:
+                if not all(os.path.exists(self._chunk_path(digest)) for digest in entry['chunks']):
+                    missing.append(archive['year'])
+                pending.append((entry, path))
+        if missing:
+            raise ValueError(f"Backup refers to archived years {missing} that are neither on disk nor in the backup")
+        
+        for entry, path in pending:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            hasher = hashlib.sha256()
+            try:
+                with open(temp_path, 'wb') as f:
+                    for data in self._read_chunks(entry['chunks']):
+                        hasher.update(data)
+                        f.write(data)
+                if hasher.hexdigest() != entry['sha256']:
+                    raise ValueError(f"Archive for {entry['year']} does not match its checksum")
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            logger.info(f"Restored archive for {entry['year']}: {path}")
+        return len(pending)
+    
+    def _missing_archives(self):
+        """Years the live registry lists whose archive file does not exist"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            archives = list_archives(conn)
+        finally:
+            conn.close()
+        return [archive['year'] for archive in archives if not os.path.exists(self._archive_file(archive))]
+    
+    def _load_manifest(self, manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != MANIFEST_FORMAT:
+            raise ValueError(f"Unsupported manifest format: {manifest.get('format')}")
+        return manifest
+    
+    def _read_chunked_backup(self, manifest_path):
+        """Reassemble a chunked backup, checking every chunk hash"""
+        manifest = self._load_manifest(manifest_path)
+        
+        snapshot = b''.join(self._read_chunks(manifest['chunks']))
+        if hashlib.sha256(snapshot).hexdigest() != manifest['sha256']:
+            raise ValueError("Reassembled database does not match manifest checksum")
+        return snapshot
+    
+    @contextmanager
+    def _open_snapshot(self, snapshot):
+        """Open a database snapshot held in memory as a SQLite connection"""
+        if hasattr(sqlite3.Connection, 'deserialize'):
+            # Images of a WAL database keep the WAL version bytes in their
+            # header, which an in-memory database cannot open; mark them as
+            # rollback-journal images instead
+            if snapshot[18:20] == b'\x02\x02':
+                snapshot = bytearray(snapshot)
+                snapshot[18:20] = b'\x01\x01'
+            conn = sqlite3.connect(':memory:')
+            try:
+                conn.deserialize(snapshot)
+                yield conn
+            finally:
+                conn.close()
+            return
+        
+        with tempfile.TemporaryDirectory(dir=self.backup_dir) as temp_dir:
+            temp_path = os.path.join(temp_dir, 'snapshot.db')
+            with open(temp_path, 'wb') as f:
+                f.write(snapshot)
+            conn = sqlite3.connect(temp_path)
+            try:
+                yield conn
+            finally:
+                conn.close()
+    
+    def _install_database(self, source_conn):
+        """Copy a database into the live file through the SQLite backup API
+        
+        Unlike copying the file over it, this goes through SQLite's own
+        locking and journal (including WAL), so open connections stay valid.
+        """
+        dest_conn = sqlite3.connect(self.db_path)
+        try:
+            previous = self._data_version(dest_conn)
+            self._online_backup(source_conn, dest_conn, 'restore')
+            
+            # The restored counter may repeat a version that running API
+            # processes have already cached, so move it past both
+            restored = self._data_version(dest_conn)
+            if previous is not None and restored is not None:
+                dest_conn.execute("""
+                    UPDATE data_version SET version = ?, updated_at = CURRENT_TIMESTAMP WHERE id = 1
+                """, (max(previous, restored) + 1,))
+                dest_conn.commit()
+        finally:
+            dest_conn.close()
+    
+    def _data_version(self, conn):
+        """The schema's change counter, or None for databases without one"""
+        try:
+            row = conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row[0] if row else None
+    
     def _create_sqlite_backup(self, backup_path):
         """Create SQLite backup using the backup API"""
         source_conn = sqlite3.connect(self.db_path)
         backup_conn = sqlite3.connect(backup_path)
         
         try:
-            source_conn.backup(backup_conn)
+            self._online_backup(source_conn, backup_conn, 'snapshot')
             logger.info("SQLite backup completed successfully")
         finally:
             source_conn.close()
             backup_conn.close()
     
-    def _update_backup_info(self, filename, size_mb):
+    def _update_backup_info(self, filename, size_mb, stats=None):
         """Update system info with backup details"""
         try:
             conn = sqlite3.connect(self.db_path)
@@ -151,6 +643,16 @@ class BackupManager:
                 VALUES ('last_backup_size', ?, CURRENT_TIMESTAMP)
             """, (f"{size_mb} MB",))
             
+            if stats:
+                cursor.executemany("""
+                    INSERT OR REPLACE INTO system_info (metric_name, metric_value, updated_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                """, [
+                    ('last_backup_codec', stats['codec']),
+                    ('last_backup_ratio', str(stats['ratio'])),
+                    ('last_backup_throughput', f"{stats['throughput_mb_s']} MB/s"),
+                ])
+            
             conn.commit()
             conn.close()
             
@@ -175,30 +677,50 @@ class BackupManager:
             if current_backup:
                 logger.info(f"Current database backed up as: {current_backup['filename']}")
             
+            archives = self._backup_archives(backup_filename)
+            if backup_filename.endswith(MANIFEST_SUFFIX):
+                with self._open_snapshot(self._read_chunked_backup(backup_path)) as source_conn:
+                    self._restore_archives(list_archives(source_conn), archives)
+                    self._install_database(source_conn)
+                return self._check_restored_archives(backup_filename)
+            
             # Handle compressed backups
             restore_path = backup_path
-            if backup_filename.endswith('.gz'):
+            if not backup_filename.endswith('.db'):
                 # Decompress to temporary file
-                temp_path = backup_path[:-3]  # Remove .gz extension
-                with gzip.open(backup_path, 'rb') as f_in:
+                temp_path = backup_path.rsplit('.', 1)[0]  # Remove compression extension
+                with open_backup_file(backup_path) as f_in:
                     with open(temp_path, 'wb') as f_out:
                         shutil.copyfileobj(f_in, f_out)
                 restore_path = temp_path
             
             # Restore database
-            shutil.copy2(restore_path, self.db_path)
+            source_conn = sqlite3.connect(restore_path)
+            try:
+                self._restore_archives(list_archives(source_conn), archives)
+                self._install_database(source_conn)
+            finally:
+                source_conn.close()
             
             # Clean up temporary file if created
             if restore_path != backup_path:
                 os.remove(restore_path)
             
-            logger.info(f"Database restored successfully from: {backup_filename}")
-            return True
+            return self._check_restored_archives(backup_filename)
             
         except Exception as e:
             logger.error(f"Failed to restore backup: {e}")
             return False
     
+    def _check_restored_archives(self, backup_filename):
+        """Confirm every archive the restored registry lists is on disk"""
+        missing = self._missing_archives()
+        if missing:
+            logger.error(f"Database restored from {backup_filename}, but archives for {missing} are missing")
+            return False
+        logger.info(f"Database restored successfully from: {backup_filename}")
+        return True
+    
     def list_backups(self):
         """List all available backups"""
         backups = []
@@ -207,7 +729,7 @@ class BackupManager:
             return backups
         
         for filename in os.listdir(self.backup_dir):
-            if filename.endswith('.db') or filename.endswith('.db.gz'):
+            if filename.endswith(BACKUP_EXTENSIONS):
                 filepath = os.path.join(self.backup_dir, filename)
                 stat = os.stat(filepath)
                 
@@ -216,7 +738,28 @@ class BackupManager:
                     'size_mb': round(stat.st_size / (1024 * 1024), 2),
                     'created': datetime.fromtimestamp(stat.st_ctime),
                     'modified': datetime.fromtimestamp(stat.st_mtime),
-                    'compressed': filename.endswith('.gz')
+                    'compressed': not filename.endswith('.db'),
+                    'format': 'full'
+                })
+            
+            elif filename.endswith(MANIFEST_SUFFIX):
+                filepath = os.path.join(self.backup_dir, filename)
+                stat = os.stat(filepath)
+                try:
+                    manifest = self._load_manifest(filepath)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable manifest {filename}: {e}")
+                    continue
+                
+                # Only the chunks this backup added count towards its size
+                backups.append({
+                    'filename': filename,
+                    'size_mb': round(manifest['stored_bytes'] / (1024 * 1024), 2),
+                    'db_size_mb': round(manifest['db_size'] / (1024 * 1024), 2),
+                    'created': datetime.fromtimestamp(stat.st_ctime),
+                    'modified': datetime.fromtimestamp(stat.st_mtime),
+                    'compressed': True,
+                    'format': 'chunked'
                 })
         
         # Sort by creation time (newest first)
@@ -234,8 +777,7 @@ class BackupManager:
             
             for backup in backups:
                 if backup['created'] < cutoff_date:
-                    backup_path = os.path.join(self.backup_dir, backup['filename'])
-                    os.remove(backup_path)
+                    self._remove_backup(backup['filename'])
                     removed_count += 1
                     logger.info(f"Removed old backup: {backup['filename']}")
             
@@ -245,17 +787,75 @@ class BackupManager:
                 excess_count = len(remaining_backups) - self.config['max_backups']
                 # Remove oldest backups
                 for backup in remaining_backups[-excess_count:]:
-                    backup_path = os.path.join(self.backup_dir, backup['filename'])
-                    os.remove(backup_path)
+                    self._remove_backup(backup['filename'])
                     removed_count += 1
                     logger.info(f"Removed excess backup: {backup['filename']}")
             
             if removed_count > 0:
                 logger.info(f"Cleanup completed: {removed_count} backups removed")
             
+            self.collect_chunk_garbage()
+            
         except Exception as e:
             logger.error(f"Failed to cleanup old backups: {e}")
     
+    def _remove_backup(self, filename):
+        backup_path = os.path.join(self.backup_dir, filename)
+        os.remove(backup_path)
+        if os.path.exists(backup_path + ARCHIVES_SUFFIX):
+            os.remove(backup_path + ARCHIVES_SUFFIX)
+    
+    def collect_chunk_garbage(self):
+        """Delete stored chunks no longer referenced by any backup"""
+        if not os.path.isdir(self.chunk_dir):
+            return 0
+        
+        with self._store_lock(exclusive=True):
+            return self._collect_chunk_garbage()
+    
+    def _collect_chunk_garbage(self):
+        referenced = set()
+        for filename in os.listdir(self.backup_dir):
+            if filename.endswith(MANIFEST_SUFFIX):
+                try:
+                    manifest = self._load_manifest(os.path.join(self.backup_dir, filename))
+                except (OSError, ValueError) as e:
+                    # Keep everything rather than risk deleting its chunks
+                    logger.warning(f"Skipping chunk collection, unreadable manifest {filename}: {e}")
+                    return 0
+                referenced.update(manifest['chunks'])
+                for archive in manifest.get('archives', []):
+                    referenced.update(archive['chunks'])
+            elif filename.endswith(ARCHIVES_SUFFIX):
+                try:
+                    with open(os.path.join(self.backup_dir, filename), 'r') as f:
+                        archives = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping chunk collection, unreadable archive list {filename}: {e}")
+                    return 0
+                for archive in archives:
+                    referenced.update(archive['chunks'])
+        
+        cutoff = datetime.now().timestamp() - CHUNK_GC_GRACE_SECONDS
+        removed = 0
+        freed = 0
+        for prefix in os.listdir(self.chunk_dir):
+            prefix_dir = os.path.join(self.chunk_dir, prefix)
+            for digest in os.listdir(prefix_dir):
+                path = os.path.join(prefix_dir, digest)
+                if digest in referenced:
+                    continue
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    continue
+                os.remove(path)
+                removed += 1
+                freed += stat.st_size
+        
+        if removed:
+            logger.info(f"Removed {removed} unreferenced chunks ({round(freed / (1024 * 1024), 2)} MB)")
+        return removed
+    
     def verify_backup(self, backup_filename):
         """Verify backup integrity"""
         backup_path = os.path.join(self.backup_dir, backup_filename)
@@ -264,46 +864,209 @@ class BackupManager:
             logger.error(f"Backup file not found: {backup_path}")
             return False
         
+        result = self.check_backup(backup_filename)
+        self._update_verify_cache([result])
+        
+        if result['ok']:
+            logger.info(f"Backup verification successful: {backup_filename}")
+            logger.info(f"Tables found: {result['tables']}")
+            return True
+        
+        logger.error(f"Backup verification failed: {result['error'] or result['result']}")
+        return False
+    
+    def check_backup(self, backup_filename):
+        """Integrity-check one backup without writing it back to disk
+        
+        Compressed and chunked backups are decompressed into memory and
+        deserialized; plain .db backups are opened read-only in place. Only
+        images over ``verify_memory_limit_mb`` spill to a temporary file.
+        Stored archives are reassembled and checksummed too. Returns a result dict including the SHA-256 of the database image.
+        """
+        backup_path = os.path.join(self.backup_dir, backup_filename)
+        started = time.perf_counter()
+        result = {'filename': backup_filename, 'ok': False, 'result': None,
+                  'tables': 0, 'sha256': None, 'error': None}
+        
         try:
-            # Handle compressed backups
-            test_path = backup_path
-            if backup_filename.endswith('.gz'):
-                # Decompress to temporary file for testing
-                temp_path = backup_path + '.test'
-                with gzip.open(backup_path, 'rb') as f_in:
-                    with open(temp_path, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
-                test_path = temp_path
-            
-            # Test database integrity
-            conn = sqlite3.connect(test_path)
-            cursor = conn.cursor()
+            stat = os.stat(backup_path)
+            result['size'] = stat.st_size
+            result['mtime_ns'] = stat.st_mtime_ns
             
-            # Run integrity check
-            cursor.execute("PRAGMA integrity_check")
-            result = cursor.fetchone()[0]
+            if backup_filename.endswith(MANIFEST_SUFFIX):
+                snapshot = self._read_chunked_backup(backup_path)
+                result['sha256'] = hashlib.sha256(snapshot).hexdigest()
+                with self._open_snapshot(snapshot) as conn:
+                    self._run_integrity_check(conn, result)
             
-            # Count tables and records
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tables = cursor.fetchall()
+            elif backup_filename.endswith('.db'):
+                result['sha256'] = self._file_sha256(backup_path)
+                uri = f"file:{backup_path}?mode=ro&immutable=1"
+                conn = sqlite3.connect(uri, uri=True)
+                try:
+                    self._run_integrity_check(conn, result)
+                finally:
+                    conn.close()
             
-            conn.close()
+            else:
+                self._check_compressed_backup(backup_path, result)
             
-            # Clean up temporary file if created
-            if test_path != backup_path:
-                os.remove(test_path)
+            archives = self._backup_archives(backup_filename)
+            self._check_archive_chunks(archives)
+            result['archives'] = len(archives)
+        
+        except Exception as e:
+            result['ok'] = False
+            result['error'] = str(e)
+        
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        return result
+    
+    def _check_compressed_backup(self, backup_path, result):
+        """Decompress into memory (or a spill file past the limit) and check"""
+        limit = self.config['verify_memory_limit_mb'] * 1024 * 1024
+        hasher = hashlib.sha256()
+        image = bytearray()
+        spill = None
+        
+        try:
+            with open_backup_file(backup_path) as f_in:
+                for block in iter(lambda: f_in.read(COMPRESS_BLOCK_SIZE), b''):
+                    hasher.update(block)
+                    if spill is None and len(image) + len(block) > limit:
+                        spill = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+                        spill.write(image)
+                        image = None
+                    if spill is not None:
+                        spill.write(block)
+                    else:
+                        image.extend(block)
+            result['sha256'] = hasher.hexdigest()
             
-            if result == 'ok':
-                logger.info(f"Backup verification successful: {backup_filename}")
-                logger.info(f"Tables found: {len(tables)}")
-                return True
+            if spill is None:
+                with self._open_snapshot(image) as conn:
+                    self._run_integrity_check(conn, result)
             else:
-                logger.error(f"Backup verification failed: {result}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Failed to verify backup: {e}")
-            return False
+                spill.close()
+                conn = sqlite3.connect(spill.name)
+                try:
+                    self._run_integrity_check(conn, result)
+                finally:
+                    conn.close()
+        finally:
+            if spill is not None:
+                spill.close()
+                os.remove(spill.name)
+    
+    def _run_integrity_check(self, conn, result):
+        cursor = conn.cursor()
+        
+        # Run integrity check
+        cursor.execute("PRAGMA integrity_check")
+        result['result'] = cursor.fetchone()[0]
+        
+        # Count tables
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        result['tables'] = len(cursor.fetchall())
+        result['ok'] = result['result'] == 'ok'
+    
+    def _file_sha256(self, path):
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(COMPRESS_BLOCK_SIZE), b''):
+                hasher.update(block)
+        return hasher.hexdigest()
+    
+    def _load_verify_cache(self):
+        cache_path = os.path.join(self.backup_dir, VERIFY_CACHE_FILE)
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, 'r') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable verification cache: {e}")
+        return {}
+    
+    def _update_verify_cache(self, results, prune=False):
+        """Record verification results; prune drops entries for deleted backups"""
+        cache = self._load_verify_cache()
+        verified_at = datetime.now().isoformat()
+        for result in results:
+            if 'mtime_ns' in result:
+                cache[result['filename']] = {**result, 'verified_at': verified_at}
+        if prune:
+            existing = set(os.listdir(self.backup_dir))
+            cache = {name: entry for name, entry in cache.items() if name in existing}
+        try:
+            self._write_atomic(os.path.join(self.backup_dir, VERIFY_CACHE_FILE),
+                               json.dumps(cache, indent=2).encode('utf-8'))
+        except OSError as e:
+            logger.warning(f"Failed to save verification cache: {e}")
+    
+    def verify_all_backups(self, force=False, workers=None, filenames=None):
+        """Verify every backup concurrently in a thread pool
+        
+        Decompression, hashing and SQLite's integrity check all release the
+        GIL, so threads run in parallel; unlike a forked process pool they
+        are also safe to start from the threaded API server and job runner.
+        Backups whose size and mtime match a cached result are not re-read
+        unless ``force`` is set. ``filenames`` limits the run to those
+        backups. Returns a summary report.
+        """
+        started = time.perf_counter()
+        cache = {} if force else self._load_verify_cache()
+        
+        if filenames is None:
+            filenames = [backup['filename'] for backup in self.list_backups()]
+        
+        results = []
+        pending = []
+        for filename in filenames:
+            stat = os.stat(os.path.join(self.backup_dir, filename))
+            cached = cache.get(filename)
+            if (cached and cached.get('size') == stat.st_size
+                    and cached.get('mtime_ns') == stat.st_mtime_ns):
+                results.append({**cached, 'cached': True})
+            else:
+                pending.append(filename)
+        
+        if pending:
+            workers = workers or self.config['verify_workers'] or os.cpu_count() or 1
+            checked = []
+            with ThreadPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+                for result in executor.map(self.check_backup, pending):
+                    checked.append(result)
+                    self._report('verify', len(checked), len(pending))
+            for result in checked:
+                result['cached'] = False
+            results.extend(checked)
+        
+        self._update_verify_cache([r for r in results if not r['cached']], prune=True)
+        
+        latencies = sorted(r['seconds'] for r in results if not r['cached'])
+        failures = [r for r in results if not r['ok']]
+        for failure in failures:
+            logger.error(f"Backup verification failed: {failure['filename']}: "
+                         f"{failure['error'] or failure['result']}")
+        
+        results.sort(key=lambda r: r['filename'])
+        return {
+            'total': len(results),
+            'verified': len(latencies),
+            'cached': len(results) - len(latencies),
+            'passed': len(results) - len(failures),
+            'failed': len(failures),
+            'failures': [{'filename': r['filename'], 'error': r['error'] or r['result']}
+                         for r in failures],
+            'latency': {
+                'min_s': latencies[0] if latencies else None,
+                'max_s': latencies[-1] if latencies else None,
+                'mean_s': round(sum(latencies) / len(latencies), 3) if latencies else None,
+                'p95_s': latencies[int(0.95 * (len(latencies) - 1))] if latencies else None
+            },
+            'seconds': round(time.perf_counter() - started, 3),
+            'results': results
+        }
     
     def setup_cron_job(self, schedule='daily'):
         """Setup cron job for automatic backups"""
@@ -392,9 +1155,15 @@ class BackupManager:
 def main():
     parser = argparse.ArgumentParser(description='Data Usage Monitor Backup Manager')
     parser.add_argument('--backup', action='store_true', help='Create a backup')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Store the backup in the deduplicating chunk store')
+    parser.add_argument('--codec', type=str, choices=sorted(CODECS), help='Compression codec for full backups')
+    parser.add_argument('--level', type=int, help='Compression level for full backups')
     parser.add_argument('--restore', type=str, help='Restore from backup file')
     parser.add_argument('--list', action='store_true', help='List all backups')
     parser.add_argument('--verify', type=str, help='Verify backup integrity')
+    parser.add_argument('--verify-all', action='store_true', help='Verify every backup in parallel')
+    parser.add_argument('--force', action='store_true', help='Re-verify backups with a cached result')
     parser.add_argument('--cleanup', action='store_true', help='Clean up old backups')
     parser.add_argument('--setup-cron', type=str, choices=['hourly', 'daily', 'weekly', 'monthly'], 
                        help='Setup automatic backup schedule')
@@ -409,11 +1178,17 @@ def main():
     
     # Initialize backup manager
     backup_manager = BackupManager(args.db_path, args.backup_dir)
+    if args.codec:
+        backup_manager.config['compression_codec'] = args.codec
+    if args.level is not None:
+        backup_manager.config['compression_level'] = args.level
     
     if args.backup:
-        result = backup_manager.create_backup()
+        result = backup_manager.create_backup(incremental=True if args.incremental else None)
         if result:
             print(f"Backup created: {result['filename']} ({result['size_mb']} MB)")
+            if 'ratio' in result:
+                print(f"Codec: {result['codec']}, ratio {result['ratio']}, {result['throughput_mb_s']} MB/s")
         else:
             sys.exit(1)
     
@@ -425,11 +1200,11 @@ def main():
     elif args.list:
         backups = backup_manager.list_backups()
         if backups:
-            print(f"{'Filename':<40} {'Size (MB)':<10} {'Created':<20} {'Compressed'}")
-            print("-" * 80)
+            print(f"{'Filename':<45} {'Size (MB)':<10} {'Created':<20} {'Compressed':<11} {'Format'}")
+            print("-" * 95)
             for backup in backups:
                 compressed = "Yes" if backup['compressed'] else "No"
-                print(f"{backup['filename']:<40} {backup['size_mb']:<10} {backup['created'].strftime('%Y-%m-%d %H:%M'):<20} {compressed}")
+                print(f"{backup['filename']:<45} {backup['size_mb']:<10} {backup['created'].strftime('%Y-%m-%d %H:%M'):<20} {compressed:<11} {backup['format']}")
         else:
             print("No backups found")
     
@@ -438,6 +1213,23 @@ def main():
         if not success:
             sys.exit(1)
     
+    elif args.verify_all:
+        report = backup_manager.verify_all_backups(force=args.force)
+        print(f"{'Filename':<45} {'Result':<8} {'Time (s)':<10} {'SHA-256':<16}")
+        print("-" * 82)
+        for result in report['results']:
+            status = 'OK' if result['ok'] else 'FAILED'
+            seconds = 'cached' if result['cached'] else result['seconds']
+            print(f"{result['filename']:<45} {status:<8} {seconds:<10} {(result['sha256'] or '-')[:16]:<16}")
+        latency = report['latency']
+        print(f"\n{report['total']} backups: {report['passed']} passed, {report['failed']} failed, "
+              f"{report['cached']} from cache ({report['seconds']}s total)")
+        if report['verified']:
+            print(f"Latency: min {latency['min_s']}s, mean {latency['mean_s']}s, "
+                  f"p95 {latency['p95_s']}s, max {latency['max_s']}s")
+        if report['failed']:
+            sys.exit(1)
+    
     elif args.cleanup:
         backup_manager.cleanup_old_backups()
     
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Synthetic Data Generator for Data Usage Monitor
+Writes usage reports in the WEEKLY_REPORTS CSV layout, and optionally imports
+them into a database, at any scale from a few sites to thousands
+"""
+
+import os
+import sys
+import csv
+import math
+import random
+import argparse
+import time
+from datetime import date, timedelta
+import logging
+
+# Project root, for the shared database.py module
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Named scales: (locations, days)
+SCALES = {
+    'tiny': (20, 90),
+    'small': (100, 365),
+    'medium': (500, 730),
+    'large': (2000, 1825),
+    'xlarge': (5000, 3650),
+}
+
+# Same first-column format as the weekly reports, with the year spelled out
+# so multi-year reports import unambiguously
+REPORT_DATE_FORMAT = '%d-%b-%Y'
+
+# Share of cells left blank (site not reporting) and reported as zero (outage)
+BLANK_RATE = 0.02
+ZERO_RATE = 0.01
+
+# Relative usage by weekday, Monday first: offices and cafes are quieter at weekends
+WEEKDAY_FACTORS = (1.1, 1.1, 1.05, 1.05, 1.0, 0.7, 0.6)
+
+SITE_KINDS = ('HQ', 'Lodge', 'Hotel', 'Cafe', 'Office', 'Clinic', 'School', 'Plaza', 'FM', 'POC')
+
+def location_names(count):
+    """Distinct, report-like site names"""
+    return [f"Site {index + 1:0{len(str(count))}d} {SITE_KINDS[index % len(SITE_KINDS)]}"
+            for index in range(count)]
+
+def report_value(value):
+    """Round like the reports do: two significant figures, one decimal below 10"""
+    if value <= 0:
+        return '0'
+    if value < 10:
+        return f"{value:.1f}"
+    return str(int(round(value, -int(math.floor(math.log10(value))) + 1)))
+
+def generate_report(path, locations=20, days=90, end_date=None, seed=42):
+    """Write a wide usage report of days x locations to path
+
+    Each site has a lognormal base level, slow growth and a weekly pattern
+    with multiplicative noise, plus occasional blanks and zero days. The
+    same seed always gives the same values. Returns a stats dict.
+    """
+    rng = random.Random(seed)
+    end_date = end_date or date.today()
+    start_date = end_date - timedelta(days=days - 1)
+
+    bases = [rng.lognormvariate(3.0, 0.9) for _ in range(locations)]
+    growth = [rng.uniform(-0.0002, 0.001) for _ in range(locations)]
+    noise = [rng.uniform(0.15, 0.5) for _ in range(locations)]
+
+    started = time.perf_counter()
+    cells = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Date'] + location_names(locations))
+        for day in range(days):
+            current = start_date + timedelta(days=day)
+            weekday = WEEKDAY_FACTORS[current.weekday()]
+            row = [current.strftime(REPORT_DATE_FORMAT)]
+            for column in range(locations):
+                draw = rng.random()
+                if draw < BLANK_RATE:
+                    row.append('')
+                    continue
+                cells += 1
+                if draw < BLANK_RATE + ZERO_RATE:
+                    row.append('0')
+                    continue
+                level = bases[column] * weekday * math.exp(growth[column] * day)
+                row.append(report_value(level * rng.lognormvariate(0, noise[column])))
+            writer.writerow(row)
+
+    elapsed = time.perf_counter() - started
+    stats = {
+        'path': path,
+        'locations': locations,
+        'days': days,
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'cells': cells,
+        'size_mb': round(os.path.getsize(path) / (1024 * 1024), 2),
+        'seconds': round(elapsed, 3)
+    }
+    logger.info(f"Generated {locations} locations x {days} days ({cells} values, "
+                f"{stats['size_mb']} MB) in {stats['seconds']}s")
+    return stats
+
+def build_database(db_path, csv_path):
+    """Create db_path and import csv_path into it; returns the import stats"""
+    from database import DatabaseManager
+
+    manager = DatabaseManager(db_path)
+    if not manager.initialize_database():
+        raise RuntimeError(f"Failed to initialize database: {db_path}")
+    stats = manager.bulk_import_daily_usage(csv_path, create_locations=True)
+    if stats is None:
+        raise RuntimeError(f"Failed to import {csv_path}")
+    return stats
+
+def main():
+    """Main function for command line usage"""
+    parser = argparse.ArgumentParser(description='Generate synthetic usage reports')
+    parser.add_argument('--scale', choices=sorted(SCALES, key=lambda name: SCALES[name]), default='tiny',
+                        help='Named size (locations x days)')
+    parser.add_argument('--locations', type=int, help='Number of locations (overrides --scale)')
+    parser.add_argument('--days', type=int, help='Number of days (overrides --scale)')
+    parser.add_argument('--end-date', type=date.fromisoformat, help='Last report date (default: today)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+    parser.add_argument('--csv', default='synthetic_usage.csv', help='Output CSV path')
+    parser.add_argument('--db', help='Also import the report into this database')
+
+    args = parser.parse_args()
+
+    locations, days = SCALES[args.scale]
+    stats = generate_report(args.csv, args.locations or locations, args.days or days,
+                            args.end_date, args.seed)
+    print(f"Wrote {stats['cells']} values to {stats['path']} ({stats['size_mb']} MB)")
+
+    if args.db:
+        import_stats = build_database(args.db, args.csv)
+        print(f"Imported {import_stats['rows']} values into {args.db} "
+              f"({import_stats['rows_per_sec']} rows/sec)")
+
+if __name__ == "__main__":
+    main()
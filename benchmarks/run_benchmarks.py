@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite for Data Usage Monitor
+Times the CSV importer, every API route, the server's cold start, backup,
+verify and restore against a synthetic dataset, compares the daily_usage
+storage layouts, writes the results as JSON
+and fails on regressions against a stored baseline
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import csv
+import sqlite3
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+import logging
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+API_DIR = os.path.join(ROOT_DIR, 'data-usage-api')
+# Project root for database.py and backup_manager.py, and the API package
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(1, API_DIR)
+
+from generate_data import SCALES, build_database, generate_report
+
+logger = logging.getLogger(__name__)
+
+BASELINE_DIR = os.path.join(BENCH_DIR, 'baselines')
+SERVE_SCRIPT = os.path.join(API_DIR, 'src', 'serve.py')
+
+# A metric regresses when it is this much slower than the baseline...
+DEFAULT_TOLERANCE = 0.5
+# ...and slower by at least this much, so sub-millisecond noise never fails a run
+DEFAULT_MIN_DELTA_MS = 5.0
+
+# Routes not timed through the test client, with the reason
+SKIPPED_ROUTES = {
+    ('/api/dashboard/changes/stream', 'GET'): 'long-lived SSE stream',
+    ('/api/system/backup', 'POST'): 'background job; timed directly in the backup phase',
+    ('/api/system/restore', 'POST'): 'background job; timed directly in the restore phase',
+    ('/api/system/verify', 'POST'): 'background job; timed directly in the verify phase',
+    ('/api/system/anomalies/backfill', 'POST'): 'background job over the whole history',
+}
+
+def summarize(samples_ms):
+    """min/median/p95/mean of a list of millisecond timings"""
+    ordered = sorted(samples_ms)
+    return {
+        'runs': len(ordered),
+        'min_ms': round(ordered[0], 3),
+        'median_ms': round(statistics.median(ordered), 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        'mean_ms': round(statistics.fmean(ordered), 3)
+    }
+
+def timed(func, *args, **kwargs):
+    """(result, elapsed ms) of one call"""
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+def settle(app, timeout=10):
+    """Let background work triggered by a write finish before the next run
+
+    Writes wake the change feed, whose listeners (anomaly scoring) would
+    otherwise run concurrently with, and be timed as part of, the next
+    request.
+    """
+    from src.services.changes import get_last_seq
+
+    feed = app.extensions.get('change_feed')
+    engine = app.extensions.get('anomaly_engine')
+    with app.extensions['db_pool'].connection() as conn:
+        last_seq = get_last_seq(conn)
+        deadline = time.monotonic() + timeout
+        while (feed is not None and last_seq is not None and (feed.head or 0) < last_seq
+               and time.monotonic() < deadline):
+            feed.notify()
+            time.sleep(0.001)
+        if engine is not None:
+            # Waits for an update already running on the feed thread
+            engine.update(conn)
+
+def route_cases(ctx):
+    """Requests for every route, as (name, method, path, kwargs_for(i))
+
+    Read routes come first so writes do not change what they measure. Write
+    routes get a fresh target per run where the route consumes it.
+    """
+    location = ctx['location_id']
+    recent = ctx['end_date']
+    start = (datetime.fromisoformat(recent) - timedelta(days=30)).date().isoformat()
+    month_ago = (datetime.fromisoformat(recent) - timedelta(days=60)).date().isoformat()
+    static_path = ctx['static_path']
+
+    def query(**params):
+        return lambda i: {'query_string': params}
+
+    def fixed(**kwargs):
+        return lambda i: kwargs
+
+    cases = [
+        ('health', 'GET', '/health', fixed()),
+        ('index', 'GET', '/', fixed()),
+        ('static_asset', 'GET', f"/{static_path}", fixed(headers={'Accept-Encoding': 'br, gzip'})),
+        ('locations', 'GET', '/api/data/locations', fixed()),
+        ('daily_usage_range', 'GET', '/api/data/daily-usage',
+         query(start_date=start, end_date=recent)),
+        ('daily_usage_location', 'GET', '/api/data/daily-usage', query(location_id=location)),
+        ('daily_usage_page', 'GET', '/api/data/daily-usage', query(cursor='', limit=500)),
+        ('daily_usage_stream', 'GET', '/api/data/daily-usage', query(stream=1)),
+        ('export_all', 'GET', '/api/data/export', fixed()),
+        ('export_range_gzip', 'GET', '/api/data/export',
+         query(start_date=start, end_date=recent, location_id=location, gzip=1)),
+        ('monthly_summary', 'GET', '/api/data/monthly-summary', fixed()),
+        ('overview', 'GET', '/api/dashboard/overview', fixed()),
+        ('usage_trends_30d', 'GET', '/api/dashboard/usage-trends', query(days=30)),
+        ('usage_trends_all', 'GET', '/api/dashboard/usage-trends', query(days=0, max_points=500)),
+        ('usage_trends_weekly', 'GET', '/api/dashboard/usage-trends', query(days=365, bucket='week')),
+        ('usage_trends_location', 'GET', '/api/dashboard/usage-trends', query(days=90, location_id=location)),
+        ('location_summary', 'GET', '/api/dashboard/location-summary', query(period='month')),
+        ('location_summary_year', 'GET', '/api/dashboard/location-summary', query(period='year')),
+        ('cycle_summary', 'GET', '/api/dashboard/cycle-summary', query(cycles=6)),
+        ('recent_updates', 'GET', '/api/dashboard/recent-updates', query(limit=50)),
+        ('anomalies', 'GET', '/api/dashboard/anomalies', query(days=0)),
+        ('forecast', 'GET', '/api/dashboard/forecast', query(as_of=recent)),
+        ('changes', 'GET', '/api/dashboard/changes', query(since=0)),
+        ('system_status', 'GET', '/api/system/status', fixed()),
+        ('status_history', 'GET', '/api/system/status/history', fixed()),
+        ('database_info', 'GET', '/api/system/database-info', fixed()),
+        ('jobs', 'GET', '/api/system/jobs', fixed()),
+        ('job', 'GET', '/api/system/jobs/missing', fixed()),
+        ('backups', 'GET', '/api/system/backups', fixed()),
+        ('db_pool', 'GET', '/api/system/db-pool', fixed()),
+        ('cache_stats', 'GET', '/api/system/cache', fixed()),
+        ('usage_matrix_stats', 'GET', '/api/system/usage-matrix', fixed()),
+        ('change_feed_stats', 'GET', '/api/system/change-feed', fixed()),
+        ('assets', 'GET', '/api/system/assets', fixed()),
+        ('migrations', 'GET', '/api/system/migrations', fixed()),
+        ('archives', 'GET', '/api/system/archives', fixed()),
+        ('metrics', 'GET', '/api/system/metrics', fixed()),
+        ('metrics_json', 'GET', '/api/system/metrics', query(format='json')),
+        ('profiles', 'GET', '/api/system/profiles', fixed()),
+        ('profile', 'GET', '/api/system/profiles/missing', fixed()),
+        ('profile_file', 'GET', '/api/system/profiles/missing/pstats', fixed()),
+        ('profile_delete', 'DELETE', '/api/system/profiles/missing', fixed()),
+        ('logs', 'GET', '/api/system/logs', fixed()),
+
+        # Writes
+        ('daily_usage_upsert', 'POST', '/api/data/daily-usage',
+         lambda i: {'json': {'date': recent, 'location_id': location, 'usage_gb': 10.0 + i}}),
+        ('daily_usage_batch_500', 'POST', '/api/data/daily-usage/batch',
+         lambda i: {'json': [{'date': (datetime.fromisoformat(month_ago) + timedelta(days=day)).date().isoformat(),
+                              'location_id': location_id, 'usage_gb': 1.0 + i + day}
+                             for day in range(5) for location_id in ctx['location_ids'][:100]]}),
+        ('daily_usage_update', 'PUT', None,
+         lambda i: {'path': f"/api/data/daily-usage/{ctx['usage_ids'][i]}", 'json': {'usage_gb': 5.0 + i}}),
+        ('daily_usage_delete', 'DELETE', None,
+         lambda i: {'path': f"/api/data/daily-usage/{ctx['usage_ids'][-1 - i]}"}),
+        ('daily_usage_delete_range', 'DELETE', '/api/data/daily-usage/batch',
+         lambda i: {'query_string': {'start_date': ctx['old_dates'][i], 'end_date': ctx['old_dates'][i]}}),
+        ('monthly_summary_save', 'POST', '/api/data/monthly-summary',
+         lambda i: {'json': {'period_start': month_ago, 'period_end': recent, 'location_id': location,
+                             'total_usage_gb': 100.0 + i}}),
+        ('import_week', 'POST', '/api/data/import',
+         lambda i: {'data': {'file': (open(ctx['week_csv'], 'rb'), 'week.csv')},
+                    'content_type': 'multipart/form-data'}),
+    ]
+    return cases
+
+def bench_routes(db_path, work_dir, repeat, csv_stats):
+    """Time every route through the Flask test client"""
+    os.environ['DATABASE_PATH'] = db_path
+    os.environ['BACKUP_DIR'] = os.path.join(work_dir, 'backups')
+
+    results = {}
+    _, import_ms = timed(__import__, 'src.main')
+    main_module = sys.modules['src.main']
+    app, create_ms = timed(main_module.create_app)
+    results['app_startup'] = {'runs': 1, 'median_ms': round(import_ms + create_ms, 3)}
+    client = app.test_client()
+    response_cache = app.extensions['response_cache']
+
+    with sqlite3.connect(db_path) as conn:
+        location_ids = [row[0] for row in conn.execute("SELECT id FROM locations ORDER BY id")]
+        # Rows far from the read windows, consumed by the update/delete cases
+        usage_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM daily_usage ORDER BY day, location_id LIMIT ?", (2 * repeat + 2,))]
+        old_dates = [row[0] for row in conn.execute(
+            "SELECT DISTINCT date FROM daily_usage ORDER BY date LIMIT ? OFFSET 10", (repeat + 1,))]
+
+    week_csv = os.path.join(work_dir, 'week.csv')
+    generate_report(week_csv, csv_stats['locations'], 7,
+                    datetime.fromisoformat(csv_stats['end_date']).date(), seed=7)
+    manifest = app.extensions['asset_manifest'].manifest()
+    ctx = {
+        'location_id': location_ids[len(location_ids) // 2],
+        'location_ids': location_ids,
+        'usage_ids': usage_ids,
+        'old_dates': old_dates,
+        'end_date': csv_stats['end_date'],
+        'week_csv': week_csv,
+        'static_path': manifest['app.js']['hashed_path'] if 'app.js' in manifest else 'app.js'
+    }
+
+    adapter = app.url_map.bind('localhost')
+    covered = set()
+    for name, method, path, request_for in route_cases(ctx):
+        samples = []
+        cold_ms = None
+        statuses = set()
+        for i in range(repeat + 1):
+            kwargs = request_for(i)
+            url = kwargs.pop('path', path)
+            # Time the work behind each request, not the response cache
+            response_cache.clear()
+            response, elapsed = timed(client.open, url, method=method, **kwargs)
+            response.get_data()
+            statuses.add(response.status_code)
+            if i == 0:
+                cold_ms = elapsed
+                rule, _ = adapter.match(url, method=method, return_rule=True)
+                covered.add((rule.rule, method))
+            else:
+                samples.append(elapsed)
+            if method != 'GET':
+                settle(app)
+
+        results[f"route:{name}"] = {**summarize(samples), 'cold_ms': round(cold_ms, 3),
+                                    'status': sorted(statuses)}
+        if any(status >= 500 for status in statuses):
+            logger.warning(f"Route {name} returned {sorted(statuses)}")
+
+    registered = {(rule.rule, method) for rule in app.url_map.iter_rules()
+                  if rule.endpoint != 'static'
+                  for method in rule.methods - {'HEAD', 'OPTIONS'}}
+    uncovered = sorted(registered - covered - set(SKIPPED_ROUTES))
+    for rule, method in uncovered:
+        logger.warning(f"No benchmark for {method} {rule}")
+
+    main_module.shutdown_app(app, timeout=5)
+    return results, uncovered
+
+def bench_startup(db_path, work_dir, repeat, budget=None):
+    """Cold-start the production server in fresh processes, as on boot
+
+    Each run imports, builds and warms the app through ``serve.py --check``.
+    Returns the metrics and whether the median stayed within the budget.
+    """
+    env = {**os.environ, 'DATABASE_PATH': db_path, 'BACKUP_DIR': os.path.join(work_dir, 'backups')}
+    command = [sys.executable, SERVE_SCRIPT, '--check']
+    if budget is not None:
+        command += ['--startup-budget', str(budget)]
+
+    reports = []
+    for _ in range(repeat):
+        completed = subprocess.run(command, env=env, capture_output=True, text=True)
+        if completed.returncode not in (0, 1):
+            raise RuntimeError(f"serve.py --check failed: {completed.stderr.strip()[-500:]}")
+        reports.append(json.loads(completed.stdout))
+
+    budget_seconds = reports[0]['budget_seconds']
+    results = {'startup:cold': {**summarize([report['startup_seconds'] * 1000 for report in reports]),
+                                'budget_ms': budget_seconds * 1000}}
+    for part in ('import', 'create_app', 'warm_up'):
+        results[f"startup:{part}"] = summarize([report[f"{part}_seconds"] * 1000 for report in reports])
+    return results, results['startup:cold']['median_ms'] <= budget_seconds * 1000
+
+def bench_backups(db_path, work_dir, repeat):
+    """Time full and incremental backups, their verification and a restore"""
+    from backup_manager import BackupManager
+
+    manager = BackupManager(db_path, os.path.join(work_dir, 'bench_backups'))
+    # Keep every backup made here; timings should not include cleanup of earlier runs
+    manager.config['max_backups'] = 10 * repeat + 10
+
+    results = {}
+    first = {}
+    for step, incremental in (('full', False), ('incremental', True)):
+        samples = []
+        for i in range(repeat):
+            backup, elapsed = timed(manager.create_backup, f"bench_{step}_{i}", incremental=incremental)
+            if not backup:
+                raise RuntimeError(f"{step} backup failed")
+            samples.append(elapsed)
+            first.setdefault(step, backup)
+        results[f"backup:{step}"] = {**summarize(samples), 'size_mb': first[step].get('size_mb')}
+
+    for step, backup in first.items():
+        samples = []
+        for _ in range(repeat):
+            result, elapsed = timed(manager.check_backup, backup['filename'])
+            if not result['ok']:
+                raise RuntimeError(f"Verification of {backup['filename']} failed: {result['error'] or result['result']}")
+            samples.append(elapsed)
+        results[f"verify:{step}"] = summarize(samples)
+
+    # Restores include the pre-restore safety backup, as in production
+    for step, backup in first.items():
+        ok, elapsed = timed(manager.restore_backup, backup['filename'], confirm=True)
+        if not ok:
+            raise RuntimeError(f"Restore of {backup['filename']} failed")
+        results[f"restore:{step}"] = {'runs': 1, 'median_ms': round(elapsed, 3)}
+    return results
+
+def bench_storage(csv_path, work_dir, repeat):
+    """Compare the row-per-cell daily_usage layout with the compact one
+
+    Loads the report into a database stopped before migration 7, times its
+    scans and file size, migrates it and times the same scans again.
+    """
+    from database import iter_report_rows, to_day
+    from migrations import migrate
+
+    db_path = os.path.join(work_dir, 'storage.db')
+    migrate(db_path, target=6)
+    with sqlite3.connect(db_path) as conn, open(csv_path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        names = [name.strip() for name in next(reader)[1:]]
+        conn.executemany("INSERT INTO locations (name, display_name) VALUES (?, ?)",
+                         [(name, name) for name in names])
+        location_map = dict(conn.execute("SELECT name, id FROM locations"))
+        columns = [(index, location_map[name]) for index, name in enumerate(names, start=1)]
+        conn.executemany("INSERT INTO daily_usage (date, location_id, usage_gb) VALUES (?, ?, ?)",
+                         iter_report_rows(reader, columns))
+        location_ids = sorted(location_map.values())
+        last_date = conn.execute("SELECT MAX(date) FROM daily_usage").fetchone()[0]
+    year_ago = (datetime.fromisoformat(last_date) - timedelta(days=365)).date().isoformat()
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("VACUUM")
+
+    # The same questions of each layout; ``window`` is the last year in its date type
+    scans = {
+        'rowid': {
+            'window': (year_ago, last_date),
+            'location_year': "SELECT date, usage_gb FROM daily_usage WHERE location_id = ? AND date BETWEEN ? AND ?",
+            'recent_totals': "SELECT location_id, SUM(usage_gb) FROM daily_usage WHERE date >= ? GROUP BY location_id",
+            'full_scan': "SELECT COUNT(*), SUM(usage_gb) FROM daily_usage",
+        },
+        'compact': {
+            'window': (to_day(year_ago), to_day(last_date)),
+            'location_year': """SELECT day, usage_gb FROM daily_usage_compact
+                                WHERE location_id = ? AND day BETWEEN ? AND ?""",
+            # The same through the view, which formats every day as a date
+            'location_year_view': "SELECT date, usage_gb FROM daily_usage WHERE location_id = ? AND day BETWEEN ? AND ?",
+            'recent_totals': """SELECT location_id, SUM(usage_gb) FROM daily_usage_compact
+                                WHERE day >= ? GROUP BY location_id""",
+            'full_scan': "SELECT COUNT(*), SUM(usage_gb) FROM daily_usage_compact",
+        },
+    }
+
+    def measure(layout):
+        queries = scans[layout]
+        start, end = queries['window']
+        # Every location's year, as the per-location routes read it
+        runs = {name: (lambda conn, sql=queries[name]: [conn.execute(sql, (location_id, start, end)).fetchall()
+                                                        for location_id in location_ids])
+                for name in ('location_year', 'location_year_view') if name in queries}
+        runs.update({
+            'recent_totals': lambda conn: conn.execute(queries['recent_totals'], (start,)).fetchall(),
+            'full_scan': lambda conn: conn.execute(queries['full_scan']).fetchall(),
+        })
+        metrics = {}
+        with sqlite3.connect(db_path) as conn:
+            for name, run_scan in runs.items():
+                metrics[f"storage:{layout}:{name}"] = summarize([timed(run_scan, conn)[1] for _ in range(repeat)])
+        metrics[f"storage:{layout}:full_scan"]['size_mb'] = round(os.path.getsize(db_path) / (1024 * 1024), 2)
+        return metrics
+
+    results = measure('rowid')
+    _, elapsed = timed(migrate, db_path)
+    results['storage:migrate'] = {'runs': 1, 'median_ms': round(elapsed, 3)}
+    results.update(measure('compact'))
+    return results
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE, min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    """Metrics slower than baseline by more than tolerance (and min_delta_ms)"""
+    regressions = []
+    for name, current in results['metrics'].items():
+        previous = baseline.get('metrics', {}).get(name)
+        if previous is None or current.get('median_ms') is None or previous.get('median_ms') is None:
+            continue
+        before, after = previous['median_ms'], current['median_ms']
+        if after > before * (1 + tolerance) and after - before >= min_delta_ms:
+            regressions.append({'metric': name, 'baseline_ms': before, 'current_ms': after,
+                                'ratio': round(after / before, 2) if before else None})
+    return regressions
+
+def run(scale, locations, days, repeat, work_dir, phases, startup_budget=None):
+    """Generate a dataset, run the selected phases and return the results"""
+    csv_path = os.path.join(work_dir, 'usage.csv')
+    db_path = os.path.join(work_dir, 'data_usage.db')
+    csv_stats = generate_report(csv_path, locations, days)
+
+    metrics = {}
+    import_stats, elapsed = timed(build_database, db_path, csv_path)
+    metrics['import:csv'] = {'runs': 1, 'median_ms': round(elapsed, 3),
+                             'rows': import_stats['rows'], 'rows_per_sec': import_stats['rows_per_sec']}
+
+    uncovered = []
+    if 'routes' in phases:
+        route_metrics, uncovered = bench_routes(db_path, work_dir, repeat, csv_stats)
+        metrics.update(route_metrics)
+    within_budget = None
+    if 'startup' in phases:
+        startup_metrics, within_budget = bench_startup(db_path, work_dir, repeat, startup_budget)
+        metrics.update(startup_metrics)
+    if 'backup' in phases:
+        metrics.update(bench_backups(db_path, work_dir, repeat))
+    if 'storage' in phases:
+        metrics.update(bench_storage(csv_path, work_dir, repeat))
+
+    return {
+        'meta': {
+            'scale': scale,
+            'locations': locations,
+            'days': days,
+            'rows': import_stats['rows'],
+            'db_size_mb': round(os.path.getsize(db_path) / (1024 * 1024), 2),
+            'repeat': repeat,
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': datetime.now().isoformat(timespec='seconds')
+        },
+        'metrics': metrics,
+        'uncovered_routes': [f"{method} {rule}" for rule, method in uncovered],
+        'startup_within_budget': within_budget
+    }
+
+def main():
+    """Main function for command line usage"""
+    parser = argparse.ArgumentParser(description='Data Usage Monitor Benchmarks')
+    parser.add_argument('--scale', choices=sorted(SCALES, key=lambda name: SCALES[name]), default='tiny',
+                        help='Named dataset size (locations x days)')
+    parser.add_argument('--locations', type=int, help='Number of locations (overrides --scale)')
+    parser.add_argument('--days', type=int, help='Number of days (overrides --scale)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per route and backup step')
+    parser.add_argument('--phases', nargs='+', choices=['routes', 'startup', 'backup', 'storage'],
+                        default=['routes', 'startup', 'backup', 'storage'], help='Phases to run after the import')
+    parser.add_argument('--startup-budget', type=float,
+                        help="Cold-start budget in seconds (default: serve.py's, for a Raspberry Pi)")
+    parser.add_argument('--output', help='Results JSON path (default: print only)')
+    parser.add_argument('--baseline', help='Baseline JSON to compare against (default: baselines/<scale>.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed slowdown before a metric fails, as a fraction')
+    parser.add_argument('--min-delta-ms', type=float, default=DEFAULT_MIN_DELTA_MS,
+                        help='Ignore slowdowns smaller than this many milliseconds')
+    parser.add_argument('--work-dir', help='Keep the dataset, database and backups here')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
+
+    locations, days = SCALES[args.scale]
+    locations, days = args.locations or locations, args.days or days
+    scale = args.scale if (locations, days) == SCALES[args.scale] else f"{locations}x{days}"
+
+    work_dir = os.path.abspath(args.work_dir) if args.work_dir else tempfile.mkdtemp(prefix='dum-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f"{scale}.json")
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    # Work inside the scratch directory so logs and backups stay out of the checkout
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        results = run(scale, locations, days, args.repeat, work_dir, set(args.phases), args.startup_budget)
+    finally:
+        os.chdir(cwd)
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'Metric':<40} {'Median (ms)':>12} {'p95 (ms)':>10} {'Cold (ms)':>10}")
+    print("-" * 75)
+    for name, metric in results['metrics'].items():
+        p95 = metric.get('p95_ms', '-')
+        cold = metric.get('cold_ms', '-')
+        print(f"{name:<40} {metric['median_ms']:>12} {p95:>10} {cold:>10}")
+    for route in results['uncovered_routes']:
+        print(f"Not benchmarked: {route}")
+
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {output_path}")
+
+    over_budget = results['startup_within_budget'] is False
+    if over_budget:
+        print(f"\nCold start took {results['metrics']['startup:cold']['median_ms']} ms, over the "
+              f"{results['metrics']['startup:cold']['budget_ms']} ms budget")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path}; run with --save-baseline to create one")
+        return 1 if over_budget else 0
+
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    if baseline['meta'].get('scale') != scale:
+        print(f"Baseline is for scale {baseline['meta'].get('scale')}, not {scale}; skipping comparison")
+        return 1 if over_budget else 0
+
+    regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) against {baseline_path} "
+              f"(baseline commit {baseline['meta'].get('commit')}):")
+        for regression in regressions:
+            print(f"  {regression['metric']}: {regression['baseline_ms']} ms -> "
+                  f"{regression['current_ms']} ms ({regression['ratio']}x)")
+        return 1
+    print(f"\nNo regressions against {baseline_path}")
+    return 1 if over_budget else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Shared pytest fixtures for Data Usage Monitor
+Each test gets its own migrated database in a temporary directory
+"""
+
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# The Flask app is imported as the ``src`` package, like main.py does
+sys.path.insert(0, os.path.join(ROOT, 'data-usage-api'))
+
+# test_application.py checks a deployed installation and is run by hand
+collect_ignore = ['test_application.py']
+
+# A small report in the WEEKLY_REPORTS layout, with a blank and a bad cell
+REPORT_CSV = """Date,Site A,Site B,Site C
+13-Mar,9.9,130,12
+14-Mar,19,71,
+15-Mar,4.5,n/a,7.3
+"""
+
+def write_report(path, text=REPORT_CSV):
+    with open(path, 'w', newline='') as f:
+        f.write(text)
+    return str(path)
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A migrated, empty database"""
+    from database import DatabaseManager
+    path = str(tmp_path / 'data_usage.db')
+    assert DatabaseManager(path).initialize_database()
+    return path
+
+@pytest.fixture
+def report_path(tmp_path):
+    return write_report(tmp_path / 'report.csv')
+
+@pytest.fixture
+def loaded_db(db_path, report_path):
+    """The database with REPORT_CSV imported for 2024"""
+    from database import DatabaseManager
+    assert DatabaseManager(db_path).bulk_import_daily_usage(report_path, default_year=2024)
+    return db_path
+
+@pytest.fixture
+def app_config(loaded_db, tmp_path):
+    """create_app() settings for the test database; tests may adjust them"""
+    return {
+        'TESTING': True,
+        'DATABASE_PATH': loaded_db,
+        'BACKUP_DIR': str(tmp_path / 'backups'),
+        'BACKGROUND_THREADS': False,
+        'METRICS_SQL': False,
+    }
+
+@pytest.fixture
+def app(app_config):
+    from src.main import create_app, shutdown_app
+    app = create_app(app_config)
+    yield app
+    shutdown_app(app)
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -2,48 +2,135 @@ import os
 import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+# Project root, for the shared database.py and backup_manager.py modules
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from flask import Flask, send_from_directory
+from flask import Flask
 from flask_cors import CORS
 from src.routes.data_usage import data_usage_bp
 from src.routes.dashboard import dashboard_bp
 from src.routes.system import system_bp
+from src.services import anomalies, assets, cache, changes, db, forecast, jobs, metrics, profiling, sampler, usage_matrix
+from migrations import migrate
 
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'data-usage-monitor-secret-key-2024'
+# Database configuration - using our custom SQLite database
+DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data_usage.db')
 
-# Enable CORS for all routes
-CORS(app)
+def create_app(config=None):
+    """Build the Flask app and its services
 
-# Register blueprints
-app.register_blueprint(data_usage_bp, url_prefix='/api/data')
-app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
-app.register_blueprint(system_bp, url_prefix='/api/system')
+    Settings come from the environment, with ``config`` taking precedence.
+    Set ``BACKGROUND_THREADS`` to False to build the app in a process that
+    will fork workers; each worker then calls start_background_threads().
+    """
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.config['SECRET_KEY'] = 'data-usage-monitor-secret-key-2024'
+    app.config.update(config or {})
 
-# Database configuration - using our custom SQLite database
-DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data_usage.db')
+    # Enable CORS for all routes
+    CORS(app)
+
+    # Register blueprints
+    app.register_blueprint(data_usage_bp, url_prefix='/api/data')
+    app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
+    app.register_blueprint(system_bp, url_prefix='/api/system')
+
+    app.config.setdefault('DATABASE_PATH', os.environ.get('DATABASE_PATH', DATABASE_PATH))
+    app.config.setdefault('DB_POOL_SIZE', int(os.environ.get('DB_POOL_SIZE', 8)))
+
+    # Bring the schema up to date before any connection is opened; planner
+    # check failures are logged rather than stopping the API
+    app.config.setdefault('MIGRATE_ON_STARTUP', os.environ.get('MIGRATE_ON_STARTUP', '1') != '0')
+    if app.config['MIGRATE_ON_STARTUP']:
+        migrate(app.config['DATABASE_PATH'], strict=False)
+
+    # Per-endpoint latency histograms and SQL timings behind /api/system/metrics;
+    # installed before the pool so pooled connections are instrumented
+    app.config.setdefault('METRICS_SQL', os.environ.get('METRICS_SQL', '1') != '0')
+    metrics.init_app(app)
+
+    # Opt-in cProfile/tracemalloc runs of single requests behind /api/system/profiles;
+    # without the header or sampling enabled no hooks are installed
+    app.config.setdefault('PROFILING_ENABLED', os.environ.get('PROFILING_ENABLED', '0') == '1')
+    app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.environ.get('PROFILE_SAMPLE_RATE', 0)))
+    profiling.init_app(app)
+
+    # Shared, pre-tuned connection pool used by all blueprints
+    db.init_app(app)
+
+    # Dashboard result cache, invalidated by the database change counter
+    cache.init_app(app)
+
+    # In-memory usage matrix behind the dashboard aggregates (needs NumPy)
+    app.config.setdefault('USAGE_MATRIX', os.environ.get('USAGE_MATRIX', '1') != '0')
+    app.config.setdefault('USAGE_MATRIX_MAX_CELLS', int(os.environ.get('USAGE_MATRIX_MAX_CELLS',
+                                                                       usage_matrix.DEFAULT_MAX_CELLS)))
+    usage_matrix.init_app(app)
+
+    # change_log follower behind the /api/dashboard/changes/stream live updates
+    app.config.setdefault('CHANGE_POLL_INTERVAL', float(os.environ.get('CHANGE_POLL_INTERVAL', 1)))
+    changes.init_app(app)
 
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-        return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
-
-@app.route('/health')
-def health_check():
-    return {'status': 'healthy', 'service': 'Data Usage Monitor API'}
+    # Per-location EWMA anomaly scoring, updated from the change feed
+    anomalies.init_app(app)
+
+    # End-of-cycle usage projections behind /api/dashboard/forecast
+    forecast.init_app(app)
+
+    # Background host metrics sampler behind /api/system/status
+    app.config.setdefault('SYSTEM_SAMPLE_INTERVAL', float(os.environ.get('SYSTEM_SAMPLE_INTERVAL', 5)))
+    sampler.init_app(app)
+
+    # Background backup, restore and verify jobs behind /api/system/backup
+    app.config.setdefault('BACKUP_DIR', os.environ.get('BACKUP_DIR', os.path.join(os.path.dirname(app.config['DATABASE_PATH']), 'backups')))
+    app.config.setdefault('JOB_STATE_DIR', os.environ.get('JOB_STATE_DIR'))
+    jobs.init_app(app)
+
+    # Fingerprinted, pre-compressed static files served from memory
+    app.config.setdefault('STATIC_AUTO_RELOAD', os.environ.get('STATIC_AUTO_RELOAD', '0') == '1')
+    assets.init_app(app)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        manifest = app.extensions['asset_manifest']
+        asset, immutable = manifest.lookup(path) if path != "" else (None, False)
+        if asset is None:
+            # Client-side routes fall back to the SPA shell
+            asset, immutable = manifest.lookup('index.html')
+            if asset is None:
+                return "index.html not found", 404
+        return assets.asset_response(asset, immutable)
+
+    @app.route('/health')
+    def health_check():
+        return {'status': 'healthy', 'service': 'Data Usage Monitor API'}
+
+    return app
+
+def start_background_threads(app):
+    """Start the change feed and system sampler threads, e.g. in a forked worker"""
+    app.extensions['change_feed'].start()
+    app.extensions['system_sampler'].start()
+
+def shutdown_app(app, timeout=30):
+    """Stop background work and close pooled connections
+
+    Running jobs are allowed to finish, so a restore is never cut short.
+    """
+    app.extensions['change_feed'].stop(timeout)
+    app.extensions['system_sampler'].stop(timeout)
+    app.extensions['job_runner'].shutdown(wait=True)
+    app.extensions['db_pool'].close_all()
+
+def __getattr__(name):
+    # The module-level app is built on first use, so importing create_app
+    # (as serve.py does) does not build and start a second one
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == '__main__':
     port = int(os.environ.get('FLASK_PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
-
+    create_app().run(host='0.0.0.0', port=port, debug=True)
@@ -3,63 +3,68 @@ Dashboard API Routes
 Provides aggregated data for dashboard views
 """
 
-from flask import Blueprint, request, jsonify
-import sqlite3
-import os
+from flask import Blueprint, Response, request, jsonify, current_app
+import json
+import time
 from datetime import datetime, date, timedelta
+from database import USAGE_ID_DAY_BITS, split_usage_id, to_day
+from partitions import summary_source, usage_source, usage_totals
+from src.services.anomalies import ANOMALY_KINDS, get_anomaly_engine
+from src.services.cache import cached_response
+from src.services.changes import CHANGE_BATCH_SIZE, get_change_feed, get_last_seq, read_changes
+from src.services.db import get_db_connection
+from src.services.downsample import (
+    BUCKET_MODES, MAX_POINTS, MIN_POINTS, bucket_rows, downsample_rows
+)
+from src.services.forecast import get_forecaster
+from src.services.pagination import CursorError, decode_cursor, get_page_size, page_response
+from src.services.usage_matrix import get_usage_matrix
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
-# Database path
-DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data_usage.db')
-
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
 @dashboard_bp.route('/overview', methods=['GET'])
+@cached_response
 def get_dashboard_overview():
     """Get dashboard overview data"""
     try:
         conn = get_db_connection()
+        seven_days_ago = (datetime.now() - timedelta(days=7)).date()
+        
+        # Answer from the in-memory usage matrix when it is available
+        matrix = get_usage_matrix(conn)
+        if matrix is not None:
+            return jsonify(matrix.overview(seven_days_ago))
         
         # Get total locations
         total_locations = conn.execute("SELECT COUNT(*) FROM locations WHERE is_active = 1").fetchone()[0]
         
-        # Get total daily records
-        total_records = conn.execute("SELECT COUNT(*) FROM daily_usage").fetchone()[0]
-        
-        # Get date range
-        date_range = conn.execute("SELECT MIN(date), MAX(date) FROM daily_usage").fetchone()
+        # Get total daily records and date range, archived years included
+        total_records, first_date, last_date = usage_totals(conn)
         
         # Get recent activity (last 7 days)
-        seven_days_ago = (datetime.now() - timedelta(days=7)).date()
-        recent_activity = conn.execute("""
-            SELECT COUNT(*) FROM daily_usage 
-            WHERE date >= ?
-        """, (seven_days_ago,)).fetchone()[0]
+        source = usage_source(conn, to_day(seven_days_ago))
+        recent_activity = conn.execute(f"""
+            SELECT COUNT(*) FROM {source} du
+            WHERE du.day >= ?
+        """, (to_day(seven_days_ago),)).fetchone()[0]
         
         # Get top 5 locations by recent usage
-        top_locations = conn.execute("""
+        top_locations = conn.execute(f"""
             SELECT l.display_name, SUM(du.usage_gb) as total_usage
-            FROM daily_usage du
+            FROM {source} du
             JOIN locations l ON du.location_id = l.id
-            WHERE du.date >= ?
+            WHERE du.day >= ?
             GROUP BY l.id, l.display_name
             ORDER BY total_usage DESC
             LIMIT 5
-        """, (seven_days_ago,)).fetchall()
-        
-        conn.close()
+        """, (to_day(seven_days_ago),)).fetchall()
         
         return jsonify({
             'total_locations': total_locations,
             'total_records': total_records,
             'date_range': {
-                'start': date_range[0],
-                'end': date_range[1]
+                'start': first_date,
+                'end': last_date
             },
             'recent_activity': recent_activity,
             'top_locations': [dict(row) for row in top_locations]
@@ -68,38 +73,67 @@ def get_dashboard_overview():
         return jsonify({'error': str(e)}), 500
 
 @dashboard_bp.route('/usage-trends', methods=['GET'])
+@cached_response
 def get_usage_trends():
-    """Get usage trends data for charts"""
+    """Get usage trends data for charts
+    
+    ``bucket`` (week, cycle or month) sums each location's usage per
+    calendar bucket, and ``max_points`` downsamples each location's series
+    with LTTB, so long ranges stay small enough to chart.
+    """
     try:
         days = request.args.get('days', 30, type=int)
         location_id = request.args.get('location_id')
+        bucket = request.args.get('bucket')
+        max_points = request.args.get('max_points', type=int)
+        
+        if bucket is not None and bucket not in BUCKET_MODES:
+            return jsonify({'error': f"bucket must be one of: {', '.join(BUCKET_MODES)}"}), 400
+        if max_points is not None:
+            max_points = max(MIN_POINTS, min(max_points, MAX_POINTS))
         
         start_date = (datetime.now() - timedelta(days=days)).date()
         
         conn = get_db_connection()
         
-        query = """
-            SELECT du.date, l.display_name, SUM(du.usage_gb) as daily_total
-            FROM daily_usage du
-            JOIN locations l ON du.location_id = l.id
-            WHERE du.date >= ?
-        """
-        params = [start_date]
-        
-        if location_id:
-            query += " AND du.location_id = ?"
-            params.append(location_id)
+        matrix = get_usage_matrix(conn)
+        if matrix is not None:
+            try:
+                location = int(location_id) if location_id else None
+            except ValueError:
+                return jsonify([])
+            if bucket:
+                trends = matrix.bucket_trends(start_date, bucket, location)
+            else:
+                trends = matrix.trends(start_date, location)
+        else:
+            query = f"""
+                SELECT du.date, l.display_name, SUM(du.usage_gb) as daily_total
+                FROM {usage_source(conn, to_day(start_date))} du
+                JOIN locations l ON du.location_id = l.id
+                WHERE du.day >= ?
+            """
+            params = [to_day(start_date)]
+            
+            if location_id:
+                query += " AND du.location_id = ?"
+                params.append(location_id)
+            
+            query += " GROUP BY du.day, l.id, l.display_name ORDER BY du.day"
+            
+            trends = [dict(row) for row in conn.execute(query, params).fetchall()]
+            if bucket:
+                trends = bucket_rows(trends, bucket)
         
-        query += " GROUP BY du.date, l.id, l.display_name ORDER BY du.date"
+        if max_points:
+            trends = downsample_rows(trends, max_points)
         
-        trends = conn.execute(query, params).fetchall()
-        conn.close()
-        
-        return jsonify([dict(row) for row in trends])
+        return jsonify(trends)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @dashboard_bp.route('/location-summary', methods=['GET'])
+@cached_response
 def get_location_summary():
     """Get summary data for each location"""
     try:
@@ -114,7 +148,11 @@ def get_location_summary():
         else:  # year
             date_filter = (datetime.now() - timedelta(days=365)).date()
         
-        summary = conn.execute("""
+        matrix = get_usage_matrix(conn)
+        if matrix is not None:
+            return jsonify(matrix.location_summary(date_filter))
+        
+        summary = conn.execute(f"""
             SELECT 
                 l.id,
                 l.display_name,
@@ -125,41 +163,275 @@ def get_location_summary():
                 MIN(du.usage_gb) as min_usage,
                 MAX(du.date) as last_update
             FROM locations l
-            LEFT JOIN daily_usage du ON l.id = du.location_id AND du.date >= ?
+            LEFT JOIN {usage_source(conn, to_day(date_filter))} du ON l.id = du.location_id AND du.day >= ?
             WHERE l.is_active = 1
             GROUP BY l.id, l.display_name
             ORDER BY total_usage DESC
-        """, (date_filter,)).fetchall()
+        """, (to_day(date_filter),)).fetchall()
+        
+        return jsonify([dict(row) for row in summary])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@dashboard_bp.route('/cycle-summary', methods=['GET'])
+@cached_response
+def get_cycle_summary():
+    """Get computed billing cycle (13th to 12th) totals per location
+    
+    Reads the pre-aggregated cycle_usage_totals rows for the most recent
+    ``cycles`` periods, with any manual monthly summary for comparison.
+    """
+    try:
+        cycles = request.args.get('cycles', 6, type=int)
+        location_id = request.args.get('location_id')
+        
+        conn = get_db_connection()
+        
+        # Manual entries of older cycles may be in archived years
+        oldest = conn.execute("""
+            SELECT MIN(period_start) FROM (
+                SELECT DISTINCT period_start FROM cycle_usage_totals 
+                ORDER BY period_start DESC LIMIT ?
+            )
+        """, (cycles,)).fetchone()[0]
+        
+        query = f"""
+            SELECT 
+                ct.period_start,
+                ct.period_end,
+                l.id as location_id,
+                l.display_name,
+                ct.total_usage_gb,
+                ct.day_count,
+                ms.total_usage_gb as manual_total_gb,
+                ms.id IS NOT NULL as has_manual_entry
+            FROM cycle_usage_totals ct
+            JOIN locations l ON ct.location_id = l.id
+            LEFT JOIN {summary_source(conn, oldest)} ms 
+                ON ms.period_start = ct.period_start AND ms.location_id = ct.location_id
+            WHERE ct.period_start IN (
+                SELECT DISTINCT period_start FROM cycle_usage_totals 
+                ORDER BY period_start DESC LIMIT ?
+            )
+        """
+        params = [cycles]
+        
+        if location_id:
+            query += " AND ct.location_id = ?"
+            params.append(location_id)
+        
+        query += " ORDER BY ct.period_start DESC, l.display_name"
         
-        conn.close()
+        summary = conn.execute(query, params).fetchall()
         
         return jsonify([dict(row) for row in summary])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @dashboard_bp.route('/recent-updates', methods=['GET'])
+@cached_response
 def get_recent_updates():
-    """Get recent data updates"""
+    """Get recent data updates
+    
+    Pass ``cursor`` (empty for the first page) to page further back through
+    history, keyed on (updated_at, id). Reads the compact table directly, as
+    its updated_at index orders by the stored Unix time.
+    """
     try:
         limit = request.args.get('limit', 10, type=int)
+        paged = 'cursor' in request.args
+        after = decode_cursor(request.args.get('cursor'), 2,
+                              types=(datetime.fromisoformat, split_usage_id)) if paged else None
         
         conn = get_db_connection()
         
-        recent = conn.execute("""
+        query = f"""
             SELECT 
-                du.date,
+                (du.location_id << {USAGE_ID_DAY_BITS}) + du.day AS id,
+                date(du.day * 86400, 'unixepoch') AS date,
                 du.usage_gb,
-                du.updated_at,
+                datetime(du.updated_at, 'unixepoch') AS updated_at,
                 l.display_name
-            FROM daily_usage du
+            FROM daily_usage_compact du
             JOIN locations l ON du.location_id = l.id
-            ORDER BY du.updated_at DESC
-            LIMIT ?
-        """, (limit,)).fetchall()
+        """
+        params = []
+        
+        if after:
+            # id order is (location_id, day) order
+            query += " WHERE (du.updated_at, du.location_id, du.day) < (CAST(strftime('%s', ?) AS INTEGER), ?, ?)"
+            params.extend([after[0].isoformat(' '), *after[1]])
+        
+        if paged:
+            limit = get_page_size(request.args, default=limit)
+        
+        query += " ORDER BY du.updated_at DESC, du.location_id DESC, du.day DESC LIMIT ?"
+        params.append(limit + 1 if paged else limit)
+        
+        recent = conn.execute(query, params).fetchall()
         
-        conn.close()
+        if paged:
+            return page_response(recent, limit, lambda row: (row['updated_at'], row['id']))
         
         return jsonify([dict(row) for row in recent])
+    except (CursorError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@dashboard_bp.route('/anomalies', methods=['GET'])
+def get_anomalies():
+    """Get days whose usage spiked, dropped or went to zero, newest first
+    
+    Filters: ``days`` back from today (default 30, 0 for all history),
+    ``location_id`` and ``kind``. Not response-cached: scores are stored
+    after the data version they belong to has moved on.
+    """
+    try:
+        days = request.args.get('days', 30, type=int)
+        location_id = request.args.get('location_id', type=int)
+        kind = request.args.get('kind')
+        limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+        
+        if kind is not None and kind not in ANOMALY_KINDS:
+            return jsonify({'error': f"kind must be one of: {', '.join(ANOMALY_KINDS)}"}), 400
+        
+        # Read-only: the scoring process keeps the stored anomalies current
+        conn = get_db_connection()
+        engine = get_anomaly_engine()
+        
+        since = (datetime.now() - timedelta(days=days)).date().isoformat() if days > 0 else None
+        return jsonify(engine.anomalies(conn, since=since, location_id=location_id, kind=kind, limit=limit))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@dashboard_bp.route('/forecast', methods=['GET'])
+@cached_response
+def get_cycle_forecast():
+    """Get projected end-of-cycle usage per location for the current billing cycle
+    
+    ``as_of`` (YYYY-MM-DD, default today) picks the cycle and the last day
+    counted as recorded; ``location_id`` narrows the result to one location.
+    """
+    try:
+        forecaster = get_forecaster()
+        if forecaster is None:
+            return jsonify({'error': 'Forecasting requires NumPy'}), 503
+        
+        as_of = request.args.get('as_of')
+        try:
+            as_of = date.fromisoformat(as_of) if as_of else date.today()
+        except ValueError:
+            return jsonify({'error': 'as_of must be a YYYY-MM-DD date'}), 400
+        location_id = request.args.get('location_id', type=int)
+        
+        result = forecaster.forecast(get_db_connection(), as_of)
+        if location_id is not None:
+            result = {**result, 'locations': [row for row in result['locations']
+                                              if row['location_id'] == location_id]}
+        
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _resume_seq():
+    """Sequence number to resume from: Last-Event-ID, then ``since``, else None"""
+    value = request.headers.get('Last-Event-ID') or request.args.get('since')
+    if value is None or value == '':
+        return None
+    seq = int(value)
+    if seq < 0:
+        raise ValueError('Sequence numbers are not negative')
+    return seq
+
+@dashboard_bp.route('/changes', methods=['GET'])
+def get_changes():
+    """Get logged data changes after a sequence number
+    
+    Returns ``reset: true`` when ``since`` can no longer be resumed from and
+    the client should reload everything from ``last_seq``.
+    """
+    try:
+        try:
+            since = _resume_seq()
+        except ValueError:
+            return jsonify({'error': 'since must be a non-negative integer'}), 400
+        limit = max(1, min(request.args.get('limit', CHANGE_BATCH_SIZE, type=int), CHANGE_BATCH_SIZE))
+        
+        conn = get_db_connection()
+        last_seq = get_last_seq(conn)
+        if last_seq is None:
+            return jsonify({'error': 'Change log not available, run migrations.py'}), 503
+        if since is None:
+            return jsonify({'changes': [], 'last_seq': last_seq, 'reset': False})
+        
+        changes = read_changes(conn, since, limit)
+        reset = since > last_seq or (since < last_seq and (not changes or changes[0]['seq'] != since + 1))
+        if reset:
+            return jsonify({'changes': [], 'last_seq': last_seq, 'reset': True})
+        
+        return jsonify({
+            'changes': changes,
+            'last_seq': changes[-1]['seq'] if changes else since,
+            'has_more': bool(changes) and changes[-1]['seq'] < last_seq,
+            'reset': False
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@dashboard_bp.route('/changes/stream', methods=['GET'])
+def stream_changes():
+    """Stream data changes as Server-Sent Events
+    
+    Each ``changes`` event carries a batch of change_log rows and has the
+    last row's sequence number as its id, so EventSource reconnects resume
+    through Last-Event-ID; ``since`` does the same for the first connection.
+    A ``reset`` event means the position was lost and the client should
+    reload.
+    """
+    try:
+        since = _resume_seq()
+    except ValueError:
+        return jsonify({'error': 'since must be a non-negative integer'}), 400
+    
+    feed = get_change_feed()
+    heartbeat = current_app.config.get('CHANGE_STREAM_HEARTBEAT', 15)
+    
+    def event(name, data, event_id=None):
+        lines = f"id: {event_id}\n" if event_id is not None else ''
+        return f"{lines}event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+    
+    def generate():
+        feed.subscribed(1)
+        try:
+            position = since if since is not None else feed.head
+            # Ask EventSource to reconnect quickly after a dropped connection
+            yield 'retry: 3000\n\n'
+            yield event('ready', {'last_seq': position}, position)
+            
+            # Ends when the feed is stopped for a server shutdown
+            while not feed.stopped:
+                if position is None:
+                    # Feed not started yet (or change_log missing): wait for a head
+                    time.sleep(min(heartbeat, 1))
+                    position = feed.head
+                    yield ': waiting\n\n'
+                    continue
+                
+                kind, payload = feed.wait_for_changes(position, heartbeat)
+                if kind == 'reset':
+                    position = payload
+                    yield event('reset', {'last_seq': position}, position)
+                elif payload:
+                    position = payload[-1]['seq']
+                    yield event('changes', {'changes': payload, 'last_seq': position}, position)
+                else:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+        finally:
+            feed.subscribed(-1)
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
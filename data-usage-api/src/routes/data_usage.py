@@ -3,21 +3,28 @@ Data Usage API Routes
 Handles CRUD operations for daily usage data and locations
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
+import io
+import csv
+import json
+import math
 import sqlite3
-import os
-from datetime import datetime, date
+from database import DatabaseManager, from_day, parse_report_date, split_usage_id, to_day
+from export import ExportError, export_filename, gzip_chunks, iter_wide_csv
+from partitions import last_archived_day, summary_source, usage_source
+from src.services.db import get_db_connection
+from src.services.usage_matrix import tracked_write
+from src.services.pagination import (
+    CursorError, decode_cursor, get_page_size, page_response, stream_json_array, stream_response
+)
 
 data_usage_bp = Blueprint('data_usage', __name__)
 
-# Database path
-DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data_usage.db')
+# Largest number of usage values accepted by one batch request
+MAX_BATCH_ROWS = 50000
 
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+class BatchError(ValueError):
+    """Raised for a batch body that cannot be parsed at all"""
 
 @data_usage_bp.route('/locations', methods=['GET'])
 def get_locations():
@@ -30,7 +37,6 @@ def get_locations():
             WHERE is_active = 1 
             ORDER BY display_name
         """).fetchall()
-        conn.close()
         
         return jsonify([dict(location) for location in locations])
     except Exception as e:
@@ -38,65 +44,396 @@ def get_locations():
 
 @data_usage_bp.route('/daily-usage', methods=['GET'])
 def get_daily_usage():
-    """Get daily usage data with optional filters"""
+    """Get daily usage data with optional filters
+    
+    Pass ``cursor`` (empty for the first page) with an optional ``limit`` for
+    keyset pages ordered by (date DESC, location_id), or ``stream=1`` to
+    stream the full result as a JSON array straight off the cursor.
+    Archived years in the date range are included.
+    """
     try:
         # Get query parameters
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         location_id = request.args.get('location_id')
+        paged = 'cursor' in request.args
+        after = decode_cursor(request.args.get('cursor'), 2, types=(to_day, int)) if paged else None
         
         conn = get_db_connection()
         
-        # Build query
+        # Build query; filters and order use the stored day number, which
+        # the primary key and indexes cover, rather than the view's date
         query = """
             SELECT du.id, du.date, du.usage_gb, du.updated_at,
                    l.id as location_id, l.name as location_name, l.display_name
-            FROM daily_usage du
+            FROM {source} du
             JOIN locations l ON du.location_id = l.id
             WHERE 1=1
         """
         params = []
+        start_day = to_day(start_date) if start_date else None
+        end_day = to_day(end_date) if end_date else None
         
-        if start_date:
-            query += " AND du.date >= ?"
-            params.append(start_date)
+        if start_day is not None:
+            query += " AND du.day >= ?"
+            params.append(start_day)
         
-        if end_date:
-            query += " AND du.date <= ?"
-            params.append(end_date)
+        if end_day is not None:
+            query += " AND du.day <= ?"
+            params.append(end_day)
         
         if location_id:
             query += " AND du.location_id = ?"
             params.append(location_id)
         
-        query += " ORDER BY du.date DESC, l.display_name"
+        if paged:
+            limit = get_page_size(request.args)
+            if after:
+                query += " AND (du.day < ? OR (du.day = ? AND du.location_id > ?))"
+                params.extend([after[0], after[0], after[1]])
+            query += " ORDER BY du.day DESC, du.location_id LIMIT ?"
+            params.append(limit + 1)
+            
+            # Sorting a union of partitions reads all of them, so a page that
+            # ends after the newest archived day is answered from the hot
+            # database alone
+            rows = conn.execute(query.format(source='daily_usage'), params).fetchall()
+            last_archived = last_archived_day(conn)
+            if last_archived is not None and (len(rows) <= limit or to_day(rows[-1]['date']) <= last_archived):
+                source = usage_source(conn, start_day, end_day)
+                rows = conn.execute(query.format(source=source), params).fetchall()
+            return page_response(rows, limit, lambda row: (row['date'], row['location_id']))
+        
+        query = query.format(source=usage_source(conn, start_day, end_day))
+        query += " ORDER BY du.day DESC, l.display_name"
+        
+        if request.args.get('stream', type=int):
+            return stream_json_array(conn.execute(query, params))
         
         usage_data = conn.execute(query, params).fetchall()
-        conn.close()
         
         return jsonify([dict(row) for row in usage_data])
+    except (CursorError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@data_usage_bp.route('/export', methods=['GET'])
+def export_usage_report():
+    """Stream daily usage in the wide report layout as a CSV download
+    
+    One Date column plus one column per location, one row per day, written
+    straight off an ordered cursor. ``start_date`` and ``end_date`` bound the
+    range (inclusive, archived years included), ``location_id`` may be
+    repeated to pick the columns (default: all active locations), and
+    ``gzip=1`` compresses the body on the fly.
+    """
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        location_ids = request.args.getlist('location_id', type=int)
+        compress = bool(request.args.get('gzip', type=int))
+        try:
+            start_day = to_day(start_date) if start_date else None
+            end_day = to_day(end_date) if end_date else None
+        except ValueError as e:
+            return jsonify({'error': f"Invalid date: {e}"}), 400
+        
+        conn = get_db_connection()
+        chunks = iter_wide_csv(conn, start_day, end_day, location_ids)
+        body = gzip_chunks(chunks) if compress else chunks
+        headers = {'Content-Disposition':
+                   f'attachment; filename="{export_filename(start_date, end_date, compress)}"'}
+        return stream_response(body, 'application/gzip' if compress else 'text/csv',
+                               close=chunks.close, headers=headers)
+    except ExportError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @data_usage_bp.route('/daily-usage', methods=['POST'])
 def add_daily_usage():
-    """Add or update daily usage record"""
+    """Add or update daily usage record
+    
+    The record is validated like a row of /daily-usage/batch.
+    """
     try:
-        data = request.get_json()
+        conn = get_db_connection()
+        location_ids = {row[0] for row in conn.execute("SELECT id FROM locations")}
+        values, errors = _validate_usage_record(request.get_json(silent=True), location_ids,
+                                                request.args.get('year', 2024, type=int))
+        if errors:
+            return jsonify({'error': '; '.join(errors)}), 400
+        usage_date, location_id, usage_gb = values
         
-        required_fields = ['date', 'location_id', 'usage_gb']
-        if not all(field in data for field in required_fields):
-            return jsonify({'error': 'Missing required fields'}), 400
+        with tracked_write(conn) as changes:
+            conn.execute("""
+                INSERT INTO daily_usage_compact (location_id, day, usage_gb, updated_at)
+                VALUES (?, ?, ?, strftime('%s', 'now'))
+                ON CONFLICT (location_id, day) DO UPDATE SET
+                    usage_gb = excluded.usage_gb,
+                    updated_at = excluded.updated_at
+            """, (location_id, to_day(usage_date), usage_gb))
+            changes.upsert(usage_date, location_id, usage_gb)
+        
+        return jsonify({'message': 'Daily usage record saved successfully'})
+    except sqlite3.IntegrityError as e:
+        # Archived years are read-only
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _read_batch_records(year):
+    """Parse a batch body into a list of raw usage records
+    
+    Accepts a JSON array, NDJSON (one object per line) or a multipart CSV
+    upload in the WEEKLY_REPORTS layout, where each usage cell becomes one
+    record. Every record carries a ``row`` reference for error reporting.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        return _read_batch_csv(io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline=''), year)
+    
+    mimetype = request.mimetype
+    records = []
+    if mimetype in ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines'):
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise BatchError(f"Line {line_no} is not valid JSON")
+            records.append({'row': line_no, 'record': record})
+            if len(records) > MAX_BATCH_ROWS:
+                break
+        return records
+    
+    if mimetype == 'text/csv':
+        return _read_batch_csv(io.StringIO(request.get_data(as_text=True)), year)
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        raise BatchError('Expected a JSON array, NDJSON or a CSV upload')
+    return [{'row': index, 'record': record} for index, record in enumerate(data)]
+
+def _read_batch_csv(stream, year):
+    """Turn a wide usage report into per-cell records keyed by location name"""
+    reader = csv.reader(stream)
+    headers = next(reader, None)
+    if not headers:
+        raise BatchError('CSV upload is empty')
+    
+    location_ids = dict(get_db_connection().execute("SELECT name, id FROM locations").fetchall())
+    unknown = [name.strip() for name in headers[1:] if name.strip() and name.strip() not in location_ids]
+    if unknown:
+        raise BatchError(f"Unknown locations in CSV header: {', '.join(unknown)}")
+    
+    columns = [(index, location_ids[name.strip()])
+               for index, name in enumerate(headers[1:], start=1) if name.strip()]
+    records = []
+    for line_no, row in enumerate(reader, start=2):
+        if not row or not row[0].strip():
+            continue
+        usage_date = parse_report_date(row[0], year)
+        for index, location_id in columns:
+            if index >= len(row) or not row[index].strip():
+                continue
+            records.append({
+                'row': f"{line_no}:{headers[index].strip()}",
+                'record': {
+                    'date': usage_date.isoformat() if usage_date else row[0],
+                    'location_id': location_id,
+                    'usage_gb': row[index].strip()
+                }
+            })
+        if len(records) > MAX_BATCH_ROWS:
+            break
+    return records
+
+def _validate_usage_record(record, location_ids, year):
+    """Normalize one record to (date, location_id, usage_gb) or return errors"""
+    if not isinstance(record, dict):
+        return None, ['Record must be an object']
+    
+    errors = []
+    missing = [field for field in ('date', 'location_id', 'usage_gb') if field not in record]
+    if missing:
+        return None, [f"Missing required fields: {', '.join(missing)}"]
+    
+    usage_date = parse_report_date(str(record['date']), year)
+    if usage_date is None:
+        errors.append(f"Invalid date: {record['date']}")
+    
+    location_id = record['location_id']
+    if isinstance(location_id, bool) or not isinstance(location_id, int) or location_id not in location_ids:
+        errors.append(f"Unknown location_id: {location_id}")
+    
+    try:
+        usage_gb = _parse_usage_gb(record['usage_gb'])
+    except ValueError as e:
+        errors.append(str(e))
+    
+    if errors:
+        return None, errors
+    return (usage_date.isoformat(), location_id, usage_gb), []
+
+def _parse_usage_gb(value):
+    """A finite, non-negative usage as a float; ValueError otherwise"""
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        usage_gb = float(value)
+        if not math.isfinite(usage_gb) or usage_gb < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid usage_gb: {value}")
+    return usage_gb
+
+@data_usage_bp.route('/daily-usage/batch', methods=['POST'])
+def add_daily_usage_batch():
+    """Add or update many daily usage records in one transaction
+    
+    The whole batch is validated before anything is written; any invalid
+    row rejects the batch with per-row errors. Otherwise every row is
+    written in a single transaction and reported as inserted, updated or
+    unchanged.
+    """
+    try:
+        year = request.args.get('year', 2024, type=int)
+        records = _read_batch_records(year)
+        if not records:
+            return jsonify({'error': 'Batch is empty'}), 400
+        if len(records) > MAX_BATCH_ROWS:
+            return jsonify({'error': f"Batch exceeds {MAX_BATCH_ROWS} rows"}), 413
         
         conn = get_db_connection()
-        conn.execute("""
-            INSERT OR REPLACE INTO daily_usage (date, location_id, usage_gb, updated_at)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-        """, (data['date'], data['location_id'], data['usage_gb']))
-        conn.commit()
-        conn.close()
+        location_ids = {row[0] for row in conn.execute("SELECT id FROM locations")}
         
-        return jsonify({'message': 'Daily usage record saved successfully'})
+        # Validate everything up front
+        rows = []
+        errors = []
+        seen = {}
+        for entry in records:
+            values, row_errors = _validate_usage_record(entry['record'], location_ids, year)
+            if values is not None:
+                key = values[:2]
+                if key in seen:
+                    row_errors = [f"Duplicate of row {seen[key]} for the same date and location"]
+                else:
+                    seen[key] = entry['row']
+            if row_errors:
+                errors.append({'row': entry['row'], 'errors': row_errors})
+            else:
+                rows.append((entry['row'], values))
+        
+        if errors:
+            return jsonify({'error': 'Validation failed, nothing was written',
+                            'invalid_rows': len(errors), 'errors': errors}), 400
+        
+        # Read current values and write inside one write transaction, so the
+        # classification matches what the upsert actually did
+        with tracked_write(conn) as changes:
+            dates = [values[0] for _, values in rows]
+            existing = {}
+            for location_id in {values[1] for _, values in rows}:
+                existing.update(((row[0], location_id), row[1]) for row in conn.execute("""
+                    SELECT date, usage_gb FROM daily_usage
+                    WHERE location_id = ? AND day BETWEEN ? AND ?
+                """, (location_id, to_day(min(dates)), to_day(max(dates)))))
+            
+            counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+            results = []
+            for row_ref, values in rows:
+                key = values[:2]
+                if key not in existing:
+                    status = 'inserted'
+                elif existing[key] != values[2]:
+                    status = 'updated'
+                else:
+                    status = 'unchanged'
+                counts[status] += 1
+                if status != 'unchanged':
+                    changes.upsert(*values)
+                results.append({'row': row_ref, 'date': values[0], 'location_id': values[1],
+                                'usage_gb': values[2], 'status': status})
+            
+            conn.executemany("""
+                INSERT INTO daily_usage_compact (location_id, day, usage_gb, updated_at)
+                VALUES (?, ?, ?, strftime('%s', 'now'))
+                ON CONFLICT (location_id, day) DO UPDATE SET
+                    usage_gb = excluded.usage_gb,
+                    updated_at = excluded.updated_at
+            """, [(location_id, to_day(usage_date), usage_gb)
+                  for usage_date, location_id, usage_gb in changes.upserts])
+        
+        return jsonify({'message': 'Batch saved successfully', 'rows': len(results),
+                        **counts, 'results': results})
+    except BatchError as e:
+        return jsonify({'error': str(e)}), 400
+    except sqlite3.IntegrityError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@data_usage_bp.route('/daily-usage/batch', methods=['DELETE'])
+def delete_daily_usage_range():
+    """Delete daily usage records in a date range
+    
+    Requires ``start_date`` and ``end_date`` (inclusive); ``location_id``
+    may be repeated to limit the delete to those locations.
+    """
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        location_ids = request.args.getlist('location_id', type=int)
+        
+        if not start_date or not end_date:
+            return jsonify({'error': 'start_date and end_date are required'}), 400
+        try:
+            params = [to_day(start_date), to_day(end_date)]
+        except ValueError as e:
+            return jsonify({'error': f"Invalid date: {e}"}), 400
+        
+        query = "DELETE FROM daily_usage_compact WHERE day BETWEEN ? AND ?"
+        if location_ids:
+            query += f" AND location_id IN ({','.join('?' * len(location_ids))})"
+            params.extend(location_ids)
+        
+        conn = get_db_connection()
+        with tracked_write(conn) as changes:
+            deleted = conn.execute(query, params).rowcount
+            changes.delete_range(from_day(params[0]), from_day(params[1]), location_ids)
+        
+        return jsonify({'message': 'Daily usage records deleted successfully', 'deleted': deleted})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@data_usage_bp.route('/import', methods=['POST'])
+def import_usage_report():
+    """Bulk import an uploaded usage report in the WEEKLY_REPORTS CSV layout
+    
+    Runs on the request's pooled connection as one tracked write, so the
+    usage matrix and change feed pick the import up like any other write.
+    """
+    try:
+        upload = request.files.get('file')
+        if upload is None:
+            return jsonify({'error': 'No file uploaded'}), 400
+        
+        year = request.form.get('year', 2024, type=int)
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        
+        conn = get_db_connection()
+        with tracked_write(conn) as changes:
+            stats = DatabaseManager(current_app.config['DATABASE_PATH']).load_usage_report(
+                conn, stream, default_year=year)
+            changes.bulk_load()
+        if stats is None:
+            return jsonify({'error': 'Usage report is empty'}), 400
+        
+        return jsonify({'message': 'Usage report imported successfully', 'stats': stats})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -104,18 +441,30 @@ def add_daily_usage():
 def update_daily_usage(usage_id):
     """Update existing daily usage record"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or 'usage_gb' not in data:
+            return jsonify({'error': 'Missing required fields: usage_gb'}), 400
+        usage_gb = _parse_usage_gb(data['usage_gb'])
+        
+        location_id, day = split_usage_id(usage_id)
         
         conn = get_db_connection()
-        conn.execute("""
-            UPDATE daily_usage 
-            SET usage_gb = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (data['usage_gb'], usage_id))
-        conn.commit()
-        conn.close()
+        with tracked_write(conn) as changes:
+            row = conn.execute("""
+                SELECT date, location_id FROM daily_usage WHERE location_id = ? AND day = ?
+            """, (location_id, day)).fetchone()
+            if row is None:
+                return jsonify({'error': 'Daily usage record not found'}), 404
+            conn.execute("""
+                UPDATE daily_usage_compact 
+                SET usage_gb = ?, updated_at = strftime('%s', 'now')
+                WHERE location_id = ? AND day = ?
+            """, (usage_gb, location_id, day))
+            changes.upsert(row['date'], row['location_id'], usage_gb)
         
         return jsonify({'message': 'Daily usage record updated successfully'})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -123,10 +472,16 @@ def update_daily_usage(usage_id):
 def delete_daily_usage(usage_id):
     """Delete daily usage record"""
     try:
+        location_id, day = split_usage_id(usage_id)
+        
         conn = get_db_connection()
-        conn.execute("DELETE FROM daily_usage WHERE id = ?", (usage_id,))
-        conn.commit()
-        conn.close()
+        with tracked_write(conn) as changes:
+            row = conn.execute("""
+                SELECT date, location_id FROM daily_usage WHERE location_id = ? AND day = ?
+            """, (location_id, day)).fetchone()
+            conn.execute("DELETE FROM daily_usage_compact WHERE location_id = ? AND day = ?", (location_id, day))
+            if row is not None:
+                changes.delete(row['date'], row['location_id'])
         
         return jsonify({'message': 'Daily usage record deleted successfully'})
     except Exception as e:
@@ -134,18 +489,29 @@ def delete_daily_usage(usage_id):
 
 @data_usage_bp.route('/monthly-summary', methods=['GET'])
 def get_monthly_summaries():
-    """Get monthly summary data"""
+    """Get monthly summary data
+    
+    Manual entries are returned with the computed cycle total for the same
+    period alongside. Supports the same ``cursor``/``limit`` keyset pages,
+    ordered by (period_start DESC, location_id), and ``stream=1`` as
+    /daily-usage.
+    """
     try:
         location_id = request.args.get('location_id')
+        paged = 'cursor' in request.args
+        after = decode_cursor(request.args.get('cursor'), 2, types=(to_day, int)) if paged else None
         
         conn = get_db_connection()
         
-        query = """
+        query = f"""
             SELECT ms.id, ms.period_start, ms.period_end, ms.total_usage_gb, 
                    ms.manual_entry, ms.updated_at,
+                   ct.total_usage_gb as computed_usage_gb, ct.day_count as computed_days,
                    l.id as location_id, l.name as location_name, l.display_name
-            FROM monthly_summaries ms
+            FROM {summary_source(conn)} ms
             JOIN locations l ON ms.location_id = l.id
+            LEFT JOIN cycle_usage_totals ct 
+                ON ct.period_start = ms.period_start AND ct.location_id = ms.location_id
             WHERE 1=1
         """
         params = []
@@ -154,12 +520,27 @@ def get_monthly_summaries():
             query += " AND ms.location_id = ?"
             params.append(location_id)
         
+        if paged:
+            limit = get_page_size(request.args)
+            if after:
+                query += " AND (ms.period_start < ? OR (ms.period_start = ? AND ms.location_id > ?))"
+                params.extend([from_day(after[0]), from_day(after[0]), after[1]])
+            query += " ORDER BY ms.period_start DESC, ms.location_id LIMIT ?"
+            params.append(limit + 1)
+            
+            rows = conn.execute(query, params).fetchall()
+            return page_response(rows, limit, lambda row: (row['period_start'], row['location_id']))
+        
         query += " ORDER BY ms.period_start DESC, l.display_name"
         
+        if request.args.get('stream', type=int):
+            return stream_json_array(conn.execute(query, params))
+        
         summaries = conn.execute(query, params).fetchall()
-        conn.close()
         
         return jsonify([dict(row) for row in summaries])
+    except CursorError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -174,15 +555,17 @@ def add_monthly_summary():
             return jsonify({'error': 'Missing required fields'}), 400
         
         conn = get_db_connection()
-        conn.execute("""
-            INSERT OR REPLACE INTO monthly_summaries 
-            (period_start, period_end, location_id, total_usage_gb, manual_entry, updated_at)
-            VALUES (?, ?, ?, ?, 1, CURRENT_TIMESTAMP)
-        """, (data['period_start'], data['period_end'], data['location_id'], data['total_usage_gb']))
-        conn.commit()
-        conn.close()
+        # No daily usage changes, but keeps the usage matrix at the new data version
+        with tracked_write(conn):
+            conn.execute("""
+                INSERT OR REPLACE INTO monthly_summaries 
+                (period_start, period_end, location_id, total_usage_gb, manual_entry, updated_at)
+                VALUES (?, ?, ?, ?, 1, CURRENT_TIMESTAMP)
+            """, (data['period_start'], data['period_end'], data['location_id'], data['total_usage_gb']))
         
         return jsonify({'message': 'Monthly summary saved successfully'})
+    except sqlite3.IntegrityError as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -3,80 +3,56 @@ System API Routes
 Handles system monitoring and backup operations
 """
 
-from flask import Blueprint, request, jsonify
-import sqlite3
+from flask import Blueprint, Response, request, jsonify, current_app, send_file, url_for
 import os
-import psutil
+import time
 import subprocess
 from datetime import datetime
+from src.services.anomalies import get_anomaly_engine
+from src.services.assets import get_asset_manifest
+from src.services.changes import get_change_feed
+from src.services.db import get_db_connection, get_pool
+from src.services.jobs import get_backup_manager, get_runner
+from src.services.metrics import PROMETHEUS_CONTENT_TYPE, get_metrics
+from src.services.profiling import get_profiler
+from src.services.sampler import FALLBACK_CPU_INTERVAL, collect_system_status
+from src.services.usage_matrix import get_usage_matrix
+from migrations import migrate, migration_status
+from partitions import PartitionManager, summary_count, usage_totals
 
 system_bp = Blueprint('system', __name__)
 
-# Database path
-DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data_usage.db')
-
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
 @system_bp.route('/status', methods=['GET'])
 def get_system_status():
-    """Get Raspberry Pi system status"""
-    try:
-        # CPU usage
-        cpu_percent = psutil.cpu_percent(interval=1)
-        
-        # Memory usage
-        memory = psutil.virtual_memory()
-        memory_percent = memory.percent
-        memory_available = round(memory.available / (1024**3), 2)  # GB
-        memory_total = round(memory.total / (1024**3), 2)  # GB
-        
-        # Disk usage
-        disk = psutil.disk_usage('/')
-        disk_percent = round((disk.used / disk.total) * 100, 2)
-        disk_free = round(disk.free / (1024**3), 2)  # GB
-        disk_total = round(disk.total / (1024**3), 2)  # GB
-        
-        # System uptime
-        boot_time = datetime.fromtimestamp(psutil.boot_time())
-        uptime = datetime.now() - boot_time
-        
-        # Database size
-        db_size = 0
-        if os.path.exists(DATABASE_PATH):
-            db_size = round(os.path.getsize(DATABASE_PATH) / (1024**2), 2)  # MB
-        
-        # Temperature (Raspberry Pi specific)
-        temperature = None
-        try:
-            with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
-                temp_raw = f.read().strip()
-                temperature = round(int(temp_raw) / 1000, 1)  # Convert to Celsius
-        except:
-            # Fallback for non-Raspberry Pi systems
-            temperature = "N/A"
+    """Get Raspberry Pi system status
+    
+    Answered from the background sampler's latest sample. Until the first
+    sample lands, CPU usage is measured over a short interval instead.
+    """
+    try:
+        sampler = current_app.extensions.get('system_sampler')
+        status = sampler.latest() if sampler else None
+        if status is None:
+            status = collect_system_status(current_app.config['DATABASE_PATH'],
+                                           cpu_interval=FALLBACK_CPU_INTERVAL)
         
-        return jsonify({
-            'cpu_percent': cpu_percent,
-            'memory': {
-                'percent': memory_percent,
-                'available_gb': memory_available,
-                'total_gb': memory_total
-            },
-            'disk': {
-                'percent': disk_percent,
-                'free_gb': disk_free,
-                'total_gb': disk_total
-            },
-            'uptime_days': uptime.days,
-            'uptime_hours': uptime.seconds // 3600,
-            'database_size_mb': db_size,
-            'temperature_c': temperature,
-            'timestamp': datetime.now().isoformat()
-        })
+        return jsonify(status)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/status/history', methods=['GET'])
+def get_system_status_history():
+    """Get downsampled CPU, memory, disk and temperature history for charts"""
+    try:
+        sampler = current_app.extensions.get('system_sampler')
+        if sampler is None:
+            return jsonify({'error': 'System sampler is not running'}), 503
+        
+        points = request.args.get('points', 120, type=int)
+        minutes = request.args.get('minutes', type=float)
+        since = time.time() - minutes * 60 if minutes else None
+        
+        return jsonify(sampler.history(points=points, since=since))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -88,21 +64,19 @@ def get_database_info():
         
         # Get table counts
         locations_count = conn.execute("SELECT COUNT(*) FROM locations").fetchone()[0]
-        daily_usage_count = conn.execute("SELECT COUNT(*) FROM daily_usage").fetchone()[0]
-        monthly_summaries_count = conn.execute("SELECT COUNT(*) FROM monthly_summaries").fetchone()[0]
         
-        # Get date range
-        date_range = conn.execute("SELECT MIN(date), MAX(date) FROM daily_usage").fetchone()
+        # Archived years count too, from their registry entries
+        daily_usage_count, first_date, last_date = usage_totals(conn)
+        monthly_summaries_count = summary_count(conn)
         
         # Get system info
         system_info = conn.execute("SELECT metric_name, metric_value, updated_at FROM system_info").fetchall()
         
-        conn.close()
-        
         # Database file info
+        db_path = current_app.config['DATABASE_PATH']
         db_stats = {}
-        if os.path.exists(DATABASE_PATH):
-            stat = os.stat(DATABASE_PATH)
+        if os.path.exists(db_path):
+            stat = os.stat(db_path)
             db_stats = {
                 'size_mb': round(stat.st_size / (1024**2), 2),
                 'created': datetime.fromtimestamp(stat.st_ctime).isoformat(),
@@ -116,8 +90,8 @@ def get_database_info():
                 'monthly_summaries': monthly_summaries_count
             },
             'date_range': {
-                'start': date_range[0],
-                'end': date_range[1]
+                'start': first_date,
+                'end': last_date
             },
             'system_info': [dict(row) for row in system_info],
             'database_file': db_stats
@@ -125,40 +99,130 @@ def get_database_info():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _job_accepted(job):
+    """202 response pointing the client at the job's status endpoint"""
+    response = jsonify({**job, 'status_url': url_for('system.get_job', job_id=job['id'])})
+    response.status_code = 202
+    response.headers['Location'] = url_for('system.get_job', job_id=job['id'])
+    return response
+
 @system_bp.route('/backup', methods=['POST'])
 def create_backup():
-    """Create database backup"""
+    """Start a database backup job
+    
+    The backup runs in the background through BackupManager, so compression
+    and retention apply; poll the returned job for progress and the result.
+    """
     try:
-        backup_dir = os.path.join(os.path.dirname(DATABASE_PATH), 'backups')
-        os.makedirs(backup_dir, exist_ok=True)
+        data = request.get_json(silent=True) or {}
+        incremental = data.get('incremental')
+        manager = get_backup_manager()
         
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_filename = f'data_usage_backup_{timestamp}.db'
-        backup_path = os.path.join(backup_dir, backup_filename)
+        def run(progress):
+            manager.progress = progress
+            result = manager.create_backup(incremental=incremental)
+            if not result:
+                raise RuntimeError('Backup failed, see backup.log for details')
+            return result
         
-        # Copy database file
-        import shutil
-        shutil.copy2(DATABASE_PATH, backup_path)
+        job = get_runner().submit('backup', run, {'incremental': incremental})
+        return _job_accepted(job)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/restore', methods=['POST'])
+def restore_backup():
+    """Start a job restoring the database from a backup"""
+    try:
+        data = request.get_json(silent=True) or {}
+        filename = data.get('filename')
         
-        # Update system info
-        conn = get_db_connection()
-        conn.execute("""
-            UPDATE system_info 
-            SET metric_value = ?, updated_at = CURRENT_TIMESTAMP 
-            WHERE metric_name = 'last_backup'
-        """, (datetime.now().isoformat(),))
-        conn.commit()
-        conn.close()
+        if not filename or os.path.basename(filename) != filename:
+            return jsonify({'error': 'A backup filename is required'}), 400
+        if data.get('confirm') is not True:
+            return jsonify({'error': 'Restore replaces the current database; resend with "confirm": true'}), 400
         
-        backup_size = round(os.path.getsize(backup_path) / (1024**2), 2)
+        manager = get_backup_manager()
+        if not os.path.exists(os.path.join(manager.backup_dir, filename)):
+            return jsonify({'error': 'Backup not found'}), 404
         
-        return jsonify({
-            'message': 'Backup created successfully',
-            'backup_file': backup_filename,
-            'backup_path': backup_path,
-            'backup_size_mb': backup_size,
-            'timestamp': timestamp
-        })
+        response_cache = current_app.extensions.get('response_cache')
+        usage_matrix = current_app.extensions.get('usage_matrix')
+        
+        def run(progress):
+            manager.progress = progress
+            if not manager.restore_backup(filename, confirm=True):
+                raise RuntimeError('Restore failed, see backup.log for details')
+            # Older backups predate later schema migrations
+            applied = migrate(manager.db_path, strict=False)
+            # The restored data version may repeat one already seen
+            if response_cache is not None:
+                response_cache.clear()
+            if usage_matrix is not None:
+                usage_matrix.invalidate()
+            return {'restored': filename, 'migrations_applied': applied}
+        
+        job = get_runner().submit('restore', run, {'filename': filename})
+        return _job_accepted(job)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/verify', methods=['POST'])
+def verify_backups():
+    """Start a job verifying one backup, or every backup when no filename is given"""
+    try:
+        data = request.get_json(silent=True) or {}
+        filename = data.get('filename')
+        force = bool(data.get('force', False))
+        
+        if filename is not None and os.path.basename(filename) != filename:
+            return jsonify({'error': 'Invalid backup filename'}), 400
+        
+        manager = get_backup_manager()
+        if filename and not os.path.exists(os.path.join(manager.backup_dir, filename)):
+            return jsonify({'error': 'Backup not found'}), 404
+        
+        def run(progress):
+            manager.progress = progress
+            return manager.verify_all_backups(force=force, filenames=[filename] if filename else None)
+        
+        job = get_runner().submit('verify', run, {'filename': filename, 'force': force})
+        return _job_accepted(job)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/anomalies/backfill', methods=['POST'])
+def backfill_anomalies():
+    """Start a job rescoring all usage history for anomalies"""
+    try:
+        engine = get_anomaly_engine()
+        pool = get_pool()
+        
+        def run(progress):
+            with pool.connection() as conn:
+                return engine.backfill(conn)
+        
+        job = get_runner().submit('anomaly-backfill', run)
+        return _job_accepted(job)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/jobs', methods=['GET'])
+def list_jobs():
+    """List recent background jobs, newest first"""
+    try:
+        return jsonify({'jobs': get_runner().list()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get a background job's status, progress and result"""
+    try:
+        job = get_runner().get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(job)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -166,28 +230,151 @@ def create_backup():
 def list_backups():
     """List available backups"""
     try:
-        backup_dir = os.path.join(os.path.dirname(DATABASE_PATH), 'backups')
+        backups = get_backup_manager().list_backups()
         
-        if not os.path.exists(backup_dir):
-            return jsonify({'backups': []})
+        for backup in backups:
+            backup['created'] = backup['created'].isoformat()
+            backup['modified'] = backup['modified'].isoformat()
         
-        backups = []
-        for filename in os.listdir(backup_dir):
-            if filename.endswith('.db') and filename.startswith('data_usage_backup_'):
-                filepath = os.path.join(backup_dir, filename)
-                stat = os.stat(filepath)
-                
-                backups.append({
-                    'filename': filename,
-                    'size_mb': round(stat.st_size / (1024**2), 2),
-                    'created': datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                    'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
-                })
+        return jsonify({'backups': backups})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/db-pool', methods=['GET'])
+def get_db_pool_stats():
+    """Get shared connection pool statistics"""
+    try:
+        return jsonify(get_pool().stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/cache', methods=['GET'])
+def get_cache_stats():
+    """Get dashboard response cache statistics"""
+    try:
+        return jsonify(current_app.extensions['response_cache'].stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/usage-matrix', methods=['GET'])
+def get_usage_matrix_stats():
+    """Get in-memory usage matrix statistics
+    
+    Pass ``check=1`` to also compare its per-location aggregates with SQLite.
+    """
+    try:
+        conn = get_db_connection()
+        matrix = get_usage_matrix(conn)
+        if matrix is None:
+            # Still report the size limit when the data outgrew it
+            idle = current_app.extensions.get('usage_matrix')
+            return jsonify({'enabled': False, **(idle.stats() if idle is not None else {})})
         
-        # Sort by creation time (newest first)
-        backups.sort(key=lambda x: x['created'], reverse=True)
+        result = {'enabled': True, **matrix.stats()}
+        if request.args.get('check', type=int):
+            result['consistency'] = matrix.check_consistency(conn)
         
-        return jsonify({'backups': backups})
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/change-feed', methods=['GET'])
+def get_change_feed_stats():
+    """Get live change feed statistics"""
+    try:
+        return jsonify(get_change_feed().stats())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/assets', methods=['GET'])
+def get_static_assets():
+    """Get the static asset manifest with compressed sizes"""
+    try:
+        return jsonify(get_asset_manifest().manifest())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/migrations', methods=['GET'])
+def get_migrations():
+    """Get applied and pending schema migrations"""
+    try:
+        return jsonify(migration_status(current_app.config['DATABASE_PATH']))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/archives', methods=['GET'])
+def get_archives():
+    """Get the hot database size and the archived years with their files"""
+    try:
+        return jsonify(PartitionManager(current_app.config['DATABASE_PATH']).status())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/metrics', methods=['GET'])
+def get_metrics_report():
+    """Get request and SQL metrics in Prometheus text format
+    
+    ``format=json`` returns a summary instead: endpoints by total time with
+    latency percentiles, and the ``statements`` (default 20) slowest SQL
+    statements.
+    """
+    try:
+        registry = get_metrics()
+        if request.args.get('format') == 'json':
+            statements = max(1, min(request.args.get('statements', 20, type=int), 200))
+            return jsonify(registry.summary(statements=statements))
+        
+        return Response(registry.prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/profiles', methods=['GET'])
+def get_profiles():
+    """Get stored request profiles, newest first, with profiler settings"""
+    try:
+        profiler = get_profiler()
+        return jsonify({'profiler': profiler.stats(), 'profiles': profiler.store.list()})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """Get one profile's summary: top functions and allocation sites"""
+    try:
+        summary = get_profiler().store.get(profile_id)
+        if summary is None:
+            return jsonify({'error': 'Profile not found'}), 404
+        
+        for kind in summary['files']:
+            summary['files'][kind] = {
+                'size': summary['files'][kind],
+                'url': url_for('system.download_profile', profile_id=profile_id, kind=kind)
+            }
+        return jsonify(summary)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/profiles/<profile_id>/<kind>', methods=['GET'])
+def download_profile(profile_id, kind):
+    """Download a raw dump: pstats (for pstats/snakeviz) or tracemalloc (Snapshot.load)"""
+    try:
+        path = get_profiler().store.file_path(profile_id, kind)
+        if path is None:
+            return jsonify({'error': 'Profile file not found'}), 404
+        
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                         download_name=os.path.basename(path))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@system_bp.route('/profiles/<profile_id>', methods=['DELETE'])
+def delete_profile(profile_id):
+    """Delete a stored profile"""
+    try:
+        if not get_profiler().store.delete(profile_id):
+            return jsonify({'error': 'Profile not found'}), 404
+        
+        return jsonify({'message': 'Profile deleted successfully'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -207,7 +394,7 @@ def get_system_logs():
                 logs = result.stdout.split('\n')
         except:
             # Fallback to application logs if available
-            log_file = os.path.join(os.path.dirname(DATABASE_PATH), 'app.log')
+            log_file = os.path.join(os.path.dirname(current_app.config['DATABASE_PATH']), 'app.log')
             if os.path.exists(log_file):
                 with open(log_file, 'r') as f:
                     logs = f.readlines()[-50:]  # Last 50 lines
@@ -0,0 +1,258 @@
+"""
+Production server for the Data Usage Monitor API
+Builds and warms the app once, then serves it from a threaded WSGI server,
+optionally in several pre-forked worker processes sharing one socket
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import logging
+
+_started = time.perf_counter()
+
+# data-usage-api/, so the app imports as the src package like in main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server
+from src.main import DATABASE_PATH, create_app, shutdown_app, start_background_threads
+
+_imported = time.perf_counter()
+
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'),
+                    format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Requests the dashboard makes on first load, replayed before serving
+WARM_UP_PATHS = (
+    '/',
+    '/api/data/locations',
+    '/api/dashboard/overview',
+    '/api/dashboard/usage-trends?days=30',
+    '/api/dashboard/recent-updates?limit=5',
+    '/api/dashboard/forecast',
+    '/api/system/status',
+)
+
+# Cold start target on a Raspberry Pi 4, from process start to ready
+DEFAULT_STARTUP_BUDGET = 10.0
+
+def warm_up(app):
+    """Run the dashboard's first requests so nothing is cold for the first user
+
+    Fills the response, forecast and usage matrix caches and prepares the
+    statements on the pooled connection that will be reused first. Returns
+    milliseconds per path; metrics are reset afterwards so the warm-up does
+    not show in them.
+    """
+    client = app.test_client()
+    timings = {}
+    for path in WARM_UP_PATHS:
+        started = time.perf_counter()
+        try:
+            response = client.get(path)
+            response.get_data()
+            if response.status_code >= 400:
+                logger.warning(f"Warm-up request {path} returned {response.status_code}")
+        except Exception as e:
+            logger.warning(f"Warm-up request {path} failed: {e}")
+        timings[path] = round((time.perf_counter() - started) * 1000, 1)
+
+    metrics = app.extensions.get('metrics')
+    if metrics is not None:
+        metrics.reset()
+    return timings
+
+def build(workers=1, warm=True, config=None):
+    """Create and warm the app; returns (app, startup report)
+
+    With several workers the app is built without background threads,
+    which would not survive the fork, and job state goes to a directory
+    every worker can read.
+    """
+    config = dict(config or {})
+    if workers > 1:
+        config['BACKGROUND_THREADS'] = False
+        if not os.environ.get('JOB_STATE_DIR'):
+            database_path = config.get('DATABASE_PATH') or os.environ.get('DATABASE_PATH', DATABASE_PATH)
+            config.setdefault('JOB_STATE_DIR', os.path.join(os.path.dirname(os.path.abspath(database_path)), 'jobs'))
+
+    created = time.perf_counter()
+    app = create_app(config)
+    warmed = time.perf_counter()
+    paths = warm_up(app) if warm else {}
+    ready = time.perf_counter()
+
+    report = {
+        'import_seconds': round(_imported - _started, 3),
+        'create_app_seconds': round(warmed - created, 3),
+        'warm_up_seconds': round(ready - warmed, 3),
+        'startup_seconds': round(ready - _started, 3),
+        'warm_up_ms': paths
+    }
+    return app, report
+
+def check_budget(report, budget):
+    """Log the startup report; True when it is within budget"""
+    within = report['startup_seconds'] <= budget
+    message = (f"Started in {report['startup_seconds']}s (import {report['import_seconds']}s, "
+               f"app {report['create_app_seconds']}s, warm-up {report['warm_up_seconds']}s; "
+               f"budget {budget}s)")
+    if within:
+        logger.info(message)
+    else:
+        logger.warning(message + " - over the cold-start budget")
+    return within
+
+def drain(app, timeout):
+    """Wait for in-flight requests to finish, up to timeout seconds"""
+    metrics = app.extensions.get('metrics')
+    deadline = time.monotonic() + timeout
+    while metrics is not None and metrics.in_flight > 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+def serve(app, server, shutdown_timeout):
+    """Serve until SIGTERM or SIGINT, then shut down cleanly
+
+    New connections stop being accepted first; the change feed is stopped
+    so live update streams end, in-flight requests get up to
+    shutdown_timeout seconds, and running jobs are allowed to finish.
+    """
+    def on_signal(signum, frame):
+        logger.info(f"Received {signal.Signals(signum).name}, shutting down")
+        # shutdown() waits for serve_forever() to return, so it can't run on this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    server.serve_forever()
+    app.extensions['change_feed'].stop(shutdown_timeout)
+    drain(app, shutdown_timeout)
+    shutdown_app(app, shutdown_timeout)
+
+def serve_prefork(app, server, workers, shutdown_timeout):
+    """Fork worker processes that accept on the shared listening socket
+
+    The app, its usage matrix and caches are built once in the parent and
+    shared copy-on-write. Workers that die are replaced; on SIGTERM they are
+    asked to stop and killed if they have not after shutdown_timeout.
+    Each worker labels its metrics with its pid, since any of them may
+    answer a scrape.
+    """
+    # No SQLite handle may cross the fork
+    app.extensions['db_pool'].close_all()
+    if not app.config.get('JOB_STATE_DIR'):
+        logger.warning("JOB_STATE_DIR is not set: each worker keeps its own jobs, so job status "
+                       "polls may miss and backups may overlap; build() sets it for several workers")
+
+    children = {}
+    stopping = threading.Event()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                metrics = app.extensions.get('metrics')
+                if metrics is not None:
+                    metrics.set_worker(os.getpid())
+                start_background_threads(app)
+                serve(app, server, shutdown_timeout)
+            except Exception as e:
+                logger.error(f"Worker {os.getpid()} failed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+        logger.info(f"Started worker {pid}")
+
+    def kill_remaining():
+        for pid in list(children):
+            logger.warning(f"Worker {pid} did not stop in time, killing it")
+            _signal_child(pid, signal.SIGKILL)
+
+    def on_signal(signum, frame):
+        if stopping.is_set():
+            return
+        stopping.set()
+        logger.info(f"Received {signal.Signals(signum).name}, stopping {len(children)} workers")
+        for pid in list(children):
+            _signal_child(pid, signal.SIGTERM)
+        timer = threading.Timer(shutdown_timeout + 5, kill_remaining)
+        timer.daemon = True
+        timer.start()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping.is_set():
+            continue
+        logger.warning(f"Worker {pid} exited with status {status}, replacing it")
+        # Don't spin if workers die straight away, e.g. on a broken database
+        if time.monotonic() - started < 5:
+            time.sleep(1)
+        spawn()
+
+    server.server_close()
+    logger.info("All workers stopped")
+
+def _signal_child(pid, signum):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
+
+def main():
+    """Main function for command line usage"""
+    parser = argparse.ArgumentParser(description='Data Usage Monitor production server')
+    parser.add_argument('--host', default=os.environ.get('SERVER_HOST', '0.0.0.0'), help='Address to listen on')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('FLASK_PORT', 5000)), help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SERVER_WORKERS', 1)),
+                        help='Worker processes, each serving requests on threads (default: 1)')
+    parser.add_argument('--shutdown-timeout', type=float, default=float(os.environ.get('SHUTDOWN_TIMEOUT', 30)),
+                        help='Seconds in-flight requests get to finish on shutdown')
+    parser.add_argument('--startup-budget', type=float,
+                        default=float(os.environ.get('STARTUP_BUDGET_SECONDS', DEFAULT_STARTUP_BUDGET)),
+                        help='Cold-start budget in seconds, warned about when exceeded')
+    parser.add_argument('--no-warm-up', action='store_true', help='Serve without replaying the first requests')
+    parser.add_argument('--check', action='store_true',
+                        help='Build and warm the app, print the startup report as JSON and exit '
+                             '(non-zero when over budget)')
+
+    args = parser.parse_args()
+    workers = max(1, args.workers)
+
+    app, report = build(workers=1 if args.check else workers, warm=not args.no_warm_up)
+    within = check_budget(report, args.startup_budget)
+
+    if args.check:
+        shutdown_app(app, args.shutdown_timeout)
+        print(json.dumps({**report, 'budget_seconds': args.startup_budget, 'within_budget': within}, indent=2))
+        sys.exit(0 if within else 1)
+
+    server = make_server(args.host, args.port, app, threaded=True)
+    logger.info(f"Serving on http://{args.host}:{args.port} with {workers} "
+                f"worker{'s' if workers > 1 else ''}")
+    if workers > 1:
+        serve_prefork(app, server, workers, args.shutdown_timeout)
+    else:
+        serve(app, server, args.shutdown_timeout)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,495 @@
+"""
+Usage anomaly detection
+Keeps an exponentially weighted mean and variance of daily usage per location,
+updated from change_log as each day arrives, and flags days that spike,
+drop or go to zero against them
+"""
+
+import os
+import math
+import threading
+import time
+import logging
+from flask import current_app
+from database import to_day
+from partitions import attach_archives, usage_source
+from src.services.changes import get_last_seq, read_changes
+
+try:
+    import numpy as np
+except ImportError:  # backfill falls back to scoring one location at a time
+    np = None
+
+try:
+    import fcntl
+except ImportError:  # Windows runs a single server process, which always scores
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through app.config
+DEFAULT_ANOMALY_CONFIG = {
+    'ANOMALY_SPAN_DAYS': 14,        # EWMA span; alpha = 2 / (span + 1)
+    'ANOMALY_Z_THRESHOLD': 3.5,     # |z| above this is a spike or drop
+    'ANOMALY_WARMUP_DAYS': 7,       # observations before a location is scored
+}
+
+# Usage at or below this counts as "went to zero"...
+ZERO_USAGE_GB = 0.01
+# ...but only for locations that normally use at least this much
+MIN_ZERO_MEAN_GB = 1.0
+
+# Floors on the standard deviation so near-constant series do not turn every
+# small wobble into a huge z-score
+STD_FLOOR_RATIO = 0.1
+STD_FLOOR_GB = 0.1
+
+# Beyond this many pending changes (or locations needing a rescore) a full
+# vectorized backfill is cheaper than the incremental path
+INCREMENTAL_LIMIT = 50000
+RESCORE_LIMIT = 25
+
+ANOMALY_KINDS = ('spike', 'drop', 'zero')
+
+# Held by the one server process that scores, next to the database
+SCORER_LOCK_FILE = 'anomaly_scorer.lock'
+
+class AnomalyEngine:
+    """Incremental EWMA anomaly scoring over daily_usage
+
+    State per location is the EWMA mean and variance as of its last scored
+    day. A new day is scored against that state and then folded into it;
+    flagged values are clamped to the threshold band first so one outlier
+    does not inflate the variance for the following weeks. A bulk import
+    logs only its earliest day per location; when that is after the last
+    scored day, the new days are read back and scored in order. Changes to
+    days at or before a location's last scored day (corrections, deletes,
+    backfilled history) rescore that location from its history.
+
+    The change_log position and the parameters the state was built with are
+    kept in system_info, so the state survives restarts and is rebuilt when
+    the parameters change.
+    """
+
+    def __init__(self, span_days=14, threshold=3.5, warmup=7):
+        self.span_days = span_days
+        self.alpha = 2.0 / (span_days + 1)
+        self.threshold = threshold
+        self.warmup = warmup
+        self.params = f"ewma:{span_days}:{threshold}:{warmup}"
+        self._lock = threading.Lock()
+        self._stats = {'updates': 0, 'processed_changes': 0, 'rescored_locations': 0,
+                       'backfills': 0, 'last_backfill_seconds': None}
+
+    def _std(self, mean, var):
+        return math.sqrt(max(var, (STD_FLOOR_RATIO * mean) ** 2, STD_FLOOR_GB ** 2))
+
+    def step(self, state, usage):
+        """Score one day's usage and fold it into state
+
+        ``state`` is (mean, var, observations) or None for a location's first
+        day. Returns (new_state, anomaly) where anomaly is
+        (kind, expected, std, z) or None.
+        """
+        if state is None:
+            return (usage, 0.0, 1), None
+
+        mean, var, observations = state
+        std = self._std(mean, var)
+        z = (usage - mean) / std
+        anomaly = None
+        update = usage
+
+        if observations >= self.warmup:
+            kind = None
+            if usage <= ZERO_USAGE_GB and mean >= MIN_ZERO_MEAN_GB:
+                kind = 'zero'
+            elif z > self.threshold:
+                kind = 'spike'
+            elif z < -self.threshold:
+                kind = 'drop'
+            if kind:
+                anomaly = (kind, mean, std, z)
+                update = min(max(usage, mean - self.threshold * std), mean + self.threshold * std)
+
+        diff = update - mean
+        increment = self.alpha * diff
+        return (mean + increment, (1 - self.alpha) * (var + diff * increment), observations + 1), anomaly
+
+    def _read_progress(self, conn):
+        rows = dict(conn.execute("""
+            SELECT metric_name, metric_value FROM system_info
+            WHERE metric_name IN ('anomaly_seq', 'anomaly_params')
+        """).fetchall())
+        seq = rows.get('anomaly_seq')
+        return (int(seq) if seq is not None else None), rows.get('anomaly_params')
+
+    def _write_progress(self, conn, seq):
+        conn.executemany("""
+            INSERT OR REPLACE INTO system_info (metric_name, metric_value, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+        """, [('anomaly_seq', str(seq)), ('anomaly_params', self.params)])
+
+    def _is_current(self, conn):
+        seq, params = self._read_progress(conn)
+        head = get_last_seq(conn)
+        if head is None:
+            raise RuntimeError('change_log is missing, run migrations.py')
+        return seq is not None and params == self.params and seq == head
+
+    def update(self, conn):
+        """Score the days logged since the last update
+
+        Falls back to a full backfill on first use, after a parameter
+        change, when change_log was pruned past the saved position or moved
+        back (restore), or when too much has changed to replay.
+        """
+        # Cheap check first, so up-to-date callers never take the write lock
+        if self._is_current(conn):
+            return {'processed': 0, 'flagged': 0, 'rescored': 0, 'backfill': False}
+
+        with self._lock:
+            # Rescoring reads whole histories, archived years included
+            attach_archives(conn)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq, params = self._read_progress(conn)
+                head = get_last_seq(conn)
+                if seq is not None and params == self.params and seq == head:
+                    conn.rollback()
+                    return {'processed': 0, 'flagged': 0, 'rescored': 0, 'backfill': False}
+
+                changes = [] if seq is None else read_changes(conn, seq, INCREMENTAL_LIMIT + 1)
+                if (seq is None or params != self.params or head < seq or len(changes) > INCREMENTAL_LIMIT
+                        or (changes and changes[0]['seq'] != seq + 1)):
+                    conn.rollback()
+                    return self._backfill(conn)
+
+                result = self._apply_changes(conn, changes)
+                if result is None:
+                    conn.rollback()
+                    return self._backfill(conn)
+
+                self._write_progress(conn, head)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+            self._stats['updates'] += 1
+            self._stats['processed_changes'] += len(changes)
+            self._stats['rescored_locations'] += result['rescored']
+            return result
+
+    def _apply_changes(self, conn, changes):
+        """Fold logged daily_usage changes into the state tables
+
+        Runs inside update()'s write transaction. Returns None when so many
+        locations need rescoring that a backfill is the better option.
+        """
+        changes = [change for change in changes if change['table'] == 'daily_usage']
+        location_ids = sorted({change['location_id'] for change in changes})
+        states = {}
+        for chunk in _chunks(location_ids, 500):
+            states.update({row[0]: (row[1], (row[2], row[3], row[4])) for row in conn.execute(f"""
+                SELECT location_id, last_date, mean_gb, var_gb, observations
+                FROM anomaly_state WHERE location_id IN ({','.join('?' * len(chunk))})
+            """, chunk)})
+
+        dirty = set()
+        # Locations whose new days were read back from daily_usage already
+        # include the rest of this batch's changes to them
+        synced = set()
+        flagged = []
+        for change in changes:
+            location_id = change['location_id']
+            if location_id in dirty or location_id in synced:
+                continue
+            last_date, state = states.get(location_id, (None, None))
+            if change['operation'] == 'delete' or (last_date is not None and change['date'] <= last_date):
+                dirty.add(location_id)
+                continue
+
+            if change['operation'] == 'bulk':
+                for usage_date, usage in self._days_after(conn, location_id, last_date):
+                    state, anomaly = self.step(state, usage or 0.0)
+                    last_date = usage_date
+                    if anomaly:
+                        flagged.append((location_id, usage_date, usage or 0.0, anomaly))
+                if state is not None:
+                    states[location_id] = (last_date, state)
+                synced.add(location_id)
+                continue
+
+            state, anomaly = self.step(state, change['usage_gb'] or 0.0)
+            states[location_id] = (change['date'], state)
+            if anomaly:
+                flagged.append((location_id, change['date'], change['usage_gb'] or 0.0, anomaly))
+
+        if len(dirty) > RESCORE_LIMIT:
+            return None
+
+        conn.executemany("""
+            INSERT OR REPLACE INTO anomaly_state (location_id, last_date, mean_gb, var_gb, observations, updated_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, [(location_id, last_date, *state) for location_id, (last_date, state) in states.items()
+              if location_id not in dirty])
+        self._insert_anomalies(conn, [row for row in flagged if row[0] not in dirty])
+
+        for location_id in dirty:
+            self._rescore_location(conn, location_id)
+
+        return {'processed': len(changes), 'flagged': len(flagged), 'rescored': len(dirty), 'backfill': False}
+
+    def _insert_anomalies(self, conn, flagged):
+        conn.executemany("""
+            INSERT OR REPLACE INTO usage_anomalies
+                (location_id, date, kind, usage_gb, expected_gb, std_gb, z_score, detected_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, [(location_id, usage_date, kind, usage, expected, std, z)
+              for location_id, usage_date, usage, (kind, expected, std, z) in flagged])
+
+    def _days_after(self, conn, location_id, last_date):
+        """(date, usage_gb) of a location's days after last_date, in order"""
+        start_day = to_day(last_date) + 1 if last_date is not None else None
+        query = f"SELECT date, usage_gb FROM {usage_source(conn, start_day)} du WHERE location_id = ?"
+        params = [location_id]
+        if start_day is not None:
+            query += " AND day >= ?"
+            params.append(start_day)
+        return conn.execute(query + " ORDER BY day", params)
+
+    def _rescore_location(self, conn, location_id):
+        """Replace one location's state and anomalies by scoring its history"""
+        state, last_date, flagged = None, None, []
+        for usage_date, usage in conn.execute(f"""
+            SELECT date, usage_gb FROM {usage_source(conn)} du WHERE location_id = ? ORDER BY day
+        """, (location_id,)):
+            state, anomaly = self.step(state, usage or 0.0)
+            last_date = usage_date
+            if anomaly:
+                flagged.append((location_id, usage_date, usage or 0.0, anomaly))
+
+        conn.execute("DELETE FROM usage_anomalies WHERE location_id = ?", (location_id,))
+        conn.execute("DELETE FROM anomaly_state WHERE location_id = ?", (location_id,))
+        if state is not None:
+            conn.execute("""
+                INSERT INTO anomaly_state (location_id, last_date, mean_gb, var_gb, observations)
+                VALUES (?, ?, ?, ?, ?)
+            """, (location_id, last_date, *state))
+        self._insert_anomalies(conn, flagged)
+
+    def backfill(self, conn):
+        """Rescore all history from scratch"""
+        with self._lock:
+            return self._backfill(conn)
+
+    def _backfill(self, conn):
+        started = time.perf_counter()
+        attach_archives(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            head = get_last_seq(conn)
+            if head is None:
+                raise RuntimeError('change_log is missing, run migrations.py')
+            rows = conn.execute(f"SELECT location_id, date, usage_gb FROM {usage_source(conn)} du ORDER BY day").fetchall()
+
+            if np is not None:
+                states, flagged = self._score_history_vectorized(rows)
+            else:
+                states, flagged = self._score_history(rows)
+
+            conn.execute("DELETE FROM usage_anomalies")
+            conn.execute("DELETE FROM anomaly_state")
+            conn.executemany("""
+                INSERT INTO anomaly_state (location_id, last_date, mean_gb, var_gb, observations)
+                VALUES (?, ?, ?, ?, ?)
+            """, [(location_id, last_date, *state) for location_id, (last_date, state) in states.items()])
+            self._insert_anomalies(conn, flagged)
+            self._write_progress(conn, head)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        elapsed = time.perf_counter() - started
+        self._stats['backfills'] += 1
+        self._stats['last_backfill_seconds'] = round(elapsed, 3)
+        logger.info(f"Anomaly backfill scored {len(rows)} days across {len(states)} locations, "
+                    f"{len(flagged)} flagged in {elapsed:.3f}s")
+        return {'processed': len(rows), 'flagged': len(flagged), 'rescored': len(states),
+                'backfill': True, 'seconds': round(elapsed, 3)}
+
+    def _score_history(self, rows):
+        """Score (location_id, date, usage) rows in date order one by one"""
+        states, flagged = {}, []
+        for location_id, usage_date, usage in rows:
+            _, state = states.get(location_id, (None, None))
+            state, anomaly = self.step(state, usage or 0.0)
+            states[location_id] = (usage_date, state)
+            if anomaly:
+                flagged.append((location_id, usage_date, usage or 0.0, anomaly))
+        return states, flagged
+
+    def _score_history_vectorized(self, rows):
+        """step() applied to every location at once, one pass over the days
+
+        ``rows`` must be in date order. History is laid out as a day x
+        location grid; each iteration scores and updates all locations that
+        have a value that day.
+        """
+        if not rows:
+            return {}, []
+
+        location_ids, columns = np.unique(np.array([row[0] for row in rows], dtype=np.int64),
+                                          return_inverse=True)
+        # Rows arrive sorted by date, so a new day starts wherever the date changes
+        row_dates = np.array([row[1] for row in rows], dtype=str)
+        starts = np.r_[True, row_dates[1:] != row_dates[:-1]]
+        day_index = np.cumsum(starts) - 1
+        dates = row_dates[starts].tolist()
+        values = np.zeros((len(dates), len(location_ids)), dtype=np.float64)
+        present = np.zeros(values.shape, dtype=bool)
+        values[day_index, columns] = [row[2] or 0.0 for row in rows]
+        present[day_index, columns] = True
+
+        width = len(location_ids)
+        mean = np.zeros(width)
+        var = np.zeros(width)
+        observations = np.zeros(width, dtype=np.int64)
+        last_day = np.full(width, -1, dtype=np.int64)
+        flagged = []
+
+        for day in range(len(dates)):
+            usage = values[day]
+            seen = present[day]
+            first = seen & (observations == 0)
+            scoring = seen & (observations >= self.warmup)
+
+            std = np.sqrt(np.maximum(np.maximum(var, (STD_FLOOR_RATIO * mean) ** 2), STD_FLOOR_GB ** 2))
+            z = (usage - mean) / std
+            zero = scoring & (usage <= ZERO_USAGE_GB) & (mean >= MIN_ZERO_MEAN_GB)
+            spike = scoring & ~zero & (z > self.threshold)
+            drop = scoring & ~zero & (z < -self.threshold)
+            hit = zero | spike | drop
+
+            if hit.any():
+                for column in np.flatnonzero(hit).tolist():
+                    kind = 'zero' if zero[column] else 'spike' if spike[column] else 'drop'
+                    flagged.append((int(location_ids[column]), dates[day], float(usage[column]),
+                                    (kind, float(mean[column]), float(std[column]), float(z[column]))))
+
+            update = np.where(hit, np.clip(usage, mean - self.threshold * std, mean + self.threshold * std), usage)
+            folding = seen & ~first
+            diff = np.where(folding, update - mean, 0.0)
+            increment = self.alpha * diff
+            var = np.where(folding, (1 - self.alpha) * (var + diff * increment), var)
+            mean = np.where(folding, mean + increment, np.where(first, usage, mean))
+            observations += seen
+            last_day[seen] = day
+
+        states = {int(location_ids[column]): (dates[last_day[column]],
+                                              (float(mean[column]), float(var[column]), int(observations[column])))
+                  for column in range(width)}
+        return states, flagged
+
+    def anomalies(self, conn, since=None, location_id=None, kind=None, limit=100):
+        """Flagged days, newest first, with location names"""
+        query = """
+            SELECT a.id, a.location_id, l.display_name, a.date, a.kind, a.usage_gb,
+                   a.expected_gb, a.std_gb, a.z_score, a.detected_at
+            FROM usage_anomalies a
+            JOIN locations l ON a.location_id = l.id
+            WHERE 1=1
+        """
+        params = []
+        if since:
+            query += " AND a.date >= ?"
+            params.append(since)
+        if location_id:
+            query += " AND a.location_id = ?"
+            params.append(location_id)
+        if kind:
+            query += " AND a.kind = ?"
+            params.append(kind)
+        query += " ORDER BY a.date DESC, a.location_id LIMIT ?"
+        params.append(limit)
+        return [dict(zip(('id', 'location_id', 'display_name', 'date', 'kind', 'usage_gb',
+                          'expected_gb', 'std_gb', 'z_score', 'detected_at'), row))
+                for row in conn.execute(query, params)]
+
+    def stats(self):
+        return {'params': self.params, 'alpha': round(self.alpha, 4), 'threshold': self.threshold,
+                'warmup': self.warmup, **self._stats}
+
+class ScorerElection:
+    """Picks the one server process that scores anomalies
+
+    Every pre-forked worker follows the change feed, but scoring writes
+    under BEGIN IMMEDIATE, so only the process holding an exclusive lock on
+    ``path`` does it and the rest serve the stored results. The lock is
+    taken on first use and kept for the life of the process; if the scorer
+    exits, another worker takes over at its next change.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def elected(self):
+        if fcntl is None:
+            return True
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                return True
+            lock_file = None
+            try:
+                lock_file = open(self.path, 'a')
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError as e:
+                if lock_file is not None:
+                    lock_file.close()
+                if not isinstance(e, BlockingIOError):
+                    logger.warning(f"Could not take the anomaly scorer lock {self.path}: {e}")
+                return False
+            self._file, self._pid = lock_file, os.getpid()
+            logger.info(f"Process {self._pid} is scoring usage anomalies")
+            return True
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def init_app(app):
+    """Create the anomaly engine and keep it updated from the change feed"""
+    for key, value in DEFAULT_ANOMALY_CONFIG.items():
+        app.config.setdefault(key, value)
+
+    engine = AnomalyEngine(
+        span_days=app.config['ANOMALY_SPAN_DAYS'],
+        threshold=app.config['ANOMALY_Z_THRESHOLD'],
+        warmup=app.config['ANOMALY_WARMUP_DAYS']
+    )
+    pool = app.extensions['db_pool']
+    election = ScorerElection(os.path.join(os.path.dirname(os.path.abspath(app.config['DATABASE_PATH'])),
+                                           SCORER_LOCK_FILE))
+
+    def on_change():
+        if election.elected():
+            with pool.connection() as conn:
+                engine.update(conn)
+
+    # Runs on the feed thread, so scoring never delays a request; the feed's
+    # first poll brings the stored scores up to date on startup
+    feed = app.extensions.get('change_feed')
+    if feed is not None:
+        feed.add_listener(on_change)
+
+    app.extensions['anomaly_engine'] = engine
+    return engine
+
+def get_anomaly_engine():
+    """The anomaly engine registered on the current app"""
+    return current_app.extensions['anomaly_engine']
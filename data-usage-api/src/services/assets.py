@@ -0,0 +1,195 @@
+"""
+Static asset pipeline
+Fingerprints and pre-compresses the SPA's static files once at startup and
+serves them from an in-memory manifest with long-lived cache headers
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+import logging
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:  # gzip only without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Fingerprinted URLs never change content, so clients may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Unversioned URLs (index.html, old links) are revalidated with their ETag
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# Files smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 256
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# Files whose references to other assets are rewritten to fingerprinted names
+REWRITE_EXTENSIONS = ('.html',)
+ASSET_REFERENCE = re.compile(r'''(?P<attr>\b(?:src|href))=(?P<quote>["'])(?P<path>[^"'#?]+)(?P=quote)''')
+
+class Asset:
+    """One static file: its body, compressed variants and cache metadata"""
+
+    def __init__(self, path, body):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.set_body(body)
+
+    def set_body(self, body):
+        self.body = body
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.etag = self.digest[:16]
+        root, ext = posixpath.splitext(self.path)
+        self.hashed_path = f"{root}.{self.digest[:10]}{ext}"
+
+        self.variants = {}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            # mtime=0 keeps the gzip bytes (and so the response) reproducible
+            compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+            if len(compressed) < len(body):
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+                if len(compressed) < len(body):
+                    self.variants['br'] = compressed
+
+class AssetManifest:
+    """In-memory map of static paths and fingerprinted paths to assets
+
+    Built by scanning the static folder once; requests are then answered
+    without touching the filesystem. With ``auto_reload`` the folder's
+    modification times are checked on each request and the manifest is
+    rebuilt when they change, for working on the frontend.
+    """
+
+    def __init__(self, static_folder, auto_reload=False):
+        self.static_folder = static_folder
+        self.auto_reload = auto_reload
+        self.assets = {}
+        self.hashed = {}
+        self._signature = None
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        """Relative path -> (full path, mtime) for every static file"""
+        files = {}
+        for root, dirs, names in os.walk(self.static_folder):
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            for name in names:
+                if name.startswith('.'):
+                    continue
+                full_path = os.path.join(root, name)
+                relative = os.path.relpath(full_path, self.static_folder).replace(os.sep, '/')
+                files[relative] = (full_path, os.stat(full_path).st_mtime_ns)
+        return files
+
+    def build(self):
+        """Load, fingerprint and compress every static file"""
+        files = self._scan()
+        assets = {}
+        for relative, (full_path, _) in files.items():
+            with open(full_path, 'rb') as f:
+                assets[relative] = Asset(relative, f.read())
+
+        # Rewrite references after every asset has its fingerprint
+        for relative, asset in assets.items():
+            if relative.endswith(REWRITE_EXTENSIONS):
+                asset.set_body(self._rewrite(asset, assets))
+
+        with self._lock:
+            self.assets = assets
+            self.hashed = {asset.hashed_path: asset for asset in assets.values()}
+            self._signature = {relative: mtime for relative, (_, mtime) in files.items()}
+
+        raw = sum(len(asset.body) for asset in assets.values())
+        logger.info(f"Built static asset manifest: {len(assets)} files, {raw / 1024:.1f} KB, "
+                    f"brotli {'enabled' if brotli is not None else 'unavailable'}")
+        return self
+
+    def _rewrite(self, page, assets):
+        """Point a page's local src/href references at fingerprinted names"""
+        base = posixpath.dirname(page.path)
+
+        def replace(match):
+            path = match.group('path')
+            if '://' in path or path.startswith('//'):
+                return match.group(0)
+            absolute = path.startswith('/')
+            target = posixpath.normpath(path.lstrip('/') if absolute else posixpath.join(base, path))
+            asset = assets.get(target)
+            if asset is None or asset is page:
+                return match.group(0)
+            hashed = '/' + asset.hashed_path if absolute else posixpath.relpath(asset.hashed_path, base or '.')
+            return f"{match.group('attr')}={match.group('quote')}{hashed}{match.group('quote')}"
+
+        return ASSET_REFERENCE.sub(replace, page.body.decode('utf-8')).encode('utf-8')
+
+    def _reload_if_changed(self):
+        signature = {relative: mtime for relative, (_, mtime) in self._scan().items()}
+        if signature != self._signature:
+            self.build()
+
+    def lookup(self, path):
+        """(asset, immutable) for a request path, or (None, False)"""
+        if self.auto_reload:
+            self._reload_if_changed()
+        with self._lock:
+            asset = self.hashed.get(path)
+            if asset is not None:
+                return asset, True
+            return self.assets.get(path), False
+
+    def manifest(self):
+        """Original path -> fingerprinted path, with sizes per encoding"""
+        with self._lock:
+            return {
+                path: {
+                    'hashed_path': asset.hashed_path,
+                    'etag': asset.etag,
+                    'sizes': {'identity': len(asset.body),
+                              **{encoding: len(body) for encoding, body in asset.variants.items()}}
+                }
+                for path, asset in sorted(self.assets.items())
+            }
+
+def asset_response(asset, immutable):
+    """Serve an asset, picking the best encoding the client accepts"""
+    headers = {
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+        'ETag': f'"{asset.etag}"',
+        'Vary': 'Accept-Encoding'
+    }
+
+    if request.if_none_match.contains(asset.etag):
+        return Response(status=304, headers=headers)
+
+    body = asset.body
+    # Pre-compressed variants, smallest first
+    for encoding in ('br', 'gzip'):
+        if encoding in asset.variants and request.accept_encodings[encoding]:
+            body = asset.variants[encoding]
+            headers['Content-Encoding'] = encoding
+            break
+
+    return Response(body, mimetype=asset.mimetype, headers=headers)
+
+def init_app(app):
+    """Build the static asset manifest for the app's static folder"""
+    app.config.setdefault('STATIC_AUTO_RELOAD', False)
+    manifest = AssetManifest(app.static_folder, auto_reload=app.config['STATIC_AUTO_RELOAD'])
+    manifest.build()
+    app.extensions['asset_manifest'] = manifest
+    return manifest
+
+def get_asset_manifest():
+    """The asset manifest registered on the current app"""
+    return current_app.extensions['asset_manifest']
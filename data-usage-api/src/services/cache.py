@@ -0,0 +1,134 @@
+"""
+Data-version-aware response cache
+Serves repeat dashboard requests from memory until the database changes
+"""
+
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from functools import wraps
+from flask import Response, current_app, make_response, request
+from src.services.db import get_db_connection
+
+class ResponseCache:
+    """Bounded LRU of rendered responses tagged with the data version they saw"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0}
+
+    def get(self, key, version):
+        """Return the entry for key if it was rendered at this data version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry['version'] != version:
+                del self._entries[key]
+                self._stats['stale'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._stats['hits'],
+                'misses': self._stats['misses'],
+                'stale': self._stats['stale'],
+                'hit_ratio': round(self._stats['hits'] / lookups, 3) if lookups else None,
+                'bytes': sum(len(entry['body']) for entry in self._entries.values())
+            }
+
+def init_app(app):
+    """Create the response cache and register it on the Flask app"""
+    app.config.setdefault('RESPONSE_CACHE_SIZE', 256)
+    cache = ResponseCache(app.config['RESPONSE_CACHE_SIZE'])
+    app.extensions['response_cache'] = cache
+    return cache
+
+def get_data_version(conn):
+    """Read the change counter maintained by the schema triggers
+
+    Returns (version, last_modified) or (None, None) for databases that
+    predate the data_version table, in which case callers skip caching.
+    """
+    try:
+        row = conn.execute("SELECT version, updated_at FROM data_version WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        return None, None
+    if row is None:
+        return None, None
+
+    try:
+        modified = datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        modified = None
+    return row[0], modified
+
+def cached_response(view):
+    """Cache a GET view's 200 response until the data version changes
+
+    Entries are keyed by endpoint, query string and the current date (views
+    that look back N days from today change at midnight). Responses carry an
+    ETag and Last-Modified so repeat requests can be answered with 304.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = current_app.extensions.get('response_cache')
+        version, modified = get_data_version(get_db_connection())
+        if cache is None or version is None:
+            return view(*args, **kwargs)
+
+        key = (request.endpoint, tuple(sorted(request.args.items(multi=True))),
+               date.today().isoformat())
+        entry = cache.get(key, version)
+        status = 'HIT'
+
+        if entry is None:
+            status = 'MISS'
+            rendered = make_response(view(*args, **kwargs))
+            if rendered.status_code != 200 or rendered.is_streamed:
+                return rendered
+
+            body = rendered.get_data()
+            entry = {
+                'version': version,
+                'body': body,
+                'mimetype': rendered.mimetype,
+                'etag': f"{version}-{hashlib.sha1(body).hexdigest()[:16]}",
+                'last_modified': modified
+            }
+            cache.put(key, entry)
+
+        response = Response(entry['body'], mimetype=entry['mimetype'])
+        response.set_etag(entry['etag'])
+        if entry['last_modified'] is not None:
+            response.last_modified = entry['last_modified']
+        # Let browsers keep the body but revalidate on every use
+        response.cache_control.no_cache = True
+        response.headers['X-Cache'] = status
+        return response.make_conditional(request)
+
+    return wrapper
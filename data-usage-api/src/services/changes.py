@@ -0,0 +1,247 @@
+"""
+Change feed
+Follows the change_log table on one background thread and fans new changes
+out to Server-Sent Events subscribers, so dashboards stay live without each
+one polling the database
+"""
+
+import sqlite3
+import threading
+import time
+import logging
+from collections import deque
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through app.config
+DEFAULT_FEED_CONFIG = {
+    'CHANGE_POLL_INTERVAL': 1.0,        # seconds between checks for writes from other processes
+    'CHANGE_BUFFER_SIZE': 5000,         # recent changes served to subscribers from memory
+    'CHANGE_LOG_RETENTION': 100000,     # change_log rows kept in the database
+    'CHANGE_PRUNE_INTERVAL': 300,       # seconds between change_log prunes
+}
+
+# Changes sent per event and read per query
+CHANGE_BATCH_SIZE = 500
+
+def get_last_seq(conn):
+    """Newest change_log sequence number, 0 when empty, None before the migration"""
+    try:
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+def read_changes(conn, after_seq, limit=CHANGE_BATCH_SIZE):
+    """change_log rows after after_seq, oldest first, as event dicts"""
+    rows = conn.execute("""
+        SELECT seq, table_name, operation, row_id, location_id, date, usage_gb, changed_at
+        FROM change_log
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+    """, (after_seq, limit)).fetchall()
+    return [{
+        'seq': row[0],
+        'table': row[1],
+        'operation': row[2],
+        'id': row[3],
+        'location_id': row[4],
+        'date': row[5],
+        'usage_gb': row[6],
+        'changed_at': row[7]
+    } for row in rows]
+
+class ChangeFeed:
+    """Tails change_log into a bounded in-memory buffer
+
+    Subscribers wait on a condition for changes newer than the sequence
+    number they have seen. Ones that have fallen behind the buffer are served
+    from the database; ones whose position no longer exists (pruned, or the
+    database was restored) are told to reset.
+    """
+
+    def __init__(self, pool, poll_interval=1.0, buffer_size=5000, retention=100000, prune_interval=300):
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self.head = None
+        self._events = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_prune = time.monotonic()
+        self._listeners = []
+        self._stats = {'polls': 0, 'changes': 0, 'resets': 0, 'pruned': 0, 'subscribers': 0}
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def stopped(self):
+        """True once stop() was called; subscribers should end their streams"""
+        return self._stop.is_set()
+
+    def add_listener(self, callback):
+        """Call callback() on the feed thread whenever the head moves"""
+        self._listeners.append(callback)
+
+    def notify(self):
+        """Poll now instead of at the next interval, e.g. after a commit"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                previous = self.head
+                self.poll()
+                if self.head != previous:
+                    self._notify_listeners()
+                if time.monotonic() - self._last_prune >= self.prune_interval:
+                    self.prune()
+            except Exception as e:
+                logger.warning(f"Change feed poll failed: {e}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _notify_listeners(self):
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Change feed listener {getattr(callback, '__qualname__', callback)} failed: {e}")
+
+    def poll(self):
+        """Pull changes committed since the last poll into the buffer"""
+        with self.pool.connection() as conn:
+            last_seq = get_last_seq(conn)
+            self._stats['polls'] += 1
+            if last_seq is None:
+                return
+
+            if self.head is None or last_seq < self.head:
+                # First poll, or the database was replaced (e.g. restored)
+                if self.head is not None:
+                    logger.info(f"change_log moved back from {self.head} to {last_seq}, resetting feed")
+                    self._stats['resets'] += 1
+                with self._cond:
+                    self._events.clear()
+                    self.head = last_seq
+                    self._cond.notify_all()
+                return
+
+            while last_seq > self.head:
+                changes = read_changes(conn, self.head)
+                if not changes:
+                    break
+                with self._cond:
+                    self._events.extend(changes)
+                    self.head = changes[-1]['seq']
+                    self._cond.notify_all()
+                self._stats['changes'] += len(changes)
+
+    def prune(self):
+        """Drop change_log rows beyond the retention window"""
+        self._last_prune = time.monotonic()
+        if self.head is None or self.head <= self.retention:
+            return 0
+        with self.pool.connection() as conn:
+            deleted = conn.execute("DELETE FROM change_log WHERE seq <= ?",
+                                   (self.head - self.retention,)).rowcount
+            conn.commit()
+        self._stats['pruned'] += deleted
+        return deleted
+
+    def wait_for_changes(self, after_seq, timeout, limit=CHANGE_BATCH_SIZE):
+        """Block until there are changes after after_seq, or timeout
+
+        Returns ``('changes', events)`` (possibly empty on timeout), or
+        ``('reset', head)`` when after_seq cannot be resumed from.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.head is None or after_seq == self.head:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stop.is_set():
+                    return 'changes', []
+                self._cond.wait(remaining)
+
+            if after_seq > self.head:
+                return 'reset', self.head
+
+            if self._events and after_seq >= self._events[0]['seq'] - 1:
+                # Subscribers are normally close to the head, so scan from the end
+                newer = []
+                for event in reversed(self._events):
+                    if event['seq'] <= after_seq:
+                        break
+                    newer.append(event)
+                newer.reverse()
+                return 'changes', newer[:limit]
+
+        # Behind the buffer: read the gap from the database
+        with self.pool.connection() as conn:
+            changes = read_changes(conn, after_seq, limit)
+        if not changes or changes[0]['seq'] != after_seq + 1:
+            # The changes right after after_seq have been pruned
+            return 'reset', self.head
+        return 'changes', changes
+
+    def subscribed(self, delta):
+        with self._cond:
+            self._stats['subscribers'] += delta
+
+    def stats(self):
+        with self._cond:
+            return {
+                'head': self.head,
+                'buffered': len(self._events),
+                'buffer_size': self._events.maxlen,
+                'oldest_buffered': self._events[0]['seq'] if self._events else None,
+                'poll_interval': self.poll_interval,
+                'retention': self.retention,
+                **self._stats
+            }
+
+def init_app(app):
+    """Start the change feed on the app's connection pool"""
+    for key, value in DEFAULT_FEED_CONFIG.items():
+        app.config.setdefault(key, value)
+
+    feed = ChangeFeed(
+        app.extensions['db_pool'],
+        poll_interval=app.config['CHANGE_POLL_INTERVAL'],
+        buffer_size=app.config['CHANGE_BUFFER_SIZE'],
+        retention=app.config['CHANGE_LOG_RETENTION'],
+        prune_interval=app.config['CHANGE_PRUNE_INTERVAL']
+    )
+    # A pre-forking server starts the thread in each worker instead
+    app.config.setdefault('BACKGROUND_THREADS', True)
+    if app.config['BACKGROUND_THREADS']:
+        feed.start()
+    app.extensions['change_feed'] = feed
+    return feed
+
+def get_change_feed():
+    """The change feed registered on the current app"""
+    return current_app.extensions['change_feed']
+
+def notify_change_feed():
+    """Wake the feed after a write so subscribers hear about it immediately"""
+    feed = current_app.extensions.get('change_feed')
+    if feed is not None:
+        feed.notify()
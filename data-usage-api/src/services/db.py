@@ -0,0 +1,215 @@
+"""
+Shared SQLite connection layer
+Hands out pre-tuned pooled connections to the Flask blueprints
+"""
+
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from flask import current_app, g
+
+logger = logging.getLogger(__name__)
+
+# Pool defaults, overridable through app.config
+DEFAULT_POOL_CONFIG = {
+    'DB_POOL_SIZE': 8,                      # maximum open connections
+    'DB_POOL_TIMEOUT': 10,                  # seconds to wait for a free connection
+    'DB_CACHE_SIZE_KB': 16384,              # page cache per connection
+    'DB_MMAP_SIZE': 64 * 1024 * 1024,       # memory-mapped I/O window
+    'DB_BUSY_TIMEOUT_MS': 5000,             # wait on locks instead of failing
+    'DB_STATEMENT_CACHE': 256,              # prepared statements kept per connection
+}
+
+class PoolTimeout(RuntimeError):
+    """Raised when no pooled connection became free in time"""
+
+class ConnectionPool:
+    """Bounded pool of tuned SQLite connections
+
+    Idle connections are reused most-recently-released first so requests land
+    on a connection whose page cache is still warm. Connections are created
+    with check_same_thread=False so they can move between worker threads, but
+    each one is only ever held by a single request at a time.
+    """
+
+    def __init__(self, db_path, max_connections=8, timeout=10, cache_size_kb=16384,
+                 mmap_size=64 * 1024 * 1024, busy_timeout_ms=5000, statement_cache_size=256,
+                 factory=sqlite3.Connection):
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.statement_cache_size = statement_cache_size
+        self.factory = factory
+
+        self._idle = []
+        self._open = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._stats = {'hits': 0, 'misses': 0, 'waits': 0, 'timeouts': 0, 'wait_seconds': 0.0}
+
+    def _connect(self):
+        """Open a new connection with the standard pragmas applied"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size,
+            factory=self.factory
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kb)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def acquire(self):
+        """Check out a connection, waiting up to the pool timeout"""
+        with self._cond:
+            if self._idle:
+                self._stats['hits'] += 1
+                self._in_use += 1
+                return self._idle.pop()
+
+            if self._open >= self.max_connections:
+                self._stats['waits'] += 1
+                started = time.perf_counter()
+                deadline = started + self.timeout
+                while not self._idle and self._open >= self.max_connections:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"No database connection free after {self.timeout}s")
+                    self._cond.wait(remaining)
+                self._stats['wait_seconds'] += time.perf_counter() - started
+
+                if self._idle:
+                    self._stats['hits'] += 1
+                    self._in_use += 1
+                    return self._idle.pop()
+
+            # Reserve the slot before connecting outside the lock
+            self._open += 1
+            self._in_use += 1
+            self._stats['misses'] += 1
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn):
+        """Return a connection to the pool, discarding any open transaction"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger.warning(f"Dropping broken pooled connection: {e}")
+            conn.close()
+            with self._cond:
+                self._open -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append(conn)
+            self._in_use -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager for code running outside a request"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        """Pool counters for sizing"""
+        with self._cond:
+            checkouts = self._stats['hits'] + self._stats['misses']
+            return {
+                'max_connections': self.max_connections,
+                'open_connections': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'hits': self._stats['hits'],
+                'misses': self._stats['misses'],
+                'waits': self._stats['waits'],
+                'timeouts': self._stats['timeouts'],
+                'hit_ratio': round(self._stats['hits'] / checkouts, 3) if checkouts else None,
+                'avg_wait_ms': round(self._stats['wait_seconds'] * 1000 / self._stats['waits'], 2)
+                               if self._stats['waits'] else 0,
+                'statement_cache_size': self.statement_cache_size
+            }
+
+    def close_all(self):
+        """Close idle connections
+
+        Checked-out connections are not affected and rejoin the pool when
+        released. Called before forking workers, so no child inherits an
+        open SQLite handle, and on shutdown.
+        """
+        with self._cond:
+            while self._idle:
+                self._idle.pop().close()
+                self._open -= 1
+
+def init_app(app):
+    """Create the shared pool and register it on the Flask app"""
+    for key, value in DEFAULT_POOL_CONFIG.items():
+        app.config.setdefault(key, value)
+
+    # Statement timing, when the metrics middleware was installed first
+    metrics = app.extensions.get('metrics')
+
+    pool = ConnectionPool(
+        app.config['DATABASE_PATH'],
+        max_connections=app.config['DB_POOL_SIZE'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+        cache_size_kb=app.config['DB_CACHE_SIZE_KB'],
+        mmap_size=app.config['DB_MMAP_SIZE'],
+        busy_timeout_ms=app.config['DB_BUSY_TIMEOUT_MS'],
+        statement_cache_size=app.config['DB_STATEMENT_CACHE'],
+        factory=metrics.connection_class if metrics is not None else sqlite3.Connection
+    )
+    app.extensions['db_pool'] = pool
+    app.teardown_appcontext(_release_connection)
+    return pool
+
+def get_pool():
+    """The pool registered on the current app"""
+    return current_app.extensions['db_pool']
+
+def get_db_connection():
+    """Get the pooled connection bound to the current request"""
+    if 'db_conn' not in g:
+        g.db_conn = get_pool().acquire()
+    return g.db_conn
+
+def detach_db_connection():
+    """Take ownership of the request's connection away from teardown
+
+    Used by streaming responses that keep reading after the view returns;
+    the caller must hand the connection back with ``get_pool().release()``.
+    """
+    return g.pop('db_conn', None)
+
+def _release_connection(exception=None):
+    """Return the request's connection to the pool on teardown"""
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().release(conn)
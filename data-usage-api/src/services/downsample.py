@@ -0,0 +1,127 @@
+"""
+Chart series reduction
+Largest-Triangle-Three-Buckets downsampling and calendar bucketing for the
+usage trend series
+"""
+
+from collections import OrderedDict
+from datetime import date, timedelta
+
+# Bucket modes accepted by /api/dashboard/usage-trends
+BUCKET_MODES = ('week', 'cycle', 'month')
+
+# Bounds for the max_points parameter; fewer than 3 points leaves no room for
+# anything between the kept endpoints
+MIN_POINTS = 3
+MAX_POINTS = 5000
+
+def lttb_indices(x, y, threshold):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets
+
+    The first and last points are always kept. The points in between are
+    split into threshold - 2 buckets, and from each bucket the point forming
+    the largest triangle with the previously kept point and the average of
+    the next bucket is chosen, which keeps peaks and troughs.
+    """
+    length = len(x)
+    if threshold >= length or threshold < MIN_POINTS:
+        return list(range(length))
+
+    kept = [0]
+    every = (length - 2) / (threshold - 2)
+    previous = 0
+
+    for bucket in range(threshold - 2):
+        # Average of the next bucket; for the final bucket that is the last point
+        avg_start = int((bucket + 1) * every) + 1
+        avg_end = min(int((bucket + 2) * every) + 1, length)
+        span = avg_end - avg_start
+        avg_x = sum(x[avg_start:avg_end]) / span
+        avg_y = sum(y[avg_start:avg_end]) / span
+
+        px, py = x[previous], y[previous]
+        best, best_area = avg_start - 1, -1.0
+        for index in range(int(bucket * every) + 1, avg_start):
+            area = abs((px - avg_x) * (y[index] - py) - (px - x[index]) * (avg_y - py))
+            if area > best_area:
+                best, best_area = index, area
+
+        kept.append(best)
+        previous = best
+
+    kept.append(length - 1)
+    return kept
+
+def _parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def bucket_start(day, mode):
+    """First day of the week (Monday), billing cycle (13th) or month holding day"""
+    if mode == 'week':
+        return day - timedelta(days=day.weekday())
+    if mode == 'month':
+        return day.replace(day=1)
+    # Billing cycles run from the 13th to the 12th of the next month
+    if day.day >= 13:
+        return day.replace(day=13)
+    previous = day.replace(day=1) - timedelta(days=1)
+    return previous.replace(day=13)
+
+def bucket_end(start, mode):
+    """Last day of the bucket starting at start"""
+    if mode == 'week':
+        return start + timedelta(days=6)
+    following = (start.replace(day=28) + timedelta(days=4)).replace(day=start.day)
+    return following - timedelta(days=1)
+
+def bucket_rows(rows, mode):
+    """Sum daily trend rows into calendar buckets per location
+
+    ``rows`` are /usage-trends rows in date order; the result has the same
+    shape with ``date`` set to the bucket start, plus ``period_end`` and the
+    number of ``days`` with data.
+    """
+    buckets = OrderedDict()
+    for row in rows:
+        day = _parse_date(row['date'])
+        if day is None:
+            continue
+        start = bucket_start(day, mode)
+        key = (start, row['display_name'])
+        if key not in buckets:
+            buckets[key] = {'date': start.isoformat(),
+                            'period_end': bucket_end(start, mode).isoformat(),
+                            'display_name': row['display_name'],
+                            'daily_total': 0.0,
+                            'days': 0}
+        buckets[key]['daily_total'] += row['daily_total']
+        buckets[key]['days'] += 1
+    return sorted(buckets.values(), key=lambda row: row['date'])
+
+def downsample_rows(rows, max_points):
+    """Reduce each location's series to at most max_points with LTTB
+
+    Rows keep their order; a location's series is only touched when it has
+    more than max_points points.
+    """
+    series = OrderedDict()
+    keep = set()
+    for position, row in enumerate(rows):
+        day = _parse_date(row['date'])
+        if day is None:
+            keep.add(position)
+        else:
+            series.setdefault(row['display_name'], []).append((position, day.toordinal()))
+
+    for points in series.values():
+        if len(points) <= max_points:
+            keep.update(position for position, _ in points)
+            continue
+        x = [ordinal for _, ordinal in points]
+        y = [rows[position]['daily_total'] for position, _ in points]
+        keep.update(points[index][0] for index in lttb_indices(x, y, max_points))
+
+    return [row for position, row in enumerate(rows) if position in keep]
@@ -0,0 +1,186 @@
+"""
+Billing cycle forecasting
+Projects each location's 13th-to-12th cycle total from the days recorded so
+far and its recent daily usage, with a confidence band, for all locations
+in one vectorized pass
+"""
+
+import threading
+import logging
+from collections import OrderedDict
+from datetime import timedelta
+from statistics import NormalDist
+from flask import current_app
+from database import to_day
+from partitions import usage_source
+from src.services.cache import get_data_version
+from src.services.downsample import bucket_end, bucket_start
+
+try:
+    import numpy as np
+except ImportError:  # the forecast endpoint reports itself unavailable
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through app.config
+DEFAULT_FORECAST_CONFIG = {
+    'FORECAST_CONFIDENCE': 0.9,      # coverage of the projected band
+    'FORECAST_HISTORY_DAYS': 28,     # recent days used for the daily rate and its spread
+    'FORECAST_PRIOR_DAYS': 7,        # weight, in days, of pre-cycle history in the rate
+}
+
+# Projections kept per (data version, as-of date)
+FORECAST_CACHE_SIZE = 16
+
+# Spread assumed, relative to the rate, when too few days exist to measure it
+FALLBACK_STD_RATIO = 0.25
+
+class UsageForecaster:
+    """Vectorized end-of-cycle projections with a per-data-version cache
+
+    The daily rate for the rest of the cycle is the cycle's mean so far,
+    shrunk towards the mean of the days before the cycle started, which
+    count as ``prior_days`` observations. The band combines day-to-day
+    variation over the remaining days with the uncertainty of the rate.
+    """
+
+    def __init__(self, confidence=0.9, history_days=28, prior_days=7):
+        self.confidence = confidence
+        self.history_days = history_days
+        self.prior_days = prior_days
+        self.z = NormalDist().inv_cdf((1 + confidence) / 2)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def forecast(self, conn, as_of):
+        """Projections for the cycle containing as_of, cached until data changes"""
+        version, _ = get_data_version(conn)
+        key = (version, as_of.isoformat())
+        with self._lock:
+            if version is not None and key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        result = self._compute(conn, as_of)
+
+        if version is not None:
+            with self._lock:
+                self._cache[key] = result
+                while len(self._cache) > FORECAST_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return result
+
+    def _compute(self, conn, as_of):
+        cycle_start = bucket_start(as_of, 'cycle')
+        cycle_end = bucket_end(cycle_start, 'cycle')
+        previous_start = bucket_start(cycle_start - timedelta(days=1), 'cycle')
+        window_start = min(cycle_start, as_of - timedelta(days=self.history_days - 1))
+        cycle_days = (cycle_end - cycle_start).days + 1
+
+        locations = conn.execute("""
+            SELECT id, display_name FROM locations WHERE is_active = 1 ORDER BY id
+        """).fetchall()
+        rows = conn.execute(f"""
+            SELECT date, location_id, usage_gb
+            FROM {usage_source(conn, to_day(window_start), to_day(as_of))}
+            WHERE day BETWEEN ? AND ?
+        """, (to_day(window_start), to_day(as_of))).fetchall()
+        previous_totals = dict(conn.execute("""
+            SELECT location_id, total_usage_gb FROM cycle_usage_totals WHERE period_start = ?
+        """, (previous_start.isoformat(),)).fetchall())
+
+        # Day x location grid over the window, with a presence mask
+        column_of = {row[0]: column for column, row in enumerate(locations)}
+        days = (as_of - window_start).days + 1
+        values = np.zeros((days, len(locations)))
+        present = np.zeros(values.shape, dtype=bool)
+        day_of = {(window_start + timedelta(days=day)).isoformat(): day for day in range(days)}
+        cells = [(day_of[row[0]], column_of[row[1]], row[2] or 0.0)
+                 for row in rows if row[0] in day_of and row[1] in column_of]
+        if cells:
+            day_index, columns, usage = (np.array(part) for part in zip(*cells))
+            values[day_index, columns] = usage
+            present[day_index, columns] = True
+
+        in_cycle = np.arange(days) >= (cycle_start - window_start).days
+        recent = np.arange(days) >= days - self.history_days
+
+        recorded = (present & in_cycle[:, None]).sum(axis=0)
+        to_date = np.where(in_cycle[:, None], values, 0.0).sum(axis=0)
+
+        prior_mask = present & ~in_cycle[:, None]
+        prior_count = prior_mask.sum(axis=0)
+        prior_mean = np.divide(np.where(prior_mask, values, 0.0).sum(axis=0), prior_count,
+                               out=np.full(len(locations), np.nan), where=prior_count > 0)
+        prior_weight = np.where(prior_count > 0, self.prior_days, 0)
+
+        weight = recorded + prior_weight
+        rate = np.divide(to_date + prior_weight * np.nan_to_num(prior_mean), weight,
+                         out=np.full(len(locations), np.nan), where=weight > 0)
+
+        # Sample standard deviation of recent days
+        recent_mask = present & recent[:, None]
+        recent_count = recent_mask.sum(axis=0)
+        recent_sum = np.where(recent_mask, values, 0.0).sum(axis=0)
+        recent_mean = np.divide(recent_sum, recent_count, out=np.zeros(len(locations)), where=recent_count > 0)
+        squares = np.where(recent_mask, (values - recent_mean) ** 2, 0.0).sum(axis=0)
+        std = np.sqrt(np.divide(squares, recent_count - 1, out=np.full(len(locations), np.nan),
+                                where=recent_count > 1))
+        std = np.where(np.isnan(std), FALLBACK_STD_RATIO * np.nan_to_num(rate), std)
+
+        remaining = cycle_days - recorded
+        projected = to_date + remaining * rate
+        spread = np.sqrt(remaining * std ** 2 + remaining ** 2 * np.divide(
+            std ** 2, weight, out=np.zeros(len(locations)), where=weight > 0))
+        lower = np.maximum(to_date, projected - self.z * spread)
+        upper = projected + self.z * spread
+
+        forecasts = []
+        for column, location in enumerate(locations):
+            known = not np.isnan(rate[column])
+            forecasts.append({
+                'location_id': location[0],
+                'display_name': location[1],
+                'days_recorded': int(recorded[column]),
+                'days_remaining': int(remaining[column]),
+                'usage_to_date': round(float(to_date[column]), 3),
+                'daily_rate': round(float(rate[column]), 3) if known else None,
+                'projected_total': round(float(projected[column]), 3) if known else None,
+                'lower': round(float(lower[column]), 3) if known else None,
+                'upper': round(float(upper[column]), 3) if known else None,
+                'previous_cycle_total': previous_totals.get(location[0])
+            })
+
+        # Largest projections first, locations without data last
+        forecasts.sort(key=lambda row: -row['projected_total'] if row['projected_total'] is not None
+                       else float('inf'))
+        return {
+            'as_of': as_of.isoformat(),
+            'cycle_start': cycle_start.isoformat(),
+            'cycle_end': cycle_end.isoformat(),
+            'cycle_days': cycle_days,
+            'days_elapsed': (as_of - cycle_start).days + 1,
+            'confidence': self.confidence,
+            'locations': forecasts
+        }
+
+def init_app(app):
+    """Create the forecaster, if NumPy is available"""
+    for key, value in DEFAULT_FORECAST_CONFIG.items():
+        app.config.setdefault(key, value)
+    if np is None:
+        logger.info("NumPy not installed, /api/dashboard/forecast is unavailable")
+        return None
+
+    forecaster = UsageForecaster(
+        confidence=app.config['FORECAST_CONFIDENCE'],
+        history_days=app.config['FORECAST_HISTORY_DAYS'],
+        prior_days=app.config['FORECAST_PRIOR_DAYS']
+    )
+    app.extensions['usage_forecaster'] = forecaster
+    return forecaster
+
+def get_forecaster():
+    """The app's forecaster, or None without NumPy"""
+    return current_app.extensions.get('usage_forecaster')
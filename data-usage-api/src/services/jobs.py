@@ -0,0 +1,241 @@
+"""
+Background job runner
+Runs backup, restore and verify operations off the request thread and
+tracks their progress for polling
+"""
+
+import os
+import json
+import re
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from flask import current_app
+from backup_manager import BackupManager
+
+try:
+    import fcntl
+except ImportError:  # Windows: jobs are only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept for status queries
+DEFAULT_JOB_HISTORY = 50
+
+# Seconds between progress writes to the shared state directory
+PROGRESS_SAVE_INTERVAL = 0.5
+
+JOB_ID = re.compile(r'^[0-9a-f]{12}$')
+FINISHED = ('succeeded', 'failed')
+
+class JobRunner:
+    """Runs jobs one at a time on a single worker thread
+
+    Backup, restore and verify all read or replace the same database file,
+    so they are serialized rather than run concurrently. With ``state_dir``
+    set, each job's status is also written there so any server process can
+    report it, and a lock file there serializes jobs across processes.
+    """
+
+    def __init__(self, history_size=DEFAULT_JOB_HISTORY, state_dir=None):
+        self.history_size = history_size
+        self.state_dir = state_dir
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='job-runner')
+
+    def submit(self, job_type, func, params=None):
+        """Queue func(progress) and return the new job's status
+
+        ``progress(stage, done, total)`` may be called from the job to report
+        how far it has got; its return value becomes the job result.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'id': job_id,
+            'type': job_type,
+            'status': 'queued',
+            'params': params or {},
+            'progress': {'stage': None, 'done': 0, 'total': 0, 'percent': 0.0},
+            'result': None,
+            'error': None,
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'seconds': None
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._prune()
+            self._save(job)
+            snapshot = self._copy(job)
+
+        self._executor.submit(self._run, job_id, func)
+        return snapshot
+
+    def _run(self, job_id, func):
+        last_save = [0.0]
+
+        def progress(stage, done, total):
+            with self._lock:
+                job = self._jobs[job_id]
+                job['progress'] = {
+                    'stage': stage,
+                    'done': done,
+                    'total': total,
+                    'percent': round(done * 100 / total, 1) if total else 0.0
+                }
+                if time.monotonic() - last_save[0] >= PROGRESS_SAVE_INTERVAL:
+                    last_save[0] = time.monotonic()
+                    self._save(job)
+
+        with self._exclusive():
+            with self._lock:
+                job = self._jobs[job_id]
+                job['status'] = 'running'
+                job['started_at'] = datetime.now().isoformat()
+                self._save(job)
+            started = time.perf_counter()
+
+            try:
+                result = func(progress)
+                status, error = 'succeeded', None
+            except Exception as e:
+                logger.error(f"Job {job_id} ({job['type']}) failed: {e}")
+                result, status, error = None, 'failed', str(e)
+
+            with self._lock:
+                job['status'] = status
+                job['result'] = result
+                job['error'] = error
+                job['finished_at'] = datetime.now().isoformat()
+                job['seconds'] = round(time.perf_counter() - started, 3)
+                self._save(job)
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the state directory's lock file, when there is one
+
+        Other processes' jobs wait here, still reported as queued.
+        """
+        if not self.state_dir or fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.state_dir, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _prune(self):
+        """Drop the oldest finished jobs beyond the history size"""
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job['status'] in FINISHED]
+        for job_id in finished[:max(0, len(self._jobs) - self.history_size)]:
+            del self._jobs[job_id]
+
+        if self.state_dir:
+            stored = sorted((job for job in self._load_all() if job['status'] in FINISHED),
+                            key=lambda job: job['created_at'])
+            for job in stored[:max(0, len(stored) - self.history_size)]:
+                try:
+                    os.remove(self._state_path(job['id']))
+                except FileNotFoundError:
+                    pass
+
+    def _state_path(self, job_id):
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _save(self, job):
+        """Write a job's status to the state directory (called with the lock held)"""
+        if not self.state_dir:
+            return
+        path = self._state_path(job['id'])
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump({**job, 'pid': os.getpid()}, f, default=str)
+            os.replace(path + '.tmp', path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not save state of job {job['id']}: {e}")
+
+    def _load(self, job_id):
+        """A job written by any process, or None"""
+        if not self.state_dir or not JOB_ID.match(job_id):
+            return None
+        try:
+            with open(self._state_path(job_id), 'r') as f:
+                job = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # A job whose process is gone will never finish
+        pid = job.pop('pid', None)
+        if job['status'] not in FINISHED and pid is not None and not _process_alive(pid):
+            job['status'] = 'failed'
+            job['error'] = 'The server process running this job exited'
+        return job
+
+    def _load_all(self):
+        if not self.state_dir:
+            return []
+        jobs = (self._load(name[:-5]) for name in os.listdir(self.state_dir) if name.endswith('.json'))
+        return [job for job in jobs if job is not None]
+
+    def _copy(self, job):
+        return {**job, 'progress': dict(job['progress'])}
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return self._copy(job)
+        return self._load(job_id)
+
+    def list(self):
+        """All tracked jobs, newest first, including other processes' jobs"""
+        with self._lock:
+            jobs = [self._copy(job) for job in reversed(self._jobs.values())]
+        if self.state_dir:
+            local = {job['id'] for job in jobs}
+            jobs += [job for job in self._load_all() if job['id'] not in local]
+            jobs.sort(key=lambda job: job['created_at'], reverse=True)
+        return jobs[:self.history_size] if self.state_dir else jobs
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # alive, but owned by another user
+    return True
+
+def init_app(app):
+    """Create the job runner and register it on the Flask app"""
+    app.config.setdefault('BACKUP_DIR', os.path.join(os.path.dirname(app.config['DATABASE_PATH']), 'backups'))
+    app.config.setdefault('JOB_HISTORY_SIZE', DEFAULT_JOB_HISTORY)
+    # Shared by every process when the app runs in several workers
+    app.config.setdefault('JOB_STATE_DIR', None)
+    runner = JobRunner(app.config['JOB_HISTORY_SIZE'], state_dir=app.config['JOB_STATE_DIR'])
+    app.extensions['job_runner'] = runner
+    return runner
+
+def get_runner():
+    """The job runner registered on the current app"""
+    return current_app.extensions['job_runner']
+
+def get_backup_manager():
+    """A BackupManager for the app's database and backup directory"""
+    return BackupManager(current_app.config['DATABASE_PATH'], current_app.config['BACKUP_DIR'])
@@ -0,0 +1,496 @@
+"""
+Request and SQL metrics
+Records per-endpoint request counts, latency and response size histograms,
+and per-statement SQLite timings, for Prometheus and the System tab
+"""
+
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from flask import current_app, g, request
+
+# Defaults, overridable through app.config
+DEFAULT_METRICS_CONFIG = {
+    'METRICS_SQL': True,                # time statements on pooled connections
+    'METRICS_MAX_STATEMENTS': 200,      # distinct statements tracked; the rest are pooled as "other"
+}
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# SQLite virtual machine instructions between progress callbacks
+PROGRESS_STEPS = 1000
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METRIC_PREFIX = 'data_usage'
+
+# Requests that matched no route share one label, so bad URLs cannot grow the series
+UNMATCHED_ENDPOINT = '<unmatched>'
+OTHER_STATEMENT = '<other>'
+
+IN_LIST = re.compile(r'\?(?:\s*,\s*\?)+')
+STATEMENT_CACHE_SIZE = 1024
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum and max"""
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating within its bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def cumulative(self):
+        """(le, cumulative count) pairs in Prometheus order, ending with +Inf"""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            pairs.append(('+Inf' if bound == float('inf') else repr(bound), total))
+        return pairs
+
+def statement_operation(sql):
+    """Coarse statement type used as the SQL histogram label"""
+    keyword = sql.split(None, 1)[0].upper() if sql.strip() else ''
+    if keyword in ('SELECT', 'WITH'):
+        return 'select'
+    if keyword in ('INSERT', 'REPLACE'):
+        return 'insert'
+    if keyword in ('UPDATE', 'DELETE', 'PRAGMA'):
+        return keyword.lower()
+    if keyword in ('BEGIN', 'COMMIT', 'END', 'ROLLBACK', 'SAVEPOINT', 'RELEASE'):
+        return 'transaction'
+    return 'other'
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that charges execute and batch fetch time to its statement
+
+    Iteration and fetchone() are left to the C cursor so that reading rows
+    one at a time costs what it does on a plain connection; their rows are
+    not counted. A statement is recorded once fetchall() or a short
+    fetchmany() exhausts it, the cursor is re-executed or closed, or (for
+    statements returning no rows) right after it runs.
+    """
+
+    _pending = None
+
+    def _start(self, sql):
+        self._finish()
+        self._pending = [sql, 0.0, 0, self.connection.vm_ticks]
+
+    def _finish(self, error=False):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        steps = (self.connection.vm_ticks - pending[3]) * PROGRESS_STEPS
+        self.connection.metrics.record_statement(pending[0], pending[1], pending[2], steps, error)
+
+    def _run(self, method, sql, args):
+        self._start(sql)
+        started = time.perf_counter()
+        try:
+            method(self, sql, *args)
+        except Exception:
+            self._pending[1] += time.perf_counter() - started
+            self._finish(error=True)
+            raise
+        self._pending[1] += time.perf_counter() - started
+        if self.description is None:
+            self._pending[2] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def execute(self, sql, parameters=(), /):
+        return self._run(sqlite3.Cursor.execute, sql, (parameters,))
+
+    def executemany(self, sql, seq_of_parameters, /):
+        return self._run(sqlite3.Cursor.executemany, sql, (seq_of_parameters,))
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        result = method(self, *args)
+        if self._pending is not None:
+            self._pending[1] += time.perf_counter() - started
+        return result
+
+    def fetchmany(self, size=None):
+        rows = self._fetch(sqlite3.Cursor.fetchmany, self.arraysize if size is None else size)
+        if self._pending is not None:
+            self._pending[2] += len(rows)
+            if len(rows) < (self.arraysize if size is None else size):
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(sqlite3.Cursor.fetchall)
+        if self._pending is not None:
+            self._pending[2] += len(rows)
+            self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements are timed into ``metrics``
+
+    SQLite's progress handler counts virtual machine instructions, so each
+    statement's record also shows how much work SQLite did for it.
+    """
+
+    metrics = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.vm_ticks = 0
+        self.set_progress_handler(self._on_progress, PROGRESS_STEPS)
+
+    def _on_progress(self):
+        self.vm_ticks += 1
+        return 0
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # Connection.execute() runs the C cursor implementation directly, so
+    # route it through an instrumented cursor
+    def execute(self, sql, parameters=(), /):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters, /):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+class MetricsRegistry:
+    """In-process request and SQL metrics, safe to update from any thread"""
+
+    def __init__(self, track_sql=True, max_statements=200):
+        self.track_sql = track_sql
+        self.max_statements = max_statements
+        self.started_at = time.time()
+        self.in_flight = 0
+        # Label of the pre-forked worker process, None when serving alone
+        self.worker = None
+        self._endpoints = {}
+        self._statements = {}
+        self._operations = {}
+        self._normalized = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # sqlite3.connect() factory for pooled connections
+        self.connection_class = (type('InstrumentedConnection', (InstrumentedConnection,), {'metrics': self})
+                                 if track_sql else sqlite3.Connection)
+
+    def _normalize(self, sql):
+        """Collapse whitespace and variable-length IN lists"""
+        normalized = self._normalized.get(sql)
+        if normalized is None:
+            normalized = IN_LIST.sub('?, ...', ' '.join(sql.split()))
+            if len(self._normalized) >= STATEMENT_CACHE_SIZE:
+                self._normalized.clear()
+            self._normalized[sql] = normalized
+        return normalized
+
+    # Requests
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+        self._local.sql = [0.0, 0]
+        return time.perf_counter()
+
+    def request_finished(self, endpoint, method, status, started, size):
+        elapsed = time.perf_counter() - started
+        sql = getattr(self._local, 'sql', None) or [0.0, 0]
+        self._local.sql = None
+        key = (endpoint or UNMATCHED_ENDPOINT, method)
+        with self._lock:
+            self.in_flight -= 1
+            stats = self._endpoints.get(key)
+            if stats is None:
+                stats = self._endpoints[key] = {
+                    'statuses': {},
+                    'latency': Histogram(LATENCY_BUCKETS),
+                    'size': Histogram(SIZE_BUCKETS),
+                    'sql_seconds': 0.0,
+                    'sql_statements': 0
+                }
+            stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+            stats['latency'].observe(elapsed)
+            if size is not None:
+                stats['size'].observe(size)
+            stats['sql_seconds'] += sql[0]
+            stats['sql_statements'] += sql[1]
+
+    # SQL
+
+    def record_statement(self, sql, seconds, rows, steps, error=False):
+        statement = self._normalize(sql)
+        operation = statement_operation(statement)
+
+        # Attribute to the request running on this thread, if any
+        current = getattr(self._local, 'sql', None)
+        if current is not None:
+            current[0] += seconds
+            current[1] += 1
+
+        with self._lock:
+            stats = self._statements.get(statement)
+            if stats is None:
+                if len(self._statements) >= self.max_statements:
+                    statement = OTHER_STATEMENT
+                    stats = self._statements.get(statement)
+                if stats is None:
+                    stats = self._statements[statement] = {
+                        'operation': operation if statement != OTHER_STATEMENT else 'other',
+                        'calls': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'rows': 0, 'vm_steps': 0
+                    }
+            stats['calls'] += 1
+            stats['errors'] += error
+            stats['seconds'] += seconds
+            stats['rows'] += rows
+            stats['vm_steps'] += steps
+            if seconds > stats['max_seconds']:
+                stats['max_seconds'] = seconds
+
+            totals = self._operations.get(operation)
+            if totals is None:
+                totals = self._operations[operation] = {
+                    'latency': Histogram(SQL_BUCKETS), 'errors': 0, 'rows': 0, 'vm_steps': 0
+                }
+            totals['latency'].observe(seconds)
+            totals['errors'] += error
+            totals['rows'] += rows
+            totals['vm_steps'] += steps
+
+    # Output
+
+    def summary(self, statements=20):
+        """JSON-friendly view: endpoints by total time, slowest statements"""
+        with self._lock:
+            endpoints = []
+            for (endpoint, method), stats in self._endpoints.items():
+                latency = stats['latency']
+                endpoints.append({
+                    'endpoint': endpoint,
+                    'method': method,
+                    'requests': latency.count,
+                    'errors': sum(count for status, count in stats['statuses'].items() if status >= 500),
+                    'statuses': {str(status): count for status, count in sorted(stats['statuses'].items())},
+                    'mean_ms': round(latency.sum * 1000 / latency.count, 2) if latency.count else None,
+                    'p50_ms': _ms(latency.quantile(0.5)),
+                    'p95_ms': _ms(latency.quantile(0.95)),
+                    'p99_ms': _ms(latency.quantile(0.99)),
+                    'max_ms': _ms(latency.max),
+                    'total_ms': _ms(latency.sum),
+                    'avg_size_bytes': round(stats['size'].sum / stats['size'].count) if stats['size'].count else None,
+                    'sql_ms': _ms(stats['sql_seconds']),
+                    'sql_statements': stats['sql_statements']
+                })
+
+            top = sorted(self._statements.items(), key=lambda item: item[1]['seconds'], reverse=True)[:statements]
+            slow_statements = [{
+                'statement': statement,
+                'operation': stats['operation'],
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'total_ms': _ms(stats['seconds']),
+                'mean_ms': round(stats['seconds'] * 1000 / stats['calls'], 3),
+                'max_ms': _ms(stats['max_seconds']),
+                'rows': stats['rows'],
+                'vm_steps': stats['vm_steps']
+            } for statement, stats in top]
+
+            operations = {operation: {
+                'calls': totals['latency'].count,
+                'errors': totals['errors'],
+                'total_ms': _ms(totals['latency'].sum),
+                'p95_ms': _ms(totals['latency'].quantile(0.95)),
+                'rows': totals['rows'],
+                'vm_steps': totals['vm_steps']
+            } for operation, totals in sorted(self._operations.items())}
+
+            return {
+                'worker': self.worker,
+                'started_at': self.started_at,
+                'uptime_seconds': round(time.time() - self.started_at, 1),
+                'in_flight': self.in_flight,
+                'sql_tracking': self.track_sql,
+                'endpoints': sorted(endpoints, key=lambda row: row['total_ms'], reverse=True),
+                'sql': {'operations': operations, 'statements': slow_statements,
+                        'tracked_statements': len(self._statements)}
+            }
+
+    def prometheus(self):
+        """Prometheus text exposition format"""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+
+        def sample(name, labels, value):
+            if self.worker is not None:
+                labels = {'worker': self.worker, **labels}
+            label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {_number(value)}" if labels
+                         else f"{METRIC_PREFIX}_{name} {_number(value)}")
+
+        def histogram(name, labels, hist):
+            for le, count in hist.cumulative():
+                sample(f"{name}_bucket", {**labels, 'le': le}, count)
+            sample(f"{name}_sum", labels, hist.sum)
+            sample(f"{name}_count", labels, hist.count)
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            operations = sorted(self._operations.items())
+
+            family('process_start_time_seconds', 'gauge', 'Start time of the process since the epoch')
+            sample('process_start_time_seconds', {}, self.started_at)
+            family('http_requests_in_flight', 'gauge', 'Requests currently being handled')
+            sample('http_requests_in_flight', {}, self.in_flight)
+
+            family('http_requests_total', 'counter', 'Requests handled, by endpoint, method and status')
+            for (endpoint, method), stats in endpoints:
+                for status, count in sorted(stats['statuses'].items()):
+                    sample('http_requests_total', {'endpoint': endpoint, 'method': method, 'status': status}, count)
+
+            family('http_request_duration_seconds', 'histogram', 'Request latency')
+            for (endpoint, method), stats in endpoints:
+                histogram('http_request_duration_seconds', {'endpoint': endpoint, 'method': method}, stats['latency'])
+
+            family('http_response_size_bytes', 'histogram', 'Response body size')
+            for (endpoint, method), stats in endpoints:
+                histogram('http_response_size_bytes', {'endpoint': endpoint, 'method': method}, stats['size'])
+
+            family('http_request_sql_seconds_total', 'counter', 'Time spent in SQL statements while handling requests')
+            for (endpoint, method), stats in endpoints:
+                sample('http_request_sql_seconds_total', {'endpoint': endpoint, 'method': method}, stats['sql_seconds'])
+
+            family('sql_statement_duration_seconds', 'histogram', 'SQLite statement time including fetchmany() and fetchall()')
+            for operation, totals in operations:
+                histogram('sql_statement_duration_seconds', {'operation': operation}, totals['latency'])
+
+            family('sql_rows_total', 'counter', 'Rows changed by SQLite statements or read with fetchmany() and fetchall()')
+            for operation, totals in operations:
+                sample('sql_rows_total', {'operation': operation}, totals['rows'])
+
+            family('sql_errors_total', 'counter', 'SQLite statements that raised an error')
+            for operation, totals in operations:
+                sample('sql_errors_total', {'operation': operation}, totals['errors'])
+
+            family('sql_vm_steps_total', 'counter',
+                   f'SQLite virtual machine instructions, in steps of {PROGRESS_STEPS}')
+            for operation, totals in operations:
+                sample('sql_vm_steps_total', {'operation': operation}, totals['vm_steps'])
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._statements.clear()
+            self._operations.clear()
+            self.started_at = time.time()
+
+    def set_worker(self, worker):
+        """Start counting afresh as one of several pre-forked workers
+
+        Every worker keeps its own counters and answers scrapes for itself,
+        so its series carry a ``worker`` label; add them up in queries,
+        e.g. ``sum without (worker) (rate(...))``.
+        """
+        self.reset()
+        with self._lock:
+            self.in_flight = 0
+            self.worker = str(worker)
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _counting(body, counter):
+    """Pass a streamed body through, adding each chunk's size to counter"""
+    for chunk in body:
+        counter[0] += len(chunk)
+        yield chunk
+
+def init_app(app):
+    """Install the request metrics middleware
+
+    Runs before the connection pool is created, which picks up
+    ``connection_class`` to time SQL on every pooled connection.
+    """
+    for key, value in DEFAULT_METRICS_CONFIG.items():
+        app.config.setdefault(key, value)
+
+    registry = MetricsRegistry(track_sql=app.config['METRICS_SQL'],
+                               max_statements=app.config['METRICS_MAX_STATEMENTS'])
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = registry.request_started()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        endpoint, method, status = request.endpoint, request.method, response.status_code
+
+        if response.is_streamed:
+            # Time and size are only known once the body has been sent
+            counter = [0]
+            response.response = _counting(response.response, counter)
+            response.call_on_close(lambda: registry.request_finished(endpoint, method, status, started, counter[0]))
+        else:
+            registry.request_finished(endpoint, method, status, started, response.calculate_content_length())
+        return response
+
+    app.extensions['metrics'] = registry
+    return registry
+
+def get_metrics():
+    """The metrics registry registered on the current app"""
+    return current_app.extensions['metrics']
@@ -0,0 +1,107 @@
+"""
+Keyset pagination and streamed JSON helpers
+Shared by the list endpoints so large tables never sit in memory at once
+"""
+
+import base64
+import json
+from flask import Response, jsonify
+from src.services.db import detach_db_connection, get_pool
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Rows pulled off the cursor per fetchmany() while streaming
+STREAM_FETCH_SIZE = 500
+
+class CursorError(ValueError):
+    """Raised for a malformed or foreign pagination cursor"""
+
+def encode_cursor(values):
+    """Encode the sort key of the last row on a page as an opaque token"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token, key_length, types=None):
+    """Decode a token from encode_cursor(), or None for the first page
+
+    Cursors come from clients, so ``types`` can give a converter per value
+    (e.g. ``to_day``, ``int``); a value they reject is a CursorError.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise CursorError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != key_length:
+        raise CursorError('Invalid cursor')
+    if types is not None:
+        try:
+            values = [convert(value) for convert, value in zip(types, values)]
+        except (ValueError, TypeError, OverflowError):
+            raise CursorError('Invalid cursor')
+    return values
+
+def get_page_size(args, default=DEFAULT_PAGE_SIZE):
+    """Read the limit query parameter, clamped to MAX_PAGE_SIZE"""
+    limit = args.get('limit', default, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def page_response(rows, limit, key):
+    """Build a page envelope from rows fetched with LIMIT limit + 1
+
+    The extra row only signals that another page exists; ``key`` maps the
+    last returned row to its keyset sort values for the next cursor.
+    """
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(key(rows[limit - 1])) if len(rows) > limit else None
+    return jsonify({'items': items, 'next_cursor': next_cursor, 'limit': limit})
+
+def stream_response(chunks, mimetype, close=None, headers=None):
+    """Stream a generator that reads from the request's connection
+
+    ``close`` is called once the body is done or the client goes away,
+    before the connection is returned to the pool.
+    """
+    # Teardown runs before the body is sent, so the response keeps the
+    # request's pooled connection until the last row has been read
+    conn = detach_db_connection()
+    pool = get_pool()
+    released = []
+
+    def release():
+        if not released:
+            released.append(True)
+            if close is not None:
+                close()
+            if conn is not None:
+                pool.release(conn)
+
+    def generate():
+        try:
+            yield from chunks
+        finally:
+            release()
+
+    response = Response(generate(), mimetype=mimetype, headers=headers)
+    # Also covers clients that disconnect before the body is started
+    response.call_on_close(release)
+    return response
+
+def stream_json_array(cursor):
+    """Stream a cursor's rows as a JSON array without materializing them"""
+    def generate():
+        yield '['
+        first = True
+        while True:
+            rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            chunk = ','.join(json.dumps(dict(row), separators=(',', ':')) for row in rows)
+            yield chunk if first else ',' + chunk
+            first = False
+        yield ']\n'
+
+    return stream_response(generate(), 'application/json', close=cursor.close)
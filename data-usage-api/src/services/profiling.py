@@ -0,0 +1,381 @@
+"""
+On-demand request profiling
+Runs individual API requests under cProfile and tracemalloc, when asked for
+with a header or picked by sampling, and keeps the results in a bounded
+on-disk store
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+import logging
+from datetime import datetime
+from flask import current_app, g, request
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through app.config
+DEFAULT_PROFILING_CONFIG = {
+    'PROFILING_ENABLED': False,         # honour the X-Profile request header
+    'PROFILE_SAMPLE_RATE': 0.0,         # share of requests profiled without the header
+    'PROFILE_SAMPLE_MODE': 'all',       # what sampled requests collect: cpu, memory or all
+    'PROFILE_DIR': None,                # default: profiles/ next to the database
+    'PROFILE_MAX_FILES': 50,            # profiles kept, oldest removed first
+    'PROFILE_MAX_MB': 100,              # total size of the store
+    'PROFILE_TRACEMALLOC_FRAMES': 10,   # stack depth recorded per allocation
+}
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+# Header values and what they collect
+PROFILE_MODES = {
+    '1': ('cpu', 'memory'),
+    'all': ('cpu', 'memory'),
+    'cpu': ('cpu',),
+    'memory': ('memory',),
+}
+
+# Functions and allocation sites kept in each profile's summary
+SUMMARY_ROWS = 25
+
+# Requests never profiled: the store's own routes
+EXCLUDED_PREFIX = '/api/system/profiles'
+
+PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{9}-[0-9a-f]{8}$')
+PROFILE_FILES = {'pstats': '.pstats', 'tracemalloc': '.tracemalloc'}
+
+class ProfileSession:
+    """cProfile and/or tracemalloc running for one request"""
+
+    def __init__(self, modes, trigger, frames):
+        self.modes = modes
+        self.trigger = trigger
+        self.profiler = None
+        self.started_tracing = False
+        self.snapshot = None
+        self.peak_bytes = None
+        self.started_at = time.time()
+        # Known up front so streamed responses can send it before their body
+        stamp = datetime.fromtimestamp(self.started_at).strftime('%Y%m%dT%H%M%S%f')[:-3]
+        self.id = f"{stamp}-{uuid.uuid4().hex[:8]}"
+
+        if 'memory' in modes:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start(frames)
+                self.started_tracing = True
+            self.baseline_bytes = tracemalloc.get_traced_memory()[0]
+        if 'cpu' in modes:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.started = time.perf_counter()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+        if self.profiler is not None:
+            self.profiler.disable()
+        if 'memory' in self.modes:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak_bytes = peak - self.baseline_bytes
+            self.retained_bytes = current - self.baseline_bytes
+            self.snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+            ))
+            if self.started_tracing:
+                tracemalloc.stop()
+
+def _short_path(filename):
+    """Trim site-packages and project prefixes from a source path"""
+    for marker in ('site-packages' + os.sep, 'data-usage-api' + os.sep):
+        index = filename.rfind(marker)
+        if index != -1:
+            return filename[index + len(marker):]
+    return filename
+
+def _function_label(filename, line, name):
+    # Built-ins are recorded as ('~', 0, '<built-in method ...>')
+    if filename == '~':
+        return name
+    return f"{_short_path(filename)}:{line}({name})"
+
+def cpu_summary(profiler, limit=SUMMARY_ROWS):
+    """Top functions by cumulative and by own time"""
+    stats = pstats.Stats(profiler).stats
+    rows = [{
+        'function': _function_label(filename, line, name),
+        'calls': calls,
+        'own_ms': round(own * 1000, 3),
+        'cumulative_ms': round(cumulative * 1000, 3)
+    } for (filename, line, name), (_, calls, own, cumulative, _) in stats.items()]
+    return {
+        'functions': len(rows),
+        'calls': sum(row['calls'] for row in rows),
+        'by_cumulative': sorted(rows, key=lambda row: row['cumulative_ms'], reverse=True)[:limit],
+        'by_own_time': sorted(rows, key=lambda row: row['own_ms'], reverse=True)[:limit]
+    }
+
+def memory_summary(session, limit=SUMMARY_ROWS):
+    """Peak and retained memory, and the largest live allocation sites"""
+    statistics = session.snapshot.statistics('lineno')
+    return {
+        'peak_kb': round(session.peak_bytes / 1024, 1),
+        'retained_kb': round(session.retained_bytes / 1024, 1),
+        'top_allocations': [{
+            'location': f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+            'size_kb': round(stat.size / 1024, 1),
+            'count': stat.count
+        } for stat in statistics[:limit]]
+    }
+
+class ProfileStore:
+    """Directory of profiles: a JSON summary plus raw pstats/tracemalloc dumps
+
+    Pruned after every save to ``max_files`` profiles and ``max_bytes``,
+    oldest first.
+    """
+
+    def __init__(self, directory, max_files=50, max_bytes=100 * 1024 * 1024):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id, suffix):
+        return os.path.join(self.directory, profile_id + suffix)
+
+    def save(self, session, details):
+        """Write a finished session's dumps and summary"""
+        profile_id = session.id
+        os.makedirs(self.directory, exist_ok=True)
+        summary = {
+            'id': profile_id,
+            'created_at': datetime.fromtimestamp(session.started_at).isoformat(timespec='milliseconds'),
+            'trigger': session.trigger,
+            'modes': list(session.modes),
+            'duration_ms': round(session.duration * 1000, 3),
+            # Pre-forked workers share the store
+            'worker': os.getpid(),
+            **details,
+            'files': {}
+        }
+
+        if session.profiler is not None:
+            path = self._path(profile_id, PROFILE_FILES['pstats'])
+            session.profiler.dump_stats(path)
+            summary['files']['pstats'] = os.path.getsize(path)
+            summary['cpu'] = cpu_summary(session.profiler)
+        if session.snapshot is not None:
+            path = self._path(profile_id, PROFILE_FILES['tracemalloc'])
+            session.snapshot.dump(path)
+            summary['files']['tracemalloc'] = os.path.getsize(path)
+            summary['memory'] = memory_summary(session)
+
+        with self._lock:
+            with open(self._path(profile_id, '.json'), 'w') as f:
+                json.dump(summary, f, indent=2)
+            self._prune()
+
+    def _prune(self):
+        profiles = sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith('.json'))
+        sizes = {profile_id: sum(os.path.getsize(self._path(profile_id, suffix))
+                                 for suffix in ('.json',) + tuple(PROFILE_FILES.values())
+                                 if os.path.exists(self._path(profile_id, suffix)))
+                 for profile_id in profiles}
+        total = sum(sizes.values())
+        # Ids start with their timestamp, so sorted order is oldest first
+        while profiles and (len(profiles) > self.max_files or total > self.max_bytes):
+            oldest = profiles.pop(0)
+            total -= sizes[oldest]
+            self._remove(oldest)
+
+    def _remove(self, profile_id):
+        for suffix in ('.json',) + tuple(PROFILE_FILES.values()):
+            try:
+                os.remove(self._path(profile_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def list(self):
+        """Summaries without the per-function tables, newest first"""
+        profiles = []
+        if not os.path.isdir(self.directory):
+            return profiles
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if not name.endswith('.json'):
+                continue
+            summary = self.get(name[:-5])
+            if summary is None:
+                continue
+            cpu = summary.pop('cpu', None)
+            memory = summary.pop('memory', None)
+            if cpu is not None:
+                summary['cpu_calls'] = cpu['calls']
+            if memory is not None:
+                summary['peak_kb'] = memory['peak_kb']
+            profiles.append(summary)
+        return profiles
+
+    def get(self, profile_id):
+        if not PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(self._path(profile_id, '.json'), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def file_path(self, profile_id, kind):
+        """Path of a raw dump, or None"""
+        if not PROFILE_ID.match(profile_id) or kind not in PROFILE_FILES:
+            return None
+        path = self._path(profile_id, PROFILE_FILES[kind])
+        return path if os.path.exists(path) else None
+
+    def delete(self, profile_id):
+        if self.get(profile_id) is None:
+            return False
+        with self._lock:
+            self._remove(profile_id)
+        return True
+
+class RequestProfiler:
+    """Decides which requests to profile and runs at most one at a time
+
+    cProfile and tracemalloc are process-wide on recent Pythons, so a
+    request arriving while another is profiled simply runs unprofiled.
+    """
+
+    def __init__(self, store, enabled=False, sample_rate=0.0, sample_mode='all', frames=10):
+        self.store = store
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.sample_modes = PROFILE_MODES.get(sample_mode, PROFILE_MODES['all'])
+        self.frames = frames
+        self._busy = threading.Lock()
+        self._stats = {'profiled': 0, 'skipped_busy': 0, 'failed': 0}
+
+    def start(self):
+        """Begin profiling the current request if it was asked for or sampled"""
+        header = request.headers.get(PROFILE_HEADER) if self.enabled else None
+        if header:
+            modes, trigger = PROFILE_MODES.get(header.lower()), 'header'
+            if modes is None:
+                return None
+        elif self.sample_rate and random.random() < self.sample_rate:
+            modes, trigger = self.sample_modes, 'sampled'
+        else:
+            return None
+
+        if request.path.startswith(EXCLUDED_PREFIX):
+            return None
+        if not self._busy.acquire(blocking=False):
+            self._stats['skipped_busy'] += 1
+            return None
+        try:
+            return ProfileSession(modes, trigger, self.frames)
+        except Exception as e:
+            self._busy.release()
+            logger.warning(f"Could not start request profiling: {e}")
+            return None
+
+    def finish(self, session, details, save=True):
+        """Stop a session and store it unless it is discarded"""
+        try:
+            session.stop()
+            if save:
+                self.store.save(session, details)
+                self._stats['profiled'] += 1
+        except Exception as e:
+            self._stats['failed'] += 1
+            logger.warning(f"Could not save request profile {session.id}: {e}")
+        finally:
+            self._busy.release()
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'sample_rate': self.sample_rate,
+            'directory': self.store.directory,
+            'max_files': self.store.max_files,
+            'max_mb': round(self.store.max_bytes / (1024 * 1024), 1),
+            **self._stats
+        }
+
+def init_app(app):
+    """Install the profiling hooks, only if profiling can ever trigger
+
+    With the header disabled and no sampling, no hooks are registered, so
+    requests pay nothing for the feature.
+    """
+    for key, value in DEFAULT_PROFILING_CONFIG.items():
+        app.config.setdefault(key, value)
+
+    directory = app.config['PROFILE_DIR'] or os.path.join(
+        os.path.dirname(os.path.abspath(app.config['DATABASE_PATH'])), 'profiles')
+    profiler = RequestProfiler(
+        ProfileStore(directory, max_files=app.config['PROFILE_MAX_FILES'],
+                     max_bytes=app.config['PROFILE_MAX_MB'] * 1024 * 1024),
+        enabled=app.config['PROFILING_ENABLED'],
+        sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+        sample_mode=app.config['PROFILE_SAMPLE_MODE'],
+        frames=app.config['PROFILE_TRACEMALLOC_FRAMES']
+    )
+    app.extensions['request_profiler'] = profiler
+
+    if not profiler.enabled and not profiler.sample_rate:
+        return profiler
+
+    @app.before_request
+    def start_profile():
+        session = profiler.start()
+        if session is not None:
+            g.profile_session = session
+
+    @app.after_request
+    def finish_profile(response):
+        session = g.pop('profile_session', None)
+        if session is None:
+            return response
+        details = {
+            'method': request.method,
+            'path': request.path,
+            'query': request.query_string.decode('utf-8', 'replace'),
+            'endpoint': request.endpoint,
+            'status': response.status_code
+        }
+
+        if response.mimetype == 'text/event-stream':
+            # Event streams never end on their own; don't hold the profiler
+            profiler.finish(session, details, save=False)
+            return response
+
+        response.headers[PROFILE_ID_HEADER] = session.id
+        if response.is_streamed:
+            # The body is produced while it is sent, so stop once it has been
+            response.call_on_close(lambda: profiler.finish(session, details))
+        else:
+            profiler.finish(session, details)
+        return response
+
+    @app.teardown_request
+    def abandon_profile(exception=None):
+        # Only reached with a session when after_request never ran
+        session = g.pop('profile_session', None)
+        if session is not None:
+            profiler.finish(session, {'method': request.method, 'path': request.path,
+                                      'endpoint': request.endpoint, 'status': 500})
+
+    return profiler
+
+def get_profiler():
+    """The request profiler registered on the current app"""
+    return current_app.extensions['request_profiler']
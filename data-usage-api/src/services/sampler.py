@@ -0,0 +1,171 @@
+"""
+Background system metrics sampler
+Collects host metrics on a timer into a fixed-size ring buffer so status
+requests never block on psutil
+"""
+
+import os
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime
+import psutil
+
+logger = logging.getLogger(__name__)
+
+# Numeric series available from the history endpoint
+HISTORY_METRICS = ('cpu_percent', 'memory_percent', 'disk_percent', 'temperature_c')
+
+# Seconds /status measures CPU for before the first sample lands; a
+# non-blocking reading needs a previous call to diff against
+FALLBACK_CPU_INTERVAL = 0.1
+
+def read_temperature():
+    """Raspberry Pi SoC temperature in Celsius, or None elsewhere"""
+    try:
+        with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
+            return round(int(f.read().strip()) / 1000, 1)
+    except (OSError, ValueError):
+        return None
+
+def collect_system_status(db_path, cpu_interval=None):
+    """Take one sample in the /api/system/status response shape
+
+    With cpu_interval=None, CPU usage is measured since the previous call,
+    which is what the sampler thread relies on to avoid blocking.
+    """
+    cpu_percent = psutil.cpu_percent(interval=cpu_interval)
+
+    memory = psutil.virtual_memory()
+    disk = psutil.disk_usage('/')
+
+    boot_time = datetime.fromtimestamp(psutil.boot_time())
+    uptime = datetime.now() - boot_time
+
+    db_size = 0
+    if os.path.exists(db_path):
+        db_size = round(os.path.getsize(db_path) / (1024**2), 2)  # MB
+
+    temperature = read_temperature()
+
+    return {
+        'cpu_percent': cpu_percent,
+        'memory': {
+            'percent': memory.percent,
+            'available_gb': round(memory.available / (1024**3), 2),
+            'total_gb': round(memory.total / (1024**3), 2)
+        },
+        'disk': {
+            'percent': round((disk.used / disk.total) * 100, 2),
+            'free_gb': round(disk.free / (1024**3), 2),
+            'total_gb': round(disk.total / (1024**3), 2)
+        },
+        'uptime_days': uptime.days,
+        'uptime_hours': uptime.seconds // 3600,
+        'database_size_mb': db_size,
+        # Fallback for non-Raspberry Pi systems
+        'temperature_c': temperature if temperature is not None else "N/A",
+        'timestamp': datetime.now().isoformat()
+    }
+
+class SystemSampler:
+    """Daemon thread sampling host metrics every ``interval`` seconds"""
+
+    def __init__(self, db_path, interval=5.0, history_size=720):
+        self.db_path = db_path
+        self.interval = interval
+        self._samples = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        # Prime psutil so the first real sample has a baseline to diff against
+        psutil.cpu_percent(interval=None)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='system-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        # Short first wait so /status has a meaningful CPU figure quickly
+        self._stop.wait(min(self.interval, 1.0))
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.take_sample()
+            except Exception as e:
+                logger.warning(f"System sample failed: {e}")
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def take_sample(self):
+        """Collect one sample into the ring buffer"""
+        sample = collect_system_status(self.db_path)
+        sample['_time'] = time.time()
+        with self._lock:
+            self._samples.append(sample)
+
+    def latest(self):
+        """Most recent sample, or None before the first one lands"""
+        with self._lock:
+            if not self._samples:
+                return None
+            sample = dict(self._samples[-1])
+        sample.pop('_time', None)
+        return sample
+
+    def history(self, points=120, since=None):
+        """Downsample the buffer to at most ``points`` bucket averages"""
+        with self._lock:
+            samples = list(self._samples)
+        if since is not None:
+            samples = [s for s in samples if s['_time'] >= since]
+
+        points = max(1, points)
+        bucket_size = max(1, -(-len(samples) // points))  # ceiling division
+        series = []
+        for start in range(0, len(samples), bucket_size):
+            bucket = samples[start:start + bucket_size]
+            point = {'timestamp': bucket[-1]['timestamp'], 'samples': len(bucket)}
+            for metric in HISTORY_METRICS:
+                values = [v for v in (_metric_value(s, metric) for s in bucket) if v is not None]
+                point[metric] = round(sum(values) / len(values), 2) if values else None
+            series.append(point)
+
+        return {
+            'interval_seconds': self.interval,
+            'bucket_seconds': self.interval * bucket_size,
+            'capacity': self._samples.maxlen,
+            'points': series
+        }
+
+def _metric_value(sample, metric):
+    if metric == 'memory_percent':
+        return sample['memory']['percent']
+    if metric == 'disk_percent':
+        return sample['disk']['percent']
+    value = sample.get(metric)
+    return value if isinstance(value, (int, float)) else None
+
+def init_app(app):
+    """Start the background sampler for the app's database"""
+    app.config.setdefault('SYSTEM_SAMPLE_INTERVAL', 5.0)
+    app.config.setdefault('SYSTEM_HISTORY_SIZE', 720)
+    sampler = SystemSampler(
+        app.config['DATABASE_PATH'],
+        interval=app.config['SYSTEM_SAMPLE_INTERVAL'],
+        history_size=app.config['SYSTEM_HISTORY_SIZE']
+    )
+    # A pre-forking server starts the thread in each worker instead
+    app.config.setdefault('BACKGROUND_THREADS', True)
+    if app.config['BACKGROUND_THREADS']:
+        sampler.start()
+    app.extensions['system_sampler'] = sampler
+    return sampler
@@ -0,0 +1,643 @@
+"""
+In-memory date x location usage matrix
+Holds daily_usage as a dense NumPy grid with a presence mask so dashboard
+aggregates are vectorized slices instead of SQL GROUP BYs
+"""
+
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from flask import current_app
+from database import from_day, to_day
+from partitions import list_archives, usage_source
+from src.services.cache import get_data_version
+from src.services.changes import get_last_seq, notify_change_feed, read_changes
+from src.services.downsample import bucket_end
+
+try:
+    import numpy as np
+except ImportError:  # the dashboard falls back to SQL without it
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Extra days allocated on either side when the date range has to grow, so a
+# run of new days does not reallocate the grid every time
+DATE_GROWTH_DAYS = 64
+
+# Relative tolerance when comparing matrix sums with SQLite's
+SUM_TOLERANCE = 1e-9
+
+# Beyond this many logged changes a full reload is cheaper than replaying them
+CATCH_UP_LIMIT = 50000
+
+# Largest grid loaded, in day x location cells of 9 bytes (value and presence
+# flag); bigger databases are served by SQL. Overridable as USAGE_MATRIX_MAX_CELLS
+DEFAULT_MAX_CELLS = 8_000_000
+
+# Rows converted into the grid per fetchmany()
+LOAD_FETCH_SIZE = 50000
+
+class UsageChanges:
+    """daily_usage changes made inside one tracked write transaction"""
+
+    def __init__(self):
+        self.upserts = []
+        self.deletes = []
+        self.range_deletes = []
+        self.bulk = False
+
+    def upsert(self, usage_date, location_id, usage_gb):
+        self.upserts.append((usage_date, location_id, usage_gb))
+
+    def delete(self, usage_date, location_id):
+        self.deletes.append((usage_date, location_id))
+
+    def delete_range(self, start_date, end_date, location_ids=None):
+        self.range_deletes.append((start_date, end_date, location_ids or None))
+
+    def bulk_load(self):
+        """Mark the write as a bulk load, too large to list cell by cell"""
+        self.bulk = True
+
+class UsageMatrix:
+    """Dense float64 grid of usage by day (rows) and location (columns)
+
+    ``present`` marks which cells hold a daily_usage row, so missing days are
+    not mistaken for zero usage. The grid is loaded from SQLite and then kept
+    current by applying the changes of tracked writes. Writes it was not told
+    about (other processes, untracked routes) are replayed from change_log;
+    when that is not possible the matrix is reloaded.
+    """
+
+    def __init__(self, db_path, max_cells=DEFAULT_MAX_CELLS):
+        self.db_path = db_path
+        self.max_cells = max_cells
+        # Cells the data would need while that is over max_cells, else None
+        self.oversize = None
+        self.version = None
+        self.seq = None  # change_log position matching version
+        self.stale = True
+        self._failed_version = None
+        self._lock = threading.RLock()
+        self._stats = {'loads': 0, 'applied_writes': 0, 'caught_up_changes': 0,
+                       'last_load_seconds': None, 'loaded_at': None}
+        self._reset()
+
+    def _reset(self):
+        self.start = None  # np.datetime64 of row 0
+        self.values = np.zeros((0, 0), dtype=np.float64)
+        self.present = np.zeros((0, 0), dtype=bool)
+        self.location_ids = np.zeros(0, dtype=np.int64)
+        self.location_index = {}
+        self.display_names = []
+        self.active = np.zeros(0, dtype=bool)
+
+    def load(self, conn):
+        """(Re)build the grid from the database in one read transaction
+
+        Archived years are included; they are attached before the
+        transaction begins. The grid is sized from the day range first and
+        filled a batch of rows at a time, so the rows are never all held as
+        Python objects. When it would exceed ``max_cells`` nothing is loaded
+        and ``oversize`` is set, and callers use SQL instead.
+        """
+        started = time.perf_counter()
+        loaded = 0
+        with self._lock:
+            source = usage_source(conn, table='daily_usage_compact')
+            # The grid and the version have to come from the same snapshot
+            began = not conn.in_transaction
+            if began:
+                conn.execute("BEGIN")
+            try:
+                version, _ = get_data_version(conn)
+                seq = get_last_seq(conn)
+                locations = conn.execute(
+                    "SELECT id, display_name, is_active FROM locations ORDER BY id").fetchall()
+                first_day, last_day = self._day_bounds(conn)
+                days = last_day - first_day + 1 if first_day is not None else 0
+
+                self._reset()
+                cells = days * len(locations)
+                if cells > self.max_cells:
+                    if self.oversize is None:
+                        logger.warning(f"Usage matrix would need {cells} cells (limit {self.max_cells}), "
+                                       f"dashboard aggregates will use SQL")
+                    self.oversize = cells
+                    self.version = version
+                    self.seq = None
+                    self.stale = False
+                    return
+                self.oversize = None
+
+                self.location_ids = np.array([row[0] for row in locations], dtype=np.int64)
+                self.location_index = {int(row[0]): index for index, row in enumerate(locations)}
+                self.display_names = [row[1] for row in locations]
+                self.active = np.array([bool(row[2]) for row in locations], dtype=bool)
+                self.values = np.zeros((days, len(locations)), dtype=np.float64)
+                self.present = np.zeros((days, len(locations)), dtype=bool)
+                if days:
+                    # Day numbers count from 1970-01-01 like datetime64[D]
+                    self.start = np.datetime64(first_day, 'D')
+                    index_of = np.zeros(int(self.location_ids.max()) + 1, dtype=np.int64)
+                    index_of[self.location_ids] = np.arange(len(locations))
+                    cursor = conn.execute(f"SELECT day, location_id, usage_gb FROM {source}")
+                    while True:
+                        rows = cursor.fetchmany(LOAD_FETCH_SIZE)
+                        if not rows:
+                            break
+                        batch = np.array(rows, dtype=np.float64)
+                        day_index = batch[:, 0].astype(np.int64) - first_day
+                        columns = index_of[batch[:, 1].astype(np.int64)]
+                        self.values[day_index, columns] = np.nan_to_num(batch[:, 2])
+                        self.present[day_index, columns] = True
+                        loaded += len(rows)
+            finally:
+                if began:
+                    conn.rollback()
+
+            self.version = version
+            self.seq = seq
+            self.stale = False
+            elapsed = time.perf_counter() - started
+            self._stats['loads'] += 1
+            self._stats['last_load_seconds'] = round(elapsed, 3)
+            self._stats['loaded_at'] = time.time()
+
+        logger.info(f"Loaded usage matrix: {loaded} values, {self.values.shape[0]} days x "
+                    f"{self.values.shape[1]} locations in {elapsed:.3f}s")
+
+    def _day_bounds(self, conn):
+        """First and last day numbers with usage, archives included
+
+        Separate MIN and MAX subqueries each read one end of the day index;
+        archives contribute the bounds recorded in their registry.
+        """
+        first_day, last_day = conn.execute("""
+            SELECT (SELECT MIN(day) FROM daily_usage_compact), (SELECT MAX(day) FROM daily_usage_compact)
+        """).fetchone()
+        for archive in list_archives(conn):
+            if archive['min_day'] is not None:
+                first_day = archive['min_day'] if first_day is None else min(first_day, archive['min_day'])
+                last_day = archive['max_day'] if last_day is None else max(last_day, archive['max_day'])
+        return first_day, last_day
+
+    def ensure_fresh(self, conn):
+        """Reload if the database has changed behind the matrix's back"""
+        version, _ = get_data_version(conn)
+        with self._lock:
+            if not self.stale and version == self.version:
+                return
+            # Don't retry a failing load on every request, only once the data changes
+            if self._failed_version is not None and version == self._failed_version:
+                raise RuntimeError(f"Usage matrix could not be loaded at data version {version}")
+            if not self.stale and self.seq is not None and self.catch_up(conn):
+                return
+            try:
+                self.load(conn)
+            except Exception:
+                self._failed_version = version
+                raise
+            self._failed_version = None
+
+    def catch_up(self, conn):
+        """Replay change_log rows written since the matrix's position
+
+        A bulk import logs only its earliest date per location, so those
+        locations are re-read from that date. Returns False when the log
+        cannot bring the matrix up to date: rows were pruned, a location
+        changed, or there are too many rows to replay.
+        """
+        with self._lock:
+            began = not conn.in_transaction
+            if began:
+                conn.execute("BEGIN")
+            try:
+                version, _ = get_data_version(conn)
+                changes = read_changes(conn, self.seq, CATCH_UP_LIMIT + 1)
+                if (not changes or changes[0]['seq'] != self.seq + 1 or len(changes) > CATCH_UP_LIMIT
+                        or any(change['table'] == 'locations' for change in changes)):
+                    return False
+                bulk_from = {}
+                for change in changes:
+                    if change['operation'] == 'bulk':
+                        location_id = change['location_id']
+                        bulk_from[location_id] = min(change['date'], bulk_from.get(location_id, change['date']))
+                # A year archived since may hold some of the imported days
+                archived = [archive['year'] for archive in list_archives(conn)]
+                if any(year >= int(first_date[:4]) for year in archived for first_date in bulk_from.values()):
+                    return False
+                bulk = self._read_days_from(conn, bulk_from, CATCH_UP_LIMIT - len(changes))
+                if bulk is None:
+                    return False
+            finally:
+                if began:
+                    conn.rollback()
+
+            # Only the last change to each cell matters; cells a bulk import
+            # covers take the value just read instead
+            final = {}
+            for change in changes:
+                if (change['table'] == 'daily_usage' and change['operation'] != 'bulk'
+                        and change['date'] < bulk_from.get(change['location_id'], '9999')):
+                    final[(change['date'], change['location_id'])] = change
+
+            upserts = [key for key, change in final.items() if change['operation'] != 'delete']
+            deletes = [key for key, change in final.items() if change['operation'] == 'delete']
+            try:
+                for location_id, first_date in bulk_from.items():
+                    self._delete_range(first_date, None, [location_id])
+                if bulk:
+                    self._set_cells(list(bulk), list(bulk.values()))
+                if deletes:
+                    self._set_cells(deletes, None)
+                if upserts:
+                    self._set_cells(upserts, [final[key]['usage_gb'] for key in upserts])
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Could not replay change_log into usage matrix, reloading: {e}")
+                return False
+
+            self.version = version
+            self.seq = changes[-1]['seq']
+            self._stats['caught_up_changes'] += len(changes)
+            return True
+
+    def _read_days_from(self, conn, first_dates, limit):
+        """{(date, location_id): usage_gb} from each location's first date on
+
+        Read through the primary key of the hot table, so callers check
+        that no archived year is in range. None once more than ``limit``
+        rows would be read.
+        """
+        cells = {}
+        for location_id, first_date in first_dates.items():
+            cursor = conn.execute("""
+                SELECT day, usage_gb FROM daily_usage_compact WHERE location_id = ? AND day >= ?
+            """, (location_id, to_day(first_date)))
+            for day, usage in cursor:
+                cells[(from_day(day), location_id)] = usage
+                if len(cells) > limit:
+                    cursor.close()
+                    return None
+        return cells
+
+    def invalidate(self):
+        with self._lock:
+            self.stale = True
+
+    def _day(self, value):
+        return np.datetime64(value, 'D')
+
+    def _ensure_days(self, first, last):
+        """Grow the grid so the days first..last have rows"""
+        if self.start is None:
+            self.start = first
+            self.values = np.zeros((0, len(self.location_ids)), dtype=np.float64)
+            self.present = np.zeros((0, len(self.location_ids)), dtype=bool)
+
+        end = self.start + self.values.shape[0]
+        pad_before = int((self.start - first).astype(np.int64)) if first < self.start else 0
+        pad_after = int((last - end).astype(np.int64)) + 1 if last >= end else 0
+        if not pad_before and not pad_after:
+            return
+
+        if pad_before:
+            pad_before += DATE_GROWTH_DAYS
+        if pad_after:
+            pad_after += DATE_GROWTH_DAYS
+        padding = ((pad_before, pad_after), (0, 0))
+        self.values = np.pad(self.values, padding)
+        self.present = np.pad(self.present, padding)
+        self.start = self.start - pad_before
+
+    def apply(self, changes, before, after, seq=None):
+        """Mirror a committed tracked write
+
+        ``before`` and ``after`` are the data versions read inside the write
+        transaction and ``seq`` the change_log position after it. If the
+        matrix was not at ``before``, some other write was missed and the
+        matrix is flagged for a catch-up or reload instead, as it is for a
+        bulk load. An oversize matrix only re-checks its size on the next read.
+        """
+        with self._lock:
+            if self.stale or self.oversize is not None or self.version != before or changes.bulk:
+                # With a change_log position the next read replays this write
+                # along with any missed ones
+                if self.seq is None:
+                    self.stale = True
+                return False
+
+            try:
+                for start_date, end_date, location_ids in changes.range_deletes:
+                    self._delete_range(start_date, end_date, location_ids)
+
+                if changes.deletes:
+                    self._set_cells(changes.deletes, None)
+
+                if changes.upserts:
+                    self._set_cells([row[:2] for row in changes.upserts],
+                                    [row[2] for row in changes.upserts])
+            except (KeyError, ValueError) as e:
+                # e.g. a location created outside the matrix's knowledge
+                logger.warning(f"Could not apply write to usage matrix, reloading: {e}")
+                self.stale = True
+                return False
+
+            self.version = after
+            self.seq = seq
+            self._stats['applied_writes'] += 1
+            return True
+
+    def _set_cells(self, keys, usage):
+        dates = np.array([key[0] for key in keys], dtype='datetime64[D]')
+        columns = np.array([self.location_index[int(key[1])] for key in keys], dtype=np.int64)
+        self._ensure_days(dates.min(), dates.max())
+        day_index = (dates - self.start).astype(np.int64)
+
+        if usage is None:
+            self.values[day_index, columns] = 0.0
+            self.present[day_index, columns] = False
+        else:
+            self.values[day_index, columns] = np.array(usage, dtype=np.float64)
+            self.present[day_index, columns] = True
+
+    def _delete_range(self, start_date, end_date, location_ids):
+        if self.start is None:
+            return
+        first, last = self._row_bounds(start_date, end_date)
+        if location_ids is None:
+            columns = slice(None)
+        else:
+            columns = [self.location_index[int(location_id)] for location_id in location_ids
+                       if int(location_id) in self.location_index]
+        self.values[first:last, columns] = 0.0
+        self.present[first:last, columns] = False
+
+    def _row_bounds(self, start_date=None, end_date=None):
+        """Row slice bounds for an inclusive date range, clipped to the grid"""
+        days = self.values.shape[0]
+        first = 0 if start_date is None else int((self._day(start_date) - self.start).astype(np.int64))
+        last = days if end_date is None else int((self._day(end_date) - self.start).astype(np.int64)) + 1
+        return max(0, min(first, days)), max(0, min(last, days))
+
+    def _date_str(self, row):
+        return str(self.start + row)
+
+    def overview(self, since):
+        """Dashboard overview figures in the /api/dashboard/overview shape"""
+        with self._lock:
+            occupied = np.flatnonzero(self.present.any(axis=1))
+            date_range = {'start': None, 'end': None}
+            recent_activity = 0
+            top_locations = []
+
+            if occupied.size:
+                date_range = {'start': self._date_str(occupied[0]), 'end': self._date_str(occupied[-1])}
+                first, last = self._row_bounds(since)
+                window = self.present[first:last]
+                recent_activity = int(window.sum())
+
+                counts = window.sum(axis=0)
+                totals = self.values[first:last].sum(axis=0)
+                candidates = np.flatnonzero(counts)
+                order = candidates[np.argsort(-totals[candidates], kind='stable')][:5]
+                top_locations = [{'display_name': self.display_names[column],
+                                  'total_usage': float(totals[column])} for column in order]
+
+            return {
+                'total_locations': int(self.active.sum()),
+                'total_records': int(self.present.sum()),
+                'date_range': date_range,
+                'recent_activity': recent_activity,
+                'top_locations': top_locations
+            }
+
+    def trends(self, since, location_id=None):
+        """Per-day, per-location usage rows in the /usage-trends shape"""
+        with self._lock:
+            if self.start is None:
+                return []
+            if location_id is None:
+                columns = np.arange(len(self.location_ids))
+            elif location_id in self.location_index:
+                columns = np.array([self.location_index[location_id]])
+            else:
+                return []
+
+            first, last = self._row_bounds(since)
+            rows, cols = np.nonzero(self.present[first:last][:, columns])
+            values = self.values[first:last][:, columns][rows, cols]
+
+            return [{'date': self._date_str(first + row),
+                     'display_name': self.display_names[columns[col]],
+                     'daily_total': float(value)}
+                    for row, col, value in zip(rows.tolist(), cols.tolist(), values.tolist())]
+
+    def bucket_trends(self, since, mode, location_id=None):
+        """Usage summed per week, billing cycle or month in the /usage-trends shape
+
+        Rows carry the bucket start as ``date`` plus ``period_end`` and the
+        number of ``days`` with data, as downsample.bucket_rows() produces.
+        """
+        with self._lock:
+            if self.start is None:
+                return []
+            if location_id is None:
+                columns = np.arange(len(self.location_ids))
+            elif location_id in self.location_index:
+                columns = np.array([self.location_index[location_id]])
+            else:
+                return []
+
+            first, last = self._row_bounds(since)
+            if first >= last:
+                return []
+            present = self.present[first:last][:, columns]
+            values = self.values[first:last][:, columns]
+
+            days = self.start + np.arange(first, last)
+            if mode == 'month':
+                starts = days.astype('datetime64[M]').astype('datetime64[D]')
+            elif mode == 'cycle':
+                # Shifting back 12 days maps the 13th..12th cycle onto one month
+                starts = (days - 12).astype('datetime64[M]').astype('datetime64[D]') + 12
+            else:
+                # datetime64 day 0 is a Thursday; weeks start on Monday
+                starts = days - (days.astype(np.int64) + 3) % 7
+
+            boundaries = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+            totals = np.add.reduceat(values, boundaries, axis=0)
+            counts = np.add.reduceat(present.astype(np.int64), boundaries, axis=0)
+
+            rows = []
+            for bucket, boundary in enumerate(boundaries.tolist()):
+                start = starts[boundary].astype(object)
+                end = bucket_end(start, mode).isoformat()
+                for position in np.flatnonzero(counts[bucket]).tolist():
+                    rows.append({'date': start.isoformat(),
+                                 'period_end': end,
+                                 'display_name': self.display_names[columns[position]],
+                                 'daily_total': float(totals[bucket, position]),
+                                 'days': int(counts[bucket, position])})
+            return rows
+
+    def location_summary(self, since):
+        """Per active location statistics in the /location-summary shape"""
+        with self._lock:
+            columns = np.flatnonzero(self.active)
+            if self.start is None:
+                first = last = 0
+            else:
+                first, last = self._row_bounds(since)
+
+            present = self.present[first:last][:, columns]
+            values = self.values[first:last][:, columns]
+            counts = present.sum(axis=0)
+            totals = values.sum(axis=0)
+            maxima = np.where(present, values, -np.inf).max(axis=0, initial=-np.inf)
+            minima = np.where(present, values, np.inf).min(axis=0, initial=np.inf)
+            # Index of the last present row in each column
+            last_rows = present.shape[0] - 1 - np.argmax(present[::-1], axis=0) if present.shape[0] else counts
+
+            summary = []
+            for position, column in enumerate(columns.tolist()):
+                count = int(counts[position])
+                summary.append({
+                    'id': int(self.location_ids[column]),
+                    'display_name': self.display_names[column],
+                    'record_count': count,
+                    'total_usage': float(totals[position]) if count else None,
+                    'avg_usage': float(totals[position] / count) if count else None,
+                    'max_usage': float(maxima[position]) if count else None,
+                    'min_usage': float(minima[position]) if count else None,
+                    'last_update': self._date_str(first + int(last_rows[position])) if count else None
+                })
+
+            # Same order as ORDER BY total_usage DESC, with NULLs last
+            summary.sort(key=lambda row: -row['total_usage'] if row['total_usage'] is not None else float('inf'))
+            return summary
+
+    def check_consistency(self, conn):
+        """Compare per-location count/sum/min/max and date bounds with SQLite"""
+        expected = {row[0]: row[1:] for row in conn.execute(f"""
+            SELECT location_id, COUNT(*), SUM(usage_gb), MIN(usage_gb), MAX(usage_gb),
+                   MIN(date), MAX(date)
+            FROM {usage_source(conn)}
+            GROUP BY location_id
+        """)}
+
+        mismatches = []
+        with self._lock:
+            counts = self.present.sum(axis=0)
+            totals = self.values.sum(axis=0)
+            maxima = np.where(self.present, self.values, -np.inf).max(axis=0, initial=-np.inf)
+            minima = np.where(self.present, self.values, np.inf).min(axis=0, initial=np.inf)
+
+            for location_id in set(expected) | set(self.location_index):
+                column = self.location_index.get(location_id)
+                sql = expected.get(location_id, (0, None, None, None, None, None))
+                if column is None:
+                    mismatches.append({'location_id': location_id, 'problem': 'missing from matrix'})
+                    continue
+
+                count = int(counts[column])
+                rows = np.flatnonzero(self.present[:, column])
+                actual = (count,
+                          float(totals[column]) if count else None,
+                          float(minima[column]) if count else None,
+                          float(maxima[column]) if count else None,
+                          self._date_str(rows[0]) if count else None,
+                          self._date_str(rows[-1]) if count else None)
+
+                if (actual[0] != sql[0] or actual[2:] != tuple(sql[2:])
+                        or (sql[1] is not None and abs(actual[1] - sql[1]) > SUM_TOLERANCE * max(1.0, abs(sql[1])))):
+                    mismatches.append({'location_id': location_id, 'matrix': actual, 'database': sql})
+
+            return {
+                'consistent': not mismatches,
+                'version': self.version,
+                'locations_checked': len(set(expected) | set(self.location_index)),
+                'mismatches': mismatches
+            }
+
+    def stats(self):
+        """Shape, memory use and load counters"""
+        with self._lock:
+            arrays = (self.values, self.present, self.location_ids, self.active)
+            occupied = int(self.present.sum())
+            cells = self.present.size
+            return {
+                'version': self.version,
+                'seq': self.seq,
+                'stale': self.stale,
+                'max_cells': self.max_cells,
+                'oversize_cells': self.oversize,
+                'start_date': str(self.start) if self.start is not None else None,
+                'days': self.values.shape[0],
+                'locations': self.values.shape[1],
+                'values': occupied,
+                'fill_ratio': round(occupied / cells, 3) if cells else None,
+                'memory_bytes': sum(array.nbytes for array in arrays),
+                'memory_mb': round(sum(array.nbytes for array in arrays) / (1024 * 1024), 3),
+                **self._stats
+            }
+
+def init_app(app):
+    """Load the usage matrix at startup, if NumPy is available"""
+    app.config.setdefault('USAGE_MATRIX', True)
+    app.config.setdefault('USAGE_MATRIX_MAX_CELLS', DEFAULT_MAX_CELLS)
+    if np is None or not app.config['USAGE_MATRIX']:
+        logger.info("Usage matrix disabled, dashboard aggregates will use SQL")
+        return None
+
+    matrix = UsageMatrix(app.config['DATABASE_PATH'], max_cells=app.config['USAGE_MATRIX_MAX_CELLS'])
+    try:
+        with app.extensions['db_pool'].connection() as conn:
+            matrix.load(conn)
+    except Exception as e:
+        # Retried on first use, e.g. before database.py has created the schema
+        logger.warning(f"Usage matrix not loaded at startup: {e}")
+
+    app.extensions['usage_matrix'] = matrix
+    return matrix
+
+def get_usage_matrix(conn):
+    """The app's matrix, brought up to date, or None to fall back to SQL"""
+    matrix = current_app.extensions.get('usage_matrix')
+    if matrix is None:
+        return None
+    try:
+        matrix.ensure_fresh(conn)
+    except Exception as e:
+        logger.warning(f"Usage matrix unavailable, using SQL: {e}")
+        return None
+    # Over USAGE_MATRIX_MAX_CELLS nothing is loaded
+    if matrix.oversize is not None:
+        return None
+    return matrix
+
+@contextmanager
+def tracked_write(conn):
+    """Write transaction whose daily_usage changes are mirrored into the matrix
+
+    Record every daily_usage change on the yielded UsageChanges; they are
+    applied to the matrix once the transaction has committed.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        before, _ = get_data_version(conn)
+        changes = UsageChanges()
+        yield changes
+        after, _ = get_data_version(conn)
+        seq = get_last_seq(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    matrix = current_app.extensions.get('usage_matrix')
+    if matrix is not None:
+        matrix.apply(changes, before, after, seq)
+    notify_change_feed()
@@ -5,7 +5,12 @@ class DataUsageMonitor {
         this.apiBase = '/api';
         this.currentTab = 'dashboard';
         this.trendsChart = null;
+        this.trendMaxPoints = 120;
         this.locations = [];
+        this.recentUpdates = [];
+        this.changeStream = null;
+        this.liveRefreshTimer = null;
+        this.liveRefreshDelayMs = 2000;
         
         this.init();
     }
@@ -15,6 +20,7 @@ class DataUsageMonitor {
         await this.loadLocations();
         await this.loadDashboard();
         this.showLoading(false);
+        this.startChangeStream();
     }
 
     setupEventListeners() {
@@ -90,14 +96,18 @@ class DataUsageMonitor {
     }
 
     async apiCall(endpoint, options = {}) {
+        // Silent calls (live updates) skip the loading overlay and error toasts
+        const { silent = false, ...fetchOptions } = options;
         try {
-            this.showLoading(true);
+            if (!silent) {
+                this.showLoading(true);
+            }
             const response = await fetch(`${this.apiBase}${endpoint}`, {
                 headers: {
                     'Content-Type': 'application/json',
-                    ...options.headers
+                    ...fetchOptions.headers
                 },
-                ...options
+                ...fetchOptions
             });
 
             if (!response.ok) {
@@ -108,10 +118,14 @@ class DataUsageMonitor {
             return data;
         } catch (error) {
             console.error('API call failed:', error);
-            this.showToast('API call failed: ' + error.message, 'error');
+            if (!silent) {
+                this.showToast('API call failed: ' + error.message, 'error');
+            }
             throw error;
         } finally {
-            this.showLoading(false);
+            if (!silent) {
+                this.showLoading(false);
+            }
         }
     }
 
@@ -193,8 +207,8 @@ class DataUsageMonitor {
 
             this.updateTopLocations(overview.top_locations);
             
-            const recentUpdates = await this.apiCall('/dashboard/recent-updates?limit=5');
-            this.updateRecentUpdates(recentUpdates);
+            this.recentUpdates = await this.apiCall('/dashboard/recent-updates?limit=5');
+            this.updateRecentUpdates(this.recentUpdates);
         } catch (error) {
             console.error('Failed to load dashboard:', error);
         }
@@ -213,7 +227,7 @@ class DataUsageMonitor {
         }
     }
 
-    updateTrendsChart(data) {
+    updateTrendsChart(data, sparse = false) {
         const ctx = document.getElementById('trendsChart').getContext('2d');
         
         if (this.trendsChart) {
@@ -224,10 +238,14 @@ class DataUsageMonitor {
         const dates = [...new Set(data.map(item => item.date))].sort();
         const locations = [...new Set(data.map(item => item.display_name))];
         
+        const values = new Map(data.map(item => [`${item.date}|${item.display_name}`, item.daily_total]));
+        
         const datasets = locations.map((location, index) => {
             const locationData = dates.map(date => {
-                const item = data.find(d => d.date === date && d.display_name === location);
-                return item ? item.daily_total : 0;
+                const value = values.get(`${date}|${location}`);
+                // Downsampled series don't share every date, so gaps are
+                // bridged instead of being drawn as zero usage
+                return value !== undefined ? value : (sparse ? null : 0);
             });
 
             return {
@@ -236,7 +254,8 @@ class DataUsageMonitor {
                 borderColor: this.getChartColor(index),
                 backgroundColor: this.getChartColor(index, 0.1),
                 tension: 0.4,
-                fill: false
+                fill: false,
+                spanGaps: true
             };
         });
 
@@ -331,15 +350,93 @@ class DataUsageMonitor {
         });
     }
 
-    async loadUsageTrends(days = 30) {
+    async loadUsageTrends(days = 30, silent = false) {
         try {
-            const trends = await this.apiCall(`/dashboard/usage-trends?days=${days}`);
-            this.updateTrendsChart(trends);
+            // Longer ranges are downsampled server-side to keep the chart light
+            const downsample = days > 90 ? `&max_points=${this.trendMaxPoints}` : '';
+            const trends = await this.apiCall(`/dashboard/usage-trends?days=${days}${downsample}`, { silent });
+            this.updateTrendsChart(trends, days > 90);
         } catch (error) {
             console.error('Failed to load usage trends:', error);
         }
     }
 
+    startChangeStream() {
+        if (!window.EventSource || this.changeStream) {
+            return;
+        }
+
+        // EventSource reconnects on its own and resumes through Last-Event-ID
+        this.changeStream = new EventSource(`${this.apiBase}/dashboard/changes/stream`);
+        this.changeStream.addEventListener('changes', (e) => {
+            this.applyChanges(JSON.parse(e.data).changes);
+        });
+        this.changeStream.addEventListener('reset', () => {
+            // Changes were missed, so start over from a full load
+            if (this.currentTab === 'dashboard') {
+                this.loadDashboard();
+            }
+        });
+    }
+
+    applyChanges(changes) {
+        if (changes.some(change => change.table === 'locations')) {
+            this.loadLocations();
+        }
+
+        const usageChanges = changes.filter(change => change.table === 'daily_usage');
+        if (usageChanges.length === 0) {
+            return;
+        }
+
+        // Bulk imports send one summary per location instead of each value
+        if (usageChanges.some(change => change.operation === 'bulk')) {
+            if (this.currentTab === 'dashboard') {
+                this.loadDashboard();
+            }
+            return;
+        }
+
+        // Recent updates are patched in place from the events themselves
+        const names = new Map(this.locations.map(location => [location.id, location.display_name]));
+        usageChanges.forEach(change => {
+            this.recentUpdates = this.recentUpdates.filter(update => update.id !== change.id);
+            if (change.operation !== 'delete') {
+                this.recentUpdates.unshift({
+                    id: change.id,
+                    date: change.date,
+                    usage_gb: change.usage_gb,
+                    updated_at: change.changed_at,
+                    display_name: names.get(change.location_id) || `Location ${change.location_id}`
+                });
+            }
+        });
+        this.recentUpdates = this.recentUpdates.slice(0, 5);
+
+        if (this.currentTab === 'dashboard') {
+            this.updateRecentUpdates(this.recentUpdates);
+            this.scheduleLiveRefresh();
+        }
+    }
+
+    scheduleLiveRefresh() {
+        // Coalesce bursts of changes (e.g. a batch import) into one refresh
+        if (this.liveRefreshTimer) {
+            return;
+        }
+        this.liveRefreshTimer = setTimeout(async () => {
+            this.liveRefreshTimer = null;
+            try {
+                const overview = await this.apiCall('/dashboard/overview', { silent: true });
+                this.updateOverview(overview);
+                this.updateTopLocations(overview.top_locations);
+                await this.loadUsageTrends(parseInt(document.getElementById('trendDays').value), true);
+            } catch (error) {
+                console.error('Failed to refresh dashboard:', error);
+            }
+        }, this.liveRefreshDelayMs);
+    }
+
     async loadDailyUsage() {
         try {
             const startDate = document.getElementById('startDate').value;
@@ -411,6 +508,7 @@ class DataUsageMonitor {
                 <td>${item.period_start} to ${item.period_end}</td>
                 <td>${item.display_name}</td>
                 <td>${item.total_usage_gb}</td>
+                <td>${item.computed_usage_gb != null ? item.computed_usage_gb.toFixed(1) : '-'}</td>
                 <td>${item.manual_entry ? 'Yes' : 'No'}</td>
                 <td>${new Date(item.updated_at).toLocaleString()}</td>
                 <td>
@@ -431,6 +529,9 @@ class DataUsageMonitor {
             const dbInfo = await this.apiCall('/system/database-info');
             this.updateDatabaseInfo(dbInfo);
 
+            const metrics = await this.apiCall('/system/metrics?format=json&statements=5', { silent: true });
+            this.updateRequestMetrics(metrics);
+
             await this.loadBackups();
         } catch (error) {
             console.error('Failed to load system status:', error);
@@ -470,6 +571,54 @@ class DataUsageMonitor {
         `;
     }
 
+    updateRequestMetrics(metrics) {
+        const container = document.getElementById('requestMetrics');
+        container.innerHTML = '';
+
+        if (metrics.endpoints.length === 0) {
+            container.innerHTML = '<p class="text-secondary">No requests recorded yet</p>';
+            return;
+        }
+
+        // Text is set through textContent: statements contain < and >
+        const table = (headers, rows) => {
+            const element = document.createElement('table');
+            element.className = 'data-table';
+            const head = element.createTHead().insertRow();
+            headers.forEach(header => {
+                const th = document.createElement('th');
+                th.textContent = header;
+                head.appendChild(th);
+            });
+            const body = element.createTBody();
+            rows.forEach(cells => {
+                const row = body.insertRow();
+                cells.forEach(cell => {
+                    row.insertCell().textContent = cell;
+                });
+            });
+            const wrapper = document.createElement('div');
+            wrapper.className = 'table-container';
+            wrapper.appendChild(element);
+            return wrapper;
+        };
+
+        container.appendChild(table(
+            ['Endpoint', 'Requests', 'Errors', 'p50 (ms)', 'p95 (ms)', 'SQL (ms)'],
+            metrics.endpoints.slice(0, 10).map(endpoint => [
+                `${endpoint.method} ${endpoint.endpoint}`, endpoint.requests, endpoint.errors,
+                endpoint.p50_ms.toFixed(1), endpoint.p95_ms.toFixed(1), endpoint.sql_ms.toFixed(1)
+            ])
+        ));
+        container.appendChild(table(
+            ['Slowest statements', 'Calls', 'Total (ms)', 'Rows'],
+            metrics.sql.statements.map(statement => [
+                statement.statement.length > 80 ? `${statement.statement.slice(0, 80)}...` : statement.statement,
+                statement.calls, statement.total_ms.toFixed(1), statement.rows.toLocaleString()
+            ])
+        ));
+    }
+
     async loadBackups() {
         try {
             const data = await this.apiCall('/system/backups');
@@ -588,11 +737,18 @@ class DataUsageMonitor {
 
     async createBackup() {
         try {
-            const result = await this.apiCall('/system/backup', {
+            const job = await this.apiCall('/system/backup', {
                 method: 'POST'
             });
 
-            this.showToast(`Backup created successfully: ${result.backup_file}`, 'success');
+            this.showToast('Backup started', 'info');
+            const finished = await this.waitForJob(job.id);
+
+            if (finished.status === 'succeeded') {
+                this.showToast(`Backup created successfully: ${finished.result.filename}`, 'success');
+            } else {
+                this.showToast(`Backup failed: ${finished.error}`, 'error');
+            }
             
             if (this.currentTab === 'system') {
                 await this.loadBackups();
@@ -602,6 +758,22 @@ class DataUsageMonitor {
         }
     }
 
+    async waitForJob(jobId, intervalMs = 1000) {
+        // Poll without the loading overlay so the dashboard stays usable
+        while (true) {
+            const response = await fetch(`${this.apiBase}/system/jobs/${jobId}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+
+            const job = await response.json();
+            if (job.status === 'succeeded' || job.status === 'failed') {
+                return job;
+            }
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+        }
+    }
+
     refreshCurrentTab() {
         this.loadTabContent(this.currentTab);
     }
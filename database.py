@@ -6,29 +6,127 @@ Database initialization and management for Data Usage Monitor
 import sqlite3
 import os
 import csv
-from datetime import datetime, date
+import time
+from datetime import datetime, date, timedelta
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Date formats accepted in the first column of usage reports
+REPORT_DATE_FORMATS = ('%d-%b-%Y', '%d/%m/%Y', '%Y-%m-%d')
+
+# Number of usage cells written per executemany() call during bulk loads
+BULK_CHUNK_SIZE = 5000
+
+# daily_usage_compact stores dates as days since this one (migration 7)
+EPOCH = date(1970, 1, 1)
+
+# Bits of the daily_usage id holding the day; the location id is above them
+USAGE_ID_DAY_BITS = 20
+
+def parse_report_date(date_str, default_year=2024):
+    """Parse a report date (DD-MMM, DD/MM/YYYY or YYYY-MM-DD) into a date"""
+    date_str = date_str.strip()
+    if not date_str:
+        return None
+    
+    # DD-MMM carries no year, so borrow the report year
+    if date_str.count('-') == 1:
+        date_str = f"{date_str}-{default_year}"
+    
+    for fmt in REPORT_DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def to_day(value):
+    """Day number of a date or YYYY-MM-DD string; ValueError if invalid"""
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return (value - EPOCH).days
+
+def from_day(day):
+    """YYYY-MM-DD string of a day number"""
+    return (EPOCH + timedelta(days=day)).isoformat()
+
+def usage_id(location_id, day):
+    """The daily_usage view's id for a (location_id, day) key"""
+    return (location_id << USAGE_ID_DAY_BITS) + day
+
+def split_usage_id(value):
+    """(location_id, day) key of a daily_usage id"""
+    return value >> USAGE_ID_DAY_BITS, value & ((1 << USAGE_ID_DAY_BITS) - 1)
+
+def iter_report_rows(reader, columns, default_year=2024, stats=None):
+    """Yield (date, location_id, usage_gb) tuples from a wide usage report
+
+    ``columns`` is a list of (column_index, location_id) pairs resolved once
+    from the header, so each data row is only walked over known locations.
+    Dates are parsed once per distinct value.
+    """
+    date_cache = {}
+    if stats is None:
+        stats = {}
+    stats.setdefault('skipped_dates', 0)
+    stats.setdefault('skipped_values', 0)
+    
+    for row in reader:
+        if not row or not row[0].strip():
+            continue
+        
+        date_str = row[0]
+        if date_str not in date_cache:
+            parsed = parse_report_date(date_str, default_year)
+            date_cache[date_str] = parsed.isoformat() if parsed else None
+            if parsed is None:
+                logger.warning(f"Skipping invalid date: {date_str}")
+        
+        usage_date = date_cache[date_str]
+        if usage_date is None:
+            stats['skipped_dates'] += 1
+            continue
+        
+        row_len = len(row)
+        for index, location_id in columns:
+            if index >= row_len:
+                continue
+            
+            usage_value = row[index].strip()
+            if not usage_value:
+                continue
+            
+            try:
+                yield (usage_date, location_id, float(usage_value))
+            except ValueError:
+                # Skip non-numeric values
+                stats['skipped_values'] += 1
+
 class DatabaseManager:
     def __init__(self, db_path='data_usage.db'):
         self.db_path = db_path
-        self.schema_path = 'schema.sql'
     
     def initialize_database(self):
         """Initialize the database with schema"""
         try:
+            # migrations.py imports this module
+            from migrations import migrate
+            
+            # schema.sql is migration 1; later migrations add indexes etc.
+            migrate(self.db_path)
+            
             with sqlite3.connect(self.db_path) as conn:
-                # Read and execute schema
-                with open(self.schema_path, 'r') as f:
-                    schema_sql = f.read()
-                conn.executescript(schema_sql)
-                conn.commit()
+                # Backfill cycle totals for databases that predate the triggers
+                has_usage = conn.execute("SELECT 1 FROM daily_usage LIMIT 1").fetchone()
+                has_totals = conn.execute("SELECT 1 FROM cycle_usage_totals LIMIT 1").fetchone()
                 logger.info("Database initialized successfully")
-                return True
+            
+            if has_usage and not has_totals:
+                return self.rebuild_cycle_totals()
+            return True
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
             return False
@@ -66,70 +164,255 @@ class DatabaseManager:
     
     def import_daily_usage_from_csv(self, csv_file_path):
         """Import daily usage data from CSV"""
+        return self.bulk_import_daily_usage(csv_file_path, create_locations=False) is not None
+    
+    def bulk_import_daily_usage(self, source, create_locations=True, default_year=2024,
+                                chunk_size=BULK_CHUNK_SIZE):
+        """Stream a wide usage report into daily_usage in a single transaction
+        
+        ``source`` is either a CSV file path or an open text stream (such as an
+        uploaded file). The load runs through load_usage_report() on its own
+        connection and commits as one transaction.
+        
+        Returns a stats dict (rows, seconds, rows_per_sec, ...) or None on failure.
+        """
+        owns_file = isinstance(source, (str, bytes, os.PathLike))
+        f = open(source, 'r', newline='', encoding='utf-8-sig') if owns_file else source
+        
+        conn = None
+        try:
+            # Autocommit mode so the transaction boundaries below are explicit
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            self._begin_bulk_load(conn)
+            conn.execute("BEGIN IMMEDIATE")
+            stats = self.load_usage_report(conn, f, create_locations, default_year, chunk_size)
+            conn.execute("COMMIT" if stats is not None else "ROLLBACK")
+            return stats
+            
+        except Exception as e:
+            if conn is not None and conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.error(f"Error importing daily usage data: {e}")
+            return None
+        finally:
+            if conn is not None:
+                conn.close()
+            if owns_file:
+                f.close()
+    
+    def load_usage_report(self, conn, f, create_locations=True, default_year=2024,
+                          chunk_size=BULK_CHUNK_SIZE):
+        """Import a wide usage report from an open text stream on conn
+        
+        Runs inside the caller's write transaction, which commits or rolls
+        back the whole load. The header is resolved to location ids once and
+        usage cells are written in chunks with executemany(). Returns a stats
+        dict, or None when the report has no header.
+        """
+        started = time.perf_counter()
+        reader = csv.reader(f)
+        headers = next(reader, None)
+        if not headers:
+            logger.error("Usage report is empty")
+            return None
+        
+        cursor = conn.cursor()
+        location_names = [name.strip() for name in headers[1:]]
+        if create_locations:
+            cursor.executemany("""
+                INSERT OR IGNORE INTO locations (name, display_name) 
+                VALUES (?, ?)
+            """, [(name, name.replace('_', ' ').title()) for name in location_names if name])
+        
+        # Resolve header columns to location ids once
+        cursor.execute("SELECT name, id FROM locations")
+        location_map = {row[0]: row[1] for row in cursor.fetchall()}
+        columns = [(index, location_map[name])
+                   for index, name in enumerate(location_names, start=1)
+                   if name in location_map]
+        
+        stats = {'rows': 0, 'changed': 0, 'locations': len(columns), 'skipped_archived': 0}
+        # Archived years are read-only (partitions.py); their rows are
+        # skipped rather than aborting the whole import
+        archived = self._archived_years(cursor)
+        skipped_years = set()
+        # Earliest date written per location, for the summary change_log rows
+        first_dates = {} if self._begin_bulk_logging(cursor) else None
+        batch = []
+        for usage_row in iter_report_rows(reader, columns, default_year, stats):
+            if archived and int(usage_row[0][:4]) in archived:
+                stats['skipped_archived'] += 1
+                skipped_years.add(int(usage_row[0][:4]))
+                continue
+            batch.append(usage_row)
+            if len(batch) >= chunk_size:
+                self._write_bulk_batch(cursor, batch, stats, first_dates)
+                batch = []
+        
+        if batch:
+            self._write_bulk_batch(cursor, batch, stats, first_dates)
+        if first_dates is not None:
+            self._end_bulk_logging(cursor, first_dates)
+        
+        # Update system info
+        cursor.execute("SELECT COUNT(*) FROM daily_usage")
+        total_records = cursor.fetchone()[0]
+        
+        cursor.execute("""
+            UPDATE system_info 
+            SET metric_value = ?, updated_at = CURRENT_TIMESTAMP 
+            WHERE metric_name = 'total_records'
+        """, (str(total_records),))
+        
+        elapsed = time.perf_counter() - started
+        stats['archived_years'] = sorted(skipped_years)
+        if skipped_years:
+            logger.warning(f"Skipped {stats['skipped_archived']} values in archived years "
+                           f"{stats['archived_years']}; unarchive them with partitions.py to re-import")
+        stats['total_records'] = total_records
+        stats['seconds'] = round(elapsed, 3)
+        stats['rows_per_sec'] = round(stats['rows'] / elapsed) if elapsed > 0 else stats['rows']
+        
+        logger.info(f"Imported {stats['rows']} usage values in {stats['seconds']}s "
+                    f"({stats['rows_per_sec']} rows/sec). Total records: {total_records}")
+        return stats
+    
+    def _archived_years(self, cursor):
+        """Years moved out to archive databases, empty before migration 8"""
+        try:
+            return {row[0] for row in cursor.execute("SELECT year FROM usage_archives")}
+        except sqlite3.OperationalError:
+            return set()
+    
+    def _begin_bulk_logging(self, cursor):
+        """Stop the row triggers logging each value; False before migration 5
+        
+        The flag row only exists inside the import's transaction.
+        """
+        try:
+            cursor.execute("INSERT OR REPLACE INTO bulk_loads (id) VALUES (1)")
+        except sqlite3.OperationalError:
+            return False
+        return True
+    
+    def _end_bulk_logging(self, cursor, first_dates):
+        """Log one 'bulk' change per location written and bump the version once"""
+        cursor.execute("DELETE FROM bulk_loads")
+        if not first_dates:
+            return
+        cursor.executemany("""
+            INSERT INTO change_log (table_name, operation, row_id, location_id, date)
+            VALUES ('daily_usage', 'bulk', NULL, ?, ?)
+        """, sorted(first_dates.items()))
+        cursor.execute("UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1")
+    
+    def _write_bulk_batch(self, cursor, batch, stats, first_dates):
+        """Write the rows of a batch whose value changed
+        
+        Only those count towards ``first_dates``, so re-importing a report
+        logs nothing for the locations it leaves as they were.
+        """
+        changed = self._changed_rows(cursor, batch)
+        self._write_usage_batch(cursor, changed)
+        stats['rows'] += len(batch)
+        stats['changed'] += len(changed)
+        if first_dates is not None:
+            for usage_date, location_id, _ in changed:
+                if usage_date < first_dates.get(location_id, '9999'):
+                    first_dates[location_id] = usage_date
+    
+    def _changed_rows(self, cursor, batch):
+        """The (date, location_id, usage_gb) rows that are new or differ from the stored value
+        
+        A report batch covers a few days, so the stored values are read per
+        location over the batch's day range through the primary key.
+        """
+        keyed = [(row[1], to_day(row[0]), row) for row in batch]
+        ranges = {}
+        for location_id, day, _ in keyed:
+            first, last = ranges.get(location_id, (day, day))
+            ranges[location_id] = (min(first, day), max(last, day))
+        stored = {}
+        for location_id, (first, last) in ranges.items():
+            stored.update(((location_id, row[0]), row[1]) for row in cursor.execute("""
+                SELECT day, usage_gb FROM daily_usage_compact WHERE location_id = ? AND day BETWEEN ? AND ?
+            """, (location_id, first, last)))
+        missing = object()
+        return [row for location_id, day, row in keyed if stored.get((location_id, day), missing) != row[2]]
+    
+    def _begin_bulk_load(self, conn):
+        """Apply pragmas suited to a bulk load that keep it crash-safe
+        
+        The journal mode is left alone: the rollback journal or WAL is what
+        lets a load interrupted by a power cut roll back cleanly. Under WAL,
+        synchronous=NORMAL only defers fsyncs to checkpoints and stays safe.
+        """
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal':
+            conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -32768")  # 32 MB
+    
+    def _write_usage_batch(self, cursor, batch):
+        """Write a chunk of (date, location_id, usage_gb) tuples
+        
+        An upsert rather than INSERT OR REPLACE, so the cycle total triggers
+        see an UPDATE instead of a silent delete, and unchanged values are
+        left alone. Dates are turned into day numbers by SQLite. Returns the
+        number of rows inserted or changed.
+        """
+        cursor.executemany("""
+            INSERT INTO daily_usage_compact (day, location_id, usage_gb, updated_at) 
+            VALUES (CAST(julianday(?) - 2440587.5 AS INTEGER), ?, ?, strftime('%s', 'now'))
+            ON CONFLICT (location_id, day) DO UPDATE SET
+                usage_gb = excluded.usage_gb,
+                updated_at = excluded.updated_at
+            WHERE usage_gb IS NOT excluded.usage_gb
+        """, batch)
+        return max(cursor.rowcount, 0)
+    
+    def rebuild_cycle_totals(self):
+        """Recompute cycle_usage_totals from daily_usage
+        
+        The triggers in schema.sql keep the totals current on every write;
+        this is for databases created before they existed, or to clear any
+        floating point drift from long runs of incremental updates. Archived
+        years are included.
+        """
+        # partitions.py imports this module
+        from partitions import usage_source
+        
         try:
             with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Get location mappings
-                cursor.execute("SELECT name, id FROM locations")
-                location_map = dict(cursor.fetchall())
-                
-                with open(csv_file_path, 'r') as f:
-                    reader = csv.DictReader(f)
-                    
-                    for row in reader:
-                        date_str = row['Date']
-                        if not date_str:
-                            continue
-                            
-                        # Parse date (format: DD-MMM)
-                        try:
-                            # Add current year for parsing
-                            date_obj = datetime.strptime(f"{date_str}-2024", "%d-%b-%Y").date()
-                        except ValueError:
-                            logger.warning(f"Skipping invalid date: {date_str}")
-                            continue
-                        
-                        # Import usage for each location
-                        for location_name, location_id in location_map.items():
-                            usage_value = row.get(location_name, '')
-                            
-                            if usage_value and usage_value.strip():
-                                try:
-                                    usage_gb = float(usage_value)
-                                    
-                                    cursor.execute("""
-                                        INSERT OR REPLACE INTO daily_usage 
-                                        (date, location_id, usage_gb, updated_at) 
-                                        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-                                    """, (date_obj, location_id, usage_gb))
-                                    
-                                except ValueError:
-                                    # Skip non-numeric values
-                                    continue
-                
-                conn.commit()
-                
-                # Update system info
-                cursor.execute("SELECT COUNT(*) FROM daily_usage")
-                total_records = cursor.fetchone()[0]
-                
-                cursor.execute("""
-                    UPDATE system_info 
-                    SET metric_value = ?, updated_at = CURRENT_TIMESTAMP 
-                    WHERE metric_name = 'total_records'
-                """, (str(total_records),))
-                
+                source = usage_source(conn)
+                conn.execute("DELETE FROM cycle_usage_totals")
+                conn.execute(f"""
+                    INSERT INTO cycle_usage_totals 
+                    (period_start, period_end, location_id, total_usage_gb, day_count)
+                    SELECT cs, date(cs, '+1 month', '-1 day'), location_id,
+                           SUM(COALESCE(usage_gb, 0)), COUNT(*)
+                    FROM (
+                        SELECT location_id, usage_gb,
+                               CASE WHEN strftime('%d', date) >= '13'
+                                    THEN date(date, 'start of month', '+12 days')
+                                    ELSE date(date, 'start of month', '-1 month', '+12 days') END AS cs
+                        FROM {source}
+                        WHERE date(date) IS NOT NULL
+                    )
+                    GROUP BY cs, location_id
+                """)
+                count = conn.execute("SELECT COUNT(*) FROM cycle_usage_totals").fetchone()[0]
                 conn.commit()
-                logger.info(f"Imported daily usage data. Total records: {total_records}")
+                logger.info(f"Rebuilt {count} billing cycle totals")
                 return True
-                
         except Exception as e:
-            logger.error(f"Error importing daily usage data: {e}")
+            logger.error(f"Error rebuilding cycle totals: {e}")
             return False
     
     def get_database_stats(self):
         """Get database statistics"""
+        # partitions.py imports this module
+        from partitions import summary_count, usage_totals
+        
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
@@ -140,16 +423,13 @@ class DatabaseManager:
                 cursor.execute("SELECT COUNT(*) FROM locations")
                 stats['locations'] = cursor.fetchone()[0]
                 
-                cursor.execute("SELECT COUNT(*) FROM daily_usage")
-                stats['daily_records'] = cursor.fetchone()[0]
-                
-                cursor.execute("SELECT COUNT(*) FROM monthly_summaries")
-                stats['monthly_records'] = cursor.fetchone()[0]
+                # Archived years included
+                daily_records, first_date, last_date = usage_totals(conn)
+                stats['daily_records'] = daily_records
+                stats['monthly_records'] = summary_count(conn)
                 
                 # Get date range
-                cursor.execute("SELECT MIN(date), MAX(date) FROM daily_usage")
-                date_range = cursor.fetchone()
-                stats['date_range'] = date_range
+                stats['date_range'] = (first_date, last_date)
                 
                 # Get database file size
                 if os.path.exists(self.db_path):
@@ -181,8 +461,10 @@ def main():
         if db_manager.import_locations_from_csv(csv_file):
             logger.info("Locations imported successfully")
         
-        if db_manager.import_daily_usage_from_csv(csv_file):
-            logger.info("Daily usage data imported successfully")
+        import_stats = db_manager.bulk_import_daily_usage(csv_file, create_locations=False)
+        if import_stats:
+            logger.info(f"Daily usage data imported successfully "
+                        f"({import_stats['rows']} values, {import_stats['rows_per_sec']} rows/sec)")
         
         # Show stats
         stats = db_manager.get_database_stats()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Wide-format Export for Data Usage Monitor
+Streams daily usage back out in the WEEKLY_REPORTS layout: a Date column
+followed by one column per location, one row per day
+"""
+
+import io
+import os
+import sys
+import csv
+import zlib
+import sqlite3
+import argparse
+import logging
+from database import from_day, to_day
+from partitions import PartitionError, usage_segments
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Rows pulled off the cursor per fetchmany()
+EXPORT_FETCH_SIZE = 1000
+
+# Report rows (days) written per chunk handed to the caller
+EXPORT_CHUNK_DAYS = 100
+
+# Times the partition list is re-read when a year is archived or restored
+# while an export is starting
+SNAPSHOT_ATTEMPTS = 3
+
+# zlib level for gzip output; the export is produced once per request
+GZIP_LEVEL = 6
+
+class ExportError(ValueError):
+    """Raised for an export request naming unknown locations"""
+
+def export_columns(conn, location_ids=None):
+    """(id, name) of the locations exported, in report column order
+
+    Defaults to the active locations. Names are the ones the importer
+    matches headers against, so an export can be imported again.
+    """
+    if not location_ids:
+        return conn.execute("SELECT id, name FROM locations WHERE is_active = 1 ORDER BY id").fetchall()
+
+    location_ids = list(dict.fromkeys(location_ids))
+    names = dict(conn.execute(f"SELECT id, name FROM locations WHERE id IN ({','.join('?' * len(location_ids))})",
+                              location_ids).fetchall())
+    missing = [location_id for location_id in location_ids if location_id not in names]
+    if missing:
+        raise ExportError(f"Unknown location ids: {missing}")
+    return [(location_id, names[location_id]) for location_id in location_ids]
+
+def format_usage(value):
+    """Report cell for a usage value: blank when missing, no trailing .0"""
+    if value is None:
+        return ''
+    text = repr(value)
+    return text[:-2] if text.endswith('.0') else text
+
+def iter_usage_rows(conn, segments, location_ids):
+    """Yield (day, location_id, usage_gb) ordered by day, then location
+
+    ``segments`` come from usage_segments(). Each partition is read in turn
+    through its (day, location_id) index, so rows come straight off the
+    cursor without a sort or a materialized copy.
+    """
+    if len(location_ids) == 1:
+        # The primary key already returns one location's days in order
+        location_filter = " AND location_id = ?"
+    else:
+        # Otherwise SQLite would search the primary key once per location and
+        # sort the lot; the unary + keeps it on the (day, location_id) index
+        location_filter = f" AND +location_id IN ({','.join('?' * len(location_ids))})"
+    for schema, first_day, last_day in segments:
+        query = f"SELECT day, location_id, usage_gb FROM {schema}.daily_usage_compact WHERE 1=1"
+        params = []
+        if first_day is not None:
+            query += " AND day >= ?"
+            params.append(first_day)
+        if last_day is not None:
+            query += " AND day <= ?"
+            params.append(last_day)
+        query += location_filter + " ORDER BY day, location_id"
+        params.extend(location_ids)
+
+        cursor = conn.execute(query, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+def iter_wide_csv(conn, start_day=None, end_day=None, location_ids=None, stats=None):
+    """Return a generator of the wide report as CSV text chunks, header first
+
+    ``start_day`` and ``end_day`` are inclusive day numbers (None for open
+    ends); days without usage for any exported location are left out.
+    Dates are written as YYYY-MM-DD, which the importer accepts and which,
+    unlike the original DD-MMM, stays unambiguous across years. ``stats``
+    is filled in with the days and values written.
+
+    Locations are resolved and archives attached before returning, so an
+    ExportError is raised here rather than part way through a response.
+    """
+    columns = export_columns(conn, location_ids)
+    owns_transaction = bool(columns) and not conn.in_transaction
+    if owns_transaction:
+        segments = _begin_snapshot(conn, start_day, end_day)
+    else:
+        segments = usage_segments(conn, start_day, end_day) if columns else []
+    if stats is None:
+        stats = {}
+    stats.update(days=0, values=0, locations=len(columns))
+    return _wide_csv_chunks(conn, columns, segments, stats, owns_transaction)
+
+def _begin_snapshot(conn, start_day, end_day):
+    """Begin a read transaction over a day range's partitions; returns them
+
+    Reading every partition in one transaction keeps a year that is archived
+    or restored mid-export from being skipped or written twice. Archives are
+    attached first, since ATTACH is not allowed inside the transaction.
+    """
+    for _ in range(SNAPSHOT_ATTEMPTS):
+        segments = usage_segments(conn, start_day, end_day)
+        conn.execute("BEGIN")
+        try:
+            if usage_segments(conn, start_day, end_day) == segments:
+                return segments
+        except PartitionError:
+            pass
+        conn.execute("ROLLBACK")
+    raise ExportError("Archived years kept changing while the export was starting")
+
+def _wide_csv_chunks(conn, columns, segments, stats, owns_transaction):
+    try:
+        yield from _wide_csv_rows(conn, columns, segments, stats)
+    finally:
+        if owns_transaction and conn.in_transaction:
+            conn.execute("COMMIT")
+
+def _wide_csv_rows(conn, columns, segments, stats):
+    positions = {location_id: index for index, (location_id, _) in enumerate(columns)}
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(['Date'] + [name for _, name in columns])
+    if not columns:
+        yield buffer.getvalue()
+        return
+
+    def flush():
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    current_day = None
+    cells = None
+    pending = 0
+    for day, location_id, usage_gb in iter_usage_rows(conn, segments, list(positions)):
+        if day != current_day:
+            if cells is not None:
+                writer.writerow(cells)
+                stats['days'] += 1
+                pending += 1
+                if pending >= EXPORT_CHUNK_DAYS:
+                    yield flush()
+                    pending = 0
+            current_day = day
+            cells = [from_day(day)] + [''] * len(columns)
+        cells[positions[location_id] + 1] = format_usage(usage_gb)
+        stats['values'] += 1
+
+    if cells is not None:
+        writer.writerow(cells)
+        stats['days'] += 1
+    yield flush()
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """Gzip a stream of text chunks on the fly, yielding compressed bytes"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_filename(start_date=None, end_date=None, compress=False):
+    """Download name of an export covering the given YYYY-MM-DD range"""
+    name = f"usage_{start_date or 'start'}_{end_date or 'end'}.csv"
+    return name + '.gz' if compress else name
+
+def export_wide_csv(db_path, output, start_date=None, end_date=None, location_ids=None, compress=None):
+    """Write the wide report for a date range to a file path or '-' for stdout
+
+    ``compress`` defaults to gzip when the path ends in .gz. Returns stats.
+    """
+    if compress is None:
+        compress = output.endswith('.gz')
+    start_day = to_day(start_date) if start_date else None
+    end_day = to_day(end_date) if end_date else None
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    temp_path = None
+    try:
+        stats = {}
+        chunks = iter_wide_csv(conn, start_day, end_day, location_ids, stats)
+        if output == '-':
+            target = sys.stdout.buffer
+        else:
+            # Written beside the destination and moved into place once complete
+            temp_path = output + '.tmp'
+            target = open(temp_path, 'wb')
+        try:
+            body = gzip_chunks(chunks) if compress else (chunk.encode('utf-8') for chunk in chunks)
+            for data in body:
+                target.write(data)
+        finally:
+            if temp_path:
+                target.close()
+            else:
+                target.flush()
+        if temp_path:
+            os.replace(temp_path, output)
+            temp_path = None
+        return stats
+    finally:
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+        conn.close()
+
+def main():
+    """Main function for command line usage"""
+    parser = argparse.ArgumentParser(description='Data Usage Monitor Wide-format Export')
+    parser.add_argument('--db-path', default='data_usage.db', help='Database file path')
+    parser.add_argument('--output', '-o', default='-', help='Output file, - for stdout (gzipped if it ends in .gz)')
+    parser.add_argument('--start-date', help='First date to export (YYYY-MM-DD)')
+    parser.add_argument('--end-date', help='Last date to export (YYYY-MM-DD)')
+    parser.add_argument('--location-id', type=int, action='append', dest='location_ids',
+                        help='Export only this location (repeatable; default: all active locations)')
+    parser.add_argument('--gzip', action='store_true', default=None, help='Gzip the output')
+
+    args = parser.parse_args()
+    try:
+        stats = export_wide_csv(args.db_path, args.output, args.start_date, args.end_date,
+                                args.location_ids, args.gzip)
+    except (ExportError, ValueError, sqlite3.Error) as e:
+        logger.error(f"Export failed: {e}")
+        sys.exit(1)
+
+    logger.info(f"Exported {stats['days']} days x {stats['locations']} locations "
+                f"({stats['values']} values) to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,771 @@
+#!/usr/bin/env python3
+"""
+Schema Migrations for Data Usage Monitor
+Applies ordered, versioned schema changes and records them in the database
+"""
+
+import os
+import sys
+import sqlite3
+import argparse
+import time
+import logging
+from database import USAGE_ID_DAY_BITS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+# daily_usage ids pack location_id * 2^USAGE_ID_DAY_BITS + day (migration 7)
+USAGE_ID_FACTOR = 1 << USAGE_ID_DAY_BITS
+
+# Each migration runs in its own transaction together with its planner checks:
+# every check's query must be planned with the named index (and without any
+# forbidden plan step), otherwise the migration is rolled back. A migration
+# can also list ``requires`` queries that must count zero rows before it
+# starts, ask for a VACUUM once applied, and name earlier migrations whose
+# checks it ``supersedes``.
+#
+# schema.sql is the baseline (version 1) and is kept as it is; later schema
+# changes are added here as new migrations instead.
+MIGRATIONS = [
+    {
+        'version': 1,
+        'name': 'baseline_schema',
+        'sql_file': SCHEMA_PATH,
+        'checks': []
+    },
+    {
+        'version': 2,
+        'name': 'covering_usage_indexes',
+        'sql': """
+            -- Location-scoped date ranges: batch lookups, location summary,
+            -- top locations and per-location trends
+            CREATE INDEX IF NOT EXISTS idx_daily_usage_location_date
+                ON daily_usage(location_id, date, usage_gb);
+
+            -- Date ranges across all locations: trends and overview counts
+            CREATE INDEX IF NOT EXISTS idx_daily_usage_date_location
+                ON daily_usage(date, location_id, usage_gb);
+
+            -- Covered by the two above and by UNIQUE(date, location_id)
+            DROP INDEX IF EXISTS idx_daily_usage_date;
+            DROP INDEX IF EXISTS idx_daily_usage_location;
+        """,
+        'checks': [
+            {
+                'sql': "SELECT date, usage_gb FROM daily_usage WHERE location_id = ? AND date BETWEEN ? AND ?",
+                'uses': 'COVERING INDEX idx_daily_usage_location_date'
+            },
+            {
+                'sql': """SELECT location_id, COUNT(id), SUM(usage_gb), MAX(date) FROM daily_usage
+                          WHERE location_id = ? AND date >= ?""",
+                'uses': 'COVERING INDEX idx_daily_usage_location_date'
+            },
+            {
+                'sql': "SELECT date, location_id, usage_gb FROM daily_usage WHERE date >= ? ORDER BY date, location_id",
+                'uses': 'COVERING INDEX idx_daily_usage_date_location',
+                'forbid': 'TEMP B-TREE'
+            }
+        ]
+    },
+    {
+        'version': 3,
+        'name': 'recent_updates_index',
+        'sql': """
+            -- Recent updates page through (updated_at, id) newest first; the
+            -- rowid is the index's implicit last column
+            CREATE INDEX IF NOT EXISTS idx_daily_usage_updated
+                ON daily_usage(updated_at);
+        """,
+        'checks': [
+            {
+                'sql': "SELECT id, updated_at FROM daily_usage ORDER BY updated_at DESC, id DESC LIMIT ?",
+                'uses': 'INDEX idx_daily_usage_updated',
+                'forbid': 'TEMP B-TREE'
+            },
+            {
+                'sql': """SELECT id FROM daily_usage WHERE (updated_at < ? OR (updated_at = ? AND id < ?))
+                          ORDER BY updated_at DESC, id DESC LIMIT ?""",
+                'uses': 'INDEX idx_daily_usage_updated',
+                'forbid': 'TEMP B-TREE'
+            }
+        ]
+    },
+    {
+        'version': 4,
+        'name': 'monthly_summary_location_index',
+        'sql': """
+            -- Location-filtered monthly summaries ordered by period
+            CREATE INDEX IF NOT EXISTS idx_monthly_summaries_location_period
+                ON monthly_summaries(location_id, period_start);
+
+            -- Covered by the index above and by UNIQUE(period_start, location_id)
+            DROP INDEX IF EXISTS idx_monthly_summaries_location;
+            DROP INDEX IF EXISTS idx_monthly_summaries_period;
+        """,
+        'checks': [
+            {
+                'sql': "SELECT id FROM monthly_summaries WHERE location_id = ? ORDER BY period_start DESC",
+                'uses': 'INDEX idx_monthly_summaries_location_period',
+                'forbid': 'TEMP B-TREE'
+            }
+        ]
+    },
+    {
+        'version': 5,
+        'name': 'change_log',
+        'sql': """
+            -- Append-only feed of row changes behind the live dashboard stream.
+            -- date/usage_gb hold period_start/total_usage_gb for monthly rows
+            -- and the new values (the old ones for deletes). A 'bulk' row
+            -- stands for a whole import at one location and has no row_id.
+            CREATE TABLE IF NOT EXISTS change_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                operation TEXT NOT NULL CHECK (operation IN ('insert', 'update', 'delete', 'bulk')),
+                row_id INTEGER CHECK (row_id IS NOT NULL OR operation = 'bulk'),
+                location_id INTEGER,
+                date DATE,
+                usage_gb REAL,
+                changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            -- A row here, written and removed inside a bulk import's own
+            -- transaction, stops the daily usage row triggers from logging
+            -- each value and bumping the version; the import logs one 'bulk'
+            -- change per location instead. Other connections never see it
+            CREATE TABLE IF NOT EXISTS bulk_loads (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            DROP TRIGGER IF EXISTS trg_daily_usage_version_insert;
+            DROP TRIGGER IF EXISTS trg_daily_usage_version_update;
+            DROP TRIGGER IF EXISTS trg_daily_usage_version_delete;
+
+            CREATE TRIGGER trg_daily_usage_version_insert
+            AFTER INSERT ON daily_usage
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads)
+            BEGIN
+                UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+            END;
+
+            CREATE TRIGGER trg_daily_usage_version_update
+            AFTER UPDATE ON daily_usage
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads)
+            BEGIN
+                UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+            END;
+
+            CREATE TRIGGER trg_daily_usage_version_delete
+            AFTER DELETE ON daily_usage
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads)
+            BEGIN
+                UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_daily_usage_change_insert
+            AFTER INSERT ON daily_usage
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads)
+            BEGIN
+                INSERT INTO change_log (table_name, operation, row_id, location_id, date, usage_gb)
+                VALUES ('daily_usage', 'insert', NEW.id, NEW.location_id, NEW.date, NEW.usage_gb);
+            END;
+
+            -- An update that moves a row to another day or location also
+            -- removes the value at its old position
+            CREATE TRIGGER IF NOT EXISTS trg_daily_usage_change_update
+            AFTER UPDATE ON daily_usage
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads)
+            BEGIN
+                INSERT INTO change_log (table_name, operation, row_id, location_id, date, usage_gb)
+                SELECT 'daily_usage', 'delete', OLD.id, OLD.location_id, OLD.date, OLD.usage_gb
+                WHERE OLD.date IS NOT NEW.date OR OLD.location_id IS NOT NEW.location_id;
+                INSERT INTO change_log (table_name, operation, row_id, location_id, date, usage_gb)
+                VALUES ('daily_usage', 'update', NEW.id, NEW.location_id, NEW.date, NEW.usage_gb);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_daily_usage_change_delete
+            AFTER DELETE ON daily_usage
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads)
+            BEGIN
+                INSERT INTO change_log (table_name, operation, row_id, location_id, date, usage_gb)
+                VALUES ('daily_usage', 'delete', OLD.id, OLD.location_id, OLD.date, OLD.usage_gb);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_monthly_summaries_change_insert
+            AFTER INSERT ON monthly_summaries
+            BEGIN
+                INSERT INTO change_log (table_name, operation, row_id, location_id, date, usage_gb)
+                VALUES ('monthly_summaries', 'insert', NEW.id, NEW.location_id, NEW.period_start, NEW.total_usage_gb);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_monthly_summaries_change_update
+            AFTER UPDATE ON monthly_summaries
+            BEGIN
+                INSERT INTO change_log (table_name, operation, row_id, location_id, date, usage_gb)
+                VALUES ('monthly_summaries', 'update', NEW.id, NEW.location_id, NEW.period_start, NEW.total_usage_gb);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_monthly_summaries_change_delete
+            AFTER DELETE ON monthly_summaries
+            BEGIN
+                INSERT INTO change_log (table_name, operation, row_id, location_id, date, usage_gb)
+                VALUES ('monthly_summaries', 'delete', OLD.id, OLD.location_id, OLD.period_start, OLD.total_usage_gb);
+            END;
+
+            -- Location changes are logged too, so a reader that has seen every
+            -- change_log row since a version has seen every data_version bump
+            CREATE TRIGGER IF NOT EXISTS trg_locations_change_insert
+            AFTER INSERT ON locations
+            BEGIN
+                INSERT INTO change_log (table_name, operation, row_id, location_id)
+                VALUES ('locations', 'insert', NEW.id, NEW.id);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_locations_change_update
+            AFTER UPDATE ON locations
+            BEGIN
+                INSERT INTO change_log (table_name, operation, row_id, location_id)
+                VALUES ('locations', 'update', NEW.id, NEW.id);
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_locations_change_delete
+            AFTER DELETE ON locations
+            BEGIN
+                INSERT INTO change_log (table_name, operation, row_id, location_id)
+                VALUES ('locations', 'delete', OLD.id, OLD.id);
+            END;
+        """,
+        'checks': [
+            {
+                'sql': "SELECT * FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?",
+                'uses': 'INTEGER PRIMARY KEY',
+                'forbid': 'TEMP B-TREE'
+            }
+        ]
+    },
+    {
+        'version': 6,
+        'name': 'usage_anomalies',
+        'sql': """
+            -- Rolling per-location statistics of the anomaly engine, as of the
+            -- location's last scored day
+            CREATE TABLE IF NOT EXISTS anomaly_state (
+                location_id INTEGER PRIMARY KEY,
+                last_date DATE NOT NULL,
+                mean_gb REAL NOT NULL,
+                var_gb REAL NOT NULL,
+                observations INTEGER NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (location_id) REFERENCES locations (id)
+            );
+
+            -- Days whose usage was flagged against the rolling statistics
+            CREATE TABLE IF NOT EXISTS usage_anomalies (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                location_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                kind TEXT NOT NULL CHECK (kind IN ('spike', 'drop', 'zero')),
+                usage_gb REAL NOT NULL,
+                expected_gb REAL NOT NULL,
+                std_gb REAL NOT NULL,
+                z_score REAL NOT NULL,
+                detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (location_id) REFERENCES locations (id),
+                UNIQUE(location_id, date)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_usage_anomalies_date ON usage_anomalies(date);
+        """,
+        'checks': [
+            {
+                'sql': "SELECT * FROM usage_anomalies WHERE date >= ? ORDER BY date DESC, location_id LIMIT ?",
+                'uses': 'INDEX idx_usage_anomalies_date'
+            }
+        ]
+    },
+    {
+        'version': 7,
+        'name': 'compact_daily_usage',
+        'requires': [
+            {
+                'sql': "SELECT COUNT(*) FROM daily_usage WHERE date IS NOT date(date)",
+                'error': "{count} daily_usage rows have a date that is not YYYY-MM-DD; correct or delete "
+                         "them (SELECT id, date FROM daily_usage WHERE date IS NOT date(date)) and migrate again"
+            }
+        ],
+        'sql': f"""
+            -- daily_usage clustered on (location_id, day) without a rowid: day
+            -- counts days since 1970-01-01 and the timestamps are Unix seconds,
+            -- so each value is stored once, in a few bytes, next to the same
+            -- location's other days
+            CREATE TABLE daily_usage_compact (
+                location_id INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                usage_gb REAL DEFAULT 0,
+                created_at INTEGER DEFAULT (strftime('%s', 'now')),
+                updated_at INTEGER DEFAULT (strftime('%s', 'now')),
+                PRIMARY KEY (location_id, day),
+                FOREIGN KEY (location_id) REFERENCES locations (id)
+            ) WITHOUT ROWID;
+
+            INSERT INTO daily_usage_compact (location_id, day, usage_gb, created_at, updated_at)
+            SELECT location_id, CAST(julianday(date) - 2440587.5 AS INTEGER), usage_gb,
+                   strftime('%s', created_at), strftime('%s', updated_at)
+            FROM daily_usage
+            ORDER BY location_id, date;
+
+            -- Takes the old indexes and triggers with it
+            DROP TABLE daily_usage;
+
+            -- Date ranges across all locations: trends and overview counts.
+            -- The primary key columns are part of every index, so location_id
+            -- is only listed to place usage_gb after it
+            CREATE INDEX idx_daily_usage_compact_day
+                ON daily_usage_compact(day, location_id, usage_gb);
+
+            -- Recent updates, newest first
+            CREATE INDEX idx_daily_usage_compact_updated
+                ON daily_usage_compact(updated_at);
+
+            -- The old columns for existing readers. id packs the primary key
+            -- as location_id * 2^20 + day; filter on day rather than date so
+            -- the primary key and indexes can be used
+            CREATE VIEW daily_usage AS
+            SELECT location_id * {USAGE_ID_FACTOR} + day AS id,
+                   date(day * 86400, 'unixepoch') AS date,
+                   location_id,
+                   usage_gb,
+                   datetime(created_at, 'unixepoch') AS created_at,
+                   datetime(updated_at, 'unixepoch') AS updated_at,
+                   day
+            FROM daily_usage_compact;
+
+            CREATE TRIGGER trg_daily_usage_view_insert
+            INSTEAD OF INSERT ON daily_usage
+            BEGIN
+                INSERT INTO daily_usage_compact (location_id, day, usage_gb, created_at, updated_at)
+                VALUES (NEW.location_id, CAST(julianday(NEW.date) - 2440587.5 AS INTEGER), NEW.usage_gb,
+                        COALESCE(strftime('%s', NEW.created_at), strftime('%s', 'now')),
+                        COALESCE(strftime('%s', NEW.updated_at), strftime('%s', 'now')));
+            END;
+
+            CREATE TRIGGER trg_daily_usage_view_update
+            INSTEAD OF UPDATE ON daily_usage
+            BEGIN
+                UPDATE daily_usage_compact
+                SET location_id = NEW.location_id,
+                    day = CAST(julianday(NEW.date) - 2440587.5 AS INTEGER),
+                    usage_gb = NEW.usage_gb,
+                    created_at = strftime('%s', NEW.created_at),
+                    updated_at = strftime('%s', NEW.updated_at)
+                WHERE location_id = OLD.location_id AND day = OLD.day;
+            END;
+
+            CREATE TRIGGER trg_daily_usage_view_delete
+            INSTEAD OF DELETE ON daily_usage
+            BEGIN
+                DELETE FROM daily_usage_compact WHERE location_id = OLD.location_id AND day = OLD.day;
+            END;
+
+            -- The schema.sql and change_log triggers, on the new table
+            CREATE TRIGGER trg_daily_usage_cycle_insert
+            AFTER INSERT ON daily_usage_compact
+            BEGIN
+                INSERT INTO cycle_usage_totals (period_start, period_end, location_id, total_usage_gb, day_count)
+                SELECT cs, date(cs, '+1 month', '-1 day'), NEW.location_id, COALESCE(NEW.usage_gb, 0), 1
+                FROM (SELECT CASE WHEN strftime('%d', NEW.day * 86400, 'unixepoch') >= '13'
+                                  THEN date(NEW.day * 86400, 'unixepoch', 'start of month', '+12 days')
+                                  ELSE date(NEW.day * 86400, 'unixepoch', 'start of month', '-1 month', '+12 days')
+                             END AS cs)
+                WHERE true
+                ON CONFLICT (period_start, location_id) DO UPDATE SET
+                    total_usage_gb = total_usage_gb + excluded.total_usage_gb,
+                    day_count = day_count + 1,
+                    updated_at = CURRENT_TIMESTAMP;
+            END;
+
+            CREATE TRIGGER trg_daily_usage_cycle_delete
+            AFTER DELETE ON daily_usage_compact
+            BEGIN
+                UPDATE cycle_usage_totals
+                SET total_usage_gb = total_usage_gb - COALESCE(OLD.usage_gb, 0),
+                    day_count = day_count - 1,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE location_id = OLD.location_id
+                  AND period_start = CASE WHEN strftime('%d', OLD.day * 86400, 'unixepoch') >= '13'
+                                          THEN date(OLD.day * 86400, 'unixepoch', 'start of month', '+12 days')
+                                          ELSE date(OLD.day * 86400, 'unixepoch', 'start of month', '-1 month', '+12 days')
+                                     END;
+                DELETE FROM cycle_usage_totals
+                WHERE location_id = OLD.location_id AND day_count <= 0;
+            END;
+
+            CREATE TRIGGER trg_daily_usage_cycle_update
+            AFTER UPDATE OF day, location_id, usage_gb ON daily_usage_compact
+            BEGIN
+                UPDATE cycle_usage_totals
+                SET total_usage_gb = total_usage_gb - COALESCE(OLD.usage_gb, 0),
+                    day_count = day_count - 1,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE location_id = OLD.location_id
+                  AND period_start = CASE WHEN strftime('%d', OLD.day * 86400, 'unixepoch') >= '13'
+                                          THEN date(OLD.day * 86400, 'unixepoch', 'start of month', '+12 days')
+                                          ELSE date(OLD.day * 86400, 'unixepoch', 'start of month', '-1 month', '+12 days')
+                                     END;
+                INSERT INTO cycle_usage_totals (period_start, period_end, location_id, total_usage_gb, day_count)
+                SELECT cs, date(cs, '+1 month', '-1 day'), NEW.location_id, COALESCE(NEW.usage_gb, 0), 1
+                FROM (SELECT CASE WHEN strftime('%d', NEW.day * 86400, 'unixepoch') >= '13'
+                                  THEN date(NEW.day * 86400, 'unixepoch', 'start of month', '+12 days')
+                                  ELSE date(NEW.day * 86400, 'unixepoch', 'start of month', '-1 month', '+12 days')
+                             END AS cs)
+                WHERE true
+                ON CONFLICT (period_start, location_id) DO UPDATE SET
+                    total_usage_gb = total_usage_gb + excluded.total_usage_gb,
+                    day_count = day_count + 1,
+                    updated_at = CURRENT_TIMESTAMP;
+                DELETE FROM cycle_usage_totals
+                WHERE location_id = OLD.location_id AND day_count <= 0;
+            END;
+
+            CREATE TRIGGER trg_daily_usage_version_insert
+            AFTER INSERT ON daily_usage_compact
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads)
+            BEGIN
+                UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+            END;
+
+            CREATE TRIGGER trg_daily_usage_version_update
+            AFTER UPDATE ON daily_usage_compact
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads)
+            BEGIN
+                UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+            END;
+
+            CREATE TRIGGER trg_daily_usage_version_delete
+            AFTER DELETE ON daily_usage_compact
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads)
+            BEGIN
+                UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+            END;
+
+            CREATE TRIGGER trg_daily_usage_change_insert
+            AFTER INSERT ON daily_usage_compact
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads)
+            BEGIN
+                INSERT INTO change_log (table_name, operation, row_id, location_id, date, usage_gb)
+                VALUES ('daily_usage', 'insert', NEW.location_id * {USAGE_ID_FACTOR} + NEW.day, NEW.location_id,
+                        date(NEW.day * 86400, 'unixepoch'), NEW.usage_gb);
+            END;
+
+            CREATE TRIGGER trg_daily_usage_change_update
+            AFTER UPDATE ON daily_usage_compact
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads)
+            BEGIN
+                INSERT INTO change_log (table_name, operation, row_id, location_id, date, usage_gb)
+                SELECT 'daily_usage', 'delete', OLD.location_id * {USAGE_ID_FACTOR} + OLD.day, OLD.location_id,
+                       date(OLD.day * 86400, 'unixepoch'), OLD.usage_gb
+                WHERE OLD.day IS NOT NEW.day OR OLD.location_id IS NOT NEW.location_id;
+                INSERT INTO change_log (table_name, operation, row_id, location_id, date, usage_gb)
+                VALUES ('daily_usage', 'update', NEW.location_id * {USAGE_ID_FACTOR} + NEW.day, NEW.location_id,
+                        date(NEW.day * 86400, 'unixepoch'), NEW.usage_gb);
+            END;
+
+            CREATE TRIGGER trg_daily_usage_change_delete
+            AFTER DELETE ON daily_usage_compact
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads)
+            BEGIN
+                INSERT INTO change_log (table_name, operation, row_id, location_id, date, usage_gb)
+                VALUES ('daily_usage', 'delete', OLD.location_id * {USAGE_ID_FACTOR} + OLD.day, OLD.location_id,
+                        date(OLD.day * 86400, 'unixepoch'), OLD.usage_gb);
+            END;
+
+            -- Row ids changed, so caches keyed on the version are dropped
+            UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+        """,
+        # The freed pages of the old table and indexes are only returned to
+        # the file system by a VACUUM
+        'vacuum': True,
+        # Their checks name indexes dropped with the old table
+        'supersedes': [2, 3],
+        'checks': [
+            {
+                'sql': "SELECT date, usage_gb FROM daily_usage WHERE location_id = ? AND day BETWEEN ? AND ?",
+                'uses': 'PRIMARY KEY (location_id=? AND day>? AND day<?)'
+            },
+            {
+                'sql': """SELECT day, location_id, usage_gb FROM daily_usage_compact
+                          WHERE day >= ? ORDER BY day, location_id""",
+                'uses': 'COVERING INDEX idx_daily_usage_compact_day',
+                'forbid': 'TEMP B-TREE'
+            },
+            {
+                'sql': """SELECT location_id, day FROM daily_usage_compact
+                          WHERE (updated_at, location_id, day) < (?, ?, ?)
+                          ORDER BY updated_at DESC, location_id DESC, day DESC LIMIT ?""",
+                'uses': 'INDEX idx_daily_usage_compact_updated',
+                'forbid': 'TEMP B-TREE'
+            }
+        ]
+    },
+    {
+        'version': 8,
+        'name': 'usage_archives',
+        'sql': """
+            -- Closed years moved out to per-year archive databases by
+            -- partitions.py. path is relative to this database's directory
+            -- unless absolute; the counts and day bounds answer totals without
+            -- attaching the archive. id is never reused, so a year archived
+            -- again is attached under a new schema name
+            CREATE TABLE IF NOT EXISTS usage_archives (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                year INTEGER NOT NULL UNIQUE,
+                path TEXT NOT NULL,
+                daily_rows INTEGER NOT NULL,
+                summary_rows INTEGER NOT NULL,
+                min_day INTEGER,
+                max_day INTEGER,
+                archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+
+            -- Archived years are read-only until restored with
+            -- partitions.py --unarchive, so no row exists in both places
+            CREATE TRIGGER IF NOT EXISTS trg_daily_usage_archived_insert
+            BEFORE INSERT ON daily_usage_compact
+            WHEN EXISTS (SELECT 1 FROM usage_archives
+                         WHERE year = CAST(strftime('%Y', NEW.day * 86400, 'unixepoch') AS INTEGER))
+            BEGIN
+                SELECT RAISE(ABORT, 'daily usage for an archived year is read-only');
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_daily_usage_archived_update
+            BEFORE UPDATE OF day ON daily_usage_compact
+            WHEN EXISTS (SELECT 1 FROM usage_archives
+                         WHERE year = CAST(strftime('%Y', NEW.day * 86400, 'unixepoch') AS INTEGER))
+            BEGIN
+                SELECT RAISE(ABORT, 'daily usage for an archived year is read-only');
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_monthly_summaries_archived_insert
+            BEFORE INSERT ON monthly_summaries
+            WHEN EXISTS (SELECT 1 FROM usage_archives
+                         WHERE year = CAST(strftime('%Y', NEW.period_start) AS INTEGER))
+            BEGIN
+                SELECT RAISE(ABORT, 'monthly summaries for an archived year are read-only');
+            END;
+
+            CREATE TRIGGER IF NOT EXISTS trg_monthly_summaries_archived_update
+            BEFORE UPDATE OF period_start ON monthly_summaries
+            WHEN EXISTS (SELECT 1 FROM usage_archives
+                         WHERE year = CAST(strftime('%Y', NEW.period_start) AS INTEGER))
+            BEGIN
+                SELECT RAISE(ABORT, 'monthly summaries for an archived year are read-only');
+            END;
+        """
+    }
+]
+
+class MigrationError(RuntimeError):
+    """Raised when a migration or its planner check fails"""
+
+def split_statements(script):
+    """Split a SQL script into statements, keeping trigger bodies whole"""
+    statements = []
+    current = ''
+    for line in script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            if current.strip():
+                statements.append(current.strip())
+            current = ''
+    if current.strip() and not all(line.strip().startswith('--') or not line.strip()
+                                   for line in current.splitlines()):
+        raise MigrationError(f"Incomplete SQL statement: {current.strip()[:80]}")
+    return statements
+
+def migration_sql(migration):
+    if 'sql_file' in migration:
+        with open(migration['sql_file'], 'r') as f:
+            return f.read()
+    return migration['sql']
+
+def query_plan(conn, sql):
+    """EXPLAIN QUERY PLAN details for sql, with NULL for every parameter"""
+    params = [None] * sql.count('?')
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+def run_checks(conn, migration):
+    """Verify the planner uses the migration's indexes; returns failures"""
+    failures = []
+    for check in migration.get('checks', []):
+        plan = query_plan(conn, check['sql'])
+        text = ' | '.join(plan)
+        if check['uses'] not in text:
+            failures.append(f"expected '{check['uses']}' in plan: {text}")
+        elif check.get('forbid') and check['forbid'] in text:
+            failures.append(f"unexpected '{check['forbid']}' in plan: {text}")
+    return failures
+
+def ensure_migrations_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duration_ms REAL
+        )
+    """)
+
+def applied_versions(conn):
+    ensure_migrations_table(conn)
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+def migrate(db_path, target=None, strict=True):
+    """Apply pending migrations up to target (default: all)
+
+    Each migration runs with its checks in one BEGIN IMMEDIATE transaction,
+    so concurrent starters wait for each other and a failed migration leaves
+    the schema untouched. With ``strict=False`` a failed planner check is
+    only logged, since a different SQLite version or stale statistics should
+    not keep the API from starting. Returns the list of versions applied.
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    applied = []
+    try:
+        for migration in sorted(MIGRATIONS, key=lambda m: m['version']):
+            if target is not None and migration['version'] > target:
+                break
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Re-read inside the lock: another process may have applied it
+                if migration['version'] in applied_versions(conn):
+                    conn.execute("ROLLBACK")
+                    continue
+
+                for requirement in migration.get('requires', []):
+                    count = conn.execute(requirement['sql']).fetchone()[0]
+                    if count:
+                        raise MigrationError(f"Migration {migration['version']} ({migration['name']}) "
+                                             f"cannot run: {requirement['error'].format(count=count)}")
+
+                started = time.perf_counter()
+                for statement in split_statements(migration_sql(migration)):
+                    conn.execute(statement)
+
+                failures = run_checks(conn, migration)
+                if failures:
+                    message = (f"Migration {migration['version']} ({migration['name']}) "
+                               f"planner check failed: {'; '.join(failures)}")
+                    if strict:
+                        raise MigrationError(message)
+                    logger.warning(f"{message} (applied anyway, see migrations.py --check)")
+
+                duration_ms = round((time.perf_counter() - started) * 1000, 1)
+                conn.execute("""
+                    INSERT INTO schema_migrations (version, name, duration_ms) VALUES (?, ?, ?)
+                """, (migration['version'], migration['name'], duration_ms))
+                conn.execute(f"PRAGMA user_version = {int(migration['version'])}")
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+
+            applied.append(migration['version'])
+            logger.info(f"Applied migration {migration['version']} ({migration['name']}) in {duration_ms} ms")
+
+        if any(migration.get('vacuum') for migration in MIGRATIONS if migration['version'] in applied):
+            try:
+                conn.execute("VACUUM")
+            except sqlite3.OperationalError as e:
+                # The space is reused by later writes either way
+                logger.warning(f"VACUUM after migrating failed: {e}")
+
+        if applied:
+            # Refresh planner statistics for the new indexes
+            conn.execute("PRAGMA optimize")
+        return applied
+    finally:
+        conn.close()
+
+def migration_status(db_path):
+    """Applied and pending migrations for db_path"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = {row[0]: row for row in conn.execute(
+            "SELECT version, name, applied_at, duration_ms FROM schema_migrations"
+        )} if conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'"
+        ).fetchone() else {}
+        user_version = conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+    return {
+        'user_version': user_version,
+        'migrations': [{
+            'version': migration['version'],
+            'name': migration['name'],
+            'applied_at': rows[migration['version']][2] if migration['version'] in rows else None,
+            'duration_ms': rows[migration['version']][3] if migration['version'] in rows else None,
+            'pending': migration['version'] not in rows
+        } for migration in sorted(MIGRATIONS, key=lambda m: m['version'])]
+    }
+
+def check_applied(db_path):
+    """Re-run the planner checks of every applied migration not superseded since"""
+    conn = sqlite3.connect(db_path)
+    try:
+        versions = applied_versions(conn)
+        superseded = {version for migration in MIGRATIONS if migration['version'] in versions
+                      for version in migration.get('supersedes', [])}
+        return {migration['version']: run_checks(conn, migration)
+                for migration in MIGRATIONS if migration['version'] in versions - superseded}
+    finally:
+        conn.close()
+
+def main():
+    """Main function for command line usage"""
+    parser = argparse.ArgumentParser(description='Data Usage Monitor Schema Migrations')
+    parser.add_argument('--db-path', default='data_usage.db', help='Database file path')
+    parser.add_argument('--status', action='store_true', help='Show applied and pending migrations')
+    parser.add_argument('--check', action='store_true', help='Re-run planner checks of applied migrations')
+    parser.add_argument('--target', type=int, help='Migrate up to this version only')
+
+    args = parser.parse_args()
+
+    if args.status:
+        status = migration_status(args.db_path)
+        print(f"Schema version: {status['user_version']}")
+        print(f"{'Version':<9} {'Name':<35} {'Applied':<21} {'Time (ms)':<10}")
+        print("-" * 77)
+        for migration in status['migrations']:
+            applied_at = migration['applied_at'] or 'pending'
+            duration = migration['duration_ms'] if migration['duration_ms'] is not None else '-'
+            print(f"{migration['version']:<9} {migration['name']:<35} {applied_at:<21} {duration:<10}")
+
+    elif args.check:
+        failed = False
+        for version, failures in check_applied(args.db_path).items():
+            for failure in failures:
+                failed = True
+                print(f"Migration {version}: {failure}")
+        if failed:
+            sys.exit(1)
+        print("All planner checks passed")
+
+    else:
+        try:
+            applied = migrate(args.db_path, args.target)
+        except Exception as e:
+            logger.error(f"Migration failed: {e}")
+            sys.exit(1)
+        print(f"Applied migrations: {applied}" if applied else "Database is up to date")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+Year Partitions for Data Usage Monitor
+Moves closed years of daily usage and monthly summaries into per-year archive
+databases, and attaches them on demand to queries whose range reaches them
+"""
+
+import os
+import sys
+import sqlite3
+import argparse
+from contextlib import contextmanager
+from datetime import date
+import logging
+from database import from_day, to_day
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Default archive location, next to the hot database
+ARCHIVE_DIR = 'archives'
+
+# Schema name an archive is attached under; id changes when a year is re-archived
+ARCHIVE_SCHEMA = 'archive_{year}_{id}'
+
+# Columns of each partitioned table as the union of partitions exposes them
+PARTITION_COLUMNS = {
+    'daily_usage': 'id, date, location_id, usage_gb, created_at, updated_at, day',
+    'daily_usage_compact': 'location_id, day, usage_gb, created_at, updated_at',
+    'monthly_summaries': 'id, period_start, period_end, location_id, total_usage_gb, '
+                         'manual_entry, created_at, updated_at',
+}
+
+# Hot database objects recreated in each archive, in creation order; the index
+# and view come after the copy so it is not slowed down by index upkeep
+ARCHIVE_TABLES = ('daily_usage_compact', 'monthly_summaries')
+ARCHIVE_OBJECTS = ('idx_daily_usage_compact_day', 'daily_usage')
+
+# Times an archive is rebuilt when the year changed while it was being written
+COPY_ATTEMPTS = 3
+# SQLite's default SQLITE_MAX_ATTACHED; every archive is attached to each connection
+MAX_ARCHIVES = 10
+
+class PartitionError(RuntimeError):
+    """Raised when a year cannot be archived, restored or attached"""
+
+def year_days(year):
+    """First and last day number of a calendar year"""
+    return to_day(date(year, 1, 1)), to_day(date(year, 12, 31))
+
+def list_archives(conn):
+    """Registered archives, oldest year first; empty before migration 8"""
+    try:
+        rows = conn.execute("""
+            SELECT id, year, path, daily_rows, summary_rows, min_day, max_day, archived_at
+            FROM usage_archives ORDER BY year
+        """).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    keys = ('id', 'year', 'path', 'daily_rows', 'summary_rows', 'min_day', 'max_day', 'archived_at')
+    return [dict(zip(keys, row)) for row in rows]
+
+def attach_archives(conn, archives=None):
+    """Attach the given registered archives (default: all) to conn
+
+    Archives already attached are reused, and archives no longer registered
+    are detached. ATTACH is not allowed inside a transaction, so callers
+    that go on to BEGIN attach first. Returns {year: schema name}.
+    """
+    if archives is None:
+        archives = list_archives(conn)
+    databases = {row[1]: row[2] for row in conn.execute("PRAGMA database_list")}
+    base = os.path.dirname(databases['main'])
+
+    schemas = {}
+    for archive in archives:
+        schema = ARCHIVE_SCHEMA.format(**archive)
+        if schema not in databases:
+            path = os.path.join(base, archive['path'])
+            if not os.path.exists(path):
+                raise PartitionError(f"Archive for {archive['year']} is missing: {path}")
+            if conn.in_transaction:
+                raise PartitionError(f"Archive for {archive['year']} must be attached before the transaction begins")
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        schemas[archive['year']] = schema
+
+    if not conn.in_transaction:
+        registered = {ARCHIVE_SCHEMA.format(**archive) for archive in list_archives(conn)}
+        for name in databases:
+            if name.startswith('archive_') and name not in registered:
+                try:
+                    conn.execute(f"DETACH DATABASE {name}")
+                except sqlite3.OperationalError as e:
+                    # Still read by an open cursor; unused, so retried next time
+                    logger.debug(f"Could not detach {name}: {e}")
+    return schemas
+
+def usage_source(conn, start_day=None, end_day=None, table='daily_usage'):
+    """FROM-clause source of daily usage between two day numbers (inclusive)
+
+    ``table`` is the daily_usage view or daily_usage_compact. Without an
+    archived year in the range that is just the hot table; otherwise a
+    UNION ALL of it and each overlapping archive, which are attached as
+    needed. Callers still filter on day, which SQLite pushes into every
+    branch of the union.
+    """
+    archives = [archive for archive in list_archives(conn)
+                if (start_day is None or year_days(archive['year'])[1] >= start_day)
+                and (end_day is None or year_days(archive['year'])[0] <= end_day)]
+    return _union(conn, table, archives)
+
+def usage_segments(conn, start_day=None, end_day=None):
+    """Schemas holding daily usage between two day numbers, in day order
+
+    Returns (schema, first_day, last_day) ranges that together cover the
+    range, None marking an open end: the hot database ('main') between
+    archived years and each overlapping archive for its own year. Reading
+    them one after another with ORDER BY day walks every partition's day
+    index in order, where sorting usage_source() would read all of them
+    first.
+    """
+    archives = sorted((archive for archive in list_archives(conn)
+                       if (start_day is None or year_days(archive['year'])[1] >= start_day)
+                       and (end_day is None or year_days(archive['year'])[0] <= end_day)),
+                      key=lambda archive: archive['year'])
+    schemas = attach_archives(conn, archives) if archives else {}
+
+    segments = []
+    low = start_day
+    for archive in archives:
+        first_day, last_day = year_days(archive['year'])
+        if low is None or low < first_day:
+            segments.append(('main', low, first_day - 1))
+        segments.append((schemas[archive['year']], first_day if low is None else max(low, first_day),
+                         last_day if end_day is None else min(last_day, end_day)))
+        low = last_day + 1
+    if end_day is None or low is None or low <= end_day:
+        segments.append(('main', low, end_day))
+    return segments
+
+def summary_source(conn, start=None, end=None):
+    """FROM-clause source of monthly summaries with period_start in [start, end]
+
+    ``start`` and ``end`` are dates or YYYY-MM-DD strings; see usage_source.
+    """
+    start_year = int(str(start)[:4]) if start is not None else None
+    end_year = int(str(end)[:4]) if end is not None else None
+    archives = [archive for archive in list_archives(conn)
+                if (start_year is None or archive['year'] >= start_year)
+                and (end_year is None or archive['year'] <= end_year)]
+    return _union(conn, 'monthly_summaries', archives)
+
+def _union(conn, table, archives):
+    if not archives:
+        return table
+    schemas = attach_archives(conn, archives)
+    columns = PARTITION_COLUMNS[table]
+    parts = [f"SELECT {columns} FROM main.{table}"]
+    parts += [f"SELECT {columns} FROM {schemas[archive['year']]}.{table}" for archive in archives]
+    return f"({' UNION ALL '.join(parts)})"
+
+def usage_totals(conn):
+    """(rows, first date, last date) of all daily usage, without attaching archives"""
+    count, min_day, max_day = conn.execute(
+        "SELECT COUNT(*), MIN(day), MAX(day) FROM daily_usage_compact").fetchone()
+    for archive in list_archives(conn):
+        count += archive['daily_rows']
+        if archive['min_day'] is not None:
+            min_day = archive['min_day'] if min_day is None else min(min_day, archive['min_day'])
+            max_day = archive['max_day'] if max_day is None else max(max_day, archive['max_day'])
+    return (count, from_day(min_day) if min_day is not None else None,
+            from_day(max_day) if max_day is not None else None)
+
+def last_archived_day(conn):
+    """Newest day number held by any archive, None without archives"""
+    days = [archive['max_day'] for archive in list_archives(conn) if archive['max_day'] is not None]
+    return max(days) if days else None
+
+def summary_count(conn):
+    """Number of monthly summaries, hot and archived"""
+    count = conn.execute("SELECT COUNT(*) FROM monthly_summaries").fetchone()[0]
+    return count + sum(archive['summary_rows'] for archive in list_archives(conn))
+
+@contextmanager
+def moving_year(conn, year):
+    """Undo the trigger side effects of moving a year's rows in or out
+
+    Restores the cycle totals the year contributes to and drops the
+    change_log rows, and their sequence numbers, written inside the block.
+    """
+    # Billing cycles holding any day of the year
+    bounds = (f"{year - 1}-12-13", f"{year}-12-13")
+    head = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+    totals = conn.execute("""
+        SELECT period_start, period_end, location_id, total_usage_gb, day_count, updated_at
+        FROM cycle_usage_totals WHERE period_start BETWEEN ? AND ?
+    """, bounds).fetchall()
+
+    yield
+
+    conn.execute("DELETE FROM cycle_usage_totals WHERE period_start BETWEEN ? AND ?", bounds)
+    conn.executemany("""
+        INSERT INTO cycle_usage_totals
+            (period_start, period_end, location_id, total_usage_gb, day_count, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, totals)
+    conn.execute("DELETE FROM change_log WHERE seq > ?", (head,))
+    conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'change_log'", (head,))
+
+class PartitionManager:
+    """Moves whole years between the hot database and archive files
+
+    A year is first copied into a new archive file from a read snapshot.
+    Then, in one write transaction on the hot database, the copy is checked
+    against the year's rows, which are deleted and the archive registered.
+    A crash in between only leaves an unregistered archive file behind.
+
+    Moving rows must not look like deleting them: cycle_usage_totals keep
+    the archived days, and the change_log rows the move writes are dropped
+    again, so followers of the change feed never see it.
+    """
+
+    def __init__(self, db_path='data_usage.db', archive_dir=None):
+        self.db_path = os.path.abspath(db_path)
+        self.archive_dir = os.path.abspath(archive_dir) if archive_dir else \
+            os.path.join(os.path.dirname(self.db_path), ARCHIVE_DIR)
+
+    def archive_path(self, year):
+        stem = os.path.splitext(os.path.basename(self.db_path))[0]
+        return os.path.join(self.archive_dir, f"{stem}_{year}.db")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+
+    def hot_years(self):
+        """Years with daily usage or monthly summaries still in the hot database"""
+        conn = self._connect()
+        try:
+            return sorted({int(row[0]) for row in conn.execute("""
+                SELECT DISTINCT strftime('%Y', day * 86400, 'unixepoch') FROM daily_usage_compact
+                UNION
+                SELECT DISTINCT strftime('%Y', period_start) FROM monthly_summaries
+                WHERE period_start IS NOT NULL
+            """) if row[0] is not None})
+        finally:
+            conn.close()
+
+    def archive_closed_years(self, keep_years=1, today=None):
+        """Archive every year older than the current one and the keep_years before it"""
+        today = today or date.today()
+        before = today.year - max(keep_years, 0)
+        return [self.archive_year(year, today) for year in self.hot_years() if year < before]
+
+    def archive_year(self, year, today=None):
+        """Move one closed year into its archive file; returns its registry entry"""
+        if year >= (today or date.today()).year:
+            raise PartitionError(f"{year} is not a closed year")
+
+        conn = self._connect()
+        try:
+            archives = list_archives(conn)
+            if any(archive['year'] == year for archive in archives):
+                raise PartitionError(f"{year} is already archived")
+            if len(archives) >= MAX_ARCHIVES:
+                raise PartitionError(f"SQLite can attach at most {MAX_ARCHIVES} archives; "
+                                     f"unarchive a year before archiving {year}")
+
+            path = self.archive_path(year)
+            for _ in range(COPY_ATTEMPTS):
+                self._write_archive(year, path)
+                conn.execute("ATTACH DATABASE ? AS archive", (path,))
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        entry = self._move_out(conn, year, path)
+                        if entry is None:
+                            # Written to since the copy was taken
+                            conn.execute("ROLLBACK")
+                            continue
+                        conn.execute("COMMIT")
+                    except Exception:
+                        if conn.in_transaction:
+                            conn.execute("ROLLBACK")
+                        raise
+                finally:
+                    conn.execute("DETACH DATABASE archive")
+
+                logger.info(f"Archived {year}: {entry['daily_rows']} daily rows and "
+                            f"{entry['summary_rows']} monthly summaries to {path}")
+                return entry
+            raise PartitionError(f"{year} kept changing while it was being archived")
+        finally:
+            conn.close()
+
+    def _write_archive(self, year, path):
+        """Copy a year of the hot database into a fresh archive file at path"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        temp_path = path + '.tmp'
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        first_day, last_day = year_days(year)
+        archive = sqlite3.connect(temp_path, isolation_level=None)
+        try:
+            archive.execute("ATTACH DATABASE ? AS hot", (self.db_path,))
+            definitions = dict(archive.execute(f"""
+                SELECT name, sql FROM hot.sqlite_master
+                WHERE name IN ({','.join('?' * (len(ARCHIVE_TABLES) + len(ARCHIVE_OBJECTS)))})
+            """, ARCHIVE_TABLES + ARCHIVE_OBJECTS))
+            missing = [name for name in ARCHIVE_TABLES + ARCHIVE_OBJECTS if name not in definitions]
+            if missing:
+                raise PartitionError(f"Hot database lacks {', '.join(missing)}; run migrations.py")
+
+            archive.execute("BEGIN")
+            for name in ARCHIVE_TABLES:
+                archive.execute(definitions[name])
+            columns = PARTITION_COLUMNS['daily_usage_compact']
+            archive.execute(f"""
+                INSERT INTO main.daily_usage_compact ({columns})
+                SELECT {columns} FROM hot.daily_usage_compact WHERE day BETWEEN ? AND ?
+                ORDER BY location_id, day
+            """, (first_day, last_day))
+            columns = PARTITION_COLUMNS['monthly_summaries']
+            archive.execute(f"""
+                INSERT INTO main.monthly_summaries ({columns})
+                SELECT {columns} FROM hot.monthly_summaries WHERE period_start BETWEEN ? AND ?
+            """, (from_day(first_day), from_day(last_day)))
+            for name in ARCHIVE_OBJECTS:
+                archive.execute(definitions[name])
+            archive.execute("COMMIT")
+            archive.execute("DETACH DATABASE hot")
+        finally:
+            archive.close()
+
+        os.replace(temp_path, path)
+
+    def _move_out(self, conn, year, path):
+        """Delete a year archived to the attached ``archive``, if it still matches
+
+        Runs inside the hot write transaction. Returns the registry entry, or
+        None when the hot rows differ from the archive.
+        """
+        first_day, last_day = year_days(year)
+        first_date, last_date = from_day(first_day), from_day(last_day)
+        for table, where, bounds in (('daily_usage_compact', 'day BETWEEN ? AND ?', (first_day, last_day)),
+                                     ('monthly_summaries', 'period_start BETWEEN ? AND ?', (first_date, last_date))):
+            columns = PARTITION_COLUMNS[table]
+            hot_rows = conn.execute(f"SELECT COUNT(*) FROM main.{table} WHERE {where}", bounds).fetchone()[0]
+            archived_rows = conn.execute(f"SELECT COUNT(*) FROM archive.{table}").fetchone()[0]
+            differing = conn.execute(f"""
+                SELECT COUNT(*) FROM (SELECT {columns} FROM main.{table} WHERE {where}
+                                      EXCEPT SELECT {columns} FROM archive.{table})
+            """, bounds).fetchone()[0]
+            if hot_rows != archived_rows or differing:
+                return None
+
+        with moving_year(conn, year):
+            daily_rows = conn.execute("DELETE FROM daily_usage_compact WHERE day BETWEEN ? AND ?",
+                                      (first_day, last_day)).rowcount
+            summary_rows = conn.execute("DELETE FROM monthly_summaries WHERE period_start BETWEEN ? AND ?",
+                                        (first_date, last_date)).rowcount
+
+        min_day, max_day = conn.execute("SELECT MIN(day), MAX(day) FROM archive.daily_usage_compact").fetchone()
+        stored_path = os.path.relpath(path, os.path.dirname(self.db_path))
+        if stored_path.startswith(os.pardir):
+            stored_path = path
+        cursor = conn.execute("""
+            INSERT INTO usage_archives (year, path, daily_rows, summary_rows, min_day, max_day)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (year, stored_path, daily_rows, summary_rows, min_day, max_day))
+        return {'id': cursor.lastrowid, 'year': year, 'path': stored_path, 'daily_rows': daily_rows,
+                'summary_rows': summary_rows, 'min_day': min_day, 'max_day': max_day}
+
+    def unarchive_year(self, year):
+        """Move an archived year back into the hot database and delete its file"""
+        conn = self._connect()
+        try:
+            archive = next((archive for archive in list_archives(conn) if archive['year'] == year), None)
+            if archive is None:
+                raise PartitionError(f"{year} is not archived")
+            path = os.path.join(os.path.dirname(self.db_path), archive['path'])
+            if not os.path.exists(path):
+                raise PartitionError(f"Archive for {year} is missing: {path}")
+
+            conn.execute("ATTACH DATABASE ? AS archive", (path,))
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # Unregister first, so the archived-year triggers allow the inserts
+                    conn.execute("DELETE FROM usage_archives WHERE year = ?", (year,))
+                    with moving_year(conn, year):
+                        for table in ARCHIVE_TABLES:
+                            columns = PARTITION_COLUMNS[table]
+                            conn.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM archive.{table}")
+                    conn.execute("COMMIT")
+                except Exception:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+            finally:
+                conn.execute("DETACH DATABASE archive")
+        finally:
+            conn.close()
+
+        os.remove(path)
+        logger.info(f"Restored {year} from {path} into the hot database")
+
+    def vacuum(self):
+        """Return the space freed by archiving to the file system"""
+        conn = self._connect()
+        try:
+            conn.execute("VACUUM")
+        except sqlite3.OperationalError as e:
+            # The space is reused by later writes either way
+            logger.warning(f"VACUUM after archiving failed: {e}")
+        finally:
+            conn.close()
+
+    def status(self):
+        """Hot database size and the registered archives with their file sizes"""
+        conn = self._connect()
+        try:
+            archives = list_archives(conn)
+        finally:
+            conn.close()
+        for archive in archives:
+            path = os.path.join(os.path.dirname(self.db_path), archive['path'])
+            archive['exists'] = os.path.exists(path)
+            archive['size_mb'] = round(os.path.getsize(path) / (1024 * 1024), 2) if archive['exists'] else None
+            archive['first_date'] = from_day(archive['min_day']) if archive['min_day'] is not None else None
+            archive['last_date'] = from_day(archive['max_day']) if archive['max_day'] is not None else None
+        return {
+            'hot_size_mb': round(os.path.getsize(self.db_path) / (1024 * 1024), 2),
+            'archives': archives
+        }
+
+def main():
+    """Main function for command line usage"""
+    parser = argparse.ArgumentParser(description='Data Usage Monitor Year Partitions')
+    parser.add_argument('--db-path', default='data_usage.db', help='Database file path')
+    parser.add_argument('--archive-dir', help=f"Archive directory (default: {ARCHIVE_DIR}/ next to the database)")
+    parser.add_argument('--list', action='store_true', help='List archived years')
+    parser.add_argument('--archive', type=int, nargs='+', metavar='YEAR', help='Archive these closed years')
+    parser.add_argument('--archive-closed', action='store_true', help='Archive every closed year but the newest')
+    parser.add_argument('--keep-years', type=int, default=1,
+                        help='Closed years --archive-closed leaves in the hot database')
+    parser.add_argument('--unarchive', type=int, metavar='YEAR', help='Move an archived year back')
+    parser.add_argument('--no-vacuum', action='store_true', help='Skip the VACUUM after archiving')
+
+    args = parser.parse_args()
+    manager = PartitionManager(args.db_path, args.archive_dir)
+
+    try:
+        if args.archive or args.archive_closed:
+            entries = ([manager.archive_year(year) for year in args.archive] if args.archive
+                       else manager.archive_closed_years(args.keep_years))
+            if entries and not args.no_vacuum:
+                manager.vacuum()
+            print(f"Archived years: {[entry['year'] for entry in entries]}" if entries
+                  else "No closed years to archive")
+
+        elif args.unarchive:
+            manager.unarchive_year(args.unarchive)
+            print(f"Restored {args.unarchive} into the hot database")
+
+        else:
+            status = manager.status()
+            print(f"Hot database: {status['hot_size_mb']} MB")
+            print(f"{'Year':<6} {'Daily rows':>11} {'Summaries':>10} {'Size (MB)':>10}  Path")
+            print("-" * 70)
+            for archive in status['archives']:
+                size = archive['size_mb'] if archive['exists'] else 'missing'
+                print(f"{archive['year']:<6} {archive['daily_rows']:>11} {archive['summary_rows']:>10} "
+                      f"{size:>10}  {archive['path']}")
+    except PartitionError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
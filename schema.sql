@@ -36,6 +36,141 @@ CREATE TABLE IF NOT EXISTS monthly_summaries (
     UNIQUE(period_start, location_id)
 );
 
+-- Computed billing cycle totals (13th to 12th) per location, kept up to date
+-- by the triggers below on every daily_usage insert, update and delete.
+-- Manual entries stay in monthly_summaries (manual_entry = 1).
+CREATE TABLE IF NOT EXISTS cycle_usage_totals (
+    period_start DATE NOT NULL, -- 13th of the month
+    period_end DATE NOT NULL,   -- 12th of next month
+    location_id INTEGER NOT NULL,
+    total_usage_gb REAL NOT NULL DEFAULT 0,
+    day_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (period_start, location_id),
+    FOREIGN KEY (location_id) REFERENCES locations (id)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_usage_cycle_insert
+AFTER INSERT ON daily_usage
+WHEN date(NEW.date) IS NOT NULL
+BEGIN
+    INSERT INTO cycle_usage_totals (period_start, period_end, location_id, total_usage_gb, day_count)
+    SELECT cs, date(cs, '+1 month', '-1 day'), NEW.location_id, COALESCE(NEW.usage_gb, 0), 1
+    FROM (SELECT CASE WHEN strftime('%d', NEW.date) >= '13'
+                      THEN date(NEW.date, 'start of month', '+12 days')
+                      ELSE date(NEW.date, 'start of month', '-1 month', '+12 days') END AS cs)
+    WHERE true
+    ON CONFLICT (period_start, location_id) DO UPDATE SET
+        total_usage_gb = total_usage_gb + excluded.total_usage_gb,
+        day_count = day_count + 1,
+        updated_at = CURRENT_TIMESTAMP;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_usage_cycle_delete
+AFTER DELETE ON daily_usage
+WHEN date(OLD.date) IS NOT NULL
+BEGIN
+    UPDATE cycle_usage_totals
+    SET total_usage_gb = total_usage_gb - COALESCE(OLD.usage_gb, 0),
+        day_count = day_count - 1,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE location_id = OLD.location_id
+      AND period_start = CASE WHEN strftime('%d', OLD.date) >= '13'
+                              THEN date(OLD.date, 'start of month', '+12 days')
+                              ELSE date(OLD.date, 'start of month', '-1 month', '+12 days') END;
+    DELETE FROM cycle_usage_totals
+    WHERE location_id = OLD.location_id AND day_count <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_usage_cycle_update
+AFTER UPDATE OF date, location_id, usage_gb ON daily_usage
+BEGIN
+    UPDATE cycle_usage_totals
+    SET total_usage_gb = total_usage_gb - COALESCE(OLD.usage_gb, 0),
+        day_count = day_count - 1,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE location_id = OLD.location_id
+      AND period_start = CASE WHEN strftime('%d', OLD.date) >= '13'
+                              THEN date(OLD.date, 'start of month', '+12 days')
+                              ELSE date(OLD.date, 'start of month', '-1 month', '+12 days') END;
+    INSERT INTO cycle_usage_totals (period_start, period_end, location_id, total_usage_gb, day_count)
+    SELECT cs, date(cs, '+1 month', '-1 day'), NEW.location_id, COALESCE(NEW.usage_gb, 0), 1
+    FROM (SELECT CASE WHEN strftime('%d', NEW.date) >= '13'
+                      THEN date(NEW.date, 'start of month', '+12 days')
+                      ELSE date(NEW.date, 'start of month', '-1 month', '+12 days') END AS cs)
+    WHERE cs IS NOT NULL
+    ON CONFLICT (period_start, location_id) DO UPDATE SET
+        total_usage_gb = total_usage_gb + excluded.total_usage_gb,
+        day_count = day_count + 1,
+        updated_at = CURRENT_TIMESTAMP;
+    DELETE FROM cycle_usage_totals
+    WHERE location_id = OLD.location_id AND day_count <= 0;
+END;
+
+-- Change counter bumped by every write to the dashboard tables, so API
+-- result caches can tell when they are stale with a single row lookup
+CREATE TABLE IF NOT EXISTS data_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS trg_locations_version_insert
+AFTER INSERT ON locations
+BEGIN
+    UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_locations_version_update
+AFTER UPDATE ON locations
+BEGIN
+    UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_locations_version_delete
+AFTER DELETE ON locations
+BEGIN
+    UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_usage_version_insert
+AFTER INSERT ON daily_usage
+BEGIN
+    UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_usage_version_update
+AFTER UPDATE ON daily_usage
+BEGIN
+    UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_daily_usage_version_delete
+AFTER DELETE ON daily_usage
+BEGIN
+    UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_monthly_summaries_version_insert
+AFTER INSERT ON monthly_summaries
+BEGIN
+    UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_monthly_summaries_version_update
+AFTER UPDATE ON monthly_summaries
+BEGIN
+    UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_monthly_summaries_version_delete
+AFTER DELETE ON monthly_summaries
+BEGIN
+    UPDATE data_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE id = 1;
+END;
+
 -- Table to store system information for dashboard
 CREATE TABLE IF NOT EXISTS system_info (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -98,7 +98,7 @@ setup_application() {
     source venv/bin/activate
     
     # Install Python dependencies
-    pip install flask flask-cors psutil
+    pip install flask flask-cors psutil numpy
     
     # Make scripts executable
     chmod +x backup_manager.py
@@ -132,7 +132,7 @@ Type=simple
 User=$USER
 WorkingDirectory=$APP_DIR
 Environment=PATH=$APP_DIR/venv/bin
-ExecStart=$APP_DIR/venv/bin/python $APP_DIR/data-usage-api/src/main.py
+ExecStart=$APP_DIR/venv/bin/python $APP_DIR/data-usage-api/src/serve.py
 Restart=always
 RestartSec=10
 
@@ -0,0 +1,88 @@
+"""
+Regression tests for anomaly scoring (services/anomalies.py)
+"""
+
+import io
+import sqlite3
+import pytest
+from database import DatabaseManager
+from src.services.anomalies import AnomalyEngine, ScorerElection
+
+# Three weeks of steady use at Site A, then a spike
+SPIKE_CSV = "Date,Site A\n" + "".join(f"2024-03-{day:02d},10\n" for day in range(1, 21)) + "2024-03-21,100\n"
+
+def test_anomalies_route_does_not_score(client, monkeypatch):
+    monkeypatch.setattr(AnomalyEngine, 'update', lambda self, conn: pytest.fail('GET scored anomalies'))
+
+    response = client.get('/api/dashboard/anomalies', query_string={'days': 0})
+
+    assert response.status_code == 200
+    assert response.get_json() == []
+
+def test_route_serves_stored_scores(client, app, loaded_db):
+    DatabaseManager(loaded_db).bulk_import_daily_usage(io.StringIO(SPIKE_CSV))
+    client.get('/api/dashboard/anomalies', query_string={'days': 0})
+    with app.extensions['db_pool'].connection() as conn:
+        app.extensions['anomaly_engine'].update(conn)
+
+    anomalies = client.get('/api/dashboard/anomalies', query_string={'days': 0}).get_json()
+
+    assert [(row['date'], row['kind']) for row in anomalies] == [('2024-03-21', 'spike')]
+
+def test_only_one_process_is_elected_to_score(tmp_path):
+    first = ScorerElection(str(tmp_path / 'scorer.lock'))
+    second = ScorerElection(str(tmp_path / 'scorer.lock'))
+
+    assert first.elected()
+    assert first.elected()
+    assert not second.elected()
+
+    # The scorer exits, releasing its lock
+    first._file.close()
+    assert second.elected()
+
+def wide_csv(days, locations=40):
+    header = "Date," + ",".join(f"Site {index}" for index in range(locations))
+    return header + "\n" + "".join(
+        f"2024-03-{day:02d}," + ",".join(str(10 + (day * index) % 7) for index in range(locations)) + "\n"
+        for day in days)
+
+def scores(conn):
+    return (conn.execute("SELECT location_id, last_date, mean_gb, var_gb, observations FROM anomaly_state"
+                         " ORDER BY location_id").fetchall(),
+            conn.execute("SELECT location_id, date, kind FROM usage_anomalies ORDER BY 1, 2").fetchall())
+
+def test_import_that_appends_days_is_scored_incrementally(db_path):
+    manager = DatabaseManager(db_path)
+    manager.bulk_import_daily_usage(io.StringIO(wide_csv(range(1, 15))))
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        engine = AnomalyEngine()
+        assert engine.update(conn)['backfill']
+
+        manager.bulk_import_daily_usage(io.StringIO(wide_csv(range(15, 22))))
+        result = engine.update(conn)
+
+        assert result['backfill'] is False
+        assert result['rescored'] == 0
+        incremental = scores(conn)
+        engine.backfill(conn)
+        assert scores(conn) == incremental
+    finally:
+        conn.close()
+
+def test_import_that_rewrites_scored_days_rescores(db_path):
+    manager = DatabaseManager(db_path)
+    manager.bulk_import_daily_usage(io.StringIO(SPIKE_CSV))
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        engine = AnomalyEngine()
+        engine.update(conn)
+
+        manager.bulk_import_daily_usage(io.StringIO("Date,Site A\n2024-03-21,10\n"))
+        result = engine.update(conn)
+
+        assert (result['backfill'], result['rescored']) == (False, 1)
+        assert scores(conn)[1] == []
+    finally:
+        conn.close()
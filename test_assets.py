@@ -0,0 +1,72 @@
+"""
+Regression tests for the fingerprinted static asset pipeline (services/assets.py)
+"""
+
+import gzip
+import re
+from src.services.assets import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, AssetManifest
+
+def manifest(app):
+    return app.extensions['asset_manifest'].manifest()
+
+def test_index_references_fingerprinted_assets(client, app):
+    hashed = {path: entry['hashed_path'] for path, entry in manifest(app).items()}
+    page = client.get('/').get_data(as_text=True)
+
+    assert re.fullmatch(r'app\.[0-9a-f]{10}\.js', hashed['app.js'])
+    assert f'src="{hashed["app.js"]}"' in page
+    assert f'href="{hashed["styles.css"]}"' in page
+    assert 'src="app.js"' not in page
+    assert 'src="https://cdn.jsdelivr.net/npm/chart.js"' in page
+
+def test_rewrite_handles_absolute_relative_and_missing_references(tmp_path):
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'js' / 'app.js').write_text('console.log(1)')
+    (tmp_path / 'pages').mkdir()
+    (tmp_path / 'pages' / 'page.html').write_text(
+        '<script src="/js/app.js"></script><script src="../js/app.js"></script><img src="gone.png">')
+    built = AssetManifest(str(tmp_path)).build()
+    hashed = built.assets['js/app.js'].hashed_path
+
+    assert built.assets['pages/page.html'].body.decode() == (
+        f'<script src="/{hashed}"></script><script src="../{hashed}"></script><img src="gone.png">')
+
+def test_hashed_urls_are_immutable_and_plain_urls_revalidate(client, app):
+    hashed = manifest(app)['app.js']['hashed_path']
+    versioned = client.get(f'/{hashed}')
+    plain = client.get('/app.js')
+
+    assert versioned.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+    assert plain.headers['Cache-Control'] == REVALIDATE_CACHE_CONTROL
+    assert versioned.get_data() == plain.get_data()
+    assert versioned.headers['ETag'] == plain.headers['ETag']
+
+def test_matching_etag_gets_304(client):
+    etag = client.get('/styles.css').headers['ETag']
+    response = client.get('/styles.css', headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert not response.get_data()
+    assert client.get('/styles.css', headers={'If-None-Match': '"stale"'}).status_code == 200
+
+def test_encoding_follows_accept_encoding(client, app, monkeypatch):
+    plain = client.get('/app.js', headers={'Accept-Encoding': 'identity'})
+    packed = client.get('/app.js', headers={'Accept-Encoding': 'gzip, deflate'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert packed.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(packed.get_data()) == plain.get_data()
+
+    asset, _ = app.extensions['asset_manifest'].lookup('app.js')
+    monkeypatch.setitem(asset.variants, 'br', b'brotli')
+    assert client.get('/app.js', headers={'Accept-Encoding': 'gzip, br'}).headers['Content-Encoding'] == 'br'
+
+def test_unknown_paths_get_the_spa_shell(client):
+    shell = client.get('/')
+    routed = client.get('/reports/2024')
+
+    assert routed.status_code == 200
+    assert routed.mimetype == 'text/html'
+    assert routed.get_data() == shell.get_data()
+    assert routed.headers['Cache-Control'] == REVALIDATE_CACHE_CONTROL
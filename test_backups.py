@@ -0,0 +1,241 @@
+"""
+Regression tests for full and chunked backups (backup_manager.py)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import tracemalloc
+from datetime import date
+import pytest
+import backup_manager
+from backup_manager import ARCHIVES_SUFFIX, CHUNK_GC_GRACE_SECONDS, BackupManager
+from partitions import PartitionManager, usage_source
+
+def usage_total(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT SUM(usage_gb), COUNT(*) FROM daily_usage").fetchone()
+    finally:
+        conn.close()
+
+def set_usage(db_path, value):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("UPDATE daily_usage_compact SET usage_gb = ?", (value,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def pad_database(db_path, megabytes):
+    """Grow the database with incompressible filler"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("CREATE TABLE filler (data BLOB)")
+        conn.executemany("INSERT INTO filler VALUES (randomblob(65536))", [()] * (megabytes * 16))
+        conn.commit()
+    finally:
+        conn.close()
+
+def total_with_archives(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(f"SELECT SUM(usage_gb), COUNT(*) FROM {usage_source(conn)}").fetchone()
+    finally:
+        conn.close()
+
+@pytest.fixture
+def manager(loaded_db, tmp_path):
+    return BackupManager(loaded_db, str(tmp_path / 'backups'))
+
+@pytest.mark.parametrize('codec', ['gzip', 'bz2', 'xz'])
+def test_compressed_backup_verifies_and_restores(manager, loaded_db, codec):
+    manager.config['compression_codec'] = codec
+    expected = usage_total(loaded_db)
+    backup = manager.create_backup()
+
+    assert backup['codec'] == codec
+    assert manager.verify_backup(backup['filename'])
+    set_usage(loaded_db, 0)
+    assert manager.restore_backup(backup['filename'], confirm=True)
+    assert usage_total(loaded_db) == expected
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_small_database_is_snapshotted_in_memory(manager, loaded_db, monkeypatch, incremental):
+    expected = usage_total(loaded_db)
+    monkeypatch.setattr(backup_manager.tempfile, 'TemporaryDirectory',
+                        lambda **kwargs: pytest.fail('snapshot written to a temporary file'))
+    backup = manager.create_backup(incremental=incremental)
+    monkeypatch.undo()
+
+    assert backup
+    set_usage(loaded_db, 0)
+    assert manager.restore_backup(backup['filename'], confirm=True)
+    assert usage_total(loaded_db) == expected
+
+def test_large_database_snapshot_spills_to_disk(manager, loaded_db):
+    pad_database(loaded_db, 16)
+    db_size = os.path.getsize(loaded_db)
+    manager.config['compression_workers'] = 2
+    manager.config['snapshot_memory_limit_mb'] = 4
+
+    tracemalloc.start()
+    try:
+        backup = manager.create_backup()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert backup
+    assert peak < db_size / 2
+
+def test_chunked_backup_only_stores_changed_chunks(manager, loaded_db):
+    first = manager.create_backup(incremental=True)
+    second = manager.create_backup(incremental=True)
+
+    assert first['new_chunks'] == first['total_chunks']
+    assert second['new_chunks'] <= 2
+    assert manager.verify_all_backups(force=True)['failed'] == 0
+
+def test_chunked_backup_restores(manager, loaded_db):
+    expected = usage_total(loaded_db)
+    backup = manager.create_backup(incremental=True)
+    set_usage(loaded_db, 0)
+
+    assert manager.restore_backup(backup['filename'], confirm=True)
+    assert usage_total(loaded_db) == expected
+
+def test_restore_requires_confirmation(manager, loaded_db):
+    backup = manager.create_backup()
+    set_usage(loaded_db, 0)
+
+    assert not manager.restore_backup(backup['filename'])
+    assert usage_total(loaded_db)[0] == 0
+
+def test_verify_all_flags_corrupt_backups_and_caches_results(manager):
+    good = manager.create_backup()['filename']
+    bad = manager.create_backup('broken')['filename']
+    with open(os.path.join(manager.backup_dir, bad), 'r+b') as f:
+        f.seek(20)
+        f.write(b'\xff' * 64)
+
+    report = manager.verify_all_backups()
+    assert report['failed'] == 1
+    assert report['failures'][0]['filename'] == bad
+
+    again = manager.verify_all_backups()
+    assert {r['filename']: r['cached'] for r in again['results']} == {good: True, bad: True}
+
+def test_verify_all_does_not_fork(manager, monkeypatch):
+    # Forking the threaded server can deadlock on locks held by other threads
+    manager.create_backup()
+    manager.create_backup(incremental=True)
+    monkeypatch.setattr(os, 'fork', lambda: pytest.fail('verify_all_backups forked'))
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(manager.verify_all_backups(workers=2)))
+    thread.start()
+    thread.join(60)
+
+    assert results[0]['passed'] == 2
+
+def test_reused_chunk_survives_garbage_collection(manager):
+    digest, written = manager._store_chunk(b'page' * 1024)
+    path = manager._chunk_path(digest)
+    old = time.time() - 2 * CHUNK_GC_GRACE_SECONDS
+    os.utime(path, (old, old))
+
+    # An in-progress backup reuses the chunk before writing its manifest
+    assert manager._store_chunk(b'page' * 1024) == (digest, 0)
+
+    assert manager.collect_chunk_garbage() == 0
+    assert os.path.exists(path)
+
+def test_unreferenced_old_chunks_are_collected(manager):
+    digest, _ = manager._store_chunk(b'orphan' * 1024)
+    path = manager._chunk_path(digest)
+    old = time.time() - 2 * CHUNK_GC_GRACE_SECONDS
+    os.utime(path, (old, old))
+
+    assert manager.collect_chunk_garbage() == 1
+    assert not os.path.exists(path)
+
+def test_garbage_collection_waits_for_running_backups(manager):
+    manager._store_chunk(b'chunk' * 1024)
+    collector = threading.Thread(target=manager.collect_chunk_garbage)
+    with manager._store_lock():
+        collector.start()
+        collector.join(0.3)
+        assert collector.is_alive()
+    collector.join(10)
+    assert not collector.is_alive()
+
+@pytest.fixture
+def archived(loaded_db):
+    """loaded_db with 2024 moved to an archive; returns the archive path"""
+    partitions = PartitionManager(loaded_db)
+    partitions.archive_year(2024, today=date(2026, 1, 15))
+    return partitions.archive_path(2024)
+
+@pytest.mark.parametrize('incremental', [False, True])
+def test_restore_brings_back_deleted_archives(manager, loaded_db, archived, incremental):
+    expected = total_with_archives(loaded_db)
+    backup = manager.create_backup(incremental=incremental)
+    os.remove(archived)
+
+    assert manager.verify_backup(backup['filename'])
+    assert manager.restore_backup(backup['filename'], confirm=True)
+    assert os.path.exists(archived)
+    assert total_with_archives(loaded_db) == expected
+
+def test_archives_of_a_wal_database_are_backed_up(manager, loaded_db, archived):
+    conn = sqlite3.connect(loaded_db)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+    backup = manager.create_backup()
+
+    with open(os.path.join(manager.backup_dir, backup['filename'] + ARCHIVES_SUFFIX)) as f:
+        assert f.read().count('"year": 2024') == 1
+
+def test_archives_are_stored_once(manager, archived):
+    manager.create_backup()
+    chunks = {name for _, _, names in os.walk(manager.chunk_dir) for name in names}
+    second = manager.create_backup(incremental=True)
+
+    assert second['new_chunks'] <= 2
+    assert {name for _, _, names in os.walk(manager.chunk_dir) for name in names} >= chunks
+    assert manager.verify_all_backups(force=True)['failed'] == 0
+
+def test_verify_fails_for_a_backup_missing_archive_chunks(manager, archived):
+    backup = manager.create_backup()
+    for root, _, names in os.walk(manager.chunk_dir):
+        for name in names:
+            os.remove(os.path.join(root, name))
+
+    assert not manager.verify_backup(backup['filename'])
+
+def test_restore_refuses_a_backup_whose_archive_is_gone(manager, loaded_db, archived):
+    backup = manager.create_backup()
+    os.remove(os.path.join(manager.backup_dir, backup['filename'] + ARCHIVES_SUFFIX))
+    os.remove(archived)
+    conn = sqlite3.connect(loaded_db)
+    conn.execute("INSERT INTO locations (name, display_name) VALUES ('Site D', 'Site D')")
+    conn.commit()
+    conn.close()
+
+    assert not manager.restore_backup(backup['filename'], confirm=True)
+    conn = sqlite3.connect(loaded_db)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM locations WHERE name = 'Site D'").fetchone()[0] == 1
+    finally:
+        conn.close()
+
+def test_cleanup_removes_archive_lists(manager, archived):
+    manager.config['max_backups'] = 1
+    first = manager.create_backup('first')
+    time.sleep(1.1)
+    manager.create_backup('second')
+
+    assert not os.path.exists(os.path.join(manager.backup_dir, first['filename']))
+    assert not os.path.exists(os.path.join(manager.backup_dir, first['filename'] + ARCHIVES_SUFFIX))
@@ -0,0 +1,102 @@
+"""
+Regression tests for the daily usage write endpoints (/api/data/daily-usage and its batch)
+"""
+
+import io
+import json
+from datetime import date
+import pytest
+from database import to_day, usage_id
+from partitions import PartitionManager
+
+BATCH = '/api/data/daily-usage/batch'
+
+def usage(client, day):
+    rows = client.get('/api/data/daily-usage', query_string={'start_date': day, 'end_date': day}).get_json()
+    return {row['location_id']: row['usage_gb'] for row in rows}
+
+def test_json_batch_reports_inserted_updated_and_unchanged(client):
+    response = client.post(BATCH, json=[
+        {'date': '2024-03-13', 'location_id': 1, 'usage_gb': 9.9},
+        {'date': '2024-03-13', 'location_id': 2, 'usage_gb': 131},
+        {'date': '2024-03-16', 'location_id': 3, 'usage_gb': '2.5'},
+    ])
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert (result['inserted'], result['updated'], result['unchanged']) == (1, 1, 1)
+    assert [row['status'] for row in result['results']] == ['unchanged', 'updated', 'inserted']
+    assert usage(client, '2024-03-16') == {3: 2.5}
+
+def test_ndjson_batch(client):
+    body = '\n'.join(json.dumps({'date': f"2024-03-{day}", 'location_id': 1, 'usage_gb': day})
+                     for day in (20, 21)) + '\n'
+    response = client.post(BATCH, data=body, content_type='application/x-ndjson')
+
+    assert response.get_json()['inserted'] == 2
+
+def test_csv_upload_batch(client):
+    response = client.post(BATCH, query_string={'year': 2024}, data={
+        'file': (io.BytesIO(b"Date,Site A,Site C\n20-Mar,1,\n21-Mar,2,3\n"), 'report.csv')})
+
+    assert response.get_json()['inserted'] == 3
+    assert usage(client, '2024-03-21') == {1: 2.0, 3: 3.0}
+
+def test_one_invalid_row_rejects_the_whole_batch(client):
+    response = client.post(BATCH, json=[
+        {'date': '2024-03-20', 'location_id': 1, 'usage_gb': 1},
+        {'date': '2024-03-20', 'location_id': 1, 'usage_gb': 2},
+        {'date': 'soon', 'location_id': 99, 'usage_gb': -1},
+    ])
+
+    assert response.status_code == 400
+    errors = {row['row']: row['errors'] for row in response.get_json()['errors']}
+    assert errors[1][0].startswith('Duplicate of row 0')
+    assert len(errors[2]) == 3
+    assert usage(client, '2024-03-20') == {}
+
+def test_unknown_csv_location_is_rejected(client):
+    response = client.post(BATCH, data={'file': (io.BytesIO(b"Date,Site Z\n20-Mar,1\n"), 'report.csv')})
+
+    assert response.status_code == 400
+    assert 'Site Z' in response.get_json()['error']
+
+def test_write_into_an_archived_year_is_a_conflict(client, loaded_db):
+    PartitionManager(loaded_db).archive_year(2024, today=date(2026, 1, 15))
+    response = client.post(BATCH, json=[{'date': '2024-03-20', 'location_id': 1, 'usage_gb': 1}])
+
+    assert response.status_code == 409
+
+def test_range_delete(client):
+    response = client.delete(BATCH, query_string={'start_date': '2024-03-14', 'end_date': '2024-03-15',
+                                                  'location_id': [1, 2]})
+
+    assert response.get_json()['deleted'] == 3
+    assert usage(client, '2024-03-14') == {}
+    assert usage(client, '2024-03-15') == {3: 7.3}
+
+@pytest.mark.parametrize('record', [
+    {'date': '2024-03-20', 'location_id': 1, 'usage_gb': 'abc'},
+    {'date': 20240320, 'location_id': 1, 'usage_gb': 1},
+    {'date': '2024-03-20', 'location_id': 99, 'usage_gb': 1},
+    {'date': '2024-03-20', 'location_id': 1},
+    ['2024-03-20', 1, 1],
+])
+def test_single_record_is_validated_like_a_batch_row(client, record):
+    response = client.post('/api/data/daily-usage', json=record)
+
+    assert response.status_code == 400
+    assert usage(client, '2024-03-20') == {}
+
+@pytest.mark.parametrize('body', [{'usage_gb': 'abc'}, {'usage_gb': -1}, {'usage_gb': True}, {}, None])
+def test_update_rejects_invalid_usage(client, body):
+    response = client.put(f"/api/data/daily-usage/{usage_id(1, to_day('2024-03-13'))}", json=body)
+
+    assert response.status_code == 400
+    assert usage(client, '2024-03-13')[1] == 9.9
+
+def test_update_of_a_missing_record_is_not_found(client):
+    response = client.put(f"/api/data/daily-usage/{usage_id(1, to_day('2024-03-20'))}", json={'usage_gb': 1})
+
+    assert response.status_code == 404
+    assert usage(client, '2024-03-20') == {}
@@ -0,0 +1,57 @@
+"""
+Regression tests for the data-version-aware response cache (services/cache.py)
+"""
+
+from src.services.cache import ResponseCache
+
+OVERVIEW = '/api/dashboard/overview'
+
+def test_repeat_request_is_served_from_cache(client):
+    first = client.get(OVERVIEW)
+    second = client.get(OVERVIEW)
+
+    assert first.headers['X-Cache'] == 'MISS'
+    assert second.headers['X-Cache'] == 'HIT'
+    assert second.get_data() == first.get_data()
+    assert second.headers['ETag'] == first.headers['ETag']
+
+def test_matching_etag_gets_304(client):
+    etag = client.get(OVERVIEW).headers['ETag']
+    response = client.get(OVERVIEW, headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert not response.get_data()
+
+def test_write_invalidates_cached_responses(client):
+    first = client.get(OVERVIEW)
+    client.post('/api/data/daily-usage', json={'date': '2024-03-16', 'location_id': 1, 'usage_gb': 1})
+    after = client.get(OVERVIEW, headers={'If-None-Match': first.headers['ETag']})
+
+    assert after.status_code == 200
+    assert after.headers['X-Cache'] == 'MISS'
+    assert after.get_json()['total_records'] == first.get_json()['total_records'] + 1
+
+def test_query_strings_are_cached_separately(client):
+    week = client.get('/api/dashboard/location-summary', query_string={'period': 'week'})
+    year = client.get('/api/dashboard/location-summary', query_string={'period': 'year'})
+
+    assert week.headers['X-Cache'] == year.headers['X-Cache'] == 'MISS'
+
+def test_errors_are_not_cached(client, monkeypatch):
+    from src.routes import dashboard
+    monkeypatch.setattr(dashboard, 'usage_totals', lambda conn: 1 / 0)
+    monkeypatch.setattr(dashboard, 'get_usage_matrix', lambda conn: None)
+
+    assert client.get(OVERVIEW).status_code == 500
+    monkeypatch.undo()
+    assert client.get(OVERVIEW).headers['X-Cache'] == 'MISS'
+
+def test_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    for key in 'abc':
+        cache.put(key, {'version': 1, 'body': b''})
+
+    assert cache.get('a', 1) is None
+    assert cache.get('c', 1) is not None
+    assert cache.get('c', 2) is None
+    assert cache.stats()['entries'] == 1
@@ -0,0 +1,99 @@
+"""
+Regression tests for change_log logging (migration 5)
+"""
+
+import io
+import sqlite3
+from database import DatabaseManager
+
+def change_log(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("""
+            SELECT operation, row_id, location_id, date FROM change_log
+            WHERE table_name = 'daily_usage' ORDER BY seq
+        """).fetchall()
+    finally:
+        conn.close()
+
+def data_version(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()[0]
+    finally:
+        conn.close()
+
+def test_bulk_import_logs_one_summary_per_location(db_path, report_path):
+    DatabaseManager(db_path).bulk_import_daily_usage(report_path, default_year=2024)
+
+    assert change_log(db_path) == [('bulk', None, 1, '2024-03-13'),
+                                   ('bulk', None, 2, '2024-03-13'),
+                                   ('bulk', None, 3, '2024-03-13')]
+
+def test_bulk_import_bumps_the_version_once(loaded_db):
+    version = data_version(loaded_db)
+
+    stats = DatabaseManager(loaded_db).bulk_import_daily_usage(
+        io.StringIO("Date,Site A,Site B\n2024-03-14,1,2\n2024-03-15,3,4\n"))
+
+    assert stats['changed'] == 4
+    assert data_version(loaded_db) == version + 1
+    assert change_log(loaded_db)[-2:] == [('bulk', None, 1, '2024-03-14'), ('bulk', None, 2, '2024-03-14')]
+
+def test_unchanged_reimport_logs_nothing(loaded_db, report_path):
+    logged = change_log(loaded_db)
+    version = data_version(loaded_db)
+
+    stats = DatabaseManager(loaded_db).bulk_import_daily_usage(report_path, default_year=2024)
+
+    assert stats['changed'] == 0
+    assert change_log(loaded_db) == logged
+    assert data_version(loaded_db) == version
+
+def test_single_writes_are_still_logged_per_row(loaded_db):
+    conn = sqlite3.connect(loaded_db)
+    conn.execute("UPDATE daily_usage_compact SET usage_gb = 1 WHERE location_id = 1 AND day = "
+                 "CAST(julianday('2024-03-14') - 2440587.5 AS INTEGER)")
+    conn.commit()
+    conn.close()
+
+    assert change_log(loaded_db)[-1][0] == 'update'
+    assert change_log(loaded_db)[-1][2:] == (1, '2024-03-14')
+
+def test_bulk_import_logs_only_locations_it_changed(loaded_db):
+    logged = change_log(loaded_db)
+
+    stats = DatabaseManager(loaded_db).bulk_import_daily_usage(
+        io.StringIO("Date,Site A,Site B\n2024-03-13,9.9,130\n2024-03-14,20,71\n"))
+
+    assert stats['changed'] == 1
+    assert change_log(loaded_db) == logged + [('bulk', None, 1, '2024-03-14')]
+
+def test_matrix_catches_up_on_a_bulk_import(app, client, loaded_db):
+    client.get('/api/dashboard/overview')
+    matrix = app.extensions['usage_matrix']
+    loads = matrix.stats()['loads']
+    response = client.post('/api/data/import', data={
+        'file': (io.BytesIO(b"Date,Site A\n2024-03-14,5\n2024-03-16,1000\n"), 'report.csv')})
+    assert response.status_code == 200
+
+    trends = client.get('/api/dashboard/usage-trends', query_string={'days': 3650}).get_json()
+    assert '1000' in str(trends)
+    stats = client.get('/api/system/usage-matrix', query_string={'check': 1}).get_json()
+    assert stats['loads'] == loads
+    assert stats['caught_up_changes'] == 1
+    assert stats['consistency']['consistent']
+
+def test_catch_up_prefers_bulk_values_over_earlier_writes(app, client, loaded_db):
+    client.get('/api/dashboard/overview')
+    conn = sqlite3.connect(loaded_db)
+    conn.execute("UPDATE daily_usage_compact SET usage_gb = 1 WHERE location_id = 1 AND day = "
+                 "CAST(julianday('2024-03-15') - 2440587.5 AS INTEGER)")
+    conn.commit()
+    conn.close()
+    DatabaseManager(loaded_db).bulk_import_daily_usage(io.StringIO("Date,Site A\n2024-03-14,5\n2024-03-15,2\n"))
+
+    stats = client.get('/api/system/usage-matrix', query_string={'check': 1}).get_json()
+
+    assert stats['caught_up_changes'] == 2
+    assert stats['consistency']['consistent']
@@ -0,0 +1,58 @@
+"""
+Regression tests for billing cycle (13th to 12th) totals maintained on write
+"""
+
+import io
+import sqlite3
+from database import DatabaseManager, to_day
+
+def cycle_totals(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {(row[0], row[1]): row[2:] for row in conn.execute("""
+            SELECT period_start, location_id, period_end, total_usage_gb, day_count FROM cycle_usage_totals
+        """)}
+    finally:
+        conn.close()
+
+def execute(db_path, sql, params=()):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(sql, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+def test_days_either_side_of_the_13th_fall_in_different_cycles(db_path):
+    DatabaseManager(db_path).bulk_import_daily_usage(
+        io.StringIO("Date,Site A\n2024-03-12,1\n2024-03-13,2\n2024-04-12,3\n"))
+
+    assert cycle_totals(db_path) == {
+        ('2024-02-13', 1): ('2024-03-12', 1, 1),
+        ('2024-03-13', 1): ('2024-04-12', 5, 2),
+    }
+
+def test_year_end_cycle_spans_january(db_path):
+    DatabaseManager(db_path).bulk_import_daily_usage(
+        io.StringIO("Date,Site A\n2024-12-31,1\n2025-01-12,2\n2025-01-13,4\n"))
+
+    assert cycle_totals(db_path)[('2024-12-13', 1)] == ('2025-01-12', 3, 2)
+
+def test_updates_moves_and_deletes_keep_totals_equal_to_a_rebuild(loaded_db):
+    execute(loaded_db, "UPDATE daily_usage_compact SET usage_gb = 50 WHERE location_id = 1 AND day = ?",
+            (to_day('2024-03-13'),))
+    execute(loaded_db, "UPDATE daily_usage_compact SET day = ? WHERE location_id = 2 AND day = ?",
+            (to_day('2024-03-01'), to_day('2024-03-14')))
+    execute(loaded_db, "DELETE FROM daily_usage_compact WHERE location_id = 3")
+    maintained = cycle_totals(loaded_db)
+
+    assert DatabaseManager(loaded_db).rebuild_cycle_totals()
+    assert cycle_totals(loaded_db) == maintained
+    assert not any(location_id == 3 for _, location_id in maintained)
+
+def test_cycle_summary_route_reads_the_totals(client):
+    rows = client.get('/api/dashboard/cycle-summary').get_json()
+
+    assert {row['display_name']: row['total_usage_gb'] for row in rows} == {
+        'Site A': 33.4, 'Site B': 201.0, 'Site C': 19.3}
+    assert all(row['period_start'] == '2024-03-13' for row in rows)
@@ -0,0 +1,91 @@
+"""
+Regression tests for the shared SQLite connection pool (services/db.py)
+"""
+
+import threading
+import pytest
+from src.services.db import ConnectionPool, PoolTimeout, get_db_connection
+
+@pytest.fixture
+def pool(loaded_db):
+    pool = ConnectionPool(loaded_db, max_connections=2, timeout=5)
+    yield pool
+    pool.close_all()
+
+def test_connections_are_tuned_and_reused(pool):
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -16384
+        first = conn
+    with pool.connection() as conn:
+        assert conn is first
+
+    stats = pool.stats()
+    assert (stats['open_connections'], stats['idle'], stats['in_use']) == (1, 1, 0)
+    assert (stats['hits'], stats['misses'], stats['hit_ratio']) == (1, 1, 0.5)
+
+def test_threads_get_their_own_connection_until_released(pool):
+    held = []
+    barrier = threading.Barrier(2)
+
+    def worker():
+        with pool.connection() as conn:
+            held.append(conn)
+            barrier.wait(5)
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(held) == 2 and held[0] is not held[1]
+    with pool.connection() as conn:
+        assert conn in held
+    assert pool.stats()['open_connections'] == 2
+
+def test_full_pool_waits_then_times_out(pool):
+    first, second = pool.acquire(), pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    waiter.join(0.05)
+    assert waiter.is_alive()
+
+    pool.release(first)
+    waiter.join(5)
+    assert got == [first]
+
+    pool.timeout = 0.01
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    stats = pool.stats()
+    assert (stats['waits'], stats['timeouts'], stats['open_connections'], stats['in_use']) == (2, 1, 2, 2)
+    pool.release(second)
+    pool.release(got[0])
+
+def test_release_rolls_back_open_transactions(pool):
+    with pool.connection() as conn:
+        conn.execute("DELETE FROM daily_usage_compact")
+        assert conn.in_transaction
+    with pool.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM daily_usage_compact").fetchone()[0] == 7
+
+def test_request_keeps_one_connection(app):
+    pool = app.extensions['db_pool']
+    with app.test_request_context():
+        conn = get_db_connection()
+        assert get_db_connection() is conn
+        assert pool.stats()['in_use'] == 1
+    assert pool.stats()['in_use'] == 0
+    with app.test_request_context():
+        assert get_db_connection() is conn
+
+def test_pool_stats_route(client):
+    client.get('/api/data/locations')
+    stats = client.get('/api/system/db-pool').get_json()
+
+    assert stats['open_connections'] >= 1
+    assert stats['hits'] >= 1
+    assert stats['in_use'] == 0
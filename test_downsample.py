@@ -0,0 +1,99 @@
+"""
+Regression tests for usage trend bucketing and downsampling (services/downsample.py)
+"""
+
+import io
+from datetime import date, timedelta
+import pytest
+from database import DatabaseManager
+from src.routes import dashboard
+from src.services.db import get_db_connection
+from src.services.downsample import bucket_rows, lttb_indices
+from src.services.usage_matrix import get_usage_matrix
+
+TRENDS = '/api/dashboard/usage-trends'
+FIRST = date(2024, 1, 1)
+PEAK = date(2024, 4, 10)
+DAYS = 182
+
+@pytest.fixture
+def series(loaded_db):
+    """Half a year of daily usage for Site A (one peak) and Site B"""
+    lines = ["Date,Site A,Site B"]
+    for offset in range(DAYS):
+        day = FIRST + timedelta(days=offset)
+        lines.append(f"{day.isoformat()},{100 if day == PEAK else offset % 7 + 1},2")
+    assert DatabaseManager(loaded_db).bulk_import_daily_usage(io.StringIO('\n'.join(lines) + '\n'))
+    return loaded_db
+
+def trends(client, **params):
+    response = client.get(TRENDS, query_string={'days': 5000, **params})
+    assert response.status_code == 200
+    return response.get_json()
+
+def by_location(rows):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row['display_name'], []).append(row)
+    return grouped
+
+def test_lttb_keeps_endpoints_and_extremes():
+    y = [float(index % 5) for index in range(100)]
+    y[37], y[60] = 100.0, -50.0
+
+    kept = lttb_indices(list(range(100)), y, 10)
+
+    assert len(kept) == 10 and kept == sorted(set(kept))
+    assert {0, 37, 60, 99} <= set(kept)
+    assert lttb_indices([0, 1, 2], [1, 2, 3], 10) == [0, 1, 2]
+
+def test_cycle_buckets_run_from_the_13th_to_the_12th():
+    rows = [{'date': day, 'display_name': 'Site A', 'daily_total': 1.0}
+            for day in ('2024-03-12', '2024-03-13', '2024-04-12', '2024-04-13', '2025-01-05', 'soon')]
+
+    assert [(row['date'], row['period_end'], row['daily_total'], row['days']) for row in bucket_rows(rows, 'cycle')] == [
+        ('2024-02-13', '2024-03-12', 1.0, 1),
+        ('2024-03-13', '2024-04-12', 2.0, 2),
+        ('2024-04-13', '2024-05-12', 1.0, 1),
+        ('2024-12-13', '2025-01-12', 1.0, 1),
+    ]
+
+def test_max_points_downsamples_each_location(client, series):
+    grouped = by_location(trends(client, max_points=20))
+
+    site_a = [row['date'] for row in grouped['Site A']]
+    assert len(site_a) == 20
+    assert site_a[0] == FIRST.isoformat()
+    assert site_a[-1] == (FIRST + timedelta(days=DAYS - 1)).isoformat()
+    assert PEAK.isoformat() in site_a
+    assert all(len(rows) <= 20 for rows in grouped.values())
+
+def test_buckets_can_be_downsampled(client, series):
+    rows = trends(client, bucket='cycle', max_points=3)
+
+    for location_rows in by_location(rows).values():
+        assert len(location_rows) <= 3
+    assert all(row['date'].endswith('-13') and row['period_end'].endswith('-12') for row in rows)
+    assert trends(client, bucket='cycle', location_id=1)[0] == {
+        'date': '2023-12-13', 'period_end': '2024-01-12', 'display_name': 'Site A',
+        'daily_total': sum(offset % 7 + 1 for offset in range(12)), 'days': 12}
+
+def test_unknown_bucket_is_rejected(client):
+    assert client.get(TRENDS, query_string={'bucket': 'fortnight'}).status_code == 400
+
+@pytest.mark.parametrize('params', [{}, {'bucket': 'week'}, {'bucket': 'cycle'}, {'bucket': 'month'},
+                                    {'bucket': 'week', 'max_points': 5}, {'max_points': 30, 'location_id': 1}])
+def test_sql_fallback_matches_the_matrix(client, app, series, monkeypatch, params):
+    # Bypass the response cache so both requests reach the view
+    monkeypatch.setitem(app.extensions, 'response_cache', None)
+    with app.test_request_context():
+        assert get_usage_matrix(get_db_connection()) is not None
+    from_matrix = trends(client, **params)
+    monkeypatch.setattr(dashboard, 'get_usage_matrix', lambda conn: None)
+    from_sql = trends(client, **params)
+
+    def key(row):
+        return row['date'], row['display_name']
+
+    assert from_matrix
+    assert sorted(from_sql, key=key) == [pytest.approx(row) for row in sorted(from_matrix, key=key)]
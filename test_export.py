@@ -0,0 +1,68 @@
+"""
+Regression tests for the wide-format export (export.py)
+"""
+
+import gzip
+import io
+from datetime import date
+import pytest
+import export
+from database import DatabaseManager
+from export import ExportError, export_wide_csv
+from partitions import PartitionManager
+
+EXPECTED = """Date,Site A,Site B,Site C
+2024-03-13,9.9,130,12
+2024-03-14,19,71,
+2024-03-15,4.5,,7.3
+"""
+
+def test_export_matches_the_report_layout(loaded_db, tmp_path):
+    output = str(tmp_path / 'export.csv')
+    stats = export_wide_csv(loaded_db, output)
+
+    with open(output) as f:
+        assert f.read() == EXPECTED
+    assert stats == {'days': 3, 'values': 7, 'locations': 3}
+
+def test_export_imports_back_unchanged(loaded_db, tmp_path):
+    output = str(tmp_path / 'export.csv')
+    export_wide_csv(loaded_db, output)
+    copy = str(tmp_path / 'copy.db')
+    manager = DatabaseManager(copy)
+    assert manager.initialize_database()
+    manager.bulk_import_daily_usage(output)
+
+    again = str(tmp_path / 'again.csv')
+    export_wide_csv(copy, again)
+    with open(again) as f:
+        assert f.read() == EXPECTED
+
+def test_export_spans_archived_years(loaded_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(export, 'EXPORT_FETCH_SIZE', 2)
+    monkeypatch.setattr(export, 'EXPORT_CHUNK_DAYS', 1)
+    DatabaseManager(loaded_db).bulk_import_daily_usage(io.StringIO("Date,Site A\n2025-01-02,1\n"))
+    PartitionManager(loaded_db).archive_year(2024, today=date(2026, 1, 15))
+    output = str(tmp_path / 'export.csv.gz')
+
+    export_wide_csv(loaded_db, output, start_date='2024-03-14', location_ids=[3, 1])
+    with gzip.open(output, 'rt') as f:
+        assert f.read() == "Date,Site C,Site A\n2024-03-14,,19\n2024-03-15,7.3,4.5\n2025-01-02,,1\n"
+
+def test_unknown_locations_are_rejected(loaded_db, tmp_path):
+    with pytest.raises(ExportError):
+        export_wide_csv(loaded_db, str(tmp_path / 'export.csv'), location_ids=[99])
+    assert not (tmp_path / 'export.csv').exists()
+
+def test_export_route_streams_csv_and_gzip(client):
+    plain = client.get('/api/data/export', query_string={'end_date': '2024-03-14'})
+    packed = client.get('/api/data/export', query_string={'end_date': '2024-03-14', 'gzip': 1})
+
+    assert plain.mimetype == 'text/csv'
+    assert 'usage_start_2024-03-14.csv' in plain.headers['Content-Disposition']
+    assert plain.get_data(as_text=True) == ''.join(EXPECTED.splitlines(keepends=True)[:3])
+    assert gzip.decompress(packed.get_data()) == plain.get_data()
+
+@pytest.mark.parametrize('params', [{'start_date': 'March'}, {'location_id': 99}])
+def test_export_route_rejects_bad_requests(client, params):
+    assert client.get('/api/data/export', query_string=params).status_code == 400
@@ -0,0 +1,68 @@
+"""
+Regression tests for billing cycle forecasts (services/forecast.py)
+"""
+
+import io
+import sqlite3
+from datetime import date
+import pytest
+from database import DatabaseManager
+from src.services.forecast import UsageForecaster
+
+AS_OF = date(2024, 3, 15)
+
+def forecast(db_path, as_of=AS_OF, **kwargs):
+    conn = sqlite3.connect(db_path)
+    try:
+        return UsageForecaster(**kwargs).forecast(conn, as_of)
+    finally:
+        conn.close()
+
+def test_steady_usage_projects_exactly(db_path):
+    DatabaseManager(db_path).bulk_import_daily_usage(io.StringIO(
+        "Date,Site A\n" + ''.join(f"2024-03-{day},2\n" for day in range(1, 16))))
+
+    row = forecast(db_path)['locations'][0]
+
+    assert (row['days_recorded'], row['days_remaining'], row['usage_to_date']) == (3, 28, 6)
+    assert row['projected_total'] == row['lower'] == row['upper'] == 62
+
+def test_projection_uses_the_cycle_so_far(loaded_db):
+    result = forecast(loaded_db)
+
+    assert (result['cycle_start'], result['cycle_end'], result['cycle_days']) == ('2024-03-13', '2024-04-12', 31)
+    rows = {row['display_name']: row for row in result['locations']}
+    assert rows['Site A']['projected_total'] == pytest.approx(33.4 + 28 * 33.4 / 3, abs=1e-3)
+    assert rows['Site B']['projected_total'] == pytest.approx(201 + 29 * 100.5, abs=1e-3)
+    assert [row['display_name'] for row in result['locations']] == ['Site B', 'Site A', 'Site C']
+    for row in rows.values():
+        assert row['usage_to_date'] <= row['lower'] <= row['projected_total'] <= row['upper']
+
+def test_locations_without_usage_are_listed_last(loaded_db):
+    conn = sqlite3.connect(loaded_db)
+    conn.execute("INSERT INTO locations (name, display_name) VALUES ('Site D', 'Site D')")
+    conn.commit()
+    conn.close()
+
+    last = forecast(loaded_db)['locations'][-1]
+
+    assert last['display_name'] == 'Site D'
+    assert last['projected_total'] is None
+
+def test_forecasts_are_cached_until_the_data_changes(loaded_db):
+    forecaster = UsageForecaster()
+    conn = sqlite3.connect(loaded_db)
+    try:
+        first = forecaster.forecast(conn, AS_OF)
+        assert forecaster.forecast(conn, AS_OF) is first
+        conn.execute("UPDATE daily_usage_compact SET usage_gb = usage_gb + 1")
+        conn.commit()
+        assert forecaster.forecast(conn, AS_OF) is not first
+    finally:
+        conn.close()
+
+def test_forecast_route(client):
+    result = client.get('/api/dashboard/forecast', query_string={'as_of': '2024-03-15', 'location_id': 3})
+
+    assert [row['display_name'] for row in result.get_json()['locations']] == ['Site C']
+    assert client.get('/api/dashboard/forecast', query_string={'as_of': 'soon'}).status_code == 400
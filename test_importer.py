@@ -0,0 +1,96 @@
+"""
+Regression tests for the streaming bulk CSV importer
+"""
+
+import io
+import sqlite3
+import pytest
+from conftest import REPORT_CSV
+from database import DatabaseManager
+
+def usage(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {(row[0], row[1]): row[2] for row in conn.execute("""
+            SELECT du.date, l.name, du.usage_gb FROM daily_usage du JOIN locations l ON l.id = du.location_id
+        """)}
+    finally:
+        conn.close()
+
+def test_import_creates_locations_and_skips_blank_and_bad_cells(db_path, report_path):
+    stats = DatabaseManager(db_path).bulk_import_daily_usage(report_path, default_year=2024)
+
+    assert stats['rows'] == 7
+    assert stats['locations'] == 3
+    assert stats['skipped_values'] == 1
+    assert stats['total_records'] == 7
+    values = usage(db_path)
+    assert values[('2024-03-13', 'Site B')] == 130
+    assert ('2024-03-14', 'Site C') not in values
+    assert ('2024-03-15', 'Site B') not in values
+
+def test_reimport_updates_values_in_place(loaded_db):
+    manager = DatabaseManager(loaded_db)
+    stats = manager.bulk_import_daily_usage(io.StringIO("Date,Site A\n2024-03-13,10.5\n"))
+
+    assert stats['rows'] == 1
+    assert stats['total_records'] == 7
+    assert usage(loaded_db)[('2024-03-13', 'Site A')] == 10.5
+
+def test_import_keeps_cycle_totals_in_step(loaded_db):
+    conn = sqlite3.connect(loaded_db)
+    try:
+        total = conn.execute("SELECT SUM(total_usage_gb), SUM(day_count) FROM cycle_usage_totals").fetchone()
+        expected = conn.execute("SELECT SUM(usage_gb), COUNT(*) FROM daily_usage").fetchone()
+    finally:
+        conn.close()
+    assert total == expected
+
+def test_invalid_dates_are_counted_not_imported(db_path):
+    stats = DatabaseManager(db_path).bulk_import_daily_usage(
+        io.StringIO("Date,Site A\nnot-a-date,1\n2024-02-30,2\n2024-03-01,3\n"))
+
+    assert stats['rows'] == 1
+    assert stats['skipped_dates'] == 2
+
+def test_import_without_header_fails(db_path):
+    assert DatabaseManager(db_path).bulk_import_daily_usage(io.StringIO("")) is None
+
+def test_upload_route_imports_report(client):
+    response = client.post('/api/data/import', data={
+        'file': (io.BytesIO(REPORT_CSV.replace('9.9', '11').encode()), 'report.csv'), 'year': '2024'})
+
+    assert response.status_code == 200
+    assert response.get_json()['stats']['rows'] == 7
+    rows = client.get('/api/data/daily-usage', query_string={'start_date': '2024-03-13',
+                                                             'end_date': '2024-03-13'}).get_json()
+    assert {row['location_name']: row['usage_gb'] for row in rows}['Site A'] == 11
+
+def test_import_keeps_the_rollback_journal(db_path, report_path, monkeypatch):
+    seen = []
+    begin = DatabaseManager._begin_bulk_load
+
+    def spy(self, conn):
+        begin(self, conn)
+        seen.append((conn.execute("PRAGMA journal_mode").fetchone()[0],
+                     conn.execute("PRAGMA synchronous").fetchone()[0]))
+    monkeypatch.setattr(DatabaseManager, '_begin_bulk_load', spy)
+
+    assert DatabaseManager(db_path).bulk_import_daily_usage(report_path, default_year=2024)
+    journal_mode, synchronous = seen[0]
+    assert journal_mode not in ('memory', 'off')
+    assert synchronous != 0
+
+def test_upload_route_writes_through_the_shared_connection(client, monkeypatch):
+    monkeypatch.setattr(DatabaseManager, 'bulk_import_daily_usage',
+                        lambda *args, **kwargs: pytest.fail('upload opened its own connection'))
+    response = client.post('/api/data/import', data={
+        'file': (io.BytesIO(b"Date,Site A\n2024-03-20,3\n"), 'report.csv')})
+
+    assert response.status_code == 200
+    assert response.get_json()['stats']['rows'] == 1
+
+def test_empty_upload_is_rejected(client):
+    response = client.post('/api/data/import', data={'file': (io.BytesIO(b""), 'report.csv')})
+
+    assert response.status_code == 400
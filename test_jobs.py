@@ -0,0 +1,124 @@
+"""
+Regression tests for the background job runner (services/jobs.py)
+"""
+
+import json
+import subprocess
+import threading
+import time
+import pytest
+from src.services.jobs import JobRunner
+
+def wait_for(runner, job_id, *statuses, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = runner.get(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} never reached {statuses}: {runner.get(job_id)}")
+
+class Gate:
+    """Job function that reports progress, then waits to be released"""
+
+    def __init__(self, result='done'):
+        self.result = result
+        self.reported = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, progress):
+        progress('copy', 1, 4)
+        self.reported.set()
+        assert self.release.wait(10)
+        return self.result
+
+@pytest.fixture
+def runners():
+    created = []
+
+    def make(**kwargs):
+        created.append(JobRunner(**kwargs))
+        return created[-1]
+
+    yield make
+    for runner in created:
+        runner.shutdown(wait=False)
+
+def test_job_lifecycle_and_progress(runners):
+    runner = runners()
+    gate = Gate(result={'files': 1})
+    job = runner.submit('backup', gate, {'incremental': True})
+    queued = runner.submit('verify', lambda progress: None)
+
+    assert job['status'] == 'queued' and job['params'] == {'incremental': True}
+    assert gate.reported.wait(10)
+    running = runner.get(job['id'])
+    assert running['status'] == 'running' and running['started_at']
+    assert running['progress'] == {'stage': 'copy', 'done': 1, 'total': 4, 'percent': 25.0}
+    assert runner.get(queued['id'])['status'] == 'queued'
+
+    gate.release.set()
+    finished = wait_for(runner, job['id'], 'succeeded')
+    assert finished['result'] == {'files': 1} and finished['seconds'] is not None
+    assert wait_for(runner, queued['id'], 'succeeded')['result'] is None
+    assert [row['id'] for row in runner.list()] == [queued['id'], job['id']]
+
+def test_failed_job_records_the_error(runners):
+    runner = runners()
+
+    def fail(progress):
+        raise ValueError('disk full')
+
+    job = wait_for(runner, runner.submit('backup', fail)['id'], 'failed')
+    assert job['error'] == 'disk full' and job['result'] is None
+
+def test_history_keeps_the_newest_finished_jobs(runners, tmp_path):
+    runner = runners(history_size=2, state_dir=str(tmp_path))
+    ids = [runner.submit('verify', lambda progress: None)['id'] for _ in range(3)]
+    wait_for(runner, ids[-1], 'succeeded')
+    runner.submit('verify', lambda progress: None)
+
+    assert runner.get(ids[0]) is None
+    assert len(list(tmp_path.glob('*.json'))) <= 3
+
+def test_shared_state_dir_reports_and_serializes_jobs_across_runners(runners, tmp_path):
+    first, second = runners(state_dir=str(tmp_path)), runners(state_dir=str(tmp_path))
+    gate = Gate()
+    job = first.submit('backup', gate)
+    assert gate.reported.wait(10)
+
+    seen = second.get(job['id'])
+    assert seen['status'] == 'running' and seen['progress']['stage'] in (None, 'copy')
+    other = second.submit('verify', lambda progress: 'verified')
+    time.sleep(0.1)
+    assert second.get(other['id'])['status'] == 'queued'
+    assert {row['id'] for row in first.list()} == {job['id'], other['id']}
+
+    gate.release.set()
+    assert wait_for(second, other['id'], 'succeeded')['result'] == 'verified'
+    assert second.get(job['id'])['status'] == 'succeeded'
+    assert second.get('../../etc') is None
+
+def test_job_of_an_exited_process_is_reported_failed(runners, tmp_path):
+    runner = runners(state_dir=str(tmp_path))
+    exited = subprocess.Popen(['true'])
+    exited.wait()
+    (tmp_path / 'abcdef012345.json').write_text(json.dumps({
+        'id': 'abcdef012345', 'type': 'backup', 'status': 'running', 'pid': exited.pid,
+        'created_at': '2024-01-01T00:00:00', 'progress': {}}))
+
+    job = runner.get('abcdef012345')
+    assert job['status'] == 'failed' and 'exited' in job['error']
+
+def test_backup_route_returns_a_job_to_poll(client):
+    response = client.post('/api/system/backup', json={})
+
+    assert response.status_code == 202
+    job = response.get_json()
+    assert response.headers['Location'].endswith(f"/api/system/jobs/{job['id']}")
+    deadline = time.monotonic() + 10
+    while job['status'] not in ('succeeded', 'failed') and time.monotonic() < deadline:
+        time.sleep(0.02)
+        job = client.get(f"/api/system/jobs/{job['id']}").get_json()
+    assert job['status'] == 'succeeded'
+    assert client.get('/api/system/jobs/000000000000').status_code == 404
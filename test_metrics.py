@@ -0,0 +1,109 @@
+"""
+Regression tests for request metrics and the pre-fork server setup
+"""
+
+import os
+import re
+import sqlite3
+import pytest
+from src.main import shutdown_app
+from src.serve import build
+from src.services.metrics import PROMETHEUS_CONTENT_TYPE, Histogram, MetricsRegistry
+
+SAMPLE = re.compile(r'(\w+)(?:\{(.*)\})? (\S+)$')
+
+def sample_lines(app):
+    return [line for line in app.extensions['metrics'].prometheus().splitlines()
+            if line and not line.startswith('#')]
+
+def samples(text):
+    """{(name, labels): value} for every sample in a Prometheus exposition"""
+    parsed = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, labels, value = SAMPLE.match(line).groups()
+            parsed[name, labels or ''] = float(value)
+    return parsed
+
+def test_histogram_buckets_are_cumulative_and_include_their_bound():
+    hist = Histogram((1, 5))
+    for value in (0.5, 1, 3, 5, 9):
+        hist.observe(value)
+
+    assert hist.cumulative() == [('1', 2), ('5', 4), ('+Inf', 5)]
+    assert (hist.count, hist.sum, hist.max) == (5, 18.5, 9)
+    assert hist.quantile(0.4) == 1
+    assert hist.quantile(1.0) == 9
+    assert Histogram((1,)).quantile(0.5) is None
+
+def test_prometheus_exposition(client):
+    for _ in range(3):
+        client.get('/api/data/locations')
+    response = client.get('/api/system/metrics')
+
+    assert response.headers['Content-Type'] == PROMETHEUS_CONTENT_TYPE
+    text = response.get_data(as_text=True)
+    parsed = samples(text)
+    labels = 'endpoint="data_usage.get_locations",method="GET"'
+    assert parsed['data_usage_http_requests_total', labels + ',status="200"'] == 3
+    assert parsed['data_usage_http_request_duration_seconds_bucket', labels + ',le="+Inf"'] == 3
+    assert parsed['data_usage_http_request_duration_seconds_count', labels] == 3
+    buckets = [value for (name, label), value in parsed.items()
+               if name == 'data_usage_http_response_size_bytes_bucket' and label.startswith(labels)]
+    assert buckets == sorted(buckets) and buckets[-1] == 3
+    for name in {name for name, _ in parsed}:
+        family = re.sub(r'_(bucket|sum|count)$', '', name)
+        assert f"# TYPE {family} " in text and f"# HELP {family} " in text
+
+def test_sql_timing_leaves_row_reads_to_sqlite(tmp_path):
+    metrics = MetricsRegistry()
+    conn = sqlite3.connect(str(tmp_path / 'metrics.db'), factory=metrics.connection_class)
+    try:
+        conn.execute("CREATE TABLE t (a INTEGER)")
+        conn.executemany("INSERT INTO t VALUES (?)", [(1,), (2,), (3,)])
+        cursor = conn.execute("SELECT a FROM t")
+        assert type(cursor).__next__ is sqlite3.Cursor.__next__
+        assert [row[0] for row in cursor] == [1, 2, 3]
+        cursor.close()
+        assert len(conn.execute("SELECT a FROM t WHERE a IN (?, ?)", (1, 2)).fetchall()) == 2
+        assert len(conn.execute("SELECT a FROM t WHERE a IN (?, ?, ?)", (1, 2, 3)).fetchmany(5)) == 3
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("SELECT missing FROM t")
+    finally:
+        conn.close()
+
+    sql = metrics.summary()['sql']
+    assert sql['operations']['insert']['rows'] == 3
+    assert (sql['operations']['select']['calls'], sql['operations']['select']['rows'],
+            sql['operations']['select']['errors']) == (4, 5, 1)
+    statements = {row['statement']: row for row in sql['statements']}
+    assert statements['SELECT a FROM t WHERE a IN (?, ...)']['calls'] == 2
+    parsed = samples(metrics.prometheus())
+    assert parsed['data_usage_sql_statement_duration_seconds_bucket', 'operation="select",le="+Inf"'] == 4
+    assert parsed['data_usage_sql_rows_total', 'operation="select"'] == 5
+
+def test_single_process_metrics_have_no_worker_label(client, app):
+    client.get('/api/data/locations')
+
+    lines = sample_lines(app)
+    assert any('data_usage_http_requests_total{' in line for line in lines)
+    assert not any('worker=' in line for line in lines)
+
+def test_forked_worker_labels_every_series_and_starts_afresh(client, app):
+    metrics = app.extensions['metrics']
+    client.get('/api/data/locations')
+    metrics.set_worker(4242)
+
+    assert metrics.summary()['endpoints'] == []
+    client.get('/api/data/locations')
+    assert all('worker="4242"' in line for line in sample_lines(app))
+    assert metrics.summary()['worker'] == '4242'
+
+def test_build_shares_job_state_between_workers(app_config, monkeypatch):
+    monkeypatch.delenv('JOB_STATE_DIR', raising=False)
+    app, _ = build(workers=2, warm=False, config=app_config)
+    try:
+        assert app.config['JOB_STATE_DIR'] == os.path.join(os.path.dirname(app_config['DATABASE_PATH']), 'jobs')
+        assert app.extensions['job_runner'].state_dir == app.config['JOB_STATE_DIR']
+    finally:
+        shutdown_app(app)
@@ -0,0 +1,48 @@
+"""
+Regression tests for schema migrations (migrations.py)
+"""
+
+import logging
+import sqlite3
+import pytest
+from migrations import MIGRATIONS, MigrationError, migrate
+
+LAST = max(migration['version'] for migration in MIGRATIONS)
+
+@pytest.fixture
+def failing_check(monkeypatch):
+    """Give the last migration a planner check that cannot pass"""
+    migration = next(migration for migration in MIGRATIONS if migration['version'] == LAST)
+    monkeypatch.setitem(migration, 'checks', [{'sql': "SELECT 1", 'uses': 'no_such_index'}])
+
+def user_version(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+def test_planner_check_failure_rolls_back_by_default(tmp_path, failing_check):
+    db_path = str(tmp_path / 'new.db')
+
+    with pytest.raises(MigrationError, match='planner check failed'):
+        migrate(db_path)
+    assert user_version(db_path) == LAST - 1
+
+def test_planner_check_failure_is_a_warning_when_not_strict(tmp_path, failing_check, caplog):
+    db_path = str(tmp_path / 'new.db')
+
+    with caplog.at_level(logging.WARNING):
+        assert migrate(db_path, strict=False)[-1] == LAST
+    assert user_version(db_path) == LAST
+    assert 'planner check failed' in caplog.text
+
+def test_api_starts_despite_a_planner_check_failure(app_config, tmp_path, failing_check):
+    from src.main import create_app, shutdown_app
+    db_path = str(tmp_path / 'new.db')
+    app = create_app({**app_config, 'DATABASE_PATH': db_path})
+    try:
+        assert app.test_client().get('/api/system/migrations').status_code == 200
+        assert user_version(db_path) == LAST
+    finally:
+        shutdown_app(app)
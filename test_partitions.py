@@ -0,0 +1,102 @@
+"""
+Regression tests for year archives (partitions.py)
+"""
+
+import io
+import os
+import sqlite3
+from datetime import date
+import pytest
+from database import DatabaseManager
+from partitions import PartitionError, PartitionManager, list_archives
+
+# Two days in an archived year and one in the current one
+TWO_YEAR_CSV = """Date,Site A,Site B
+2024-12-30,5,6
+2024-12-31,7,8
+2025-01-01,9,10
+"""
+
+TODAY = date(2026, 1, 15)
+
+def archived_db(db_path):
+    manager = DatabaseManager(db_path)
+    assert manager.bulk_import_daily_usage(io.StringIO(TWO_YEAR_CSV))
+    PartitionManager(db_path).archive_year(2024, today=TODAY)
+    return manager
+
+def test_reimport_skips_archived_years(db_path):
+    manager = archived_db(db_path)
+
+    stats = manager.bulk_import_daily_usage(io.StringIO(TWO_YEAR_CSV.replace('9,10', '11,12')))
+
+    assert stats is not None
+    assert stats['rows'] == 2
+    assert stats['skipped_archived'] == 4
+    assert stats['archived_years'] == [2024]
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT SUM(usage_gb) FROM daily_usage").fetchone()[0] == 23
+        assert [archive['year'] for archive in list_archives(conn)] == [2024]
+    finally:
+        conn.close()
+
+def test_reimport_leaves_archive_untouched(db_path):
+    manager = archived_db(db_path)
+    manager.bulk_import_daily_usage(io.StringIO(TWO_YEAR_CSV.replace('5,6', '50,60')))
+
+    conn = sqlite3.connect(PartitionManager(db_path).archive_path(2024))
+    try:
+        assert conn.execute("SELECT SUM(usage_gb) FROM daily_usage").fetchone()[0] == 26
+    finally:
+        conn.close()
+
+def test_archiving_keeps_cycle_totals_and_change_log(db_path):
+    manager = DatabaseManager(db_path)
+    assert manager.bulk_import_daily_usage(io.StringIO(TWO_YEAR_CSV))
+    conn = sqlite3.connect(db_path)
+    try:
+        totals = conn.execute("SELECT * FROM cycle_usage_totals ORDER BY 1, 3").fetchall()
+        head = conn.execute("SELECT MAX(seq) FROM change_log").fetchone()[0]
+        PartitionManager(db_path).archive_year(2024, today=TODAY)
+        assert conn.execute("SELECT * FROM cycle_usage_totals ORDER BY 1, 3").fetchall() == totals
+        assert conn.execute("SELECT MAX(seq) FROM change_log").fetchone()[0] == head
+    finally:
+        conn.close()
+
+def test_open_years_cannot_be_archived(db_path):
+    with pytest.raises(PartitionError):
+        PartitionManager(db_path).archive_year(TODAY.year, today=TODAY)
+
+def test_unarchive_moves_the_year_back(db_path):
+    archived_db(db_path)
+    partitions = PartitionManager(db_path)
+    partitions.unarchive_year(2024)
+
+    assert not os.path.exists(partitions.archive_path(2024))
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT SUM(usage_gb) FROM daily_usage").fetchone()[0] == 45
+        assert list_archives(conn) == []
+    finally:
+        conn.close()
+
+def test_routes_read_archived_years(loaded_db, client):
+    archived_db(loaded_db)
+
+    rows = client.get('/api/data/daily-usage', query_string={'start_date': '2024-12-31'}).get_json()
+    assert [row['usage_gb'] for row in rows] == [9, 10, 7, 8]
+    assert client.get('/api/dashboard/overview').get_json()['total_records'] == 13
+    archives = client.get('/api/system/archives').get_json()['archives']
+    assert [(archive['year'], archive['exists'], archive['last_date']) for archive in archives] == \
+        [(2024, True, '2024-12-31')]
+
+@pytest.mark.parametrize('path, body', [
+    ('/api/data/daily-usage', {'date': '2024-12-30', 'location_id': 1, 'usage_gb': 1}),
+    ('/api/data/monthly-summary', {'period_start': '2024-11-13', 'period_end': '2024-12-12',
+                                   'location_id': 1, 'total_usage_gb': 1}),
+])
+def test_writes_into_archived_years_are_conflicts(loaded_db, client, path, body):
+    archived_db(loaded_db)
+
+    assert client.post(path, json=body).status_code == 409
@@ -0,0 +1,105 @@
+"""
+Regression tests for on-demand request profiling (services/profiling.py)
+"""
+
+import os
+import pstats
+import pytest
+from src.services.profiling import PROFILE_ID_HEADER, ProfileSession, ProfileStore
+
+PROFILES = '/api/system/profiles'
+
+@pytest.fixture
+def make_client(app_config, tmp_path):
+    """Client factory for apps with the given profiling settings"""
+    from src.main import create_app, shutdown_app
+    apps = []
+
+    def make(**config):
+        app = create_app({**app_config, 'PROFILE_DIR': str(tmp_path / 'profiles'), **config})
+        apps.append(app)
+        return app.test_client()
+
+    yield make
+    for app in apps:
+        shutdown_app(app)
+
+def stored(profile_id):
+    session = ProfileSession((), 'header', 1)
+    session.stop()
+    session.id, session.duration = profile_id, 0.001
+    return session
+
+def test_header_profiles_a_single_request(make_client, tmp_path):
+    client = make_client(PROFILING_ENABLED=True)
+    response = client.get('/api/data/locations', headers={'X-Profile': 'cpu'})
+    profile_id = response.headers[PROFILE_ID_HEADER]
+
+    listed = client.get(PROFILES).get_json()
+    assert [profile['id'] for profile in listed['profiles']] == [profile_id]
+    assert listed['profiles'][0]['trigger'] == 'header' and listed['profiles'][0]['cpu_calls'] > 0
+    assert listed['profiler']['profiled'] == 1
+
+    summary = client.get(f'{PROFILES}/{profile_id}').get_json()
+    assert summary['modes'] == ['cpu'] and summary['status'] == 200
+    assert summary['cpu']['by_cumulative']
+    assert 'memory' not in summary
+    raw = client.get(summary['files']['pstats']['url'])
+    path = tmp_path / 'raw.pstats'
+    path.write_bytes(raw.get_data())
+    assert pstats.Stats(str(path)).total_calls > 0
+
+    assert client.delete(f'{PROFILES}/{profile_id}').status_code == 200
+    assert client.get(f'{PROFILES}/{profile_id}').status_code == 404
+
+def test_memory_profile_keeps_a_tracemalloc_dump(make_client):
+    client = make_client(PROFILING_ENABLED=True)
+    profile_id = client.get('/api/data/locations', headers={'X-Profile': 'memory'}).headers[PROFILE_ID_HEADER]
+
+    summary = client.get(f'{PROFILES}/{profile_id}').get_json()
+    assert set(summary['files']) == {'tracemalloc'}
+    assert summary['memory']['peak_kb'] >= 0
+    assert client.get(f'{PROFILES}/{profile_id}/tracemalloc').status_code == 200
+    assert client.get(f'{PROFILES}/{profile_id}/pstats').status_code == 404
+
+@pytest.mark.parametrize('headers', [{}, {'X-Profile': 'everything'}])
+def test_requests_without_a_valid_header_are_not_profiled(make_client, headers):
+    client = make_client(PROFILING_ENABLED=True)
+
+    assert PROFILE_ID_HEADER not in client.get('/api/data/locations', headers=headers).headers
+    assert PROFILE_ID_HEADER not in client.get(PROFILES, headers={'X-Profile': '1'}).headers
+    assert client.get(PROFILES).get_json()['profiles'] == []
+
+def test_disabled_profiling_ignores_the_header(make_client):
+    client = make_client()
+
+    assert PROFILE_ID_HEADER not in client.get('/api/data/locations', headers={'X-Profile': '1'}).headers
+
+def test_sampled_requests_use_the_sample_mode(make_client):
+    client = make_client(PROFILE_SAMPLE_RATE=1.0, PROFILE_SAMPLE_MODE='cpu')
+    for _ in range(2):
+        assert PROFILE_ID_HEADER in client.get('/api/data/locations').headers
+
+    profiles = client.get(PROFILES).get_json()['profiles']
+    assert len(profiles) == 2
+    assert all(profile['trigger'] == 'sampled' and profile['modes'] == ['cpu'] for profile in profiles)
+
+def test_store_keeps_the_newest_max_files(tmp_path):
+    store = ProfileStore(str(tmp_path), max_files=2)
+    for index in range(3):
+        store.save(stored(f"20240101T00000000{index}-0000000{index}"), {'path': '/'})
+
+    assert [profile['id'] for profile in store.list()] == [
+        '20240101T000000002-00000002', '20240101T000000001-00000001']
+
+def test_store_keeps_under_max_bytes(tmp_path):
+    store = ProfileStore(str(tmp_path))
+    store.save(stored('20240101T000000000-00000000'), {'path': '/'})
+    size = os.path.getsize(tmp_path / '20240101T000000000-00000000.json')
+    store.max_bytes = int(size * 2.5)
+    for index in range(1, 4):
+        store.save(stored(f"20240101T00000000{index}-0000000{index}"), {'path': '/'})
+
+    assert [profile['id'] for profile in store.list()] == [
+        '20240101T000000003-00000003', '20240101T000000002-00000002']
+    assert store.get('../secrets') is None
@@ -0,0 +1,73 @@
+"""
+Regression tests for the background system sampler (services/sampler.py)
+"""
+
+import itertools
+import time
+import psutil
+import pytest
+from src.services import sampler
+from src.services.sampler import FALLBACK_CPU_INTERVAL, SystemSampler
+
+@pytest.fixture
+def readings(monkeypatch):
+    """Make every sample report the next CPU figure: 10, 20, 30, ..."""
+    counter = itertools.count(10, 10)
+
+    def fake(db_path, cpu_interval=None):
+        return {'cpu_percent': float(next(counter)), 'memory': {'percent': 50.0}, 'disk': {'percent': 25.0},
+                'temperature_c': 'N/A', 'timestamp': time.strftime('%H:%M:%S')}
+
+    monkeypatch.setattr(sampler, 'collect_system_status', fake)
+
+def test_ring_buffer_keeps_the_latest_samples(readings, db_path):
+    buffer = SystemSampler(db_path, history_size=3)
+    assert buffer.latest() is None
+    for _ in range(5):
+        buffer.take_sample()
+
+    history = buffer.history(points=10)
+    assert history['capacity'] == 3
+    assert [point['cpu_percent'] for point in history['points']] == [30.0, 40.0, 50.0]
+    assert buffer.latest()['cpu_percent'] == 50.0
+    assert '_time' not in buffer.latest()
+
+def test_history_averages_samples_into_points(readings, db_path):
+    buffer = SystemSampler(db_path, interval=5.0)
+    for _ in range(6):
+        buffer.take_sample()
+
+    history = buffer.history(points=2)
+    assert history['bucket_seconds'] == 15.0
+    assert [(point['cpu_percent'], point['samples']) for point in history['points']] == [(20.0, 3), (50.0, 3)]
+    assert history['points'][0]['memory_percent'] == 50.0
+    assert history['points'][0]['temperature_c'] is None
+
+def test_history_since_drops_older_samples(readings, db_path):
+    buffer = SystemSampler(db_path)
+    buffer.take_sample()
+    time.sleep(0.01)
+    since = time.time()
+    buffer.take_sample()
+    buffer.take_sample()
+
+    assert [point['cpu_percent'] for point in buffer.history(since=since)['points']] == [20.0, 30.0]
+
+def test_status_measures_cpu_until_the_first_sample(client, app, monkeypatch):
+    intervals = []
+    monkeypatch.setattr(psutil, 'cpu_percent', lambda interval=None: intervals.append(interval) or 12.5)
+
+    assert client.get('/api/system/status').get_json()['cpu_percent'] == 12.5
+    assert intervals == [FALLBACK_CPU_INTERVAL]
+
+    app.extensions['system_sampler'].take_sample()
+    intervals.clear()
+    client.get('/api/system/status')
+    assert intervals == []
+
+def test_history_route(client, app, readings):
+    for _ in range(4):
+        app.extensions['system_sampler'].take_sample()
+
+    points = client.get('/api/system/status/history', query_string={'points': 2}).get_json()['points']
+    assert [point['cpu_percent'] for point in points] == [15.0, 35.0]
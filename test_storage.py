@@ -0,0 +1,49 @@
+"""
+Regression tests for the compact daily usage storage and its ids (migration 7)
+"""
+
+import base64
+import json
+import sqlite3
+import pytest
+from database import from_day, split_usage_id, to_day, usage_id
+
+def cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def test_view_and_change_log_ids_match_usage_id(loaded_db):
+    conn = sqlite3.connect(loaded_db)
+    try:
+        rows = conn.execute("SELECT id, location_id, date FROM daily_usage").fetchall()
+        conn.execute("UPDATE daily_usage_compact SET usage_gb = usage_gb + 1")
+        logged = conn.execute("""
+            SELECT row_id, location_id, date FROM change_log WHERE operation = 'update'
+        """).fetchall()
+    finally:
+        conn.close()
+
+    assert rows and len(logged) == len(rows)
+    for row_id, location_id, day in rows + logged:
+        assert row_id == usage_id(location_id, to_day(day))
+        assert split_usage_id(row_id) == (location_id, to_day(day))
+
+def test_recent_updates_ids_round_trip(client):
+    rows = client.get('/api/dashboard/recent-updates').get_json()
+
+    assert rows
+    for row in rows:
+        assert from_day(split_usage_id(row['id'])[1]) == row['date']
+
+@pytest.mark.parametrize('path, values', [
+    ('/api/data/daily-usage', [20000, 1]),
+    ('/api/data/daily-usage', ['2024-02-30', 1]),
+    ('/api/data/daily-usage', ['2024-03-13', 'one']),
+    ('/api/data/monthly-summary', [None, 1]),
+    ('/api/dashboard/recent-updates', ['yesterday', 1]),
+    ('/api/dashboard/recent-updates', ['2024-03-13 00:00:00', '1']),
+])
+def test_malformed_cursor_values_are_rejected(client, path, values):
+    response = client.get(path, query_string={'cursor': cursor(values)})
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid cursor'
@@ -0,0 +1,57 @@
+"""
+Regression tests for the in-memory usage matrix (services/usage_matrix.py)
+"""
+
+from datetime import date
+import pytest
+from partitions import PartitionManager
+from src.services import usage_matrix
+from src.services.db import get_db_connection
+from src.services.usage_matrix import get_usage_matrix
+
+def overview(client):
+    response = client.get('/api/dashboard/overview')
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_matrix_loaded_in_batches_matches_sql(app, loaded_db, monkeypatch):
+    monkeypatch.setattr(usage_matrix, 'LOAD_FETCH_SIZE', 2)
+    PartitionManager(loaded_db).archive_year(2024, today=date(2026, 1, 15))
+    matrix = app.extensions['usage_matrix']
+    matrix.invalidate()
+
+    with app.test_request_context():
+        conn = get_db_connection()
+        assert get_usage_matrix(conn) is matrix
+        assert matrix.stats()['values'] == 7
+        assert matrix.check_consistency(conn)['consistent']
+
+@pytest.mark.parametrize('max_cells', [1, usage_matrix.DEFAULT_MAX_CELLS])
+def test_oversize_matrix_falls_back_to_sql(app_config, max_cells):
+    from src.main import create_app, shutdown_app
+    app = create_app({**app_config, 'USAGE_MATRIX_MAX_CELLS': max_cells})
+    try:
+        client = app.test_client()
+        result = overview(client)
+        stats = client.get('/api/system/usage-matrix').get_json()
+
+        assert result['total_records'] == 7
+        assert result['date_range'] == {'start': '2024-03-13', 'end': '2024-03-15'}
+        assert stats['enabled'] == (max_cells > 1)
+        assert stats['oversize_cells'] == (9 if max_cells == 1 else None)
+    finally:
+        shutdown_app(app)
+
+def test_oversize_matrix_ignores_writes(app_config):
+    from src.main import create_app, shutdown_app
+    app = create_app({**app_config, 'USAGE_MATRIX_MAX_CELLS': 1})
+    try:
+        client = app.test_client()
+        response = client.post('/api/data/daily-usage', json={
+            'date': '2024-03-16', 'location_id': 1, 'usage_gb': 2.5})
+
+        assert response.status_code == 200
+        assert overview(client)['total_records'] == 8
+        assert app.extensions['usage_matrix'].values.size == 0
+    finally:
+        shutdown_app(app)